@@ -4,7 +4,18 @@ common ept functions
 from ... utils import get_app_config
 from . ept_msg import MSG_TYPE
 from . ept_msg import eptMsg
+from . ept_msg import WORKER_QUEUE_BULK
+from . ept_msg import WORKER_QUEUE_COUNT
+from . ept_msg import WORKER_QUEUE_HIGH
+from . ept_msg import WORKER_QUEUE_NORMAL
+from . ept_msg import WORKER_QUEUE_PREEMPT_COUNT
+from array import array
+from heapq import heapify
+from heapq import heappop
+from heapq import heappush
+from struct import unpack_from
 
+import calendar
 import logging
 import hashlib
 import os
@@ -48,11 +59,101 @@ BG_EVENT_HANDLER_INTERVAL           = 0.01
 HASH_SHIFT                          = 128
 HASH_PRIME                          = 1000003
 
+# initial endpoint build splits each epm class query into node scoped queries that are executed in
+# parallel, each on a dedicated apic session spread across the known controllers. BUILD_FETCH_
+# CONCURRENCY is the maximum number of parallel queries (and sessions). Set to 1 to use a single
+# class query per epm class. A failed node query is retried up to BUILD_FETCH_MAX_RETRIES times,
+# skipping objects already returned from that node, before the endpoint build fails.
+BUILD_FETCH_CONCURRENCY             = 4
+BUILD_FETCH_MAX_RETRIES             = 2
+
+# when the subscription is lost after the fabric is initialized, the subscriber attempts an 
+# incremental resync: the subscription is restarted, the mo and dependent dbs are rebuilt, and
+# create jobs are only sent for epm objects with a modTs later than the cutoff. The cutoff is the
+# last received event or successful heartbeat minus the full heartbeat detection window and an
+# additional RESYNC_TS_MARGIN seconds for clock skew with the APIC. Delete jobs are sent for 
+# endpoints not returned from the APIC. If the subscription was lost for more than RESYNC_MAX_GAP
+# seconds, the set of active leafs changed, or the resync fails, the subscriber exits and the 
+# fabric is restarted with a full rebuild. Set RESYNC_MAX_GAP to 0 to disable incremental resync.
+RESYNC_MAX_GAP                      = 600.0
+RESYNC_TS_MARGIN                    = 120.0
+
+# by default the manager starts a dedicated subscriber process for each monitored fabric. If
+# SUBSCRIBER_HOST is enabled, all fabric subscribers are hosted within a single eptSubscriberHost
+# process that shares the db and redis connections, subscriber ctrl channel listener, hello and
+# stats thread, and event batching thread. The manager starts and stops each fabric with
+# FABRIC_START/FABRIC_STOP msgs on the subscriber ctrl channel. SUBSCRIBER_HOST_START_TIMEOUT is
+# the maximum time the manager waits for the host process to listen on the ctrl channel. A start
+# for a fabric whose stopped subscriber has not yet exited is deferred until the subscriber exits
+# and a warning is logged every SUBSCRIBER_HOST_STOP_TIMEOUT seconds while the start is deferred.
+SUBSCRIBER_HOST                     = False
+SUBSCRIBER_HOST_START_TIMEOUT       = 30.0
+SUBSCRIBER_HOST_STOP_TIMEOUT        = 10.0
+
+# endpoint refresh tracks each endpoint returned from the APIC in an eptEndpointPresence set to find
+# db endpoints that need a delete job. Each endpoint is held as a 64-bit key in an open addressing
+# table that is grown when the load exceeds PRESENCE_MAX_LOAD.
+PRESENCE_INITIAL_SIZE               = 65536
+PRESENCE_MAX_LOAD                   = 0.7
+
+# standard mo events received by the watcher are held for STD_MO_COALESCE_WINDOW seconds so that a
+# burst of events for the same dn is collapsed into a single dependency sync. Flushes for the ept
+# objects updated by the synced events are combined into one message per collection. Events are
+# checked on each WATCH_INTERVAL.
+STD_MO_COALESCE_WINDOW              = 1.0
+
+# multiple (collection, name) flushes are sent to workers as a single FLUSH_CACHE_BULK broadcast. 
+# If more than FLUSH_CACHE_MAX_NAMES names are flushed for a single collection then the request is
+# escalated to a full collection flush.
+FLUSH_CACHE_MAX_NAMES               = 256
+
+# watcher events are scheduled in a per-fabric min-heap ordered by execute timestamp. Replaced and
+# removed events are left in the heap and skipped when popped. The heap for a fabric is rebuilt with
+# only current events when it holds more than WATCH_SCHEDULE_COMPACT_MIN entries and more than twice
+# the number of current events.
+WATCH_SCHEDULE_COMPACT_MIN          = 1024
+
 # when API requests msg queue length, manager can read the full data off each queue and accurate
 # msgs within bulk messages for accurate count. There is a performance hit to this so the
 # alternative is counting the number of messages in each queue where a bulk message counts as one.
 ACCURATE_QUEUE_LENGTH               = False
 
+# when enabled in eptSettings, workers read node, tunnel, vpc, pc, vnid, and epg objects through a
+# shared redis hash per fabric and collection before the db. The hash name includes a version which
+# is incremented by send_flush for the collection so stale entries are never read after the flush.
+# Each hash expires SHARED_CACHE_TTL seconds after the last write.
+SHARED_CACHE_PREFIX                 = "ept.cache"
+SHARED_CACHE_TTL                    = 3600
+
+# number of messages read from redis per request when flushing a fabric from a queue
+FLUSH_QUEUE_CHUNK_SIZE              = 1024
+
+# when a worker receives an eptMsgBulk with more than one endpoint event, the eptHistory and
+# eptEndpoint state for each unique endpoint is read with a small number of batched queries before
+# the events are processed. BULK_PREFETCH_SIZE limits the number of addresses in a single $in query.
+BULK_PREFETCH                       = True
+BULK_PREFETCH_SIZE                  = 1024
+
+# when a worker receives an eptMsgBulk, push_event operations are buffered and written to the db
+# with unordered bulk writes. The buffer is flushed when it exceeds WRITE_BUFFER_MAX_SIZE operations
+# or the oldest buffered operation exceeds WRITE_BUFFER_MAX_AGE seconds, and always after the bulk
+# has been processed.
+WRITE_BUFFER                        = True
+WRITE_BUFFER_MAX_SIZE               = 512
+WRITE_BUFFER_MAX_AGE                = 1.0
+
+# each worker keeps the latest eptHistory and eptEndpoint state for recently updated endpoints that
+# it owns in a bounded write-through cache (sized by endpoint_cache_size setting) so that repeated
+# events for the same endpoint do not need to read the state from the db. The cache is flushed on 
+# any FLUSH_CACHE, fabric stop, and worker drain (worker set change).
+ENDPOINT_STATE_CACHE                = True
+
+# when the set of active workers changes, messages for endpoints that moved to a new worker are held
+# by the subscriber until each existing worker has acknowledged a drain marker (i.e., processed all
+# messages enqueued before the change). MAX_WORKER_DRAIN_TIME is the maximum amount of time to hold
+# messages before they are released to the new worker regardless of pending acks.
+MAX_WORKER_DRAIN_TIME               = 120.0
+
 # transitory timers:
 #   max_epm_build   maximum amount of time to wait for ACK from all worker processes to indiciate
 #                   that all initial epm messages (from build created/delete) have been processed.
@@ -245,44 +346,87 @@ def get_queue_length(rdb, queue, accurate=True):
     else:
         return rdb.llen(queue)
 
+# copy all messages from queue (KEYS[1]) to temporary key (KEYS[2]) in a single operation
+FLUSH_QUEUE_COPY_SCRIPT = """
+redis.call('del', KEYS[2])
+local items = redis.call('lrange', KEYS[1], 0, -1)
+for i = 1, #items, 1024 do
+    redis.call('rpush', KEYS[2], unpack(items, i, math.min(i+1023, #items)))
+end
+return #items
+"""
+
+# remove each message from queue (KEYS[1]) matching an id "<length>:<sha1>" within ARGV and keep
+# all other messages in their current order. Return the number of messages removed
+FLUSH_QUEUE_REMOVE_SCRIPT = """
+local remove = {}
+local lengths = {}
+for i, id in ipairs(ARGV) do
+    remove[id] = true
+    lengths[tonumber(string.match(id, "^(%d+):"))] = true
+end
+local items = redis.call('lrange', KEYS[1], 0, -1)
+local keep = {}
+for i, v in ipairs(items) do
+    if not (lengths[#v] and remove[#v .. ":" .. redis.sha1hex(v)]) then
+        keep[#keep+1] = v
+    end
+end
+local removed = #items - #keep
+if removed > 0 then
+    redis.call('del', KEYS[1])
+    for i = 1, #keep, 1024 do
+        redis.call('rpush', KEYS[1], unpack(keep, i, math.min(i+1023, #keep)))
+    end
+end
+return removed
+"""
+
 def flush_queue(redis_db, fabric, q, lock=None):
-    """ flush messages for provided fabric and redis queue """
+    """ flush messages for provided fabric and redis queue.
+        The queue is copied to a temporary key within a single script and the copy is briefly
+        parsed in chunks of FLUSH_QUEUE_CHUNK_SIZE to determine the fabric (eptMsgBulk is not fully
+        decoded) without blocking producers or consumers. The matched messages are then removed
+        from the queue by a second script that keeps all other messages, including any messages
+        added since the copy, in their current position. Since redis scripts are atomic, producers
+        and consumers only wait on the copy and remove operations and no message is reordered.
+    """
     logger.debug("flushing %s from queue %s", fabric, q)
-    # pull off all messages on the queue in single operation
-    pl = redis_db.pipeline()
-    pl.lrange(q, 0, -1)
-    pl.delete(q)
-    ret = []
-    repush = []
-    removed_count = 0
-    if lock is not None:
-        with lock:
-            ret = pl.execute()
-    else:
-        ret = pl.execute()
-    # inspect each message and if matching fabric discard, else push back onto queue
-    if len(ret) > 0 and type(ret[0]) is list:
-        logger.debug("inspecting %s msg from queue %s", len(ret[0]), q)
-        for data in ret[0]:
-            # need to reparse message and check fabric
-            msg = eptMsg.parse(data)
-            # for eptMsgBulk it is currently safe to assume if the first msg is our fabric
-            # then all messages will be our fabric
-            if msg.msg_type == MSG_TYPE.BULK and len(msg.msgs)>0 and hasattr(msg.msgs[0], "fabric")\
-                and msg.msgs[0].fabric == fabric:
-                removed_count+=len(msg.msgs)
-            elif hasattr(msg, "fabric") and msg.fabric == fabric:
-                removed_count+=1
-            else:
-                repush.append(data)
-        logger.debug("removed %s and repushing %s to queue %s", removed_count, len(repush), q)
-        if len(repush) > 0:
+    tmp = "%s.flush.%s" % (q, get_random_sequence())
+    copy_script = redis_db.register_script(FLUSH_QUEUE_COPY_SCRIPT)
+    remove_script = redis_db.register_script(FLUSH_QUEUE_REMOVE_SCRIPT)
+    try:
+        total = copy_script(keys=[q, tmp])
+        if total == 0:
+            logger.debug("queue %s is empty, nothing to flush", q)
+            return
+        remove = set()
+        removed_count = 0
+        logger.debug("inspecting %s msg from queue %s", total, q)
+        for offset in xrange(0, total, FLUSH_QUEUE_CHUNK_SIZE):
+            for data in redis_db.lrange(tmp, offset, offset + FLUSH_QUEUE_CHUNK_SIZE - 1):
+                msg = eptMsg.parse(data, brief=True)
+                if msg.msg_type == MSG_TYPE.BULK:
+                    if msg.fabric != fabric:
+                        continue
+                    removed_count+= msg.msg_count
+                elif getattr(msg, "fabric", None) == fabric:
+                    removed_count+= 1
+                else:
+                    continue
+                remove.add("%s:%s" % (len(data), hashlib.sha1(data).hexdigest()))
+        logger.debug("removing %s msgs (%s unique) from queue %s", removed_count, len(remove), q)
+        remove = list(remove)
+        for offset in xrange(0, len(remove), 64*FLUSH_QUEUE_CHUNK_SIZE):
+            ids = remove[offset:offset + 64*FLUSH_QUEUE_CHUNK_SIZE]
             if lock is not None:
                 with lock:
-                    redis_db.rpush(q, *repush)
+                    remove_script(keys=[q], args=ids)
             else:
-                redis_db.rpush(q, *repush)
-            logger.debug("repush completed")
+                remove_script(keys=[q], args=ids)
+    finally:
+        redis_db.delete(tmp)
+    logger.debug("flush completed")
 
 
 ###############################################################################
@@ -358,9 +502,9 @@ def parse_vrf_name(dn):
         return None
 
 
-def subscriber_op(fabric, msg_type, data=None, qnum=0):
-    """ send msg to subscriber with provided msg_type and data. The message is only sent if fabric 
-        is currently running, else an error is returned.
+def subscriber_op(fabric, msg_type, qnum, data=None):
+    """ send msg to subscriber with provided msg_type, worker queue (qnum), and data. The message
+        is only sent if fabric is currently running, else an error is returned.
         returns a tuple (success, error_string)
     """
     from ... utils import get_redis
@@ -401,6 +545,29 @@ def parse_tz(tz):
         logger.warn("failed to parse timezone: %s", tz)
         return tz
 
+apic_ts_reg = "^(?P<y>[0-9]{4})-(?P<mo>[0-9]{2})-(?P<d>[0-9]{2})T(?P<h>[0-9]{2}):(?P<mi>[0-9]{2}):"
+apic_ts_reg+= "(?P<s>[0-9]{2})(?P<f>\.[0-9]+)?((?P<os>[+\-])(?P<oh>[0-9]{2}):(?P<om>[0-9]{2})|Z)?$"
+apic_ts_reg = re.compile(apic_ts_reg)
+def parse_apic_timestamp(ts):
+    """ return float unix timestamp for APIC timestamp string (such as modTs) in the format
+        2019-05-09T18:46:34.123+00:00.  If no offset is present then UTC is assumed. Return 0 if
+        the timestamp cannot be parsed (such as 'never').
+    """
+    r1 = apic_ts_reg.search(ts)
+    if r1 is None:
+        return 0
+    value = calendar.timegm((int(r1.group("y")), int(r1.group("mo")), int(r1.group("d")),
+                            int(r1.group("h")), int(r1.group("mi")), int(r1.group("s")), 0, 0, 0))
+    if r1.group("f") is not None:
+        value+= float(r1.group("f"))
+    if r1.group("os") is not None:
+        offset = int(r1.group("oh"))*3600 + int(r1.group("om"))*60
+        if r1.group("os") == "+":
+            value-= offset
+        else:
+            value+= offset
+    return value
+
 def get_msg_hash(msg):
     """ receive eptMsg object with addr, vnid, and type attributes and return calculated hash """
     # multiple types of work objects supported by each has an addr field. It may have a vnid
@@ -433,6 +600,216 @@ def get_msg_hash(msg):
     #logger.debug("addr(%s:0x%x), hash:0x%x", m_addr, _addr, _hash)
     return _hash
 
+# cache of per-worker seeds used for rendezvous hashing indexed by worker_id
+_worker_hash_seeds = {}
+
+def _hash_mix(value):
+    """ 64-bit integer finalizer (splitmix64) to evenly distribute sequential values """
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return value ^ (value >> 31)
+
+def get_worker_index(_hash, workers):
+    """ receive hash from get_msg_hash and list of workers (TrackedWorker objects or worker_id
+        strings) and return the index of the worker that owns the hash or -1 if workers is empty.
+        This uses rendezvous (highest random weight) hashing so when a worker is added or removed 
+        only the hashes owned by that worker are remapped (~1/N of the keys) instead of almost all 
+        keys with a simple modulo of the worker count.
+    """
+    # fold hash into 64-bits (vnid is shifted by HASH_SHIFT) and mix once for the message
+    while _hash > 0xffffffffffffffff:
+        _hash = (_hash & 0xffffffffffffffff) ^ (_hash >> 64)
+    _hash = _hash_mix(_hash)
+    index = -1
+    max_weight = -1
+    for i, w in enumerate(workers):
+        worker_id = getattr(w, "worker_id", w)
+        seed = _worker_hash_seeds.get(worker_id, None)
+        if seed is None:
+            seed = int(hashlib.md5(worker_id).hexdigest()[0:16], base=16)
+            _worker_hash_seeds[worker_id] = seed
+        weight = _hash_mix(_hash ^ seed)
+        if weight > max_weight:
+            max_weight = weight
+            index = i
+    return index
+
+class eptEndpointPresence(object):
+    """ compact set of (node, vnid, addr) tuples used for delete detection on endpoint refresh.
+        Each tuple is stored as a 64-bit md5 derived key within an open addressing (linear probe)
+        table backed by an unsigned long array. This requires 12 to 24 bytes per endpoint compared
+        to well over 100 bytes per endpoint for a 3-level dict of strings. Since only the key is kept,
+        two different endpoints can collide on the same key. The probability of any collision is
+        approximately n*m/2^64 for n added and m checked endpoints (< 1e-6 at 10M endpoints).
+        On platforms where unsigned long is only 32-bits, the key is folded to 32-bits which uses
+        half the memory but increases the probability of collision to n*m/2^32.
+    """
+    # array typecode for key table and number of bits per key
+    TYPECODE = "L"
+    KEY_BITS = min(64, array(TYPECODE).itemsize * 8)
+
+    def __init__(self, size=PRESENCE_INITIAL_SIZE):
+        # size must be a power of 2
+        capacity = 1
+        while capacity < size:
+            capacity = capacity << 1
+        self.table = array(eptEndpointPresence.TYPECODE, [0]) * capacity
+        self.mask = capacity - 1
+        self.count = 0
+        self.max_count = int(capacity * PRESENCE_MAX_LOAD)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        (node, vnid, addr) = key
+        return self.exists(node, vnid, addr)
+
+    @staticmethod
+    def get_key(node, vnid, addr):
+        """ return non-zero key for endpoint that fits within KEY_BITS """
+        key = unpack_from("<Q", hashlib.md5("%s %s %s" % (node, vnid, addr)).digest())[0]
+        if eptEndpointPresence.KEY_BITS < 64:
+            key = (key ^ (key >> 32)) & 0xffffffff
+        return key if key > 0 else 1
+
+    def add(self, node, vnid, addr):
+        """ add endpoint to set """
+        if self._insert(self.get_key(node, vnid, addr)):
+            self.count+= 1
+            if self.count > self.max_count:
+                self._grow()
+
+    def exists(self, node, vnid, addr):
+        """ return True if endpoint has been added to set """
+        key = self.get_key(node, vnid, addr)
+        table = self.table
+        mask = self.mask
+        index = key & mask
+        while True:
+            value = table[index]
+            if value == key:
+                return True
+            if value == 0:
+                return False
+            index = (index + 1) & mask
+
+    def memory_size(self):
+        """ return number of bytes used by key table """
+        return self.table.itemsize * len(self.table)
+
+    def _insert(self, key):
+        # insert key into table and return True if added or False if already present
+        table = self.table
+        mask = self.mask
+        index = key & mask
+        while True:
+            value = table[index]
+            if value == 0:
+                table[index] = key
+                return True
+            if value == key:
+                return False
+            index = (index + 1) & mask
+
+    def _grow(self):
+        # double the table size and re-insert all keys
+        old = self.table
+        capacity = len(old) << 1
+        self.table = array(eptEndpointPresence.TYPECODE, [0]) * capacity
+        self.mask = capacity - 1
+        self.max_count = int(capacity * PRESENCE_MAX_LOAD)
+        for key in old:
+            if key > 0:
+                self._insert(key)
+
+class eptWatchSchedule(object):
+    """ dict of watcher msgs indexed by unique key along with a min-heap per fabric of (xts, seq,
+        key, msg) entries so that msgs ready to execute are found without scanning all watched
+        keys. Setting an existing key or popping a key leaves the previous heap entry in place and
+        it is skipped when it reaches the top of the heap (lazy deletion). Each msg requires 
+        'fabric' and 'xts' attributes.
+    """
+    def __init__(self):
+        self.msgs = {}
+        self.heaps = {}
+        self.counts = {}
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.msgs)
+
+    def __contains__(self, key):
+        return key in self.msgs
+
+    def __getitem__(self, key):
+        return self.msgs[key]
+
+    def __setitem__(self, key, msg):
+        prev = self.msgs.get(key, None)
+        if prev is not None:
+            self.counts[prev.fabric]-= 1
+        self.msgs[key] = msg
+        self.counts[msg.fabric] = self.counts.get(msg.fabric, 0) + 1
+        self.seq+= 1
+        heap = self.heaps.setdefault(msg.fabric, [])
+        heappush(heap, (msg.xts, self.seq, key, msg))
+        if len(heap) > WATCH_SCHEDULE_COMPACT_MIN and len(heap) > 2*self.counts[msg.fabric]:
+            self.compact(msg.fabric)
+
+    def get(self, key, default=None):
+        return self.msgs.get(key, default)
+
+    def pop(self, key, default=None):
+        msg = self.msgs.pop(key, None)
+        if msg is None:
+            return default
+        self.counts[msg.fabric]-= 1
+        return msg
+
+    def items(self):
+        return self.msgs.items()
+
+    def get_count(self, fabric):
+        """ return number of msgs currently scheduled for fabric """
+        return self.counts.get(fabric, 0)
+
+    def pop_ready(self, ts, skip_fabrics=None):
+        """ remove and return list of (key, msg) with xts <= ts in execute order. Msgs for fabrics
+            within skip_fabrics are not returned and remain scheduled.
+        """
+        work = []
+        for fabric, heap in self.heaps.items():
+            if skip_fabrics is not None and fabric in skip_fabrics:
+                continue
+            while len(heap) > 0 and heap[0][0] <= ts:
+                (xts, seq, key, msg) = heappop(heap)
+                if self.msgs.get(key, None) is msg and msg.xts <= ts:
+                    self.msgs.pop(key)
+                    self.counts[fabric]-= 1
+                    work.append((key, msg))
+            if len(heap) == 0:
+                self.heaps.pop(fabric, None)
+        # each heap is already ordered, merge across fabrics
+        work.sort(key=lambda w: w[1].xts)
+        return work
+
+    def remove_fabric(self, fabric):
+        """ remove all msgs for fabric and return number of msgs removed """
+        pop = [k for (k, msg) in self.msgs.items() if msg.fabric == fabric]
+        for k in pop:
+            self.msgs.pop(k, None)
+        self.heaps.pop(fabric, None)
+        self.counts.pop(fabric, None)
+        return len(pop)
+
+    def compact(self, fabric):
+        """ rebuild heap for fabric with only current msgs """
+        heap = [e for e in self.heaps.get(fabric, []) if self.msgs.get(e[2], None) is e[3] and \
+                    e[0] == e[3].xts]
+        heapify(heap)
+        self.heaps[fabric] = heap
+
 ###############################################################################
 #
 # common conversion functions
@@ -647,3 +1024,55 @@ class BackgroundThread(threading.Thread):
                 return
             time.sleep(self.interval)
 
+
+class BackgroundTasks(threading.Thread):
+    """ single background thread that executes multiple functions, each at its own regular
+        interval. This is used in place of a BackgroundThread per function for periodic tasks that
+        are mostly idle (hello, stats, etc...) to reduce the number of threads per process.  Note,
+        a slow task delays the next execution of all other tasks within the same thread.
+    """
+    def __init__(self, name=None):
+        threading.Thread.__init__(self)
+        self._exit = False
+        if name is not None:
+            self.name = "%s" % name
+        # list of tasks where each task is a dict with func, interval, args, kwargs, and next
+        # timestamp for execution
+        self.tasks = []
+
+    def add_task(self, func, interval, args=None, kwargs=None):
+        """ add function to execute at provided interval (in seconds). Tasks must be added before
+            thread is started.
+        """
+        if not callable(func):
+            raise Exception("background task function (%s) not callable" % func)
+        self.tasks.append({
+            "func": func,
+            "interval": interval,
+            "args": args if args is not None else [],
+            "kwargs": kwargs if kwargs is not None else {},
+            "next": 0,
+        })
+
+    def exit(self):
+        """ exit thread """
+        logger.debug("exiting background tasks thread: %s", self.name)
+        self._exit = True
+
+    def run(self):
+        logger.debug("starting background tasks thread: %s", self.name)
+        while not self._exit and len(self.tasks) > 0:
+            for task in self.tasks:
+                if task["next"] <= time.time():
+                    try:
+                        task["func"](*task["args"], **task["kwargs"])
+                    except Exception as e:
+                        logger.debug("Traceback:\n%s", traceback.format_exc())
+                        logger.error("failed to execute background task: %s", e)
+                    task["next"] = time.time() + task["interval"]
+                if self._exit:
+                    return
+            # sleep until next task is ready
+            delay = min([t["next"] for t in self.tasks]) - time.time()
+            if delay > 0:
+                time.sleep(delay)
@@ -1,5 +1,8 @@
 
 from ... utils import get_db
+from . common import FLUSH_CACHE_MAX_NAMES
+from . common import SHARED_CACHE_PREFIX
+from . common import SHARED_CACHE_TTL
 from . common import get_ip_prefix
 from . ept_endpoint import eptEndpoint
 from . ept_epg import eptEpg
@@ -10,7 +13,9 @@ from . ept_subnet import eptSubnet
 from . ept_vnid import eptVnid
 from . ept_vpc import eptVpc
 
+import json
 import logging
+import sys
 import traceback
 
 # module level logging
@@ -35,24 +40,43 @@ class eptCache(object):
 
             get_subnets         return [eptSubnet] for provided bd
 
+            get_subnet_index    return subnetIndex built from get_subnets for provided bd
+
             get_rapid_endpoint  return rapidEndpointCachedObject from cache or new object
 
+            get_endpoint_state  return endpointStateCachedObject from cache or None
+
             ip_is_offsubnet     return bool if ip is outside of subnets for bd corresponding to 
                                 vrf, pctag
 
             offsubnet check:
-            vnid,pctag-> eptEpg.bd_vnid -> list(eptSubnets)
-                                                  |
-                                                  + ip ------> offsubnetCachedObject
+            vnid,pctag-> eptEpg.bd_vnid -> list(eptSubnets) -> subnetIndex(bd)
+                                                                    |
+                                                                    + ip ---> longest match
     """
     MAX_CACHE_SIZE = 512
-    MAX_OFFSUBNET_CACHE_SIZE = 1024
     MAX_ENDPOINT_CACHE_SIZE = 1024
     KEY_DELIM = "`"             # majority of keys are integers, this should be sufficient delimiter
+    # name of each hitCache attribute, endpoint caches are sized by endpoint_cache_size setting
+    CACHES = [
+        "tunnel_cache",
+        "node_cache",
+        "vpc_cache",
+        "pc_cache",
+        "vnid_cache",
+        "epg_cache",
+        "subnet_cache",
+        "subnet_index_cache",
+        "rapid_cache",
+        "endpoint_cache",
+    ]
+    ENDPOINT_CACHES = ["rapid_cache", "endpoint_cache"]
     def __init__(self, fabric):
         self.fabric = fabric
         self.flush_requests = 0
         self.key_delim = eptCache.KEY_DELIM
+        # optional sharedCache read before db lookup for supported collections
+        self.shared_cache = None
         self.tunnel_cache = hitCache(eptCache.MAX_CACHE_SIZE)   # eptTunnel(node, intf) = eptTunnel
         self.node_cache = hitCache(eptCache.MAX_CACHE_SIZE)         # eptNode(node) = eptNode
         self.vpc_cache = hitCache(eptCache.MAX_CACHE_SIZE)          # eptVpc(node,intf) = eptVpc
@@ -60,39 +84,94 @@ class eptCache(object):
         self.vnid_cache = hitCache(eptCache.MAX_CACHE_SIZE)         # eptVnid(vnid) = eptVnid
         self.epg_cache = hitCache(eptCache.MAX_CACHE_SIZE)          # eptEpg(vrf,pctag) = eptEpg
         self.subnet_cache = hitCache(eptCache.MAX_CACHE_SIZE)       # eptSubnet(bd) = list(eptSubnet)
-        # (vrf,pctag,ip) = eptOffSubnet
-        self.offsubnet_cache = hitCache(eptCache.MAX_OFFSUBNET_CACHE_SIZE) 
+        # (bd) = subnetIndex
+        self.subnet_index_cache = hitCache(eptCache.MAX_CACHE_SIZE)
         # (vnid,addr) = rapidEndpointCachedObject
         self.rapid_cache = hitCache(eptCache.MAX_ENDPOINT_CACHE_SIZE, callback=self.evict_rapid) 
+        # (vnid,addr) = endpointStateCachedObject
+        self.endpoint_cache = hitCache(eptCache.MAX_ENDPOINT_CACHE_SIZE)
+
+    def resize(self, max_size, max_endpoint_size, max_memory=0):
+        """ update max size of each cache and optional max memory in bytes (0 to disable)"""
+        for cache_name in eptCache.CACHES:
+            if cache_name in eptCache.ENDPOINT_CACHES:
+                getattr(self, cache_name).resize(max_endpoint_size, max_memory=max_memory)
+            else:
+                getattr(self, cache_name).resize(max_size, max_memory=max_memory)
 
-    def handle_flush(self, collection_name, name=None):
-        """ flush one or more entries in collection name """
-        logger.debug("flush request for %s: %s", collection_name, name)
+    def handle_flush(self, collection_name, name=None, version=None, names=None):
+        """ flush one or more entries in collection name. version is the shared cache version for
+            the collection after invalidation by the sender of the flush (if known). names is an
+            optional list of names to flush with a single request
+        """
+        logger.debug("flush request for %s: %s %s", collection_name, name, names)
         self.flush_requests+= 1
+        # endpoint state embeds names and learn info derived from the other caches so it is always
+        # fully flushed and rebuilt from the db on next event
+        self.endpoint_cache.flush()
+        if self.shared_cache is not None:
+            self.shared_cache.set_version(collection_name, version)
+        if names is None:
+            names = [name]
+        for name in names:
+            self.handle_flush_name(collection_name, name)
+
+    def handle_flush_bulk(self, data):
+        """ flush each collection within FLUSH_CACHE_BULK data created by get_flush_bulk_data """
+        for f in data.get("flush", []):
+            self.handle_flush(f["cache"], version=f.get("version", None), 
+                    names=f.get("names", None))
+
+    @staticmethod
+    def get_flush_bulk_data(redis, fabric, flush):
+        """ receive list of (collection, name) tuples and return data for FLUSH_CACHE_BULK msg. A
+            name of None flushes the full collection which is also used when the number of names
+            for a collection exceeds FLUSH_CACHE_MAX_NAMES. The shared cache is invalidated for 
+            each collection.
+        """
+        collections = {}
+        order = []
+        for (collection, name) in flush:
+            classname = collection._classname
+            if classname not in collections:
+                collections[classname] = set()
+                order.append(classname)
+            names = collections[classname]
+            if names is None:
+                continue
+            names.add(name)
+            if name is None or len(names) > FLUSH_CACHE_MAX_NAMES:
+                collections[classname] = None
+        data = {"flush": []}
+        for classname in order:
+            names = collections[classname]
+            data["flush"].append({
+                "cache": classname,
+                "names": sorted(names) if names is not None else None,
+                "version": sharedCache.invalidate(redis, fabric, classname),
+            })
+        return data
+
+    def handle_flush_name(self, collection_name, name=None):
+        """ flush entry with name in collection name or full collection if name is None """
         if collection_name == eptNode._classname:
             self.node_cache.flush()     # always full cache flush for node
         elif collection_name == eptTunnel._classname:
-            if name is not None: self.tunnel_cache.remove(name, name=True)
+            if name is not None: self.tunnel_cache.remove(name, name=True, preserve_none=False)
             else: self.tunnel_cache.flush()
         elif collection_name == eptVpc._classname:
-            if name is not None: self.vpc_cache.remove(name, name=True)
+            if name is not None: self.vpc_cache.remove(name, name=True, preserve_none=False)
             else: self.vpc_cache.flush()
         elif collection_name == eptPc._classname:
-            if name is not None: self.pc_cache.remove(name, name=True)
+            if name is not None: self.pc_cache.remove(name, name=True, preserve_none=False)
             else: self.pc_cache.flush()
         elif collection_name == eptVnid._classname:
-            if name is not None: self.vnid_cache.remove(name, name=True)
+            if name is not None: self.vnid_cache.remove(name, name=True, preserve_none=False)
             else: self.vnid_cache.flush()
         elif collection_name == eptEpg._classname:
-            # need to remove one or all entries in offsubnet cache based on matching epg.bd
-            if name is not None: 
-                epg = self.epg_cache.search(name, name=True)
-                if not isinstance(epg, hitCacheNotFound) and epg is not None:
-                    self.offsubnet_flush(epg.bd)
-                self.epg_cache.remove(name, name=True)
-            else: 
-                self.epg_cache.flush()
-                self.offsubnet_cache.flush()
+            # subnet index is per bd so an epg change only needs to flush the epg to bd mapping
+            if name is not None: self.epg_cache.remove(name, name=True, preserve_none=False)
+            else: self.epg_cache.flush()
         elif collection_name == eptSubnet._classname:
             # eptSubnet maps to subnet_cache which is the only current cache that maps to a list. If
             # one entry is flushed, we don't know if that was an add or create so we need to
@@ -100,8 +179,8 @@ class eptCache(object):
             # we need to know the bd for the corresponding subnet. If not found in cache and not
             # found in eptSubnet table, then we need to flush the entire cache. Else, we can flush
             # just the subnets corresponding to the affected bd.
-            # the offsubnet cache also needs to be updated, however it already supports a flush on
-            # a per bd basis so we will be flushing just that bd or the full cache.
+            # the subnet index is built from the same list and is also keyed by bd so it is flushed
+            # along with the subnet_cache.
             flush_bd = None
             if name is not None:
                 subnets = self.subnet_cache.search(name, name=True)
@@ -119,16 +198,18 @@ class eptCache(object):
                     if len(obj)>0:
                         flush_bd = obj[0].bd
                         logger.debug("deriving bd 0x%x from db subnet %s", flush_bd, obj[0].name)
-            # flush subnet_cache and offsubnet_cache for specific bd or all bds
+            # flush subnet_cache and subnet_index_cache for specific bd or all bds
             if flush_bd is not None:
-                logger.debug("flushing subnet_cache and offsubnet_cache for bd 0x%x", flush_bd)
+                logger.debug("flushing subnet_cache and subnet_index_cache for bd 0x%x", flush_bd)
+                # both caches are keyed by bd and subnet_cache may also hold a cached None for a bd
+                # without subnets so remove by key
                 keystr = self.get_key_str(bd=flush_bd)
                 self.subnet_cache.remove(keystr)
-                self.offsubnet_flush(flush_bd)
+                self.subnet_index_cache.remove(keystr)
             else:
-                logger.debug("flushing full subnet_cache and offsubnet_cache")
+                logger.debug("flushing full subnet_cache and subnet_index_cache")
                 self.subnet_cache.flush()
-                self.offsubnet_cache.flush()
+                self.subnet_index_cache.flush()
         else:
             logger.debug("flush for unsupported collection name: %s", collection_name)
 
@@ -162,7 +243,16 @@ class eptCache(object):
         if not db_lookup: 
             # if entry not in cache and db_lookup disabled, then return None 
             return None
-        obj = eptObject.find(projection=projection, fabric=self.fabric, **keys)
+        shared = self.shared_cache is not None and projection is None and \
+                eptObject._classname in sharedCache.COLLECTIONS
+        obj = None
+        if shared:
+            obj = self.shared_cache.get(eptObject, keystr)
+        if obj is None:
+            obj = eptObject.find(projection=projection, fabric=self.fabric, **keys)
+            # only objects found in the db are added to the shared cache
+            if shared and len(obj) > 0:
+                self.shared_cache.set(eptObject, keystr, obj)
         if len(obj) == 0:
             logger.debug("(cache) not found in db: %s %s", eptObject._classname, keys)
             # add None to cache for keys to prevent db lookup on next check
@@ -243,6 +333,31 @@ class eptCache(object):
             time when rapid counters are saved to db
         """
         cached_rapid.save()
+        # keep rapid counters within cached endpoint state consistent with the saved values
+        state = self.endpoint_cache.peek(self.get_key_str(vnid=cached_rapid.vnid, 
+                                                            addr=cached_rapid.addr))
+        if not isinstance(state, hitCacheNotFound) and state.endpoint is not None:
+            state.set_rapid(cached_rapid)
+
+    def get_endpoint_state(self, vnid, addr):
+        """ return endpointStateCachedObject for endpoint or None if not in cache """
+        ret = self.endpoint_cache.search(self.get_key_str(vnid=vnid, addr=addr))
+        if isinstance(ret, hitCacheNotFound):
+            return None
+        return ret
+
+    def has_endpoint_state(self, vnid, addr):
+        """ return True if endpoint state is in cache without triggering a hit """
+        keystr = self.get_key_str(vnid=vnid, addr=addr)
+        return not isinstance(self.endpoint_cache.peek(keystr), hitCacheNotFound)
+
+    def set_endpoint_state(self, vnid, addr, state):
+        """ add or update endpointStateCachedObject for endpoint """
+        self.endpoint_cache.push(self.get_key_str(vnid=vnid, addr=addr), state)
+
+    def remove_endpoint_state(self, vnid, addr):
+        """ remove endpointStateCachedObject for endpoint if present """
+        self.endpoint_cache.remove(self.get_key_str(vnid=vnid, addr=addr))
 
     def get_subnets(self, bd):
         """ return list of subnet objects for provided bd.  Return an empty list of subnets not
@@ -252,16 +367,22 @@ class eptCache(object):
         if subnets is None: return []
         return subnets
 
+    def get_subnet_index(self, bd):
+        """ return subnetIndex for provided bd, building the index from get_subnets if not already
+            cached.
+        """
+        keystr = self.get_key_str(bd=bd)
+        index = self.subnet_index_cache.search(keystr)
+        if isinstance(index, hitCacheNotFound):
+            index = subnetIndex(bd, self.get_subnets(bd))
+            self.subnet_index_cache.push(keystr, index)
+        return index
+
     def ip_is_offsubnet(self, vrf, pctag, ip):
         """ return bool if ip is offsubnet
             if unable to determine bd then cannot execute offsubnet check and return False.  If 
             unable to parse ip address then also an error and assume not offsubnet
         """
-        ret = self.generic_cache_lookup(self.offsubnet_cache,offsubnetCachedObject, db_lookup=False,
-                vrf=vrf, pctag=pctag, ip=ip)
-        if ret is not None:
-            return ret.offsubnet
-
         # get bd for corresponding epg (vrf, pctag)
         epg = self.get_epg_name(vrf, pctag, return_object=True)
         if epg is None:
@@ -272,57 +393,22 @@ class eptCache(object):
         if addr is None or mask is None:
             logger.warn("failed to parse ip address: %s", ip)
             return False
-        else:
-            # get list of subnets and check each for a match against the addr (assume offsubnet 
-            # until matched against one of the bd subnets)
-            offsubnet = True
-            subnets = self.get_subnets(epg.bd)
-            for s in subnets:
-                (saddr, smask) = get_ip_prefix(s.ip)
-                if saddr is None or smask is None:
-                    logger.warn("failed to parse ip address for subnet(%s): %s", s.name, s.ip)
-                    continue
-                if addr & smask == saddr:
-                    logger.debug("addr %s matched subnet: %s", ip, s.name)
-                    offsubnet = False
-                    break
-            if offsubnet:
-                logger.debug("addr %s not matched against any of the %s subnets in bd %s", ip, 
-                    len(subnets), epg.bd)
-
-        # add result to cache for next lookup
-        keystr = self.get_key_str(vrf=vrf, pctag=pctag, ip=ip)
-        self.offsubnet_cache.push(keystr, offsubnetCachedObject(epg.bd, offsubnet))
-        return offsubnet
-
-    def offsubnet_flush(self, bd):
-        """ offsubnet_cache contains offsubnetCachedObjects with key of vrf,pctag,ip. Flush occurs
-            based on bd so need to walk through all nodes in list and remove nodes with provided bd.
-        """
-        remove_nodes = []
-        for n in self.offsubnet_cache.get_node_list():
-            if n.val is not None and hasattr(n.val, "bd") and n.val.bd == bd:
-                remove_nodes.append(n)
-        for n in remove_nodes:
-            self.offsubnet_cache._remove_node(n)
+        index = self.get_subnet_index(epg.bd)
+        return index.lookup(addr, ipv6=(":" in ip)) is None
 
     def log_stats(self):
         """ log statistics for each cache """
-        caches = [
-            "tunnel_cache",
-            "node_cache", 
-            "vpc_cache", 
-            "epg_cache", 
-            "subnet_cache", 
-            "offsubnet_cache",
-            "rapid_cache",
-        ]
         logger.debug("cache stats for fabric %s, flush_request: 0x%08x", self.fabric, 
                 self.flush_requests)
-        for cache_name in caches:
+        for cache_name in eptCache.CACHES:
             c = getattr(self, cache_name)
-            logger.debug("[hit: 0x%08x, miss: 0x%08x, evict: 0x%08x, flush: 0x%08x] %s", 
-                c.hit_count, c.miss_count, c.evict_count, c.flush_count, cache_name)
+            logger.debug("[hit: 0x%08x, miss: 0x%08x, evict: 0x%08x, flush: 0x%08x, size: %s/%s, "
+                "memory: %s/%s] %s", c.hit_count, c.miss_count, c.evict_count, c.flush_count,
+                c.get_size(), c.max_size, c.memory, c.max_memory, cache_name)
+        if self.shared_cache is not None:
+            c = self.shared_cache
+            logger.debug("[hit: 0x%08x, miss: 0x%08x, error: 0x%08x] shared_cache", c.hit_count,
+                c.miss_count, c.error_count)
 
 class rapidEndpointCachedObject(object):
     """ rapid statistics for eptEndpoint """
@@ -360,19 +446,174 @@ class rapidEndpointCachedObject(object):
             "rapid_icount": self.rapid_icount,
         }})
 
-class offsubnetCachedObject(object):
-    """ cache objects support a key and val where val can contain an optionally name used mainly for
-        remove(flush) operations.  We want to cache the result of offsubnet check using 
-        key=vrf,pctag,ip and result=bool as well as supporting a flush for any change to eptEpg or
-        eptSubnet that has bd corresponding to epg belonging to vrf,pctag. To do this, we create 
-        an offsubnetCachedObject that has two attributes:
-            bd = bd vnid corresponding to eptEpg/eptSubnet that created the entry
-            offsubnet = boolean (true if offsubnet else false)
+class endpointStateCachedObject(object):
+    """ latest eptHistory and eptEndpoint state for an endpoint owned by the worker. This is the
+        same state read from the db with HISTORY_PROJECTION and ENDPOINT_PROJECTION and is updated
+        by the worker after each event (write-through) so it is only valid while the worker owns
+        the endpoint.
+
+            history     dict indexed by node-id containing a list with the most recent
+                        eptHistoryEvent for the node (with watch info embedded)
+
+            endpoint    eptEndpoint document or None if the endpoint does not exist
     """
-    _classname = "offsubnet_cache"
-    def __init__(self, bd, offsubnet):
+    _classname = "endpoint_state_cache"
+    RAPID_ATTRIBUTES = ["is_rapid", "rapid_lts", "rapid_count", "rapid_lcount", "rapid_icount"]
+    def __init__(self, history, endpoint):
+        self.history = history
+        self.endpoint = endpoint
+
+    def __repr__(self):
+        return "nodes:%s, endpoint:%r" % (len(self.history), self.endpoint is not None)
+
+    def get_history(self):
+        """ return copy of per-node history events safe for the caller to modify """
+        return dict([(node, list(self.history[node])) for node in self.history])
+
+    def set_rapid(self, cached_rapid):
+        """ update endpoint rapid counters from rapidEndpointCachedObject """
+        for a in endpointStateCachedObject.RAPID_ATTRIBUTES:
+            self.endpoint[a] = getattr(cached_rapid, a)
+
+class subnetIndex(object):
+    """ longest prefix match index for the subnets within a single bd. Each subnet is parsed once
+        when the index is built and added to a per address family list of (mask, {network: name})
+        tuples ordered from longest to shortest mask. A lookup is a single masked dict check per
+        unique mask length configured on the bd (not per subnet) and the first hit is the longest
+        match.
+    """
+    def __init__(self, bd, subnets):
         self.bd = bd
-        self.offsubnet = offsubnet
+        self.size = 0
+        self.ipv4 = []
+        self.ipv6 = []
+        ipv4 = {}
+        ipv6 = {}
+        for s in subnets:
+            (saddr, smask) = get_ip_prefix(s.ip)
+            if saddr is None or smask is None:
+                logger.warn("failed to parse ip address for subnet(%s): %s", s.name, s.ip)
+                continue
+            family = ipv6 if ":" in s.ip else ipv4
+            family.setdefault(smask, {})[saddr] = s.name
+            self.size+= 1
+        # masks are in 1-care format so the numerically larger mask is always the longer prefix
+        for smask in sorted(ipv4, reverse=True):
+            self.ipv4.append((smask, ipv4[smask]))
+        for smask in sorted(ipv6, reverse=True):
+            self.ipv6.append((smask, ipv6[smask]))
+
+    def __repr__(self):
+        return "bd:0x%x, subnets:%s, ipv4 masks:%s, ipv6 masks:%s" % (self.bd, self.size,
+                len(self.ipv4), len(self.ipv6))
+
+    def lookup(self, addr, ipv6=False):
+        """ return name of the longest subnet matching the provided integer address or None if the
+            address is not within any subnet on the bd
+        """
+        for (smask, networks) in (self.ipv6 if ipv6 else self.ipv4):
+            name = networks.get(addr & smask, None)
+            if name is not None:
+                return name
+        return None
+
+class sharedCache(object):
+    """ read-through cache shared by all worker processes for a single fabric. Objects are stored
+        as json in a redis hash per collection keyed by the same key string as the local hitCache.
+        The hash name includes a version number for the collection:
+            <prefix>.<fabric>.<collection>.<version>
+
+        Any process updating a collection calls sharedCache.invalidate to increment the version
+        before sending the flush so the stale hash is no longer referenced.  Workers learn the new
+        version from the flush message, or read the current version from redis on the next lookup
+        if the flush did not include one.
+    """
+    COLLECTIONS = [
+        eptNode._classname,
+        eptTunnel._classname,
+        eptVpc._classname,
+        eptPc._classname,
+        eptVnid._classname,
+        eptEpg._classname,
+    ]
+
+    def __init__(self, fabric, redis, ttl=SHARED_CACHE_TTL):
+        self.fabric = fabric
+        self.redis = redis
+        self.ttl = ttl
+        self.versions = {}
+        self.hit_count = 0
+        self.miss_count = 0
+        self.error_count = 0
+
+    @staticmethod
+    def get_version_key(fabric, collection_name):
+        return "%s.%s.%s.ver" % (SHARED_CACHE_PREFIX, fabric, collection_name)
+
+    @staticmethod
+    def invalidate(redis, fabric, collection_name):
+        """ increment version for collection so all current entries are invalidated. Return the
+            new version or None if not a shared collection or an error occurred
+        """
+        if collection_name not in sharedCache.COLLECTIONS:
+            return None
+        try:
+            return redis.incr(sharedCache.get_version_key(fabric, collection_name))
+        except Exception as e:
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            logger.warn("failed to invalidate shared cache %s: %s", collection_name, e)
+        return None
+
+    def set_version(self, collection_name, version=None):
+        """ set current version for collection. If version is None then version is read from redis
+            on next lookup
+        """
+        if version is None:
+            self.versions.pop(collection_name, None)
+        else:
+            self.versions[collection_name] = version
+
+    def get_key(self, collection_name):
+        """ return name of redis hash for current version of collection """
+        version = self.versions.get(collection_name, None)
+        if version is None:
+            version = self.redis.get(sharedCache.get_version_key(self.fabric, collection_name))
+            version = int(version) if version is not None else 0
+            self.versions[collection_name] = version
+        return "%s.%s.%s.%s" % (SHARED_CACHE_PREFIX, self.fabric, collection_name, version)
+
+    def get(self, eptObject, keystr):
+        """ return list of eptObjects for keystr or None if not found or an error occurred """
+        try:
+            data = self.redis.hget(self.get_key(eptObject._classname), keystr)
+            if data is None:
+                self.miss_count+= 1
+                return None
+            objs = []
+            for js in json.loads(data):
+                obj = eptObject(**js)
+                obj._exists = True
+                objs.append(obj)
+            self.hit_count+= 1
+            return objs
+        except Exception as e:
+            self.error_count+= 1
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            logger.warn("failed to read %s from shared cache: %s", eptObject._classname, e)
+        return None
+
+    def set(self, eptObject, keystr, objs):
+        """ add list of eptObjects to shared cache for keystr """
+        try:
+            key = self.get_key(eptObject._classname)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(key, keystr, json.dumps([o.to_json() for o in objs]))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self.error_count+= 1
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            logger.warn("failed to add %s to shared cache: %s", eptObject._classname, e)
 
 class hitCacheNotFound(object):
     """ when searching for an object within hitCache and the corresponding name or key is not found,
@@ -396,14 +637,28 @@ class hitCache(object):
         provide a callback function that receives val of evicted object to get perform additional
         logic on cache eviction (i.e., cache write back logic). callback must accept single argument
         which is value of object evicted
+
+        provide a list of tags (attribute names) to maintain a secondary index of nodes per tag
+        value.  For example, tags=["bd"] allows remove_tag("bd", 1) to remove every node whose val
+        (or any object within a list val) has bd attribute of 1 without walking the full list.
+
+        provide max_memory in bytes to also evict nodes when the approximate memory footprint of
+        the cached objects exceeds the limit.  The footprint is only calculated when max_memory is
+        enabled.
     """
-    def __init__(self, max_size, callback=None):
+    def __init__(self, max_size, callback=None, tags=None, max_memory=0):
         self.head = None
         self.tail = None
         self.max_size = max_size
+        self.max_memory = max_memory
+        self.memory = 0
         self.key_hash = {}
         self.name_hash = {}
         self.none_hash = {}     # objects with no name set (cached 'not found' objects)
+        self.tags = tags if tags is not None else []
+        self.tag_hash = {}      # tag_hash[tag][tag_value][key] = node
+        for tag in self.tags:
+            self.tag_hash[tag] = {}
         self.hit_count = 0
         self.miss_count = 0
         self.evict_count = 0
@@ -437,10 +692,31 @@ class hitCache(object):
         self.key_hash = {}
         self.name_hash = {}
         self.none_hash = {}
+        for tag in self.tags:
+            self.tag_hash[tag] = {}
         self.head = None
         self.tail = None
+        self.memory = 0
         self.flush_count+= 1
 
+    def resize(self, max_size, max_memory=0):
+        """ update max_size and max_memory of the cache, evicting nodes if the cache now exceeds
+            either limit.
+        """
+        if max_memory > 0 and self.max_memory <= 0:
+            # memory not previously tracked so need to calculate footprint for all nodes
+            self.memory = 0
+            for node in self.get_node_list():
+                node.size = get_approx_size(node.val)
+                self.memory+= node.size
+        elif max_memory <= 0:
+            self.memory = 0
+            for node in self.get_node_list():
+                node.size = 0
+        self.max_size = max_size
+        self.max_memory = max_memory
+        self._evict()
+
     def get_size(self):
         """ get number of nodes currently in cached linked list """
         return len(self.key_hash)
@@ -464,6 +740,15 @@ class hitCache(object):
         self.miss_count+= 1
         return hitCacheNotFound()
 
+    def peek(self, key):
+        """ return val for key without triggering a hit or updating counters. return
+            hitCacheNotFound object if not found
+        """
+        node = self.key_hash.get(key, None)
+        if node is None:
+            return hitCacheNotFound()
+        return node.val
+
     def push(self, key, val):
         """ push a new or existing node to the top of the list. If the node already exists, then it
             is simply moved to the top of the list.
@@ -472,14 +757,19 @@ class hitCache(object):
         """
         node = None
         if key not in self.key_hash:
-            node = hitCacheNode(key, val)
+            node = hitCacheNode(key, val, tags=self.tags)
+            if self.max_memory > 0:
+                node.size = get_approx_size(val)
         else:
             node = self.key_hash[key]
             self._remove_node(node)
-        # unconditionally add back to key_hash and name hash
+        # unconditionally add back to key_hash, name hash, and tag hash
         self.key_hash[key] = node
+        self.memory+= node.size
         for name in node.name:
             self.name_hash[name] = node
+        for (tag, tag_val) in node.tags:
+            self.tag_hash[tag].setdefault(tag_val, {})[key] = node
         if node.val is None:
             self.none_hash[key] = node
 
@@ -490,17 +780,24 @@ class hitCache(object):
         else:
             self._set_node_child(node, self.head)
             self.head = node
-            if len(self.key_hash) > self.max_size:
-                self.evict_count+=1
-                if self.evict_callback is not None and self.tail is not None:
-                    try:
-                        self.evict_callback(self.tail.val)
-                    except Exception as e:
-                        logger.debug("Traceback:\n%s", traceback.format_exc())
-                        logger.warn("failed to execute cache evict callback: %s", e)
-                self._remove_node(self.tail)
-
-    def remove(self, key, name=False, preserve_none=False):
+            self._evict()
+
+    def _evict(self):
+        # evict nodes from the tail of the list while max_size or max_memory is exceeded, always
+        # leaving at least the head of the list
+        while self.tail is not None and self.tail != self.head and (
+            len(self.key_hash) > self.max_size or \
+            (self.max_memory > 0 and self.memory > self.max_memory)):
+            self.evict_count+=1
+            if self.evict_callback is not None:
+                try:
+                    self.evict_callback(self.tail.val)
+                except Exception as e:
+                    logger.debug("Traceback:\n%s", traceback.format_exc())
+                    logger.warn("failed to execute cache evict callback: %s", e)
+            self._remove_node(self.tail)
+
+    def remove(self, key, name=False, preserve_none=True):
         """ remove a key from linked list if found.  If name is set to True, then use name_hash as
             lookup for key. if preserve_none is set to false then all nodes in none_hash are also 
             removed.
@@ -514,12 +811,26 @@ class hitCache(object):
             self._remove_node(node)
             self.evict_count+=1
         if not preserve_none:
-            none_keys = self.none_hash.keys()
-            for k in none_keys:
-                node = self.none_hash.get(k, None)
-                if node is not None:
-                    self._remove_node(node)
-                    self.evict_count+=1
+            self.remove_none()
+
+    def remove_tag(self, tag, tag_val, preserve_none=True):
+        """ remove all nodes with provided value for tag.  This is O(nodes removed) using the
+            tag_hash.  If preserve_none is set to false then all nodes in none_hash are also removed.
+            return number of nodes removed
+        """
+        nodes = self.tag_hash.get(tag, {}).get(tag_val, {}).values()
+        for node in nodes:
+            self._remove_node(node)
+            self.evict_count+=1
+        if not preserve_none:
+            self.remove_none()
+        return len(nodes)
+
+    def remove_none(self):
+        """ remove all nodes in none_hash (cached 'not found' objects) """
+        for node in self.none_hash.values():
+            self._remove_node(node)
+            self.evict_count+=1
 
     def _set_node_child(self, node, child):
         # add a child to a specific node, updatoing tail pointer if needed
@@ -531,10 +842,17 @@ class hitCache(object):
 
     def _remove_node(self, node):
         # remove a node from linked list while maintaining head/tail pointers
-        self.key_hash.pop(node.key, None)
+        if self.key_hash.pop(node.key, None) is not None:
+            self.memory-= node.size
         self.none_hash.pop(node.key, None)
         for name in node.name:
             self.name_hash.pop(name, None)
+        for (tag, tag_val) in node.tags:
+            tagged = self.tag_hash[tag].get(tag_val, None)
+            if tagged is not None:
+                tagged.pop(node.key, None)
+                if len(tagged) == 0:
+                    self.tag_hash[tag].pop(tag_val, None)
         if self.head == node:
             self.head = node.child
         if self.tail == node:
@@ -547,22 +865,47 @@ class hitCache(object):
         node.parent = None
         node.child = None
 
+def get_approx_size(val):
+    """ return approximate memory footprint in bytes of a cached value. This includes the object,
+        its attribute dict, and each attribute or slot value (one level deep). For a list, the 
+        footprint is the size of the list and each object within the list.
+    """
+    if type(val) is list:
+        return sys.getsizeof(val) + sum([get_approx_size(v) for v in val])
+    size = sys.getsizeof(val)
+    attrs = getattr(val, "__dict__", None)
+    if attrs is not None:
+        size+= sys.getsizeof(attrs)
+        for k in attrs:
+            size+= sys.getsizeof(attrs[k])
+    for k in getattr(val, "__slots__", ()):
+        if hasattr(val, k):
+            size+= sys.getsizeof(getattr(val, k))
+    return size
+
 class hitCacheNode(object):
     """ individual hit node within hit node linked list """
-    def __init__(self, key, val):
+    def __init__(self, key, val, tags=None):
         self.key = key
         self.val = val
         self.parent = None
         self.child = None
         self.name = []      # one or more names representing this node (many-to-one relation)
+        self.tags = []      # one or more unique (tag, value) tuples used for tag_hash index
+        self.size = 0       # approximate memory footprint of val when tracked by hitCache
         # val is a single object or list of objects. Each object may have a name attribute which 
-        # needs to be added to name list
+        # needs to be added to name list along with any tag attribute that needs to be indexed
         if type(val) is list:
             for v in val:
                 if hasattr(v, "name"):
                     self.name.append(v.name)
         elif hasattr(val,"name"):
             self.name = [val.name]
+        if tags:
+            for v in (val if type(val) is list else [val]):
+                for tag in tags:
+                    if hasattr(v, tag) and (tag, getattr(v, tag)) not in self.tags:
+                        self.tags.append((tag, getattr(v, tag)))
 
     def __repr__(self):
         return " %s<-(%s.%s %s)->%s " % (
@@ -0,0 +1,266 @@
+
+from ... rest import Rest
+from ... rest import api_register
+from . ept_queue_stats import eptQueueStats
+
+import logging
+import time
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+stats_cache_meta = {
+    "timestamp": {
+        "type": float,
+        "description": "epoch timestamp when stats where collected",
+    },
+    "total_hit": {
+        "type": int,
+        "description": "total number of cache hits at time of collection",
+    },
+    "total_miss": {
+        "type": int,
+        "description": "total number of cache misses at time of collection",
+    },
+    "total_evict": {
+        "type": int,
+        "description": "total number of cache evictions at time of collection",
+    },
+    "total_flush": {
+        "type": int,
+        "description": "total number of full cache flushes at time of collection",
+    },
+    "hit": {
+        "type": int,
+        "description": "number of cache hits within interval",
+    },
+    "miss": {
+        "type": int,
+        "description": "number of cache misses within interval",
+    },
+    "evict": {
+        "type": int,
+        "description": "number of cache evictions within interval",
+    },
+    "flush": {
+        "type": int,
+        "description": "number of full cache flushes within interval",
+    },
+    "hit_ratio": {
+        "type": float,
+        "description": "ratio of hits to total lookups within interval (0 if no lookups)",
+    },
+    "size": {
+        "type": int,
+        "description": "number of objects in cache at time of collection",
+    },
+    "memory": {
+        "type": int,
+        "description": """approximate memory footprint in bytes of objects in cache at time of
+            collection. This is only tracked when cache_max_memory is configured""",
+    },
+}
+
+@api_register(path="ept/cache")
+class eptCacheStats(Rest):
+    """ historical statistics for the lookup caches maintained by each worker process per fabric.
+        Each worker tracks hit, miss, eviction, and flush counters per cache which are collected on
+        the same intervals as eptQueueStats.  This is useful to understand if the configured cache
+        sizes are sufficient for the fabric.
+    """
+
+    META_ACCESS = {
+        "create": False,
+        "read": True,
+        "update": False,
+        "delete": False,
+    }
+
+    META = {
+        "proc": {
+            "type": str,
+            "key": True,
+            "key_index": 0,
+            "description": "worker process identifier"
+        },
+        "fabric": {
+            "type": str,
+            "key": True,
+            "key_index": 1,
+            "description": "fabric identifier"
+        },
+        "cache": {
+            "type": str,
+            "key": True,
+            "key_index": 2,
+            "description": "cache name"
+        },
+        "start_timestamp": {
+            "type": float,
+            "description": "epoch timestamp when process last restarted",
+        },
+        "total_hit": {
+            "type": int,
+            "description": """
+            total number of cache hits since uptime of the process. Note these counters are reset
+            if process is restarted.
+            """,
+        },
+        "total_miss": {
+            "type": int,
+            "description": """
+            total number of cache misses since uptime of the process. Note these counters are reset
+            if process is restarted.
+            """,
+        },
+        "total_evict": {
+            "type": int,
+            "description": "total number of cache evictions since uptime of the process",
+        },
+        "total_flush": {
+            "type": int,
+            "description": "total number of full cache flushes since uptime of the process",
+        },
+        "hit_ratio": {
+            "type": float,
+            "description": "ratio of hits to total lookups since uptime of the process",
+        },
+        "size": {
+            "type": int,
+            "description": "number of objects in cache at time of last collection",
+        },
+        "max_size": {
+            "type": int,
+            "description": "configured maximum number of objects in cache",
+        },
+        "memory": {
+            "type": int,
+            "description": "approximate memory footprint in bytes at time of last collection",
+        },
+        "max_memory": {
+            "type": int,
+            "description": "configured maximum memory footprint in bytes (0 is unlimited)",
+        },
+        "stats_1min": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            1 min interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+        "stats_5min": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            5 min interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+        "stats_15min": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            15 min interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+        "stats_1hour": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            1 hour interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+        "stats_1day": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            1 day interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+        "stats_1week": {
+            "type": list,
+            "subtype": dict,
+            "description": """
+            1 week interval statistics for this cache with most recent events at the top of the list
+            """,
+            "meta": stats_cache_meta,
+        },
+    }
+
+    def init_cache(self):
+        # initialize counters (which occurs anytime corresponding process restarts)
+        logger.debug("initialize cache stats: %s, %s, %s", self.proc, self.fabric, self.cache)
+        self.start_timestamp = time.time()
+        self.total_hit = 0
+        self.total_miss = 0
+        self.total_evict = 0
+        self.total_flush = 0
+        self.save(refresh=True)
+        # hitCache counters at last collection used to calculate delta since the cache object
+        # itself may be recreated (and counters reset) on fabric restart
+        self.last_counters = (0, 0, 0, 0)
+
+    def collect(self, cache):
+        """ add counters from provided hitCache to totals and push stats to historical list """
+        counters = (cache.hit_count, cache.miss_count, cache.evict_count, cache.flush_count)
+        delta = []
+        for i, c in enumerate(counters):
+            # a counter lower than the previous collection indicates the cache was recreated
+            if c >= self.last_counters[i]:
+                delta.append(c - self.last_counters[i])
+            else:
+                delta.append(c)
+        self.last_counters = counters
+        total_hit = self.total_hit + delta[0]
+        total_miss = self.total_miss + delta[1]
+        total_evict = self.total_evict + delta[2]
+        total_flush = self.total_flush + delta[3]
+
+        # refresh state from db and calculate stats for each measurement inteval
+        self.reload()
+        ts = time.time()
+        for (stat_name, interval, stats_slice) in eptQueueStats.INTERVALS:
+            stats = getattr(self, stat_name)
+            if ts - self.start_timestamp > interval and \
+                (len(stats)==0 or ts - stats[0]["timestamp"] >= interval):
+                record = {
+                    "timestamp": ts,
+                    "total_hit": total_hit,
+                    "total_miss": total_miss,
+                    "total_evict": total_evict,
+                    "total_flush": total_flush,
+                    "hit": total_hit,
+                    "miss": total_miss,
+                    "evict": total_evict,
+                    "flush": total_flush,
+                    "hit_ratio": 0,
+                    "size": cache.get_size(),
+                    "memory": cache.memory,
+                }
+                if len(stats) > 0:
+                    record["hit"] = abs(total_hit - stats[0]["total_hit"])
+                    record["miss"] = abs(total_miss - stats[0]["total_miss"])
+                    record["evict"] = abs(total_evict - stats[0]["total_evict"])
+                    record["flush"] = abs(total_flush - stats[0]["total_flush"])
+                if record["hit"] + record["miss"] > 0:
+                    record["hit_ratio"] = float(record["hit"]) / (record["hit"] + record["miss"])
+                stats.insert(0, record)
+                setattr(self, stat_name, stats[0:stats_slice])
+
+        # save db update
+        self.total_hit = total_hit
+        self.total_miss = total_miss
+        self.total_evict = total_evict
+        self.total_flush = total_flush
+        self.hit_ratio = 0
+        if total_hit + total_miss > 0:
+            self.hit_ratio = float(total_hit) / (total_hit + total_miss)
+        self.size = cache.get_size()
+        self.max_size = cache.max_size
+        self.memory = cache.memory
+        self.max_memory = cache.max_memory
+        self.save(refresh=False)
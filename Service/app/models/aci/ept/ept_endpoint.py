@@ -7,11 +7,13 @@ from .. utils import clear_endpoint
 from . common import common_event_attribute
 from . common import get_mac_value
 from . common import get_msg_hash
+from . common import get_worker_index
 from . common import parse_vrf_name
 from . common import subscriber_op
 from . ept_history import eptHistory
 from . ept_move import eptMove
 from . ept_msg import MSG_TYPE
+from . ept_msg import WORKER_QUEUE_HIGH
 from . ept_msg import WORK_TYPE
 from . ept_msg import eptMsgWorkEpmEvent
 from . ept_node import eptNode
@@ -24,8 +26,10 @@ from flask import abort
 from flask import jsonify
 
 import logging
+import re
 import threading
 import time
+import traceback
 
 # module level logging
 logger = logging.getLogger(__name__)
@@ -193,12 +197,17 @@ class eptEndpoint(Rest):
             "reference": True,
             "type": int,
             "min": 1,
-            "description": "total number of workers when calculating worker index",
+            "description": "number of workers assumed when the active workers cannot be read",
         },
         "worker_index": {
             "reference": True,
             "type": int,
-            "description": "worker index which is simply hash modulo worker_count",
+            "description": "index of the owning worker within the active workers sorted by id",
+        },
+        "worker": {
+            "reference": True,
+            "type": str,
+            "description": "worker id of the active worker that owns this endpoint",
         },
     }
 
@@ -237,7 +246,7 @@ class eptEndpoint(Rest):
     @api_route(path="delete", methods=["DELETE"], swag_ret=["success"])
     def delete_endpoint(self):
         """ delete endpoint and all historical data from database """
-        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.DELETE_EPT, qnum=0, data={
+        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.DELETE_EPT, WORKER_QUEUE_HIGH, data={
                 "addr": self.addr,
                 "vnid": self.vnid,
                 "type": self.type,
@@ -256,7 +265,7 @@ class eptEndpoint(Rest):
     @api_route(path="refresh", methods=["POST"], swag_ret=["success"])
     def refresh_endpoint(self):
         """ force endpoint refresh by querying APIC epmDb to get current state of endpoint """
-        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.REFRESH_EPT, qnum=0, data={
+        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.REFRESH_EPT, WORKER_QUEUE_HIGH, data={
                 "addr": self.addr,
                 "vnid": self.vnid,
                 "type": self.type,
@@ -397,9 +406,15 @@ class eptEndpoint(Rest):
             "error": ". ".join(error_rows)
         })
 
-    @api_route(path="hash", methods=["POST"], swag_ret=["hash", "worker_index"])
+    @api_route(path="hash", methods=["POST"], 
+            swag_ret=["hash", "worker_index", "worker", "worker_count"])
     def get_worker_hash(self, worker_count=10):
-        """ calculate and return worker hash integer for this endpoint """
+        """ calculate and return worker hash integer for this endpoint along with the active worker
+            that owns the endpoint. If the active workers cannot be read from the manager, then
+            worker_count workers with ids w0 through w<worker_count-1> are assumed.
+        """
+        # on-demand import of AppStatus only at api call (prevents circular imports)
+        from ... app_status import AppStatus
         # need a dummy eptMsgWorkEpmEvent to send through calculation
         data = {"vnid": self.vnid}
         if self.type == "mac":
@@ -408,11 +423,33 @@ class eptEndpoint(Rest):
         else:
             wt = WORK_TYPE.EPM_IP_EVENT
             data["type"] = "ip"
-        _hash = get_msg_hash(eptMsgWorkEpmEvent(self.addr, "worker", data, wt))
-        return jsonify({"hash": _hash, "worker_index": _hash % worker_count})
+        _hash = get_msg_hash(eptMsgWorkEpmEvent(self.addr, "worker", data, wt, WORKER_QUEUE_HIGH))
+        # use the active workers from the manager sorted by id the same as the manager
+        workers = []
+        try:
+            workers = [w["worker_id"] for w in AppStatus.check_manager_status()["workers"]
+                        if w.get("role", None) == "worker" and w.get("active", False)]
+        except Exception as e:
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            logger.warn("failed to get active workers from manager: %s", e)
+        if len(workers) > 0:
+            workers = sorted(workers, key=lambda w: int(re.sub("[^0-9]", "", w)))
+        else:
+            logger.debug("no active workers from manager, assuming %s workers", worker_count)
+            workers = ["w%s" % i for i in range(0, worker_count)]
+        index = get_worker_index(_hash, workers)
+        return jsonify({
+            "hash": _hash,
+            "worker_index": index,
+            "worker": workers[index],
+            "worker_count": len(workers),
+        })
 
 class eptEndpointEvent(object):
     # status will only be created or deleted, used for easy detection of deleted endpoints.
+    __slots__ = ("ts", "node", "pod", "status", "intf_id", "intf_name", "pctag", "encap", "rw_mac",
+                "rw_bd", "epg_name", "vnid_name")
+
     def __init__(self, **kwargs):
         self.ts = kwargs.get("ts", 0)
         self.node = kwargs.get("node", 0)
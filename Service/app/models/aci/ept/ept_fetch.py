@@ -0,0 +1,151 @@
+
+from .. utils import get_apic_session
+from .. utils import get_node_class
+
+from . common import BUILD_FETCH_CONCURRENCY
+from . common import BUILD_FETCH_MAX_RETRIES
+from . common import MAX_SEND_MSG_LENGTH
+
+from six.moves.queue import Empty
+from six.moves.queue import Queue
+
+import logging
+import threading
+import traceback
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+# marker added to result queue when a fetch thread has completed
+FETCH_COMPLETE = "complete"
+
+class eptEpmFetcher(object):
+    """ parallel fetch of epm objects during initial endpoint build. Each epm class query is split
+        into node scoped queries that are executed by a bounded number of fetch threads, each with
+        a dedicated apic session spread across the available controllers. Parsed results are 
+        returned to the caller in pages so endpoint tracking and send_msg batching remain within
+        the subscriber thread.
+    """
+    def __init__(self, fabric, epm_parser, concurrency=BUILD_FETCH_CONCURRENCY,
+            max_retries=BUILD_FETCH_MAX_RETRIES, page_size=MAX_SEND_MSG_LENGTH):
+        self.fabric = fabric
+        self.epm_parser = epm_parser
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.page_size = page_size
+        self.sessions = []
+
+    def start(self):
+        """ create one session per fetch thread with round robin across configured apic and known
+            controllers. Return bool success if at least one session was created.
+        """
+        hostnames = [self.fabric.apic_hostname]
+        for h in self.fabric.controllers:
+            if h not in hostnames:
+                hostnames.append(h)
+        for i in xrange(0, self.concurrency):
+            session = get_apic_session(self.fabric, hostname=hostnames[i % len(hostnames)])
+            if session is None:
+                logger.warn("failed to create fetch session %s", i)
+                break
+            self.sessions.append(session)
+        logger.debug("started %s fetch sessions to %s", len(self.sessions),
+                ",".join([s.hostname for s in self.sessions]))
+        return len(self.sessions) > 0
+
+    def close(self):
+        """ close all fetch sessions """
+        for session in self.sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logger.debug("failed to close fetch session: %s", e)
+        self.sessions = []
+
+    def fetch(self, classname, nodes, ts, orderBy=None):
+        """ generator yielding lists of eptMsgWorkEpmEvent for classname across the provided list
+            of (pod_id, node_id) tuples. Results within a single node are in query order but pages
+            from different nodes are interleaved. A failed node query is retried from the start up
+            to max_retries times so objects from that node already returned may be returned again.
+            If the retries are exhausted then None is yielded and no further results are returned.
+        """
+        # each shard is (pod_id, node_id, attempt)
+        shards = Queue()
+        for (pod_id, node_id) in nodes:
+            shards.put((pod_id, node_id, 0))
+        # bound the number of parsed pages waiting on the subscriber
+        results = Queue(maxsize=2*len(self.sessions))
+        abort = threading.Event()
+        threads = []
+        for session in self.sessions[0:len(nodes)]:
+            t = threading.Thread(target=self._fetch_shards, 
+                    args=(session, classname, shards, results, abort, ts, orderBy))
+            t.name = "sub-fetch"
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        running = len(threads)
+        failed = False
+        try:
+            while running > 0:
+                page = results.get()
+                if page is FETCH_COMPLETE:
+                    running-= 1
+                elif page is None:
+                    failed = True
+                    abort.set()
+                elif not abort.is_set():
+                    yield page
+        finally:
+            # consume remaining results so fetch threads are not blocked on a full queue
+            abort.set()
+            while running > 0:
+                if results.get() is FETCH_COMPLETE:
+                    running-= 1
+        if failed:
+            yield None
+
+    def _fetch_shards(self, session, classname, shards, results, abort, ts, orderBy):
+        # fetch thread executing node scoped queries until no shards remain. A failed shard is
+        # requeued and picked up by the next available thread (including this one). The retry 
+        # restarts the node query from the first object since the order of objects may change
+        # between queries. Duplicate create msgs for objects already returned are harmless.
+        try:
+            while not abort.is_set():
+                try:
+                    (pod_id, node_id, attempt) = shards.get_nowait()
+                except Empty:
+                    return
+                attrs = []
+                success = True
+                for obj in get_node_class(session, pod_id, node_id, classname, stream=True, 
+                        orderBy=orderBy):
+                    if obj is None:
+                        success = False
+                        break
+                    if abort.is_set():
+                        return
+                    if classname in obj and "attributes" in obj[classname]:
+                        attrs.append(obj[classname]["attributes"])
+                        if len(attrs) >= self.page_size:
+                            results.put(self.epm_parser.parse_many(classname, attrs, ts))
+                            attrs = []
+                    else:
+                        logger.warn("invalid %s object: %s", classname, obj)
+                if success:
+                    if len(attrs) > 0:
+                        results.put(self.epm_parser.parse_many(classname, attrs, ts))
+                elif attempt < self.max_retries:
+                    logger.warn("failed to get %s data for node-%s, retrying", classname, node_id)
+                    shards.put((pod_id, node_id, attempt+1))
+                else:
+                    logger.warn("failed to get %s data for node-%s after %s attempts", classname, 
+                            node_id, attempt+1)
+                    results.put(None)
+                    return
+        except Exception as e:
+            logger.debug("Traceback:\n%s", traceback.format_exc())
+            logger.warn("failed to fetch %s: %s", classname, e)
+            results.put(None)
+        finally:
+            results.put(FETCH_COMPLETE)
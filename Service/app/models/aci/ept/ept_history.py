@@ -1,6 +1,7 @@
 from ...rest import Rest
 from ...rest import api_register
 from . common import common_event_attribute
+from . ept_msg import get_epm_flag_bits
 from . ept_stale import eptStaleEvent
 import logging
 
@@ -28,6 +29,7 @@ class eptHistory(Rest):
         "update": False,
         "delete": False,
         "db_index": ["addr", "vnid", "fabric", "node"],
+        "db_index2": ["fabric", "build_gen"],
         "db_shard_enable": True,
         "db_shard_index": ["addr"],
     }
@@ -102,6 +104,14 @@ class eptHistory(Rest):
             total count including the events that have wrapped.
             """,
         },
+        "build_gen": {
+            "type": int,
+            "default": 0,
+            "description": """
+            generation of the last endpoint build that returned this endpoint from the APIC. After 
+            each build, entries with an older generation are no longer in the fabric and deleted.
+            """,
+        },
         "events": {
             "type": list,
             "subtype": dict,
@@ -111,6 +121,12 @@ class eptHistory(Rest):
 
 
 class eptHistoryEvent(object):
+    """ single event within eptHistory events list. flag_bits is the bitmask for flags (see 
+        ept_msg.EPM_FLAGS) and is always updated when flags is set.
+    """
+    __slots__ = ("classname", "ts", "status", "remote", "pctag", "_flags", "flag_bits", 
+                "tunnel_flags", "encap", "intf_id", "intf_name", "epg_name", "vnid_name", "rw_mac",
+                "rw_bd", "watch_offsubnet_ts", "watch_stale_ts", "watch_stale_event")
 
     def __init__(self, **kwargs):
         self.classname = kwargs.get("classname", "")
@@ -141,6 +157,15 @@ class eptHistoryEvent(object):
                 self.tunnel_flags
             )
 
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = flags
+        self.flag_bits = get_epm_flag_bits(flags)
+
     def to_dict(self):
         """ convert object to dict for insertion into eptHistory events list """
         return {
@@ -176,7 +201,9 @@ class eptHistoryEvent(object):
         if msg.status != "deleted":
             event.remote = msg.remote
             event.pctag = msg.pcTag
-            event.flags = sorted(msg.flags)
+            # flag_bits is independent of order, copy from msg instead of recalculating
+            event._flags = sorted(msg.flags)
+            event.flag_bits = msg.flag_bits
             event.tunnel_flags = msg.tunnel_flags
             event.encap = msg.encap
             event.intf_id = msg.ifId
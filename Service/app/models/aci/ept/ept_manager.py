@@ -5,6 +5,7 @@ from .. fabric import Fabric
 from .. utils import raise_interrupt
 from .. utils import register_signal_handlers
 from .. utils import terminate_process
+from . common import FLUSH_QUEUE_CHUNK_SIZE
 from . common import HELLO_INTERVAL
 from . common import HELLO_TIMEOUT
 from . common import WATCHER_BROADCAST_CHANNEL
@@ -13,6 +14,9 @@ from . common import MANAGER_CTRL_CHANNEL
 from . common import MANAGER_CTRL_RESPONSE_CHANNEL
 from . common import MANAGER_WORK_QUEUE
 from . common import SEQUENCE_TIMEOUT
+from . common import SUBSCRIBER_CTRL_CHANNEL
+from . common import SUBSCRIBER_HOST
+from . common import SUBSCRIBER_HOST_START_TIMEOUT
 from . common import SUPPRESS_FABRIC_RESTART
 from . common import WORKER_CTRL_CHANNEL
 from . common import WORKER_UPDATE_INTERVAL
@@ -21,17 +25,24 @@ from . common import db_alive
 from . common import flush_queue
 from . common import get_msg_hash
 from . common import get_queue_length
+from . common import get_random_sequence
+from . common import get_worker_index
 from . common import log_version
 from . common import wait_for_db
 from . common import wait_for_redis
 from . ept_msg import MSG_TYPE
 from . ept_msg import WORK_TYPE
+from . ept_msg import WIRE_VERSION
+from . ept_msg import WIRE_VERSION_JSON
 from . ept_msg import eptMsg
 from . ept_msg import eptMsgBulk
 from . ept_msg import eptMsgHello
+from . ept_msg import eptMsgSubOp
 from . ept_queue_stats import eptQueueStats
 from . ept_subscriber import eptSubscriber
+from . ept_subscriber_host import eptSubscriberHost
 from multiprocessing import Process
+from redis.exceptions import ResponseError
 
 import logging
 import re
@@ -58,6 +69,7 @@ class eptManager(object):
         self.db = get_db(uniq=True, overwrite_global=True, write_concern=True)
         self.redis = get_redis()
         self.fabrics = {}               # running fabrics indexed by fabric name
+        self.subscriber_host = None     # shared subscriber process when SUBSCRIBER_HOST is enabled
         self.subscribe_thread = None
         self.stats_thread = None
         self.worker_tracker = None
@@ -105,8 +117,10 @@ class eptManager(object):
         if self.subscribe_thread is not None:
             self.subscribe_thread.stop()
         for f, fab in self.fabrics.items():
-            if fab["process"] is not None:
+            if fab["process"] is not None and fab["process"] is not self.subscriber_host:
                 terminate_process(fab["process"])
+        if self.subscriber_host is not None:
+            terminate_process(self.subscriber_host)
         if self.db is not None:
             self.db.client.close()
         if self.redis is not None and self.redis.connection_pool is not None:
@@ -252,12 +266,14 @@ class eptManager(object):
                               skip_suppress=True)
 
         elif msg.msg_type == MSG_TYPE.GET_WORKER_HASH:
-            # requires addr field only and returns hash, index, and selected worker
+            # requires addr field with optional vnid and type, returns hash, index, and selected
+            # worker using the same calculation as subscriber send_msg
             if "addr" in msg.data:
-                if "worker" in self.worker_tracker.active_workers:
-                    _hash = sum(ord(i) for i in msg.data["addr"])
-                    index = _hash % len(self.worker_tracker.active_workers["worker"])
-                    worker = self.worker_tracker.active_workers["worker"][index]
+                workers = self.worker_tracker.active_workers.get("worker", [])
+                if len(workers) > 0:
+                    _hash = get_msg_hash(eptMsgSubOp(MSG_TYPE.GET_WORKER_HASH, data=msg.data))
+                    index = get_worker_index(_hash, workers)
+                    worker = workers[index]
                     data = {
                         "addr": msg.data["addr"],
                         "hash": _hash,
@@ -369,11 +385,20 @@ class eptManager(object):
                     return False
 
                 f.add_fabric_event("starting", reason)
-                sub = eptSubscriber(f, active_workers=self.worker_tracker.active_workers)
-                self.fabrics[fabric]["subscriber"] = sub
-                self.fabrics[fabric]["process"] = Process(target=sub.run)
-                self.fabrics[fabric]["process"].daemon = True
-                self.fabrics[fabric]["process"].start()
+                if SUBSCRIBER_HOST:
+                    host = self.get_subscriber_host()
+                    if host is None:
+                        f.add_fabric_event("failed", "subscriber host process failed to start")
+                        self.fabrics[fabric]["waiting_for_retry"] = True
+                        return False
+                    self.fabrics[fabric]["process"] = host
+                    self.publish_subscriber_host_ctrl(MSG_TYPE.FABRIC_START, fabric)
+                else:
+                    sub = eptSubscriber(f, active_workers=self.worker_tracker.active_workers)
+                    self.fabrics[fabric]["subscriber"] = sub
+                    self.fabrics[fabric]["process"] = Process(target=sub.run)
+                    self.fabrics[fabric]["process"].daemon = True
+                    self.fabrics[fabric]["process"].start()
                 self.fabrics[fabric]["waiting_for_retry"] = False
                 # save start time to fabric object to suppress rapid restarts
                 start_ts = time.time()
@@ -423,7 +448,11 @@ class eptManager(object):
             # to prevent race condition with check_fabric_process, go ahead and pop fabric from
             # self.fabrics before terminating and we can add it back if needed
             fab = self.fabrics.pop(fabric)
-            terminate_process(fab["process"])
+            if fab["process"] is self.subscriber_host:
+                # only stop this fabric within shared subscriber process
+                self.publish_subscriber_host_ctrl(MSG_TYPE.FABRIC_STOP, fabric)
+            else:
+                terminate_process(fab["process"])
             fab["process"] = None
             # need to force all workers to flush their caches for this fabric AND flush their work
             # queue for this fabric. There is an optimization we can make for the latter operation,
@@ -457,6 +486,39 @@ class eptManager(object):
             tmp.start()
             return True
 
+    def get_subscriber_host(self):
+        """ return shared subscriber host process, starting it if not currently running. Return
+            None if the host fails to start listening within SUBSCRIBER_HOST_START_TIMEOUT.
+        """
+        if self.subscriber_host is not None and self.subscriber_host.is_alive():
+            return self.subscriber_host
+        if self.subscriber_host is not None:
+            logger.warn("subscriber host process is no longer running, restarting")
+        host = eptSubscriberHost()
+        p = Process(target=host.run)
+        p.daemon = True
+        p.start()
+        if not host.ready.wait(SUBSCRIBER_HOST_START_TIMEOUT):
+            logger.warn("timeout waiting for subscriber host process to start")
+            terminate_process(p)
+            self.subscriber_host = None
+            return None
+        self.subscriber_host = p
+        return p
+
+    def publish_subscriber_host_ctrl(self, msg_type, fabric):
+        """ send FABRIC_START or FABRIC_STOP to shared subscriber host process. The start includes
+            the current list of active workers for the new subscriber.
+        """
+        data = {"fabric": fabric}
+        if msg_type == MSG_TYPE.FABRIC_START:
+            workers = []
+            for role in self.worker_tracker.active_workers:
+                workers.extend([w.to_json() for w in self.worker_tracker.active_workers[role]])
+            data["workers"] = workers
+        self.redis.publish(SUBSCRIBER_CTRL_CHANNEL, eptMsg(msg_type, data=data).jsonify())
+        self.increment_stats(SUBSCRIBER_CTRL_CHANNEL, tx=True)
+
     def check_fabric_processes(self):
         # check if each running fabric is still running. If not attempt to restart process
         # triggered by worker_tracker thread at WORKER_UDPATE_INTERVAL interval
@@ -517,6 +579,8 @@ class WorkerTracker(object):
         self.known_subscribers = {} # indexed by fabric-id
         self.known_workers = {}     # indexed by worker_id
         self.active_workers = {}    # list of active workers indexed by role
+        self.retired_workers = {}   # removed workers with queues that may still receive work from
+                                    # subscribers that have not yet received a worker update
         self.watcher_broadcast_seq = 0
         self.worker_broadcast_seq = 0
         self.update_interval = WORKER_UPDATE_INTERVAL # interval to check for new/expired workers
@@ -553,11 +617,14 @@ class WorkerTracker(object):
                 logger.warn("invalid worker, no available work queues: %s", hello)
                 return
             self.known_workers[hello.worker_id] = TrackedWorker(hello.worker_id)
+            # worker queues are owned by the new worker if previously retired
+            self.retired_workers.pop(hello.worker_id, None)
             self.known_workers[hello.worker_id].role = hello.role
             self.known_workers[hello.worker_id].start_time = hello.start_time
             self.known_workers[hello.worker_id].queues = hello.queues
             self.known_workers[hello.worker_id].last_hello = time.time()
             self.known_workers[hello.worker_id].hello_seq = hello.seq
+            self.known_workers[hello.worker_id].wire = min(hello.wire, WIRE_VERSION)
             for q in hello.queues:
                 self.known_workers[hello.worker_id].last_seq.append(0)
                 self.known_workers[hello.worker_id].last_head.append(0)
@@ -621,26 +688,28 @@ class WorkerTracker(object):
             if w.role in self.active_workers and w in self.active_workers[w.role]:
                 logger.debug("removing worker from active_workers[%s]: %s", w.role, w)
                 self.active_workers[w.role].remove(w)
-
-            # TODO, rebalance work for this worker to a new worker - for now flush and restart
-            for i, q in enumerate(w.queues):
-                logger.debug("deleting work from queue: %s", q)
-                with w.queue_locks[i]:
-                    self.redis.delete(q)
-
-        # if a worker has died or new worker comes online, then trigger monitor restart
-        stop_message = None
-        if len(new_workers)>0: 
-            stop_message = "[%s]" % ", ".join([w.worker_id for w in new_workers])
-            stop_message = "new worker detected %s" % stop_message
-        elif len(remove_workers)>0:
+            self.retired_workers[w.worker_id] = w
+
+        # workers are assigned via rendezvous hash so a new or removed worker only changes the
+        # assignment of ~1/N endpoints. Instead of restarting each fabric, the new list of active
+        # workers is published to all subscribers and pending work from removed workers is handed
+        # off to the new owner.
+        if len(new_workers) > 0 or len(remove_workers) > 0:
+            logger.info("total workers: %s, new: [%s], removed: [%s]", len(self.known_workers),
+                ",".join([w.worker_id for w in new_workers]),
+                ",".join([w.worker_id for w in remove_workers]))
+        # if there are no longer enough workers then stop fabric (manager will restart when ready)
+        if len(remove_workers) > 0 and not self.manager.minimum_workers_ready():
             stop_message = "[%s]" % ", ".join([w.worker_id for w in remove_workers])
             stop_message = "worker heartbeat timeout %s" % stop_message
-        if stop_message is not None:
-            logger.info("total workers: %s", len(self.known_workers))
-            # stop fabric (manager will restart when ready)
             for f in self.manager.fabrics.keys():
                 self.manager.stop_fabric(f, reason=stop_message)
+        # worker update is published at each interval to sync subscribers that were initializing
+        # and not listening on the subscriber channel when the workers changed
+        self.publish_worker_update()
+        # handoff any work enqueued on removed worker queues
+        for wid, w in self.retired_workers.items():
+            self.handoff_queues(w)
 
         # check hello from each subscriber. If any have timedout, set to inactive (manager func 
         # will restart any subscribers that are inactive)
@@ -653,10 +722,60 @@ class WorkerTracker(object):
         # trigger manager fabric processes check
         self.manager.check_fabric_processes()
 
-    def send_bulk(self, msgs):
+    def publish_worker_update(self):
+        """ publish list of active workers to all subscribers """
+        workers = []
+        for role in self.active_workers:
+            workers.extend([w.to_json() for w in self.active_workers[role]])
+        self.redis.publish(SUBSCRIBER_CTRL_CHANNEL, eptMsg(MSG_TYPE.WORKER_UPDATE, data={
+            "workers": workers
+        }).jsonify())
+        self.manager.increment_stats(SUBSCRIBER_CTRL_CHANNEL, tx=True)
+
+    def handoff_queues(self, w):
+        """ re-dispatch all work pending on the queues of a removed worker to the active workers.
+            The queue is atomically renamed so late producers are not blocked, and the messages are
+            pushed to the head of the new owner queues (oldest first) so they are processed before
+            any newer events for the same endpoint.
+        """
+        for i, q in enumerate(w.queues):
+            tmp = "%s.handoff.%s" % (q, get_random_sequence())
+            try:
+                with w.queue_locks[i]:
+                    self.redis.rename(q, tmp)
+            except ResponseError as e:
+                # rename fails if q does not exist (empty queue)
+                continue
+            total = self.redis.llen(tmp)
+            logger.info("handoff %s messages from queue %s (worker %s)", total, q, w.worker_id)
+            # each chunk is prepended so need to start with the last chunk in the queue
+            offset = total - total % FLUSH_QUEUE_CHUNK_SIZE
+            if offset == total:
+                offset-= FLUSH_QUEUE_CHUNK_SIZE
+            while offset >= 0:
+                bulk = []
+                for data in self.redis.lrange(tmp, offset, offset + FLUSH_QUEUE_CHUNK_SIZE - 1):
+                    try:
+                        msg = eptMsg.parse(data)
+                        msg_list = msg.msgs if msg.msg_type == MSG_TYPE.BULK else [msg]
+                        for m in msg_list:
+                            # only work messages are handed off (FABRIC_START/STOP are per worker)
+                            if m.msg_type == MSG_TYPE.WORK:
+                                bulk.append((get_msg_hash(m), m))
+                    except Exception as e:
+                        logger.debug("failed to parse message from q: %s, data: %s", q, data)
+                        logger.error("Traceback:\n%s", traceback.format_exc())
+                if len(bulk) > 0:
+                    self.send_bulk(bulk, prepend=True)
+                offset-= FLUSH_QUEUE_CHUNK_SIZE
+            self.redis.delete(tmp)
+
+    def send_bulk(self, msgs, prepend=False):
         """ receive list of tuples (_hash, msg) and enqueue to an available worker. 
             Each msg in bulk list must be of type eptMsgWork.  This will create sub bulk messages to
             reduce the blocking IO for redis calls.
+            When prepend is set to True, a lpush is executed instead of rpush to force the messages
+            to the top of the queue.
             return boolean success
         """
         all_success = True
@@ -666,7 +785,7 @@ class WorkerTracker(object):
                 logger.warn("no available workers for role '%s'", msg.role)
                 all_success = False
             else:
-                index = _hash % len(self.active_workers[msg.role])
+                index = get_worker_index(_hash, self.active_workers[msg.role])
                 worker = self.active_workers[msg.role][index]
                 if msg.qnum >= len(worker.queues):
                     logger.warn("unable to enqueue work on worker %s, queue %s does not exist", 
@@ -690,12 +809,17 @@ class WorkerTracker(object):
                 # if there's only one message, then send that single message instead of bulk format
                 if len(tx_msg.msgs) == 1:
                     tx_msg = tx_msg.msgs[0]
+                    data = tx_msg.jsonify()
                 else:
                     tx_msg.seq = tx_msg.msgs[-1].seq
+                    data = tx_msg.jsonify(wire=worker.wire)
                 with worker.queue_locks[qnum]:
                     try:
                         #logger.debug("enqueue %s: %s", worker.queues[qnum], tx_msg)
-                        self.redis.rpush(worker.queues[qnum], tx_msg.jsonify())
+                        if prepend:
+                            self.redis.lpush(worker.queues[qnum], data)
+                        else:
+                            self.redis.rpush(worker.queues[qnum], data)
                     except Exception as e:
                         logger.error("failed to enqueue msg on queue %s: %s", worker.queues[qnum], 
                                         tx_msg)
@@ -735,40 +859,7 @@ class WorkerTracker(object):
 
     def flush_queue(self, fabric, q, lock=None):
         """ flush messages for provided fabric and redis queue """
-        logger.debug("flushing %s from queue %s", fabric, q)
-        # pull off all messages on the queue in single operation
-        pl = self.redis.pipeline()
-        pl.lrange(q, 0, -1)
-        pl.delete(q)
-        ret = []
-        repush = []
-        removed_count = 0
-        if lock is not None:
-            with lock: ret = pl.execute()
-        else:
-            ret = pl.execute()
-        # inspect each message and if matching fabric discard, else push back onto queue
-        if len(ret) > 0 and type(ret[0]) is list:
-            logger.debug("inspecting %s msg from queue %s", len(ret[0]), q)
-            for data in ret[0]:
-                # need to reparse message and check fabric
-                msg = eptMsg.parse(data) 
-                # for eptMsgBulk it is currently safe to assume if the first msg is our fabric
-                # then all messages will be our fabric
-                if msg.msg_type == MSG_TYPE.BULK and len(msg.msgs)>0 and \
-                    hasattr(msg.msgs[0], "fabric") and msg.msgs[0].fabric == fabric:
-                    removed_count+=len(msg.msgs)
-                elif hasattr(msg, "fabric") and msg.fabric == fabric:
-                    removed_count+=1
-                else:
-                    repush.append(data)
-            logger.debug("removed %s and repushing %s to queue %s",removed_count,len(repush),q)
-            if len(repush) > 0:
-                if lock is not None:
-                    with lock: self.redis.rpush(q, *repush)
-                else:
-                    self.redis.rpush(q, *repush)
-                logger.debug("repush completed")
+        flush_queue(self.redis, fabric, q, lock=lock)
 
     def flush_fabric(self, fabric):
         # flush local queues for provided fabric. Note, moved per-worker flush to each worker
@@ -799,10 +890,28 @@ class TrackedWorker(object):
         self.last_seq = []              # last seq enqueued on worker per queue
         self.last_head = []             # at time of last worker check, seq at head of queue
         self.last_head_check = 0        # timestamp of last head seq check
+        self.wire = WIRE_VERSION_JSON   # eptMsgBulk wire version supported by worker
 
     def __repr__(self):
         return "%s, role:%s, q:%s" % (self.worker_id,self.role,self.queues)
 
+    @staticmethod
+    def from_json(js):
+        # return TrackedWorker object from to_json dict with queue locks and seq initialized
+        w = TrackedWorker(js["worker_id"])
+        w.active = js.get("active", False)
+        w.queues = js.get("queues", [])
+        w.role = js.get("role", None)
+        w.start_time = js.get("start_time", 0)
+        w.hello_seq = js.get("hello_seq", 0)
+        w.last_hello = js.get("last_hello", 0)
+        w.wire = js.get("wire", WIRE_VERSION_JSON)
+        for q in w.queues:
+            w.last_seq.append(0)
+            w.last_head.append(0)
+            w.queue_locks.append(threading.Lock())
+        return w
+
     def to_json(self):
         return {
             "worker_id": self.worker_id,
@@ -812,6 +921,7 @@ class TrackedWorker(object):
             "start_time": self.start_time,
             "hello_seq": self.hello_seq,
             "last_hello": self.last_hello,
-            "last_seq": self.last_seq
+            "last_seq": self.last_seq,
+            "wire": self.wire,
         }
 
@@ -10,6 +10,75 @@ import time
 # module level logging
 logger = logging.getLogger(__name__)
 
+# wire format versions for eptMsgBulk sent to worker queues. Workers advertise the highest version
+# they support within eptMsgHello and the sender uses the lower of its own and the worker's version.
+#   1   json with each msg in the bulk encoded as a json string (double encoded)
+#   2   json with each msg embedded directly in the bulk and eptMsgWorkEpmEvent encoded as a
+#       positional list (see eptMsgWorkEpmEvent.compact)
+WIRE_VERSION_JSON   = 1
+WIRE_VERSION_COMPACT= 2
+WIRE_VERSION        = WIRE_VERSION_COMPACT
+
+# each worker listens on multiple queues with strict priority on the lowest queue index:
+#   high    refresh and delete requests from the user and control messages
+#   normal  live epm and std_mo events, watch events
+#   bulk    synthetic create/delete events from initial build of the endpoint db
+# live epm events received during a build are held by the subscriber until the build is complete so
+# they are never processed before older create/delete events for the same endpoint.
+# when processing an eptMsgBulk from a lower priority queue, the worker checks the higher priority
+# queues after every WORKER_QUEUE_PREEMPT_COUNT messages. If there is pending work then the remaining
+# messages are pushed back to the head of their queue so the higher priority work is handled first.
+WORKER_QUEUE_HIGH           = 0
+WORKER_QUEUE_NORMAL         = 1
+WORKER_QUEUE_BULK           = 2
+WORKER_QUEUE_COUNT          = 3
+WORKER_QUEUE_PREEMPT_COUNT  = 256
+
+# epm endpoint flags are received as a comma separated string and maintained as a list for the db
+# and wire format. Events also track the known flags as a bitmask (flag_bits) so membership checks 
+# on the hot path are a single bitwise and. Unknown flags are preserved in the list without a bit.
+EPM_FLAG_LOCAL              = 0x00000001
+EPM_FLAG_VPC_ATTACHED       = 0x00000002
+EPM_FLAG_PEER_ATTACHED      = 0x00000004
+EPM_FLAG_PEER_ATTACHED_RL   = 0x00000008
+EPM_FLAG_BOUNCE             = 0x00000010
+EPM_FLAG_BOUNCE_TO_PROXY    = 0x00000020
+EPM_FLAG_CACHED             = 0x00000040
+EPM_FLAG_VTEP               = 0x00000080
+EPM_FLAG_LOOPBACK           = 0x00000100
+EPM_FLAG_SVI                = 0x00000200
+EPM_FLAG_PSVI               = 0x00000400
+EPM_FLAG_STATIC             = 0x00000800
+EPM_FLAG_MAC                = 0x00001000
+EPM_FLAG_IP                 = 0x00002000
+EPM_FLAG_PEER_AGED          = 0x00004000
+EPM_FLAG_SPAN               = 0x00008000
+EPM_FLAGS = {
+    "local":                EPM_FLAG_LOCAL,
+    "vpc-attached":         EPM_FLAG_VPC_ATTACHED,
+    "peer-attached":        EPM_FLAG_PEER_ATTACHED,
+    "peer-attached-rl":     EPM_FLAG_PEER_ATTACHED_RL,
+    "bounce":               EPM_FLAG_BOUNCE,
+    "bounce-to-proxy":      EPM_FLAG_BOUNCE_TO_PROXY,
+    "cached":               EPM_FLAG_CACHED,
+    "vtep":                 EPM_FLAG_VTEP,
+    "loopback":             EPM_FLAG_LOOPBACK,
+    "svi":                  EPM_FLAG_SVI,
+    "psvi":                 EPM_FLAG_PSVI,
+    "static":               EPM_FLAG_STATIC,
+    "mac":                  EPM_FLAG_MAC,
+    "ip":                   EPM_FLAG_IP,
+    "peer-aged":            EPM_FLAG_PEER_AGED,
+    "span":                 EPM_FLAG_SPAN,
+}
+
+def get_epm_flag_bits(flags):
+    """ return bitmask for list of epm flags """
+    bits = 0
+    for f in flags:
+        bits|= EPM_FLAGS.get(f, 0)
+    return bits
+
 # static msg types to prevent duplicates
 @enum_unique
 class MSG_TYPE(Enum):
@@ -34,6 +103,11 @@ class MSG_TYPE(Enum):
     FABRIC_EPM_EOF_ACK  = "epm_eof_ack"     # sent from worker to subscriber on subscriber channel 
                                             # to indiciate reception/processing of work type
                                             # FABRIC_EPM_EOF.
+    WORKER_UPDATE       = "worker_update"   # sent from manager to subscribers with current list of
+                                            # active workers when workers are added or removed
+    WORKER_DRAIN_ACK    = "drain_ack"       # sent from worker to subscriber on subscriber channel
+                                            # to indicate reception/processing of work type
+                                            # WORKER_DRAIN.
 
 # static work types sent with MSG_TYPE.WORK
 @enum_unique
@@ -46,6 +120,7 @@ class WORK_TYPE(Enum):
     WATCH_OFFSUBNET     = "watch_offsubnet" # an offsubnet endpoint event requires watch or notify
     WATCH_RAPID         = "watch_rapid"     # rapid endpoint event requiring notify
     FLUSH_CACHE         = "flush_cache"     # flush cache for specific collection and/or dn
+    FLUSH_CACHE_BULK    = "flush_bulk"      # flush cache for list of collections and/or dns
     EPM_IP_EVENT        = "epm_ip "         # epmIpEp event
     EPM_MAC_EVENT       = "epm_mac"         # epmMacEp event
     EPM_RS_IP_EVENT     = "epmRsIp"         # epmRsMacEpToIpEpAtt event
@@ -57,6 +132,11 @@ class WORK_TYPE(Enum):
                                             # EPM event. In response workers send back 
     FABRIC_WATCH_PAUSE  = "watch_pause"     # sent from subscriber to watcher to pause watch execute
     FABRIC_WATCH_RESUME = "watch_resume"    # sent from subscriber to watcher to resume execute
+    MO_INDEX_RESET      = "mo_index_reset"  # sent from subscriber to watcher after mo rebuild to 
+                                            # reload the mo dependency index
+    WORKER_DRAIN        = "worker_drain"    # sent from subscriber to each existing worker queue 
+                                            # when active workers change. In response workers send
+                                            # back WORKER_DRAIN_ACK
 
 class eptMsg(object):
     """ generic ept job for messaging between workers 
@@ -67,28 +147,41 @@ class eptMsg(object):
         self.data = data
         self.seq = seq
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "data": self.data,
             "seq": self.seq,
-        })
+        }
 
     def __repr__(self):
         return "%s.0x%08x" % (self.msg_type.value, self.seq)
 
+    def jsonify(self):
+        """ jsonify for transport across messaging queue """
+        return json.dumps(self.to_msg_json())
+
+    def compact(self):
+        """ return msg as an object that can be embedded directly into a compact eptMsgBulk """
+        return self.to_msg_json()
+
     @staticmethod
     def parse(data, brief=False):
         # parse data received on message queue and return corresponding eptMsg
         # allow exception to raise on invalid data
-        js = json.loads(data)
+        return eptMsg.from_msg_json(json.loads(data), brief=brief)
+
+    @staticmethod
+    def from_msg_json(js, brief=False):
+        # return corresponding eptMsg from decoded msg js
         if js["msg_type"] == MSG_TYPE.WORK.value:
             return eptMsgWork.from_msg_json(js)
         elif js["msg_type"] == MSG_TYPE.HELLO.value:
             return eptMsgHello.from_msg_json(js)
         elif js["msg_type"] == MSG_TYPE.BULK.value:
-            return eptMsgBulk(MSG_TYPE.BULK, js["data"], js["seq"], brief=brief)
+            return eptMsgBulk(MSG_TYPE.BULK, js["data"], js["seq"], brief=brief, 
+                                wire=js.get("wire", WIRE_VERSION_JSON))
         elif js["msg_type"] == MSG_TYPE.REFRESH_EPT.value:
             return eptMsgSubOp(MSG_TYPE.REFRESH_EPT, js["data"], js["seq"])
         elif js["msg_type"] == MSG_TYPE.DELETE_EPT.value:
@@ -97,6 +190,8 @@ class eptMsg(object):
             return eptMsgSubOp(MSG_TYPE.SETTINGS_RELOAD, js["data"], js["seq"])
         elif js["msg_type"] == MSG_TYPE.FABRIC_EPM_EOF_ACK.value:
             return eptMsgSubOp(MSG_TYPE.FABRIC_EPM_EOF_ACK, js["data"], js["seq"])
+        elif js["msg_type"] == MSG_TYPE.WORKER_DRAIN_ACK.value:
+            return eptMsgSubOp(MSG_TYPE.WORKER_DRAIN_ACK, js["data"], js["seq"])
         return eptMsg(
                     MSG_TYPE(js["msg_type"]), 
                     data=js.get("data", {}),
@@ -105,26 +200,62 @@ class eptMsg(object):
 
 class eptMsgBulk(eptMsg):
     """ list of eptMsg objects that share a common destination and qnum """
-    def __init__(self, msg_type=MSG_TYPE.BULK, data={}, seq=1, brief=False):
+    def __init__(self, msg_type=MSG_TYPE.BULK, data={}, seq=1, brief=False, 
+                    wire=WIRE_VERSION_JSON):
         super(eptMsgBulk, self).__init__(msg_type, data, seq)
         self.msg_type = MSG_TYPE.BULK
-        self.msgs_count = 0
+        self.msg_count = 0
         self.msgs = []
-        # each msg in msgs should be of type eptMsg in jsonify format that needs to be parsed
+        # fabric is set in the bulk header only if all msgs in the bulk belong to the same fabric.
+        # This allows a brief parse to filter bulk msgs by fabric without parsing each msg.
+        self.fabric = data.get("fabric", None)
+        # for WIRE_VERSION_JSON each msg in msgs is an eptMsg in jsonify format that needs to be 
+        # parsed. For WIRE_VERSION_COMPACT each msg is either a compact eptMsgWorkEpmEvent list or
+        # an already decoded msg object.
         if "msgs" in data and len(data["msgs"])>0:
             self.msg_count = len(data["msgs"])
             if not brief:
-                for m in data["msgs"]:
-                    self.msgs.append(eptMsg.parse(m))
-
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
+                if wire >= WIRE_VERSION_COMPACT:
+                    for m in data["msgs"]:
+                        if isinstance(m, list):
+                            self.msgs.append(eptMsgWorkEpmEvent.from_compact(m))
+                        else:
+                            self.msgs.append(eptMsg.from_msg_json(m))
+                else:
+                    for m in data["msgs"]:
+                        self.msgs.append(eptMsg.parse(m))
+            elif self.fabric is None:
+                # older senders do not include fabric in the header, use the first msg which is
+                # the same behavior previously implemented by flush_queue
+                m = data["msgs"][0]
+                if wire >= WIRE_VERSION_COMPACT:
+                    if isinstance(m, list):
+                        m = eptMsgWorkEpmEvent.from_compact(m)
+                    else:
+                        m = eptMsg.from_msg_json(m)
+                else:
+                    m = eptMsg.parse(m)
+                self.fabric = getattr(m, "fabric", None)
+
+    def jsonify(self, wire=WIRE_VERSION_JSON):
+        """ jsonify for transport across messaging queue using requested wire version """
+        data = {}
+        fabrics = set([getattr(m, "fabric", None) for m in self.msgs])
+        if len(fabrics) == 1:
+            data["fabric"] = fabrics.pop()
+        if wire >= WIRE_VERSION_COMPACT:
+            data["msgs"] = [m.compact() for m in self.msgs]
+            return json.dumps({
+                "msg_type": self.msg_type.value,
+                "seq": self.seq,
+                "wire": WIRE_VERSION_COMPACT,
+                "data": data,
+            }, separators=(",",":"))
+        data["msgs"] = [m.jsonify() for m in self.msgs]
         return json.dumps({
             "msg_type": self.msg_type.value,
             "seq": self.seq,
-            "data": {
-                "msgs": [m.jsonify() for m in self.msgs],
-            },
+            "data": data,
         })
 
     def __repr__(self):
@@ -138,6 +269,8 @@ class eptMsgSubOp(eptMsg):
             - MSG_TYPE.SETTINGS_RELOAD      (no ept required but fabric needed for worker)
             - MSG_TYPE.FABRIC_EPM_EOF_ACK   sent from worker to subscriber with worker_id 
                                             embedded in addr field
+            - MSG_TYPE.WORKER_DRAIN_ACK     sent from worker to subscriber with worker_id 
+                                            embedded in addr field and drain id in seq
     """
     def __init__(self, msg_type, data={}, seq=1):
         super(eptMsgSubOp, self).__init__(msg_type, data, seq)
@@ -148,9 +281,9 @@ class eptMsgSubOp(eptMsg):
         self.type = data.get("type", "")
         self.qnum = int(data.get("qnum", 1))
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "data": {
@@ -160,7 +293,7 @@ class eptMsgSubOp(eptMsg):
                 "type": self.type,
                 "qnum": self.qnum,
             },
-        })
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [0x%06x %s]" % (self.msg_type.value, self.seq, 
@@ -169,13 +302,14 @@ class eptMsgSubOp(eptMsg):
 class eptMsgHello(object):
     """ hello message sent from worker to manager """
 
-    def __init__(self, worker_id, role, queues, start_time, seq=1):
+    def __init__(self, worker_id, role, queues, start_time, seq=1, wire=WIRE_VERSION):
         self.msg_type = MSG_TYPE.HELLO
         self.worker_id = worker_id
         self.role = role
         self.queues = queues            # list of queue names sorted by priority        
         self.start_time = start_time
         self.seq = seq
+        self.wire = wire                # highest supported eptMsgBulk wire version
 
     def __repr__(self):
         return "[%s] %s.0x%08x %s" % (self.worker_id, self.msg_type.value, self.seq, self.role)
@@ -190,6 +324,7 @@ class eptMsgHello(object):
                 "role": self.role,
                 "queues": self.queues, 
                 "start_time": self.start_time,
+                "wire": self.wire,
             },
         })
 
@@ -203,16 +338,20 @@ class eptMsgHello(object):
             hello_data["queues"],
             hello_data["start_time"],
             seq = js["seq"],
+            # workers that do not advertise a wire version only support json
+            wire = hello_data.get("wire", WIRE_VERSION_JSON),
         )
 
 class eptMsgWork(object):
     """ primary work message sent from subscriber to manager and then dispatched to a worker  
         Addr is a string that will be used as a simple hash for worker calculation
-        qnum is the index for worker queue. At present, all workers should subscribe to 2 queues 
-        with strict priority queuing on lowest queue index.
+        qnum is the index for worker queue and must be provided by each caller. All workers 
+        subscribe to WORKER_QUEUE_COUNT queues with strict priority queuing on lowest queue index.
+        wf and now are set by the worker when the msg is received.
     """
+    __slots__ = ("msg_type", "addr", "role", "qnum", "data", "wt", "seq", "fabric", "wf", "now")
 
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         self.msg_type = MSG_TYPE.WORK
         self.addr = addr
         self.role = role
@@ -229,7 +368,15 @@ class eptMsgWork(object):
 
     def jsonify(self):
         """ jsonify for transport across messaging queue """
-        return json.dumps({
+        return json.dumps(self.to_msg_json())
+
+    def compact(self):
+        """ return msg as an object that can be embedded directly into a compact eptMsgBulk """
+        return self.to_msg_json()
+
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "data": self.data,
@@ -238,7 +385,7 @@ class eptMsgWork(object):
             "role": self.role,
             "qnum": self.qnum,
             "fabric": self.fabric,
-        })
+        }
 
     @staticmethod
     def from_msg_json(js):
@@ -263,28 +410,28 @@ class eptMsgWork(object):
 
 class eptMsgWorkRaw(eptMsgWork):
     """ raw/unparsed epm or standard mo event """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         super(eptMsgWorkRaw, self).__init__(addr, role, data, wt, qnum=qnum, seq=seq, fabric=fabric)
         self.wt = WORK_TYPE.RAW
 
 class eptMsgWorkStdMo(eptMsgWork):
     """ raw/unparsed epm or standard mo event """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         super(eptMsgWorkStdMo, self).__init__(addr, role, data, wt, qnum=qnum,seq=seq,fabric=fabric)
         self.wt = WORK_TYPE.STD_MO
 
 class eptMsgWorkDeleteEpt(eptMsgWork):
     """ fixed message type for DELETE_EPT """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkDeleteEpt, self).__init__(addr, "worker", data, wt, 
                                                     qnum=qnum, seq=seq, fabric=fabric)
         self.wt = WORK_TYPE.DELETE_EPT
         self.vnid = int(data.get("vnid",0))
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -295,8 +442,7 @@ class eptMsgWorkDeleteEpt(eptMsgWork):
             "data": {
                 "vnid": self.vnid,
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [0x%06x, %s]" % (self.msg_type.value, self.seq, 
@@ -304,7 +450,7 @@ class eptMsgWorkDeleteEpt(eptMsgWork):
 
 class eptMsgWorkWatchNode(eptMsgWork):
     """ fixed message type for WATCH_NODE """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkWatchNode, self).__init__(addr, "watcher", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -313,9 +459,9 @@ class eptMsgWorkWatchNode(eptMsgWork):
         self.node = int(data.get("node", 0))
         self.status = data.get("status", "")
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -328,8 +474,7 @@ class eptMsgWorkWatchNode(eptMsgWork):
                 "node": self.node,
                 "status": self.status,
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [ts:%.03f node:%d, %s]" % (self.msg_type.value, self.seq, 
@@ -337,7 +482,7 @@ class eptMsgWorkWatchNode(eptMsgWork):
 
 class eptMsgWorkWatchMove(eptMsgWork):
     """ fixed message type for WATCH_MOVE """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkWatchMove, self).__init__(addr, "watcher", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -347,9 +492,9 @@ class eptMsgWorkWatchMove(eptMsgWork):
         self.src = data.get("src", {})
         self.dst = data.get("dst", {})
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -363,8 +508,7 @@ class eptMsgWorkWatchMove(eptMsgWork):
                 "src": self.src,
                 "dst": self.dst
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [0x%06x, %s, %s]" % (self.msg_type.value, 
@@ -372,7 +516,7 @@ class eptMsgWorkWatchMove(eptMsgWork):
 
 class eptMsgWorkWatchRapid(eptMsgWork):
     """ fixed message type for WATCH_RAPID """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkWatchRapid, self).__init__(addr, "watcher", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -385,9 +529,9 @@ class eptMsgWorkWatchRapid(eptMsgWork):
         self.rate = float(data.get("rate",0))
         self.vnid_name = data.get("vnid_name", "")
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -403,8 +547,7 @@ class eptMsgWorkWatchRapid(eptMsgWork):
                 "rate": self.rate,
                 "vnid_name": self.vnid_name,
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [0x%06x, %s, %s, rate %.3f]" % (self.msg_type.value, 
@@ -412,7 +555,7 @@ class eptMsgWorkWatchRapid(eptMsgWork):
 
 class eptMsgWorkWatchOffSubnet(eptMsgWork):
     """ fixed message type for WATCH_OFFSUBNET """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkWatchOffSubnet, self).__init__(addr, "watcher", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -424,9 +567,9 @@ class eptMsgWorkWatchOffSubnet(eptMsgWork):
         self.type = data.get("type", "")
         self.event = data.get("event", {})
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -441,8 +584,7 @@ class eptMsgWorkWatchOffSubnet(eptMsgWork):
                 "type": self.type,
                 "event": self.event,
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [ts:%.03f %s node:%d, 0x%06x, %s]" % (self.msg_type.value, 
@@ -450,7 +592,7 @@ class eptMsgWorkWatchOffSubnet(eptMsgWork):
 
 class eptMsgWorkWatchStale(eptMsgWork):
     """ fixed message type for WATCH_STALE """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set
         super(eptMsgWorkWatchStale, self).__init__(addr, "watcher", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -462,9 +604,9 @@ class eptMsgWorkWatchStale(eptMsgWork):
         self.type = data.get("type", "")
         self.event = data.get("event", {})
 
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -479,8 +621,7 @@ class eptMsgWorkWatchStale(eptMsgWork):
                 "type": self.type,
                 "event": self.event,
             }
-        })
-        return ret
+        }
 
     def __repr__(self):
         return "%s.0x%08x %s %s [ts:%.03f %s node:%d, 0x%06x, %s]" % (self.msg_type.value, 
@@ -507,8 +648,68 @@ epm_rsMacToIp_reg+= "ip-\[(?P<ip>[0-9\.a-fA-F\:]+)\]"
 epm_rsMacToIp_reg = re.compile(epm_rsMacToIp_reg)
 epm_reg = re.compile(epm_reg)
 
+# epm classname to (work type, endpoint type, is rs object)
+EPM_CLASSES = {
+    "epmIpEp": (WORK_TYPE.EPM_IP_EVENT, "ip", False),
+    "epmMacEp": (WORK_TYPE.EPM_MAC_EVENT, "mac", False),
+    "epmRsMacEpToIpEpAtt": (WORK_TYPE.EPM_RS_IP_EVENT, "ip", True),
+}
+
+# anchored fast path for full epm dn. Each group is bounded by its terminating character so the 
+# expression does not scan or backtrack, and all fields are returned by a single groups() call. The
+# rs target dn is split off with str.partition so the lazy match in epm_rsMacToIp_reg is avoided.
+epm_fast_reg = "topology/pod-[0-9]+/node-([0-9]+)/sys/(?:ctx-\[vxlan-([0-9]+)\]|inst-overlay-1)/"
+epm_fast_reg+= "(?:bd-\[vxlan-([0-9]+)\]/)?(?:vx?lan-\[(vx?lan-[0-9]+)\]/)?db-ep/"
+epm_fast_reg+= "(?:mac-([0-9a-fA-F:]+)|ip-\[([0-9a-fA-F\.:]+)\])$"
+epm_fast_reg = re.compile(epm_fast_reg)
+
+def parse_epm_dn(dn, rs=False):
+    """ parse epm dn into tuple (node, vrf, bd, encap, addr, ip) where vrf is None for objects
+        within inst-overlay-1, bd is 0 if not present, and encap/ip are empty strings if not
+        present.  This is used for every epm event received.  Return None if the dn is not in the
+        expected format in which case the caller should fall back to parse_epm_dn_regex.
+    """
+    ip = ""
+    if rs:
+        # rsmacEpToIpEpAtt-[sys/.../db-ep/ip-[<ip>]]
+        (dn, sep, rs_dn) = dn.partition("/rsmacEpToIpEpAtt-")
+        i = rs_dn.rfind("ip-[")
+        if i < 0 or rs_dn[-2:] != "]]":
+            return None
+        ip = rs_dn[i+4:-2]
+    r1 = epm_fast_reg.match(dn)
+    if r1 is None:
+        return None
+    (node, vrf, bd, encap, mac, addr) = r1.groups()
+    return (
+        int(node),
+        int(vrf) if vrf is not None else None,
+        int(bd) if bd is not None else 0,
+        encap if encap is not None else "",
+        mac if mac is not None else addr,
+        ip
+    )
+
+def parse_epm_dn_regex(dn, rs=False):
+    """ parse epm dn using regex and return same tuple as parse_epm_dn or None on error """
+    r1 = epm_rsMacToIp_reg.search(dn) if rs else epm_reg.search(dn)
+    if r1 is None:
+        return None
+    # either vrf or ovl will always be set
+    vrf = int(r1.group("vrf")) if r1.group("vrf") is not None else None
+    return (
+        int(r1.group("node")),
+        vrf,
+        int(r1.group("bd")) if r1.group("bd") is not None else 0,
+        r1.group("encap") if r1.group("encap") is not None else "",
+        r1.group("addr"),
+        r1.group("ip") if rs else "",
+    )
+
 class eptEpmEventParser(object):
-    """ shim for creating/parsing epmEvents """
+    """ shim for creating/parsing epmEvents. Events are created for the normal worker queue and the
+        caller must set qnum for any other queue (i.e., build create/delete events)
+    """
     def __init__(self, fabric, overlay_vnid):
         logger.debug("init parser for fabric %s with overlay-vnid: %s", fabric, overlay_vnid)
         self.fabric = fabric
@@ -516,14 +717,57 @@ class eptEpmEventParser(object):
 
     def parse(self, classname, attr, ts):
         # return an instance of eptMsgWorkEpmEvent or None on error
-        msg = eptMsgWorkEpmEvent(None, "worker", {}, None, fabric=self.fabric)
+        msg = eptMsgWorkEpmEvent(None, "worker", {}, None, WORKER_QUEUE_NORMAL, 
+                fabric=self.fabric)
         if not msg.parse(self.overlay_vnid, classname, attr, ts):
             return None
         return msg
 
+    def parse_many(self, classname, objects, ts):
+        """ parse an iterable of attribute dicts for a single classname, such as a page of objects
+            from an APIC query, and return a list of eptMsgWorkEpmEvent objects.  The classname is
+            resolved once for the full iterable and objects that fail to parse are skipped.
+        """
+        ret = []
+        if classname not in EPM_CLASSES:
+            logger.warn("insupported epmEvent classname for parse_many: %s", classname)
+            return ret
+        (wt, epm_type, rs) = EPM_CLASSES[classname]
+        is_mac = classname == "epmMacEp"
+        fabric = self.fabric
+        overlay_vnid = self.overlay_vnid
+        append = ret.append
+        # allocate each msg without __init__ as set_parsed overwrites all epm attributes and only
+        # the eptMsgWork base attributes need to be set here
+        new = eptMsgWorkEpmEvent.__new__
+        work = MSG_TYPE.WORK
+        for attr in objects:
+            dn = attr.get("dn", None)
+            if dn is None:
+                logger.warn("invalid epm attribute (%s): %s", classname, attr)
+                continue
+            tokens = parse_epm_dn(dn, rs) or parse_epm_dn_regex(dn, rs)
+            if tokens is None:
+                logger.warn("failed to parse epm event for %s: %s", classname, dn)
+                continue
+            msg = new(eptMsgWorkEpmEvent)
+            msg.msg_type = work
+            msg.role = "worker"
+            msg.qnum = WORKER_QUEUE_NORMAL
+            msg.data = {}
+            msg.wt = wt
+            msg.seq = 1
+            msg.fabric = fabric
+            msg.force = False
+            msg.build_gen = 0
+            msg.set_parsed(overlay_vnid, classname, epm_type, is_mac, tokens, attr, ts)
+            append(msg)
+        return ret
+
     def get_delete_event(self, classname, node, vnid, addr, ts):
         # return an eptMsgWorkEpmEvent with status 'delete' for provided node+vnid+addr
-        msg = eptMsgWorkEpmEvent(addr, "worker", {}, None, fabric=self.fabric)
+        msg = eptMsgWorkEpmEvent(addr, "worker", {}, None, WORKER_QUEUE_NORMAL, 
+                fabric=self.fabric)
         msg.status = "deleted"
         msg.node = node
         msg.vnid = vnid
@@ -545,9 +789,17 @@ class eptEpmEventParser(object):
 
 class eptMsgWorkEpmEvent(eptMsgWork):
     """ standardize parsed result for epmMacEp, epmIpEp, and epmRsMacEpToIpEpAtt objects to always
-        include all attributes with default of empty string if not present
+        include all attributes with default of empty string if not present.  This is allocated for
+        every epm event so attributes are fixed via __slots__, including the names resolved by the
+        worker during update_endpoint_history. build_gen is set by the subscriber on create events
+        from an endpoint build and is stamped on the eptHistory entry by the worker.
     """
-    def __init__(self, addr, role, data, wt, qnum=0, seq=1, fabric=1):
+    __slots__ = ("ts", "classname", "type", "status", "_flags", "flag_bits", "ifId", "pcTag", 
+                "encap", "ip", "node", "vnid", "vrf", "bd", "force", "build_gen", 
+                # set by worker
+                "epg_name", "remote", "ifId_name", "tunnel_flags", "vnid_name")
+
+    def __init__(self, addr, role, data, wt, qnum, seq=1, fabric=1):
         # initialize as eptMsgWork with empty data set 
         super(eptMsgWorkEpmEvent, self).__init__(addr, "worker", data, wt, 
                 qnum=qnum, seq=seq, fabric=fabric)
@@ -565,74 +817,61 @@ class eptMsgWorkEpmEvent(eptMsgWork):
         self.vrf = int(data.get("vrf", 0))
         self.bd = int(data.get("bd", 0))
         self.force = bool(data.get("force", False))
+        self.build_gen = int(data.get("build_gen", 0))
+
+    @property
+    def flags(self):
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        # always keep flag_bits in sync with list of flags
+        self._flags = flags
+        self.flag_bits = get_epm_flag_bits(flags)
 
     def parse(self, overlay_vnid, classname, attr, ts):
         # parse event and set data dict to prepare 
-        self.classname = classname
         if "dn" not in attr:
             logger.warn("invalid epm attribute (%s): %s", classname, attr)
             return False
-        if self.classname == "epmIpEp":
-            self.wt = WORK_TYPE.EPM_IP_EVENT
-            r1 = epm_reg.search(attr["dn"])
-            self.type = "ip"
-        elif self.classname == "epmMacEp":
-            self.wt = WORK_TYPE.EPM_MAC_EVENT
-            r1 = epm_reg.search(attr["dn"])
-            self.type = "mac"
-        elif self.classname == "epmRsMacEpToIpEpAtt":
-            self.wt = WORK_TYPE.EPM_RS_IP_EVENT
-            r1 = epm_rsMacToIp_reg.search(attr["dn"])
-            self.type = "ip"
-            self.ip = r1.group("ip")
-        else:
+        if classname not in EPM_CLASSES:
             logger.warn("insupported epmEvent classname (%s): %s", classname, attr)
             return False
-        if r1 is None:
+        (wt, epm_type, rs) = EPM_CLASSES[classname]
+        # fast path tokenizer with fallback to regex for unexpected dn formats
+        tokens = parse_epm_dn(attr["dn"], rs) or parse_epm_dn_regex(attr["dn"], rs)
+        if tokens is None:
             logger.warn("failed to parse epm event for %s: %s", classname, attr["dn"])
             return False
+        self.wt = wt
+        self.set_parsed(overlay_vnid, classname, epm_type, classname=="epmMacEp", tokens, attr, ts)
+        # successful parse
+        # logger.debug("parse epm event on %s(%s): %s", self.classname, self.fabric, attr["dn"])
+        return True
 
+    def set_parsed(self, overlay_vnid, classname, epm_type, is_mac, tokens, attr, ts):
+        # set attributes from parse_epm_dn tokens and epm object attributes
+        (self.node, vrf, self.bd, self.encap, self.addr, self.ip) = tokens
+        self.classname = classname
+        self.type = epm_type
         self.ts = ts
-        self.status = attr.get("status", "created")
         # on build, status is empty string, we need assume created if not provided or empty
-        if len(self.status) == 0: 
-            self.status = "created"
-        self.flags = attr.get("flags", "")
-        if len(self.flags) == 0: 
-            self.flags = []
-        else:
-            self.flags = self.flags.split(",")
+        self.status = attr.get("status", "") or "created"
+        flags = attr.get("flags", "")
+        self.flags = flags.split(",") if len(flags) > 0 else []
         self.ifId = attr.get("ifId", "")
         try:
             self.pcTag = int(attr.get("pcTag", 0))
         except ValueError as e:
             self.pcTag = 0
-        self.node = int(r1.group("node"))
-        self.addr = r1.group("addr")
-
-        # either vrf or ovl will always be set. If ovl then use overlay_vnid for vrf
-        if r1.group("vrf") is not None:
-            self.vrf = int(r1.group("vrf"))
-        elif r1.group("ovl") is not None:
-            self.vrf = overlay_vnid
-        else:
-            logger.warn("parse did not match vrf or ovl %s: %s",attr["dn"],r1.groupdict())
-            return False
-
-        # optional matches that need to be set empty string if not present
-        self.bd = int(r1.group("bd"))   if r1.group("bd") is not None else 0
-        self.encap = r1.group("encap")  if r1.group("encap") is not None else ""
-
+        # vrf is not set for objects within overlay so use overlay_vnid
+        self.vrf = vrf if vrf is not None else overlay_vnid
         # set vnid to bd or vrf depending on classname
-        self.vnid = self.bd if self.classname == "epmMacEp" else self.vrf
+        self.vnid = self.bd if is_mac else self.vrf
 
-        # successful parse
-        # logger.debug("parse epm event on %s(%s): %s", self.classname, self.fabric, attr["dn"])
-        return True
-
-    def jsonify(self):
-        """ jsonify for transport across messaging queue """
-        return json.dumps({
+    def to_msg_json(self):
+        """ return dict representation of msg used by jsonify and compact """
+        return {
             "msg_type": self.msg_type.value,
             "seq": self.seq,
             "wt": self.wt.value,
@@ -655,9 +894,58 @@ class eptMsgWorkEpmEvent(eptMsgWork):
                 "ip": self.ip,
                 "vnid": self.vnid,
                 "force": self.force,
+                "build_gen": self.build_gen,
             }
-        })
-        return ret
+        }
+
+    def compact(self):
+        """ return positional list representation of event for compact eptMsgBulk. Field order
+            must remain in sync with from_compact
+        """
+        return [
+            self.wt.value,
+            self.addr,
+            self.qnum,
+            self.seq,
+            self.fabric,
+            self.classname,
+            self.type,
+            self.ts,
+            self.status,
+            ",".join(self.flags),
+            self.ifId,
+            self.pcTag,
+            self.node,
+            self.vrf,
+            self.bd,
+            self.encap,
+            self.ip,
+            self.vnid,
+            1 if self.force else 0,
+            self.build_gen,
+        ]
+
+    @staticmethod
+    def from_compact(c):
+        # return eptMsgWorkEpmEvent from positional list created by compact
+        msg = eptMsgWorkEpmEvent(c[1], "worker", {}, WORK_TYPE(c[0]), qnum=c[2], seq=c[3], 
+                                    fabric=c[4])
+        msg.classname = c[5]
+        msg.type = c[6]
+        msg.ts = c[7]
+        msg.status = c[8]
+        msg.flags = c[9].split(",") if len(c[9]) > 0 else []
+        msg.ifId = c[10]
+        msg.pcTag = c[11]
+        msg.node = c[12]
+        msg.vrf = c[13]
+        msg.bd = c[14]
+        msg.encap = c[15]
+        msg.ip = c[16]
+        msg.vnid = c[17]
+        msg.force = c[18] == 1
+        msg.build_gen = c[19] if len(c) > 19 else 0
+        return msg
 
     def __repr__(self):
         return "%s.0x%08x %s %s [ts:%.3f, node:%d, 0x%06x, %s, %s] %s" % (self.msg_type.value, 
@@ -6,6 +6,7 @@ from ... rest import api_callback
 from .. fabric import Fabric
 from . common import subscriber_op
 from . ept_msg import MSG_TYPE
+from . ept_msg import WORKER_QUEUE_HIGH
 from flask import abort
 from flask import jsonify
 import logging
@@ -252,6 +253,45 @@ class eptSettings(Rest):
             "default": 600,
             "description": "holdtime to ignore new events for endpoint marked as rapid",
         },
+        "cache_size": {
+            "type": int,
+            "default": 512,
+            "min": 64,
+            "max": 131072,
+            "description": """ maximum number of objects in each of the worker lookup caches for 
+            this fabric (node, tunnel, vpc, pc, vnid, epg, and subnet). Increase for fabrics with a
+            large number of tunnels or epgs if cache hit ratio is low. Each cache is allocated per 
+            worker process.
+            """,
+        },
+        "endpoint_cache_size": {
+            "type": int,
+            "default": 1024,
+            "min": 64,
+            "max": 131072,
+            "description": """ maximum number of endpoints within each of the worker endpoint 
+            caches for this fabric
+            """,
+        },
+        "shared_cache": {
+            "type": bool,
+            "default": False,
+            "description": """ enable a cache in redis shared by all worker processes for node,
+            tunnel, vpc, pc, vnid, and epg objects. Workers read through the shared cache before the
+            database which reduces database load after a restart or flush when there are a large 
+            number of workers.
+            """,
+        },
+        "cache_max_memory": {
+            "type": int,
+            "default": 0,
+            "min": 0,
+            "max": 4096,
+            "description": """ optional limit in MB for the approximate memory footprint of each 
+            worker cache for this fabric. When exceeded, the least recently used objects are evicted
+            even if the cache size has not been reached. Set to 0 to disable.
+            """,
+        },
         "tz": {
             "type": str,
             "write": False,
@@ -317,7 +357,8 @@ class eptSettings(Rest):
         """ send msg to background processes to graceful reload settings. This is used after
             settings are updated to apply them without restarting the fabric monitor.
         """
-        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.SETTINGS_RELOAD, qnum=0)
+        (success, err_str) = subscriber_op(self.fabric, MSG_TYPE.SETTINGS_RELOAD,
+                qnum=WORKER_QUEUE_HIGH)
         if success:
             return jsonify({"success": True})
         abort(500, err_str)
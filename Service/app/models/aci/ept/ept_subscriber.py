@@ -12,22 +12,33 @@ from .. utils import validate_session_role
 from .. subscription_ctrl import SubscriptionCtrl
 
 from . common import BG_EVENT_HANDLER_INTERVAL
+from . common import BUILD_FETCH_CONCURRENCY
 from . common import HELLO_INTERVAL
 from . common import MANAGER_CTRL_CHANNEL
 from . common import MANAGER_WORK_QUEUE
 from . common import MAX_EPM_BUILD_TIME
 from . common import MAX_SEND_MSG_LENGTH
+from . common import MAX_WORKER_DRAIN_TIME
 from . common import MINIMUM_SUPPORTED_VERSION
 from . common import MO_BASE
+from . common import RESYNC_MAX_GAP
+from . common import RESYNC_TS_MARGIN
 from . common import SUBSCRIBER_CTRL_CHANNEL
 from . common import WATCHER_BROADCAST_CHANNEL
 from . common import WORKER_BROADCAST_CHANNEL
 from . common import WORKER_CTRL_CHANNEL
+from . common import WORKER_QUEUE_BULK
+from . common import WORKER_QUEUE_HIGH
+from . common import WORKER_QUEUE_NORMAL
+from . common import BackgroundTasks
 from . common import BackgroundThread
 from . common import db_alive
+from . common import eptEndpointPresence
 from . common import get_msg_hash
 from . common import get_vpc_domain_id
+from . common import get_worker_index
 from . common import log_version
+from . common import parse_apic_timestamp
 from . common import parse_tz
 from . ept_msg import MSG_TYPE
 from . ept_msg import WORK_TYPE
@@ -40,7 +51,10 @@ from . ept_msg import eptMsgWorkDeleteEpt
 from . ept_msg import eptMsgWorkRaw
 from . ept_msg import eptMsgWorkStdMo
 from . ept_msg import eptMsgWorkWatchNode
+from . ept_cache import eptCache
+from . ept_cache import sharedCache
 from . ept_epg import eptEpg
+from . ept_fetch import eptEpmFetcher
 from . ept_history import eptHistory
 from . ept_node import eptNode
 from . ept_pc import eptPc
@@ -50,6 +64,7 @@ from . ept_subnet import eptSubnet
 from . ept_tunnel import eptTunnel
 from . ept_vnid import eptVnid
 from . ept_vpc import eptVpc
+from . mo_dependency import DependencyIndex
 from . mo_dependency_map import dependency_map
 
 from importlib import import_module
@@ -79,33 +94,46 @@ class eptSubscriber(object):
         self.initializing = True    # set to queue events until fully initialized
         self.epm_initializing = True # different initializing flag for epm events
         self.stopped = False        # set to ignore events after hard_restart triggered
+        self.hosted = False         # set when running within shared eptSubscriberHost process
+        self.ctrl_ready = False     # set when initialized and handling subscriber ctrl msgs
+        self._exit = False          # set to exit main loop when hosted subscriber is stopped
         self.db = None
         self.redis = None
         self.session = None
         self.bg_thread = None           # background thread used to batch epm/std_mo event messages
-        self.stats_thread = None        # update stats at regular interval
+        self.tasks_thread = None        # hello, stats, and ingest stats at regular intervals
         self.epm_event_queue = Queue()
         self.std_mo_event_queue = Queue()
         self.epm_parser = None  # initialized once overlay vnid is known
         self.soft_restart_ts = 0    # timestamp of last soft_restart
+        self.subscription_alive_ts = 0  # timestamp subscription was last known to be alive
         self.subscription_check_interval = 5.0   # interval to check subscription health
+        self.ingest_stats_interval = 60.0       # interval to log websocket ingest stats
         self.manager_ctrl_channel_lock = threading.Lock()
         self.manager_work_queue_lock = threading.Lock()
         self.queue_stats_lock = threading.Lock()
 
         # broadcast hello for any managers (registration and keepalives)
-        self.hello_thread = None
         self.hello_msg = eptMsgHello(self.fabric.fabric, "subscriber", [], time.time())
         self.hello_msg.seq = 0
 
         # active workers indexed by role. Each role is a list of TrackedWorker objects.
-        # Note, this is initial value of workers when subscriber is started. It may not be accurate 
-        # at a later time and therefore should only be trusted during initial startup. If we want 
-        # to support dynamic worker bringup/teardown in the future, then we will need to implement 
-        # messaging between manager and subscriber with active worker updates to keep them in sync.
-        # for now, if active workers change then subscriber will be restarted by manager process
+        # Note, this is initial value of workers when subscriber is started. The manager publishes
+        # a WORKER_UPDATE on the subscriber channel when workers are added or removed.
         self.active_workers = active_workers
 
+        # when new workers are added, messages for the new workers are held until all existing
+        # workers have processed a drain marker. worker_drain is None when no drain is in progress,
+        # else a dict with the following keys:
+        #   drain   - drain id sent in each drain marker
+        #   start   - timestamp of when drain was started
+        #   hold    - set of worker_ids that messages are being held for
+        #   held    - list of held messages (in order) to be sent when drain completes
+        #   pending - dict indexed by tuple (worker_id, qnum) of outstanding drain acks
+        self.worker_drain = None
+        self.worker_drain_seq = 0
+        self.worker_drain_lock = threading.RLock()
+
         # keep a dummy seq for each supported broadcast channel
         self.watcher_broadcast_seq = 0
         self.worker_broadcast_seq = 0
@@ -139,6 +167,27 @@ class eptSubscriber(object):
         self.epm_eof_tracking = None
         self.epm_eof_start = None
 
+        # each endpoint build stamps a build generation on every eptHistory entry returned from the
+        # APIC. Once all workers have processed the build (first epm EOF ack), entries with an older
+        # generation are swept and delete jobs sent. build_sweep is None when no sweep is pending,
+        # else a dict with the following keys:
+        #   gen     - build generation of the current build
+        #   ts      - timestamp of the start of the build
+        #   ready   - set to True when epm EOF ack is received from all workers
+        #   late    - set to True when max build time is exceeded before all workers have acked.
+        #             Watchers are resumed and the sweep is run without a second epm EOF once the
+        #             remaining workers have acked (or are removed)
+        self.build_gen = 0
+        self.build_sweep = None
+
+        # build create/delete events are sent on the bulk queue while live epm events are sent on
+        # the normal queue. To ensure a live event is never processed before an older build event
+        # for the same endpoint, live epm events are held until all workers have processed the
+        # build (including the sweep). epm_build_held is None when no build is in progress, else
+        # the list of held messages (in order) to send when the build completes.
+        self.epm_build_held = None
+        self.epm_build_lock = threading.Lock()
+
         # classes that have corresponding mo Rest object and handled by handle_std_mo_event
         # the order shouldn't matter during build but just to be safe we'll control the order...
         self.ordered_mo_classes = [
@@ -228,24 +277,13 @@ class eptSubscriber(object):
             # allocate a unique db connection as this is running in a new process
             self.db = get_db(uniq=True, overwrite_global=True, write_concern=True)
             self.redis = get_redis()
-            # start hello thread
-            self.hello_thread = BackgroundThread(
-                func=self.send_hello,
-                name="sub-hello",
-                count=0,
-                interval = HELLO_INTERVAL
-            )
-            self.hello_thread.daemon = True
-            self.hello_thread.start()
-            # stats thread
-            self.stats_thread = BackgroundThread(
-                func=self.update_stats,
-                name="sub-stats",
-                count=0,
-                interval= eptQueueStats.STATS_INTERVAL
-            )
-            self.stats_thread.daemon = True
-            self.stats_thread.start()
+            # start single thread for hello, stats, and ingest stats which are mostly idle
+            self.tasks_thread = BackgroundTasks(name="sub-tasks")
+            self.tasks_thread.add_task(self.send_hello, HELLO_INTERVAL)
+            self.tasks_thread.add_task(self.update_stats, eptQueueStats.STATS_INTERVAL)
+            self.tasks_thread.add_task(self.log_ingest_stats, self.ingest_stats_interval)
+            self.tasks_thread.daemon = True
+            self.tasks_thread.start()
             # start background event handler thread
             self.bg_thread = BackgroundThread(
                 func=self.handle_background_event_queue,
@@ -266,12 +304,41 @@ class eptSubscriber(object):
             self.subscriber.unsubscribe()
             if self.db is not None:
                 self.db.client.close()
-            if self.hello_thread is not None:
-                self.hello_thread.exit()
+            if self.tasks_thread is not None:
+                self.tasks_thread.exit()
             if self.bg_thread is not None:
                 self.bg_thread.exit()
-            if self.stats_thread is not None:
-                self.stats_thread.exit()
+
+    def run_hosted(self, db, redis):
+        """ run subscriber within eptSubscriberHost process. The db and redis connections along 
+            with the subscriber ctrl channel, hello, stats, and event batching threads are owned
+            by the host and shared across all hosted fabrics.
+        """
+        threading.currentThread().name = "sub-%s" % self.fabric.fabric
+        logger.info("starting hosted eptSubscriber for fabric '%s'", self.fabric.fabric)
+        self.hosted = True
+        self.db = db
+        self.redis = redis
+        try:
+            self._run()
+        except eptSubscriberExitError as e:
+            logger.warn("subscriber exit: %s", e)
+        except Exception as e:
+            logger.error("Traceback:\n%s", traceback.format_exc())
+        finally:
+            self.ctrl_ready = False
+            self.subscriber.unsubscribe()
+            logger.info("hosted eptSubscriber for fabric '%s' exited", self.fabric.fabric)
+
+    def stop(self):
+        """ stop hosted subscriber. Events are ignored and subscriptions closed immediately, the
+            main loop (or any in progress build) exits shortly after
+        """
+        logger.info("stopping eptSubscriber for fabric '%s'", self.fabric.fabric)
+        self._exit = True
+        self.stopped = True
+        self.ctrl_ready = False
+        self.subscriber.unsubscribe()
 
     def increment_stats(self, queue, tx=False, count=1):
         """ update queue stats for transmit/receive message """
@@ -342,10 +409,17 @@ class eptSubscriber(object):
             is applied to send to send specific worker based on vnid and address.
             Note, messages must be of type eptMsgWork (or inherited object) which contain addr, 
             qnum, and role.
-            prepend support added to support priority-like functionality with only a single queue.
-            When prepend is set to True, a lpush is executed instead of rpush to force the message
-            to the top of the queue.
+            Priority is provided by the qnum of each message (see WORKER_QUEUE_HIGH, 
+            WORKER_QUEUE_NORMAL, and WORKER_QUEUE_BULK). When prepend is set to True, a lpush is
+            executed instead of rpush to force the message to the top of the queue.
+            If a worker drain is in progress, messages for newly added workers are held until the
+            drain has completed.
         """
+        with self.worker_drain_lock:
+            self._send_msg(msg, prepend=prepend)
+
+    def _send_msg(self, msg, prepend=False):
+        """ send_msg with worker_drain_lock held """
         # dict indexed by worker_id and qnum with a tuple (worker, worker-msgs), where worker-msgs 
         # is a list of eptBulkMsg objects with at most MAX_SEND_MSG_LENGTH per bulk message
         work = {}
@@ -357,7 +431,11 @@ class eptSubscriber(object):
                 logger.warn("no available workers for role '%s'", m.role)
             else:
                 _hash = get_msg_hash(m)
-                worker = self.active_workers[m.role][_hash % len(self.active_workers[m.role])]
+                workers = self.active_workers[m.role]
+                worker = workers[get_worker_index(_hash, workers)]
+                if self.worker_drain is not None and worker.worker_id in self.worker_drain["hold"]:
+                    self.worker_drain["held"].append(m)
+                    continue
                 if m.qnum >= len(worker.queues):
                     logger.warn("unable to enqueue work on worker %s, queue %s does not exist", 
                         worker.worker_id, m.qnum)
@@ -392,16 +470,18 @@ class eptSubscriber(object):
                     # if there's only one message, then send just that single message
                     if len(bulk.msgs) == 1:
                         bulk = bulk.msgs[0]
+                        data = bulk.jsonify()
                     else:
                         # update bulk sequence number to last entry sent
                         bulk.seq = bulk.msgs[-1].seq
+                        data = bulk.jsonify(wire=worker.wire)
                     with worker.queue_locks[qnum]:
                         try:
                             #logger.debug("enqueue %s: %s", worker.queues[qnum], bulk)
                             if prepend:
-                                self.redis.lpush(worker.queues[qnum], bulk.jsonify())
+                                self.redis.lpush(worker.queues[qnum], data)
                             else:
-                                self.redis.rpush(worker.queues[qnum], bulk.jsonify())
+                                self.redis.rpush(worker.queues[qnum], data)
                         except Exception as e:
                             logger.debug("Traceback:\n%s", traceback.format_exc())
                             logger.error("failed to enqueue msg on queue (%s) %s: %s", e,
@@ -449,7 +529,11 @@ class eptSubscriber(object):
 
     def handle_subscriber_ctrl(self, msg):
         """ handle subscriber control messages """
-        # all subscriber ctrl messages must have fabric present
+        # worker update is sent to all subscribers
+        if msg.msg_type == MSG_TYPE.WORKER_UPDATE:
+            self.handle_worker_update(msg)
+            return
+        # all other subscriber ctrl messages must have fabric present
         if msg.fabric != self.fabric.fabric:
             logger.debug("request not for this fabric")
             return
@@ -466,7 +550,7 @@ class eptSubscriber(object):
             self.settings = eptSettings.load(fabric=self.fabric.fabric, settings="default")
             # node addr of 0 is broadcast to all nodes. set role to None to send to all roles
             logger.debug("broadcasting settings reload to all roles")
-            self.broadcast(eptMsgWork(0, None, {}, WORK_TYPE.SETTINGS_RELOAD))
+            self.broadcast(eptMsgWork(0, None, {}, WORK_TYPE.SETTINGS_RELOAD, WORKER_QUEUE_HIGH))
         elif msg.msg_type == MSG_TYPE.FABRIC_EPM_EOF_ACK:
             # received an ack from a worker for completion of work
             logger.debug("%s receiving EPM EOF ACK: %s", msg.fabric, msg.addr)
@@ -476,16 +560,19 @@ class eptSubscriber(object):
                 else:
                     logger.warn("%s received ack from unknown worker %s", msg.fabric, msg.addr)
                 # check if all workers have been received or still pending from any
-                pending = self.get_workers_with_pending_ack()
-                if len(pending) == 0:
-                    logger.debug("%s received epm ack from all workers", msg.fabric)
-                    # unpause and stop tracking
-                    logger.debug("%s broadcasting resume to all watchers", msg.fabric)
-                    self.broadcast(eptMsgWork(0,"watcher",{},WORK_TYPE.FABRIC_WATCH_RESUME))
-                    self.epm_eof_tracking = None
-                    self.fabric.add_fabric_event("running")
+                self.check_epm_eof_tracking()
             else:
                 logger.debug("%s ignoring ack as tracking is disabled", msg.fabric)
+        elif msg.msg_type == MSG_TYPE.WORKER_DRAIN_ACK:
+            # received an ack from a worker for drain marker
+            logger.debug("%s receiving drain ACK %s: %s, q:%s", msg.fabric, msg.seq, msg.addr,
+                            msg.qnum)
+            with self.worker_drain_lock:
+                if self.worker_drain is not None:
+                    key = (msg.addr, msg.qnum)
+                    if self.worker_drain["pending"].get(key, None) == msg.seq:
+                        self.worker_drain["pending"].pop(key, None)
+                    self.check_worker_drain()
         else:
             logger.debug("%s ignoring unexpected msg type: %s", msg.fabric, msg.msg_type)
 
@@ -603,7 +690,8 @@ class eptSubscriber(object):
       
         # trigger watch pause until initial build is complete
         logger.debug("broadcasting pause to all watchers")
-        self.broadcast(eptMsgWork(0, "watcher", {}, WORK_TYPE.FABRIC_WATCH_PAUSE))
+        self.broadcast(eptMsgWork(0, "watcher", {}, WORK_TYPE.FABRIC_WATCH_PAUSE, 
+            WORKER_QUEUE_HIGH))
 
         # setup slow subscriptions to catch events occurring during build 
         if self.settings.queue_init_events:
@@ -620,62 +708,9 @@ class eptSubscriber(object):
                 pass
             return
 
-        # build mo db first as other objects rely on it
-        self.fabric.add_fabric_event(init_str, "collecting base managed objects")
-        if not self.build_mo():
-            # build_mo sets specific error message, no need to set a second one here
-            #self.fabric.add_fabric_event("failed", "failed to collect MOs")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # build node db and vpc db
-        self.fabric.add_fabric_event(init_str, "building node db")
-        if not self.build_node_db():
-            self.fabric.add_fabric_event("failed", "failed to build node db")
+        # build mo db and all dependent dbs (node, vpc, tunnel, vnid, epg, and subnet)
+        if not self.build_base_db(init_str):
             return
-        if not self.build_vpc_db():
-            self.fabric.add_fabric_event("failed", "failed to build node pc to vpc db")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # build tunnel db
-        self.fabric.add_fabric_event(init_str, "building tunnel db")
-        if not self.build_tunnel_db():
-            self.fabric.add_fabric_event("failed", "failed to build tunnel db")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # build vnid db along with vnsLIfCtxToBD db which relies on vnid db
-        self.fabric.add_fabric_event(init_str, "building vnid db")
-        if not self.build_vnid_db():
-            self.fabric.add_fabric_event("failed", "failed to build vnid db")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # build epg db
-        self.fabric.add_fabric_event(init_str, "building epg db")
-        if not self.build_epg_db():
-            self.fabric.add_fabric_event("failed", "failed to build epg db")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # build subnet db
-        self.fabric.add_fabric_event(init_str, "building subnet db")
-        if not self.build_subnet_db():
-            self.fabric.add_fabric_event("failed", "failed to build subnet db")
-            return
-        # check if subscriptions died during previous step
-        self.subscriber_is_alive() 
-
-        # slow objects (including std mo objects) initialization completed
-        self.initializing = False
-        # safe to call resume even if never paused
-        self.subscriber.resume(self.subscription_classes + self.ordered_mo_classes)
 
         # build current epm state, start subscriptions for epm objects after query completes
         self.epm_parser = eptEpmEventParser(self.fabric.fabric, self.settings.overlay_vnid)
@@ -688,43 +723,39 @@ class eptSubscriber(object):
         # check if subscriptions died during previous step
         self.subscriber_is_alive() 
 
-        # epm objects intialization completed
+        # epm objects intialization completed, hold live events until build is complete
+        self.start_epm_build_hold()
         self.epm_initializing = False
         # safe to call resume even if never paused
         self.subscriber.resume(self.epm_subscription_classes)
 
-        # subscribe to subscriber events only after successfully started and initialized
-        channels = {
-            SUBSCRIBER_CTRL_CHANNEL: self.handle_channel_msg,
-        }
-        p = self.redis.pubsub(ignore_subscribe_messages=True)
-        p.subscribe(**channels)
-        self.subscribe_thread = p.run_in_thread(sleep_time=0.01, daemon=True)
-        self.subscribe_thread.name = "sub-redis"
-        logger.debug("[%s] listening for events on channels: %s", self, channels.keys())
+        # subscribe to subscriber events only after successfully started and initialized. Hosted
+        # subscribers receive ctrl msgs from eptSubscriberHost once ctrl_ready is set
+        if not self.hosted:
+            channels = {
+                SUBSCRIBER_CTRL_CHANNEL: self.handle_channel_msg,
+            }
+            p = self.redis.pubsub(ignore_subscribe_messages=True)
+            p.subscribe(**channels)
+            self.subscribe_thread = p.run_in_thread(sleep_time=0.01, daemon=True)
+            self.subscribe_thread.name = "sub-redis"
+            logger.debug("[%s] listening for events on channels: %s", self, channels.keys())
+        self.ctrl_ready = True
 
         # send EPM EOF to all workers lowest prority queue to track when initial processing is done
         # note, this needs to be done after listern is setup on SUBSCRIBER_CTRL_CHANNEL
-        self.epm_eof_start = time.time()
-        self.epm_eof_tracking = {}
-        for role in self.active_workers:
-            if role == "worker":
-                for w in self.active_workers[role]:
-                    self.epm_eof_tracking[w.worker_id] = False
-                    logger.debug("epm eof tracking for worker %s", w.worker_id)
-                    self.send_msg_direct(
-                        worker=w,
-                        msg=eptMsgWork("","worker",{},WORK_TYPE.FABRIC_EPM_EOF,qnum=0),
-                    )
-
-        logger.debug("sending fabric epm eof to all workers")
+        self.send_epm_eof()
         self.fabric.add_fabric_event(init_str, "building endpoint db")
 
-        while True:
-            # ensure that all subscriptions are active
-            self.subscriber_is_alive()
+        self.subscription_alive_ts = time.time()
+        while not self._exit:
+            # ensure that all subscriptions are active, attempt incremental resync if lost
+            if not self.subscriber.is_alive() and not self._exit and not self.resync():
+                raise eptSubscriberExitError("subscription lost and resync failed")
+            self.subscription_alive_ts = time.time()
 
-            if self.epm_eof_tracking is not None:
+            late = self.build_sweep is not None and self.build_sweep["late"]
+            if self.epm_eof_tracking is not None and not late:
                 # still actively tracking workers, check if we've exceeded max build time
                 ts = time.time()
                 if self.epm_eof_start + MAX_EPM_BUILD_TIME <= ts:
@@ -734,17 +765,216 @@ class eptSubscriber(object):
                             )
                     logger.warn(err)
                     self.fabric.add_fabric_event("warning", err)
-                    # unpause and stop tracking
+                    # release held events and unpause
+                    self.release_epm_build_hold()
                     logger.debug("broadcasting resume to all watchers")
-                    self.broadcast(eptMsgWork(0,"watcher",{},WORK_TYPE.FABRIC_WATCH_RESUME))
-                    self.epm_eof_tracking = None
+                    self.broadcast(eptMsgWork(0,"watcher",{},WORK_TYPE.FABRIC_WATCH_RESUME,
+                        WORKER_QUEUE_HIGH))
                     self.fabric.add_fabric_event("running")
+                    # build generation stamps are incomplete until the remaining workers have
+                    # processed the build, keep tracking acks and run the sweep once complete
+                    if self.build_sweep is not None:
+                        logger.warn("stale endpoint sweep for build %s deferred until all workers "
+                                "have processed the build", self.build_sweep["gen"])
+                        self.build_sweep["late"] = True
+                    else:
+                        self.epm_eof_tracking = None
+
+            # all workers have processed the build, send delete jobs for stale endpoints and then
+            # track processing of the delete jobs with a second epm EOF. The second epm EOF is not
+            # needed if watchers were already resumed after max build time was exceeded
+            sweep = self.build_sweep
+            if sweep is not None and sweep["ready"]:
+                self.build_sweep = None
+                self.sweep_endpoint_db(sweep["gen"], sweep["ts"])
+                if not sweep["late"]:
+                    self.send_epm_eof()
+
+            drain = self.worker_drain
+            if drain is not None and drain["start"] + MAX_WORKER_DRAIN_TIME <= time.time():
+                # release held messages if we've exceeded max drain time
+                logger.warn("worker drain max time (%s) exceeded while waiting for [%s]",
+                    MAX_WORKER_DRAIN_TIME, ",".join(["%s:%s" % k for k in drain["pending"]]))
+                self.check_worker_drain(force=True)
 
             # sleep for check interval
             time.sleep(self.subscription_check_interval)
 
+    def log_ingest_stats(self):
+        """ log websocket ingest pipeline stats for subscription """
+        stats = self.subscriber.get_ingest_stats()
+        if stats is None:
+            return
+        logger.debug("ingest frames[recv/dispatch]: %s/%s, backlog[cur/max]: %s/%s, blocked: %s, "
+            "latency avg/max wait: %.3f/%.3f, decode: %.3f/%.3f, dispatch: %.3f/%.3f",
+            stats["recv_frames"], stats["dispatch_frames"], stats["backlog"], stats["backlog_max"],
+            stats["recv_blocked"], stats["wait_avg"], stats["wait_max"], stats["decode_avg"],
+            stats["decode_max"], stats["dispatch_avg"], stats["dispatch_max"])
+
+    def send_epm_eof(self):
+        """ send EPM EOF to the lowest priority queue of each worker and start tracking acks """
+        self.epm_eof_start = time.time()
+        self.epm_eof_tracking = {}
+        for role in self.active_workers:
+            if role == "worker":
+                for w in self.active_workers[role]:
+                    self.epm_eof_tracking[w.worker_id] = False
+                    logger.debug("epm eof tracking for worker %s", w.worker_id)
+                    self.send_msg_direct(
+                        worker=w,
+                        msg=eptMsgWork("","worker",{},WORK_TYPE.FABRIC_EPM_EOF,
+                            qnum=min(WORKER_QUEUE_BULK, len(w.queues)-1)),
+                    )
+        logger.debug("sending fabric epm eof to all workers")
+
+    def start_epm_build_hold(self):
+        """ start holding live epm events until the current build is complete. If a hold is
+            already in progress (i.e., resync during a build), the held events are kept
+        """
+        with self.epm_build_lock:
+            if self.epm_build_held is None:
+                self.epm_build_held = []
+
+    def release_epm_build_hold(self):
+        """ send all live epm events held during the build and stop holding new events """
+        with self.epm_build_lock:
+            held = self.epm_build_held
+            self.epm_build_held = None
+            if held is not None and len(held) > 0:
+                logger.debug("%s sending %s epm events held during build", self.fabric.fabric,
+                        len(held))
+                self.send_msg(held)
+
+    def check_epm_eof_tracking(self):
+        """ if epm eof ack has been received from all workers then resume watchers. If a build
+            sweep is pending then the sweep is triggered instead and watchers are resumed after the
+            workers have acked the subsequent epm eof.
+        """
+        if self.epm_eof_tracking is None:
+            return
+        pending = self.get_workers_with_pending_ack()
+        if len(pending) == 0:
+            logger.debug("%s received epm ack from all workers", self.fabric.fabric)
+            if self.build_sweep is not None:
+                logger.debug("%s build %s complete, sweep ready", self.fabric.fabric, 
+                        self.build_sweep["gen"])
+                self.epm_eof_tracking = None
+                self.build_sweep["ready"] = True
+                return
+            # release held events, unpause, and stop tracking
+            self.release_epm_build_hold()
+            logger.debug("%s broadcasting resume to all watchers", self.fabric.fabric)
+            self.broadcast(eptMsgWork(0,"watcher",{},WORK_TYPE.FABRIC_WATCH_RESUME,
+                WORKER_QUEUE_HIGH))
+            self.epm_eof_tracking = None
+            self.fabric.add_fabric_event("running")
+
+    def handle_worker_update(self, msg):
+        """ receive WORKER_UPDATE from manager with list of active workers. Workers are assigned
+            using rendezvous hash so only the endpoints owned by added or removed workers are moved.
+            Pending work for removed workers is handed off by the manager. For added workers, a
+            drain marker is sent to each queue of the existing workers and messages that are now
+            owned by a new worker are held until all existing workers have acked the drain (i.e.,
+            completed all work enqueued before the update), preserving per-endpoint order. A drain
+            is also sent to the remaining workers when a worker is removed so that each worker 
+            flushes any cached endpoint state that may now be owned by a different worker.
+        """
+        from . ept_manager import TrackedWorker
+        current = {}
+        for role in self.active_workers:
+            for w in self.active_workers[role]:
+                current[w.worker_id] = w
+        updated = {}
+        added = []
+        for js in msg.data.get("workers", []):
+            w = current.get(js["worker_id"], None)
+            if w is None or w.role != js["role"] or w.queues != js["queues"]:
+                w = TrackedWorker.from_json(js)
+                added.append(w)
+            else:
+                w.wire = js.get("wire", w.wire)
+            if w.role not in updated:
+                updated[w.role] = []
+            updated[w.role].append(w)
+        updated_ids = set([w.worker_id for role in updated for w in updated[role]])
+        removed = [wid for wid in current if wid not in updated_ids or \
+                    current[wid] not in updated.get(current[wid].role, [])]
+        if len(added) == 0 and len(removed) == 0:
+            return
+        logger.info("%s worker update, added: [%s], removed: [%s]", self.fabric.fabric,
+                    ",".join([w.worker_id for w in added]), ",".join(removed))
+        fab_id = "fab-%s" % self.fabric.fabric
+        for w in added:
+            for q in w.queues:
+                if q not in self.queue_stats:
+                    stats = eptQueueStats.load(proc=fab_id, queue=q)
+                    stats.init_queue()
+                    with self.queue_stats_lock:
+                        self.queue_stats[q] = stats
+
+        with self.worker_drain_lock:
+            self.active_workers = updated
+            drain_roles = set([w.role for w in added] + [current[wid].role for wid in removed])
+            if self.worker_drain is None and len(drain_roles) > 0:
+                self.worker_drain = {
+                    "drain": 0,
+                    "start": time.time(),
+                    "hold": set(),
+                    "held": [],
+                    "pending": {},
+                }
+            if self.worker_drain is not None:
+                # existing workers are no longer tracked if removed and held messages for removed
+                # workers will be remapped when drain completes
+                for key in self.worker_drain["pending"].keys():
+                    if key[0] in removed:
+                        self.worker_drain["pending"].pop(key, None)
+                self.worker_drain["hold"].difference_update(removed)
+            if len(drain_roles) > 0:
+                self.worker_drain_seq+= 1
+                self.worker_drain["drain"] = self.worker_drain_seq
+                self.worker_drain["hold"].update([w.worker_id for w in added])
+                for role in drain_roles:
+                    for w in updated.get(role, []):
+                        if w.worker_id in self.worker_drain["hold"]:
+                            continue
+                        for qnum in range(0, len(w.queues)):
+                            self.worker_drain["pending"][(w.worker_id, qnum)] = self.worker_drain_seq
+                            self.send_msg_direct(w, eptMsgWork("", role, 
+                                {"drain": self.worker_drain_seq}, WORK_TYPE.WORKER_DRAIN, qnum=qnum
+                            ))
+            self.check_worker_drain()
+
+        # stop tracking epm eof for removed workers
+        if self.epm_eof_tracking is not None:
+            for wid in removed:
+                self.epm_eof_tracking.pop(wid, None)
+            self.check_epm_eof_tracking()
+
+    def check_worker_drain(self, force=False):
+        """ if all drain acks have been received (or force is set), then release held messages """
+        with self.worker_drain_lock:
+            if self.worker_drain is None:
+                return
+            if len(self.worker_drain["pending"]) > 0 and not force:
+                return
+            drain = self.worker_drain
+            self.worker_drain = None
+            logger.debug("%s worker drain %s complete after %.3f seconds, sending %s held msgs",
+                self.fabric.fabric, drain["drain"], time.time()-drain["start"], len(drain["held"]))
+            if len(drain["held"]) > 0:
+                self._send_msg(drain["held"])
+
+    def check_exit(self):
+        """ raise exception if subscriber has been stopped. This is checked within each build loop
+            so a stopped subscriber exits without completing the build
+        """
+        if self._exit:
+            raise eptSubscriberExitError("subscriber stopped")
+
     def subscriber_is_alive(self):
-        """ check if subscriber is alive and raise exception if it has died """
+        """ check if subscriber is alive and raise exception if it has died or has been stopped """
+        self.check_exit()
         if not self.subscriber.is_alive():
             logger.warn("subscription no longer alive for %s", self.fabric.fabric)
             # add a fabric event with specific reason for subscriber exist if set
@@ -763,6 +993,161 @@ class eptSubscriber(object):
                         ",".join(pending))
         return pending
 
+    def resync(self):
+        """ incremental resync after the subscription is lost.  The subscription is restarted and
+            the mo db is rebuilt, syncing only the ept objects dependent on changed mos.  Instead of
+            a full endpoint build, create jobs are only sent for epm objects modified while the
+            subscription was down.  Return boolean success. On failure the caller must exit so the
+            fabric is restarted with a full rebuild.
+        """
+        reason = self.subscriber.failure_reason
+        if reason is None:
+            reason = "subscription no longer alive"
+        start_time = time.time()
+        # last alive ts must be read before the subscription is restarted with a new session
+        cutoff = self.get_resync_cutoff(self.subscriber.get_last_alive_ts())
+        gap = start_time - self.subscription_alive_ts
+        logger.warn("subscription lost for %s (%.3f seconds since last alive): %s", 
+                self.fabric.fabric, gap, reason)
+        if gap > RESYNC_MAX_GAP:
+            logger.warn("subscription gap exceeds max resync gap (%s)", RESYNC_MAX_GAP)
+            self.fabric.add_fabric_event("failed", reason)
+            return False
+
+        init_str = "re-syncing"
+        self.fabric.add_fabric_event(init_str, reason)
+        # block events and pause watchers until resync is complete
+        self.initializing = True
+        self.epm_initializing = True
+        logger.debug("broadcasting pause to all watchers")
+        self.broadcast(eptMsgWork(0, "watcher", {}, WORK_TYPE.FABRIC_WATCH_PAUSE, 
+            WORKER_QUEUE_HIGH))
+
+        if self.session is not None:
+            self.session.close()
+        self.session = get_apic_session(self.fabric)
+        if self.session is None:
+            logger.warn("failed to connect to fabric: %s", self.fabric.fabric)
+            self.fabric.add_fabric_event("failed", "failed to connect to apic")
+            return False
+        if self.settings.queue_init_events:
+            self.subscriber.pause(self.subscription_classes + self.ordered_mo_classes)
+        if self.settings.queue_init_epm_events:
+            self.subscriber.pause(self.epm_subscription_classes)
+        if not self.subscriber.subscribe(blocking=False, session=self.session):
+            self.fabric.add_fabric_event("failed", "failed to restart one or more subscriptions")
+            return False
+
+        # a change in active leafs requires a full endpoint build
+        leafs = self.get_active_leafs()
+        if not self.build_base_db(init_str, incremental=True):
+            return False
+        if self.get_active_leafs() != leafs:
+            self.fabric.add_fabric_event("failed", "active leafs changed during resync")
+            return False
+
+        self.fabric.add_fabric_event(init_str, "getting changed endpoint state")
+        if not self.resync_endpoint_db(cutoff, start_time):
+            self.fabric.add_fabric_event("failed", "failed to resync endpoint db")
+            return False
+        # resync sent delete jobs for all endpoints not returned so a pending build sweep is no
+        # longer required
+        if self.build_sweep is not None:
+            logger.debug("resync replaces pending sweep for build %s", self.build_sweep["gen"])
+            self.build_sweep = None
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive()
+
+        self.start_epm_build_hold()
+        self.epm_initializing = False
+        self.subscriber.resume(self.epm_subscription_classes)
+        # watchers are resumed and held events released after workers have processed the resync
+        self.send_epm_eof()
+        logger.info("resync for %s completed in %.3f seconds", self.fabric.fabric, 
+                time.time() - start_time)
+        return True
+
+    def get_resync_cutoff(self, last_alive_ts):
+        """ return timestamp where epm objects with a later modTs are sent to workers on resync.
+            Events may be lost anytime after the subscription was last confirmed alive (last 
+            received event or successful heartbeat) and a lost APIC is only detected after
+            heartbeat_max_retries failed heartbeats.  The full detection window along with
+            RESYNC_TS_MARGIN for clock skew with the APIC is subtracted from the last alive ts.
+        """
+        if last_alive_ts <= 0 or last_alive_ts > self.subscription_alive_ts:
+            last_alive_ts = self.subscription_alive_ts
+        window = (self.fabric.heartbeat_interval + self.fabric.heartbeat_timeout) * \
+                    self.fabric.heartbeat_max_retries
+        cutoff = last_alive_ts - window - RESYNC_TS_MARGIN
+        logger.debug("resync cutoff %.3f (last alive: %.3f, detection window: %s)", cutoff,
+                last_alive_ts, window)
+        return cutoff
+
+    def resync_endpoint_db(self, cutoff, ts):
+        """ stream all epm objects from the APIC and send create jobs only for objects with a modTs
+            after the provided cutoff (or an unknown modTs). Delete jobs are sent for endpoints 
+            within the db that were not returned. ts is used as the timestamp for delete jobs.
+            Return boolean success
+        """
+        logger.debug("resync endpoint db for objects modified after %.3f", cutoff)
+        start_time = time.time()
+        # compact set of (node, vnid, addr) for each endpoint returned from class query
+        endpoints = eptEndpointPresence()
+        total = 0
+        total_create = 0
+        for c in self.epm_subscription_classes:
+            if c == "epmRsMacEpToIpEpAtt":
+                orderBy = "%s.dn" % c
+            else:
+                orderBy = "%s.addr" % c
+            # attributes of changed and unchanged objects which are parsed in pages
+            pages = [[], []]
+            for obj in get_class(self.session, c, stream=True, orderBy=orderBy):
+                self.check_exit()
+                if obj is None:
+                    logger.warn("failed to get epm data for class %s", c)
+                    return False
+                if c in obj and "attributes" in obj[c]:
+                    attr = obj[c]["attributes"]
+                    mod_ts = parse_apic_timestamp(attr.get("modTs", ""))
+                    pages[0 if mod_ts == 0 or mod_ts > cutoff else 1].append(attr)
+                    if len(pages[0]) + len(pages[1]) >= MAX_SEND_MSG_LENGTH:
+                        (count, create_count) = self.resync_epm_pages(c, pages, endpoints)
+                        total+= count
+                        total_create+= create_count
+                        pages = [[], []]
+                else:
+                    logger.warn("invalid %s object: %s", c, obj)
+            (count, create_count) = self.resync_epm_pages(c, pages, endpoints)
+            total+= count
+            total_create+= create_count
+        delete_count = self.sweep_endpoint_db(endpoints=endpoints, ts=ts)
+        logger.debug("resync endpoint db %s objects, %s create, %s delete (time: %.3f)", total,
+                total_create, delete_count, time.time() - start_time)
+        return True
+
+    def resync_epm_pages(self, classname, pages, endpoints):
+        """ parse pages of changed and unchanged epm attributes, add all to endpoints presence set,
+            and send create msgs for changed objects.  Return tuple (total, create count).
+        """
+        ts = time.time()
+        (changed, unchanged) = pages
+        for msg in self.epm_parser.parse_many(classname, unchanged, ts):
+            endpoints.add(msg.node, msg.vnid, msg.addr)
+        create_msgs = self.epm_parser.parse_many(classname, changed, ts)
+        for msg in create_msgs:
+            endpoints.add(msg.node, msg.vnid, msg.addr)
+        create_count = self.send_epm_create_msgs(classname, create_msgs)
+        return (len(changed) + len(unchanged), create_count)
+
+    def get_active_leafs(self):
+        """ return sorted list of (pod_id, node) for each in-service leaf within node db """
+        nodes = []
+        for n in eptNode.find(fabric=self.fabric.fabric):
+            if n.role == "leaf" and n.state == "in-service":
+                nodes.append((n.pod_id, n.node))
+        return sorted(nodes)
+
     def hard_restart(self, reason=""):
         """ send msg to manager for fabric restart """
         logger.warn("restarting fabric monitor '%s': %s", self.fabric.fabric, reason)
@@ -825,6 +1210,7 @@ class eptSubscriber(object):
         if not s3:
             self.fabric.add_fabric_event("failed", err3)
             return self.hard_restart("failed to build node pc to vpc db")
+        self.send_mo_index_reset()
 
         # build tunnel db
         self.fabric.add_fabric_event(init_str, "building tunnel db")
@@ -833,10 +1219,7 @@ class eptSubscriber(object):
             return self.hard_restart("failed to build tunnel db")
 
         # clear appropriate caches
-        self.send_flush(eptNode)
-        self.send_flush(eptVpc)
-        self.send_flush(eptPc)
-        self.send_flush(eptTunnel)
+        self.send_flush_bulk([(c, None) for c in [eptNode, eptVpc, eptPc, eptTunnel]])
 
         self.fabric.add_fabric_event("running")
         self.initializing = False
@@ -845,9 +1228,21 @@ class eptSubscriber(object):
     def send_flush(self, collection, name=None):
         """ send flush message to workers for provided collection """
         logger.debug("flush %s (name:%s)", collection._classname, name)
+        version = sharedCache.invalidate(self.redis, self.fabric.fabric, collection._classname)
         # node addr of 0 is broadcast to all nodes of provided role
-        data = {"cache": collection._classname, "name": name}
-        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE))
+        data = {"cache": collection._classname, "name": name, "version": version}
+        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, WORKER_QUEUE_HIGH))
+
+    def send_mo_index_reset(self):
+        """ send mo index reset to watchers after mo db is rebuilt """
+        logger.debug("broadcasting mo index reset to all watchers")
+        self.broadcast(eptMsgWork(0, "watcher", {}, WORK_TYPE.MO_INDEX_RESET, WORKER_QUEUE_HIGH))
+
+    def send_flush_bulk(self, flush):
+        """ send single flush message to workers for list of (collection, name) tuples """
+        logger.debug("flush bulk %s entries", len(flush))
+        data = eptCache.get_flush_bulk_data(self.redis, self.fabric.fabric, flush)
+        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE_BULK, WORKER_QUEUE_HIGH))
 
     def parse_event(self, event, verify_ts=True):
         """ iterarte list of (classname, attr) objects from subscription event including _ts 
@@ -921,15 +1316,17 @@ class eptSubscriber(object):
                 # we will statically set it to an empty string. can make this dn in the future...
                 # note that integer 0 is a broadcast that is never sent as bulk.
                 addr = ""
-                msg = eptMsgWorkStdMo(addr, "watcher",{classname:attr}, WORK_TYPE.STD_MO)
+                msg = eptMsgWorkStdMo(addr, "watcher",{classname:attr}, WORK_TYPE.STD_MO,
+                        qnum=WORKER_QUEUE_NORMAL)
                 self.std_mo_event_queue.put(msg)
         except Exception as e:
             logger.error("Traceback:\n%s", traceback.format_exc())
 
-    def handle_epm_event(self, event, qnum=0):
+    def handle_epm_event(self, event):
         """ handle epm events received on epm_subscription
             this will parse the epm event and create and eptMsgWorkRaw msg for the event. Then it
-            will add msg to epm_event_queue for background process to batch
+            will add msg to epm_event_queue for background process to batch. Live epm events are
+            always sent on the normal worker queue.
         """
         if self.stopped:
             logger.debug("ignoring event (subscriber stopped and waiting for reset)")
@@ -949,32 +1346,160 @@ class eptSubscriber(object):
                 #   .../db-ep/ip-[10.1.55.220]
                 #   rsmacEpToIpEpAtt-.../db-ep/ip-[10.1.1.74]]
                 # addr = re.sub("[\[\]]","", attr["dn"].split("-")[-1])
-                #msg = eptMsgWorkRaw(addr,"worker", {classname:attr}, WORK_TYPE.RAW, qnum=qnum)
+                #msg = eptMsgWorkRaw(addr,"worker", {classname:attr}, WORK_TYPE.RAW, 
+                #       qnum=WORKER_QUEUE_NORMAL)
                 # OR, full parse of event in subscriber module which extracts all required info 
                 # this is needed for address and vnid info for hash module
                 msg = self.epm_parser.parse(classname, attr, attr["_ts"])
-                self.epm_event_queue.put(msg)
+                if msg is not None:
+                    msg.qnum = WORKER_QUEUE_NORMAL
+                    self.epm_event_queue.put(msg)
         except Exception as e:
             logger.error("Traceback:\n%s", traceback.format_exc())
 
     def handle_background_event_queue(self):
         """ pull off all current msgs in epm_event_queue/std_mo_event_queue and send as a batch.
-            The purpose of this is to create bulk eptMsg objects to improve redis performance
+            The purpose of this is to create bulk eptMsg objects to improve redis performance.
+            Epm msgs are held instead if an endpoint build is in progress.
         """
         for q in [self.std_mo_event_queue, self.epm_event_queue]:
             msgs = []
             while not q.empty():
                 msgs.append(q.get())
-            if len(msgs)>0:
+            if len(msgs) == 0:
+                continue
+            if q is self.epm_event_queue:
+                with self.epm_build_lock:
+                    if self.epm_build_held is not None:
+                        self.epm_build_held.extend(msgs)
+                    else:
+                        self.send_msg(msgs)
+            else:
                 self.send_msg(msgs)
 
-    def build_mo(self):
-        """ build managed objects for defined classes """
+    def build_base_db(self, init_str, incremental=False):
+        """ build mo db and all dbs that depend on it (node, vpc, tunnel, vnid, epg, and subnet) 
+            then flush worker caches and resume slow subscriptions.  A fabric event is added with
+            the specific reason on failure.
+            If incremental is set, the vnid, epg, and subnet dbs are not rebuilt.  Instead, only
+            the ept objects dependent on changed mos are synced.
+            Return boolean success
+        """
+        # build mo db first as other objects rely on it
+        mo_changes = [] if incremental else None
+        self.fabric.add_fabric_event(init_str, "collecting base managed objects")
+        if not self.build_mo(mo_changes=mo_changes):
+            # build_mo sets specific error message, no need to set a second one here
+            #self.fabric.add_fabric_event("failed", "failed to collect MOs")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+
+        # build node db and vpc db
+        self.fabric.add_fabric_event(init_str, "building node db")
+        if not self.build_node_db():
+            self.fabric.add_fabric_event("failed", "failed to build node db")
+            return False
+        if not self.build_vpc_db():
+            self.fabric.add_fabric_event("failed", "failed to build node pc to vpc db")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+
+        # build tunnel db
+        self.fabric.add_fabric_event(init_str, "building tunnel db")
+        if not self.build_tunnel_db():
+            self.fabric.add_fabric_event("failed", "failed to build tunnel db")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+
+        # sync ept objects dependent on changed mos instead of full vnid, epg, and subnet build
+        if incremental:
+            self.fabric.add_fabric_event(init_str, "syncing changed managed objects")
+            if not self.sync_mo_changes(mo_changes):
+                self.fabric.add_fabric_event("failed", "failed to sync changed managed objects")
+                return False
+            return self.complete_base_db()
+
+        # build vnid db along with vnsLIfCtxToBD db which relies on vnid db
+        self.fabric.add_fabric_event(init_str, "building vnid db")
+        if not self.build_vnid_db():
+            self.fabric.add_fabric_event("failed", "failed to build vnid db")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+
+        # build epg db
+        self.fabric.add_fabric_event(init_str, "building epg db")
+        if not self.build_epg_db():
+            self.fabric.add_fabric_event("failed", "failed to build epg db")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+
+        # build subnet db
+        self.fabric.add_fabric_event(init_str, "building subnet db")
+        if not self.build_subnet_db():
+            self.fabric.add_fabric_event("failed", "failed to build subnet db")
+            return False
+        # check if subscriptions died during previous step
+        self.subscriber_is_alive() 
+        return self.complete_base_db()
+
+    def complete_base_db(self):
+        """ flush worker caches and resume slow subscriptions after base db build """
+        # flush worker caches (including shared cache) for objects that may have been cached
+        # before or during the build
+        self.send_flush_bulk([(c, None) for c in [eptNode,eptTunnel,eptVpc,eptPc,eptVnid,eptEpg]])
+
+        # slow objects (including std mo objects) initialization completed
+        self.initializing = False
+        # safe to call resume even if never paused
+        self.subscriber.resume(self.subscription_classes + self.ordered_mo_classes)
+        return True
+
+    def build_mo(self, mo_changes=None):
+        """ build managed objects for defined classes.  If mo_changes list is provided then a tuple
+            (classname, change) is appended for each mo created, modified, or deleted by rebuild
+        """
         for mo in self.ordered_mo_classes:
-            (success, errmsg) = self.mo_classes[mo].rebuild(self.fabric, session=self.session)
+            self.check_exit()
+            changes = None if mo_changes is None else []
+            (success, errmsg) = self.mo_classes[mo].rebuild(self.fabric, session=self.session,
+                                                            changes=changes)
             if not success:
                 self.fabric.add_fabric_event("failed", errmsg)
                 return False
+            if changes is not None:
+                mo_changes.extend([(mo, c) for c in changes])
+        # watcher mo dependency index is stale after rebuild
+        self.send_mo_index_reset()
+        return True
+
+    def sync_mo_changes(self, mo_changes):
+        """ sync dependent ept objects for each (classname, change) tuple returned by build_mo.  
+            This must only be called after all mo classes are rebuilt as each sync reads parent
+            and child objects from the local mo db.  Return boolean success
+        """
+        logger.debug("syncing dependent ept objects for %s mo changes", len(mo_changes))
+        if len(mo_changes) == 0:
+            return True
+        index = DependencyIndex(self.fabric.fabric, dependency_map.values())
+        if not index.load():
+            return False
+        updates = 0
+        try:
+            for (classname, change) in mo_changes:
+                if classname in dependency_map:
+                    updates+= len(dependency_map[classname].sync_rebuild(self.fabric.fabric, 
+                                    change, index=index))
+                else:
+                    logger.warn("%s not defined in dependency_map", classname)
+        except Exception as e:
+            logger.error("Traceback:\n%s", traceback.format_exc())
+            return False
+        logger.debug("updated ept objects: %s", updates)
         return True
 
     def initialize_ept_collection(self, eptObject, mo_classname, attribute_map=None, 
@@ -1509,7 +2034,8 @@ class eptSubscriber(object):
                             self.hard_restart(reason="leaf '%s' became active" % node.node)
                         else:
                             logger.debug("node %s '%s', sending watch_node event", node.node,status)
-                            msg = eptMsgWorkWatchNode("1","watcher",{},WORK_TYPE.WATCH_NODE)
+                            msg = eptMsgWorkWatchNode("1","watcher",{},WORK_TYPE.WATCH_NODE,
+                                    qnum=WORKER_QUEUE_NORMAL)
                             msg.node = node.node
                             msg.ts = attr["_ts"]
                             msg.status = status
@@ -1532,92 +2058,161 @@ class eptSubscriber(object):
     def build_endpoint_db(self):
         """ all endpoint events (eptHistory and eptEndpoint) are handled by app workers. To build
             the initial database we need to simulate create or delete events for each endpoint 
-            returned from the APIC and send through worker process.  Delete jobs are created for
-            endpoints previously within the database but not returned on query, all other objects 
-            will result in a create job.
+            returned from the APIC and send through worker process.  Each create job is stamped
+            with the current build generation which the worker sets on the eptHistory entry. Delete
+            jobs for endpoints previously within the database but not returned on query are sent by
+            sweep_endpoint_db after all workers have processed the create jobs.
 
             Return boolean success
         """
         logger.debug("initialize endpoint db")
         start_time = time.time()
+        # build generation is the build start time in milliseconds
+        self.build_gen = int(start_time * 1000)
+        self.build_sweep = None
+        logger.debug("endpoint build generation %s", self.build_gen)
 
-        # 3-level dict to track endpoints returned from class query endpoints[node][vnid][addr] = 1
-        endpoints = {}
         # we will start epm subscription AFTER get_class (which can take a long time) but before 
         # processing endpoints.  This minimizes amount of time we lose data without having to buffer
         # all events that are recieved during get requests.
         paused = self.settings.queue_init_epm_events
         total_create = 0
-        for c in self.epm_subscription_classes:
-            if c == "epmRsMacEpToIpEpAtt":
-                gen = get_class(self.session, c, stream=True, orderBy="%s.dn" % c)
-            else:
-                gen = get_class(self.session, c, stream=True, orderBy="%s.addr" % c)
-            ts = time.time()
-            create_count = 0
-            create_msgs = []
-            if not self.subscriber.add_interest(c, self.handle_epm_event, paused=paused):
-                logger.warn("failed to add interest %s to subscriber", c)
-                return False
-            for obj in gen:
-                if obj is None:
-                    logger.error("failed to get epm data for class %s", c)
+        # split each class query into node scoped queries across in-service leafs when parallel 
+        # fetch is enabled. Classes are still fetched in order so analysis order is maintained.
+        fetcher = None
+        nodes = []
+        if BUILD_FETCH_CONCURRENCY > 1:
+            nodes = self.get_active_leafs()
+            if len(nodes) > 0:
+                fetcher = eptEpmFetcher(self.fabric, self.epm_parser)
+                if not fetcher.start():
+                    logger.warn("failed to start parallel fetch, using single class query")
+                    fetcher = None
+        try:
+            for c in self.epm_subscription_classes:
+                self.check_exit()
+                if c == "epmRsMacEpToIpEpAtt":
+                    orderBy = "%s.dn" % c
+                else:
+                    orderBy = "%s.addr" % c
+                if not self.subscriber.add_interest(c, self.handle_epm_event, paused=paused):
+                    logger.warn("failed to add interest %s to subscriber", c)
                     return False
-                if c in obj and "attributes" in obj[c]:
-                    msg = self.epm_parser.parse(c, obj[c]["attributes"], ts)
-                    if msg is not None:
-                        create_count+=1
-                        create_msgs.append(msg)
-                        if msg.node not in endpoints: endpoints[msg.node] = {}
-                        if msg.vnid not in endpoints[msg.node]: endpoints[msg.node][msg.vnid] = {}
-                        endpoints[msg.node][msg.vnid][msg.addr] = 1
-                        # process the data now as we can't afford buffer all msgs in memory on 
-                        # scale setups.
-                        if len(create_msgs) >= MAX_SEND_MSG_LENGTH:
-                            logger.debug("build_endpoint_db sending %s create for %s", 
-                                    len(create_msgs), c)
-                            self.send_msg(create_msgs)
-                            create_msgs = []
+                ts = time.time()
+                # failed node queries are retried by the fetcher. A full class query is not used
+                # as a fallback since create msgs were already sent for the successful nodes
+                if fetcher is not None:
+                    create_count = self.fetch_epm_class_parallel(fetcher, c, nodes, ts, orderBy)
                 else:
-                    logger.warn("invalid %s object: %s", c, obj)
-
-            # send remaining create messages
-            if len(create_msgs) > 0:
-                logger.debug("build_endpoint_db sending %s create for %s", len(create_msgs),c)
-                self.send_msg(create_msgs)
-                create_msgs = []
-            # print total for reference
-            logger.debug("build_endpoint_db total %s create for %s", create_count, c)
-            total_create+= create_count
+                    create_count = self.fetch_epm_class(c, ts, orderBy)
+                if create_count is None:
+                    logger.error("failed to get epm data for class %s", c)
+                    return False
+                # print total for reference
+                logger.debug("build_endpoint_db total %s create for %s", create_count, c)
+                total_create+= create_count
+        finally:
+            if fetcher is not None:
+                fetcher.close()
+
+        # delete jobs are sent once workers have stamped the build generation on all entries
+        self.build_sweep = {
+            "gen": self.build_gen,
+            "ts": start_time,
+            "ready": False,
+            "late": False,
+        }
+        logger.debug("build_endpoint_db total time: %.3f", time.time()-start_time)
+        # add fabric event so user is aware of number of create events that will be processed
+        overview = "analyzing %s endpoint records" % total_create
+        self.fabric.add_fabric_event("initializing", overview)
+        return True
 
-        # stream delete jobs
+    def sweep_endpoint_db(self, build_gen=None, ts=None, endpoints=None):
+        """ send delete jobs for each endpoint in the db that is not deleted and was not stamped by
+            the provided build generation (i.e., not returned from the APIC during the build) or,
+            if endpoints presence set is provided, is not within the set. The delete jobs use the
+            provided start ts so they are ignored by the worker for any endpoint with a more recent
+            event. Return the number of delete jobs sent.
+        """
+        start_time = time.time()
         delete_count = 0
         delete_msgs = []
-        for obj in self.get_epm_delete_msgs(endpoints):
+        for obj in self.get_epm_delete_msgs(endpoints=endpoints, build_gen=build_gen, ts=ts):
+            self.check_exit()
+            obj.qnum = WORKER_QUEUE_BULK
             delete_count+= 1
             delete_msgs.append(obj)
             if len(delete_msgs) >= MAX_SEND_MSG_LENGTH:
-                logger.debug("build_endpoint_db sending %s delete jobs", len(delete_msgs))
+                logger.debug("sweep_endpoint_db sending %s delete jobs", len(delete_msgs))
                 self.send_msg(delete_msgs)
                 delete_msgs = []
         # send remaining delete messages
         if len(delete_msgs) > 0:
-            logger.debug("build_endpoint_db sending %s delete jobs", len(delete_msgs))
+            logger.debug("sweep_endpoint_db sending %s delete jobs", len(delete_msgs))
             self.send_msg(delete_msgs)
-            delete_msgs = []
-        # print total for reference
-        logger.debug("build_endpoint_db total %s delete jobs", delete_count)
-        logger.debug("build_endpoint_db total time: %.3f", time.time()-start_time)
-        # add fabric event so user is aware of number of create/delete events that will be processed
-        overview = "analyzing %s endpoint records" % (total_create + delete_count)
-        self.fabric.add_fabric_event("initializing", overview)
-        return True
+        logger.debug("sweep_endpoint_db build %s total %s delete jobs (time: %.3f)", build_gen,
+                delete_count, time.time()-start_time)
+        return delete_count
+
+    def fetch_epm_class(self, classname, ts, orderBy):
+        """ fetch all objects for epm class with a single class query and send create msgs to 
+            workers in pages. Return the number of create msgs sent or None on error.
+        """
+        create_count = 0
+        attrs = []
+        for obj in get_class(self.session, classname, stream=True, orderBy=orderBy):
+            self.check_exit()
+            if obj is None:
+                return None
+            if classname in obj and "attributes" in obj[classname]:
+                attrs.append(obj[classname]["attributes"])
+                # process the data now as we can't afford buffer all msgs in memory on 
+                # scale setups.
+                if len(attrs) >= MAX_SEND_MSG_LENGTH:
+                    create_msgs = self.epm_parser.parse_many(classname, attrs, ts)
+                    create_count+= self.send_epm_create_msgs(classname, create_msgs)
+                    attrs = []
+            else:
+                logger.warn("invalid %s object: %s", classname, obj)
+        # send remaining create messages
+        if len(attrs) > 0:
+            create_msgs = self.epm_parser.parse_many(classname, attrs, ts)
+            create_count+= self.send_epm_create_msgs(classname, create_msgs)
+        return create_count
+
+    def fetch_epm_class_parallel(self, fetcher, classname, nodes, ts, orderBy):
+        """ fetch all objects for epm class with node scoped queries executed in parallel by the
+            provided eptEpmFetcher and send create msgs to workers as each page is received. Return
+            the number of create msgs sent or None on error.
+        """
+        fetch_start = time.time()
+        create_count = 0
+        for create_msgs in fetcher.fetch(classname, nodes, ts, orderBy=orderBy):
+            self.check_exit()
+            if create_msgs is None:
+                return None
+            create_count+= self.send_epm_create_msgs(classname, create_msgs)
+        logger.debug("parallel fetch of %s from %s nodes completed in %0.3f seconds", classname,
+                len(nodes), time.time() - fetch_start)
+        return create_count
+
+    def send_epm_create_msgs(self, classname, create_msgs):
+        """ stamp each parsed epm create msg with the current build generation and send the create
+            msgs to workers on the bulk queue.  Return the number of create msgs sent.
+        """
+        build_gen = self.build_gen
+        for msg in create_msgs:
+            msg.qnum = WORKER_QUEUE_BULK
+            msg.build_gen = build_gen
+        if len(create_msgs) > 0:
+            logger.debug("build_endpoint_db sending %s create for %s", len(create_msgs), classname)
+            self.send_msg(create_msgs)
+        return len(create_msgs)
 
     def refresh_endpoint(self, vnid, addr, addr_type):
         """ perform endpoint refresh. This triggers an API query for epmDb filtering on provided
-            addr and vnid. The results are fed through handle_epm_event which is enqueued onto 
-            a worker. Since workers only have a single queue, will need to insert at the top of
-            thier queue.
+            addr and vnid. The results are enqueued onto the high priority worker queue.
         """
         logger.debug("refreshing [0x%06x %s]", vnid, addr)
         if addr_type == "mac":
@@ -1636,8 +2231,8 @@ class eptSubscriber(object):
             }
         objects = get_class(self.session, classname, **kwargs)
         ts = time.time()
-        # 3-level dict to track endpoints returned from class query endpoints[node][vnid][addr] = 1
-        endpoints = {}
+        # compact set of (node, vnid, addr) for each endpoint returned from class query
+        endpoints = eptEndpointPresence(size=64)
         # queue all the events to send at one time...
         create_msgs = []
         # queue all the events to send at one time...
@@ -1650,11 +2245,7 @@ class eptSubscriber(object):
                     msg = self.epm_parser.parse(classname, attr, attr["_ts"])
                     if msg is not None:
                         create_msgs.append(msg)
-                        if msg.node not in endpoints:
-                            endpoints[msg.node] = {}
-                        if msg.vnid not in endpoints[msg.node]:
-                            endpoints[msg.node][msg.vnid] = {}
-                        endpoints[msg.node][msg.vnid][msg.addr] = 1
+                        endpoints.add(msg.node, msg.vnid, msg.addr)
                 else:
                     logger.debug("ignoring invalid epm object %s", obj)
             # get delete jobs
@@ -1664,16 +2255,20 @@ class eptSubscriber(object):
             # set force flag on each msg to trigger analysis update
             for msg in create_msgs+delete_msgs:
                 msg.force = True
+                msg.qnum = WORKER_QUEUE_HIGH
 
-            self.send_msg(create_msgs+delete_msgs, prepend=True)
+            self.send_msg(create_msgs+delete_msgs)
         else:
             logger.debug("failed to get epm objects")
 
-    def get_epm_delete_msgs(self, endpoints, addr=None, vnid=None):
-        """ from provided create endpoint dict and flt, stream iterators for epm delete msgs
-            endpoints must be 3-level dict in the form endpoints[node][vnid][addr]
+    def get_epm_delete_msgs(self, endpoints=None, addr=None, vnid=None, build_gen=None, ts=None):
+        """ from provided create endpoint set and flt, stream iterators for epm delete msgs
+            endpoints must be an eptEndpointPresence set of each endpoint returned from the APIC.
+            If build_gen is provided, then endpoints is not used and delete msgs are created for 
+            all entries with an older (or no) build generation and last event before ts.
         """
-        logger.debug("get epm delete messages (flt addr:%s, vnid:%s)", addr, vnid)
+        logger.debug("get epm delete messages (flt addr:%s, vnid:%s, build_gen:%s)", addr, vnid,
+                build_gen)
 
         # get entries in db and create delete events for those not deleted and not in class query.
         # we need to iterate through the results and do so as fast as possible and current rest
@@ -1691,12 +2286,15 @@ class eptSubscriber(object):
         if addr is not None and vnid is not None:
             flt["addr"] = addr
             flt["vnid"] = vnid
-
-        ts = time.time()
+        if ts is None:
+            ts = time.time()
+        if build_gen is not None:
+            # entries that existed before build generations were introduced do not have build_gen
+            flt["$or"] = [{"build_gen": {"$lt": build_gen}}, {"build_gen": None}]
+            flt["events.0.ts"] = {"$lt": ts}
         for obj in self.db[eptHistory._classname].find(flt, projection):
-            # if in endpoints dict, then stil exists in the fabric so do not create a delete event
-            if obj["node"] in endpoints and obj["vnid"] in endpoints[obj["node"]] and \
-                obj["addr"] in endpoints[obj["node"]][obj["vnid"]]:
+            # if in endpoints set, then stil exists in the fabric so do not create a delete event
+            if endpoints is not None and endpoints.exists(obj["node"], obj["vnid"], obj["addr"]):
                 continue
             if obj["type"] == "mac":
                 msg = self.epm_parser.get_delete_event("epmMacEp", obj["node"], 
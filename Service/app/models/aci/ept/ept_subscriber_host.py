@@ -0,0 +1,282 @@
+from ... utils import get_db
+from ... utils import get_redis
+from .. fabric import Fabric
+from . common import BG_EVENT_HANDLER_INTERVAL
+from . common import HELLO_INTERVAL
+from . common import SUBSCRIBER_CTRL_CHANNEL
+from . common import SUBSCRIBER_HOST_START_TIMEOUT
+from . common import SUBSCRIBER_HOST_STOP_TIMEOUT
+from . common import BackgroundTasks
+from . common import BackgroundThread
+from . common import log_version
+from . ept_msg import MSG_TYPE
+from . ept_msg import eptMsg
+from . ept_queue_stats import eptQueueStats
+from . ept_subscriber import eptSubscriber
+
+from multiprocessing import Event
+
+import logging
+import threading
+import time
+import traceback
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+class eptSubscriberHost(object):
+    """ runs an eptSubscriber for multiple fabrics within a single process. Each fabric subscriber
+        runs in its own thread with its own apic session and subscriptions, while the db and redis
+        connections, subscriber ctrl channel listener, hello/stats tasks, and event batching thread
+        are shared across all hosted fabrics. The manager starts and stops each fabric by sending
+        FABRIC_START and FABRIC_STOP on the subscriber ctrl channel.
+    """
+    def __init__(self, ingest_stats_interval=60.0):
+        self.db = None
+        self.redis = None
+        self.subscribers = {}           # hosted eptSubscriber indexed by fabric name
+        self.threads = {}               # subscriber thread indexed by fabric name
+        self.stopping = {}              # thread of stopped subscriber indexed by fabric name
+        self.pending = {}               # deferred start (workers and ts) indexed by fabric name
+        self.lock = threading.Lock()
+        self.subscribe_thread = None
+        self.tasks_thread = None
+        self.bg_thread = None
+        self.ingest_stats_interval = ingest_stats_interval
+        self.ready = Event()            # set when host is listening on subscriber ctrl channel
+        self._exit = False
+
+    def __repr__(self):
+        return "sub-host"
+
+    def run(self):
+        """ wrapper around run to handle interrupts/errors """
+        threading.currentThread().name = "sub-host"
+        log_version()
+        logger.info("starting eptSubscriberHost")
+        try:
+            # allocate a unique db connection as this is running in a new process
+            self.db = get_db(uniq=True, overwrite_global=True, write_concern=True)
+            self.redis = get_redis()
+            self.tasks_thread = BackgroundTasks(name="sub-tasks")
+            self.tasks_thread.add_task(self.send_hello, HELLO_INTERVAL)
+            self.tasks_thread.add_task(self.update_stats, eptQueueStats.STATS_INTERVAL)
+            self.tasks_thread.add_task(self.log_ingest_stats, self.ingest_stats_interval)
+            self.tasks_thread.daemon = True
+            self.tasks_thread.start()
+            self.bg_thread = BackgroundThread(
+                func=self.handle_background_event_queue,
+                name="sub-event",
+                count=0,
+                interval=BG_EVENT_HANDLER_INTERVAL
+            )
+            self.bg_thread.daemon = True
+            self.bg_thread.start()
+            self._run()
+        except KeyboardInterrupt as e:
+            logger.debug("keyboard interupt: %s", e)
+        except (Exception, SystemExit) as e:
+            logger.error("Traceback:\n%s", traceback.format_exc())
+        finally:
+            self.cleanup()
+
+    def _run(self):
+        """ listen on subscriber ctrl channel and reap subscribers that have exited """
+        p = self.redis.pubsub()
+        p.subscribe(**{SUBSCRIBER_CTRL_CHANNEL: self.handle_channel_msg})
+        # manager is waiting on ready event before sending FABRIC_START, ensure subscription is
+        # active on redis before releasing it
+        ts = time.time() + SUBSCRIBER_HOST_START_TIMEOUT
+        while True:
+            msg = p.get_message(timeout=1.0)
+            if msg is not None and msg["type"] == "subscribe":
+                break
+            if time.time() > ts:
+                raise Exception("failed to subscribe to channel %s" % SUBSCRIBER_CTRL_CHANNEL)
+        self.subscribe_thread = p.run_in_thread(sleep_time=0.01, daemon=True)
+        self.subscribe_thread.name = "sub-redis"
+        logger.debug("[%s] listening for events on channel: %s", self, SUBSCRIBER_CTRL_CHANNEL)
+        self.ready.set()
+
+        while not self._exit:
+            self.reap_subscribers()
+            if not self.subscribe_thread.is_alive():
+                raise Exception("subscriber ctrl channel listener is no longer running")
+            time.sleep(1.0)
+
+    def reap_subscribers(self):
+        """ remove subscribers that have exited so they no longer send hellos and the manager
+            restarts the fabric on hello timeout. Deferred starts are executed once the stopped
+            subscriber for the fabric has exited.
+        """
+        with self.lock:
+            for fabric, t in self.threads.items():
+                if not t.is_alive():
+                    logger.debug("[%s] removing exited subscriber for fabric %s", self, fabric)
+                    self.threads.pop(fabric, None)
+                    self.subscribers.pop(fabric, None)
+            for fabric, t in self.stopping.items():
+                pending = self.pending.get(fabric, None)
+                if t.is_alive():
+                    ts = time.time()
+                    if pending is not None and pending["ts"] + SUBSCRIBER_HOST_STOP_TIMEOUT < ts:
+                        logger.warn("[%s] start of fabric '%s' deferred, waiting for stopped "
+                                "subscriber to exit", self, fabric)
+                        pending["ts"] = ts
+                    continue
+                logger.debug("[%s] stopped subscriber for fabric %s exited", self, fabric)
+                self.stopping.pop(fabric, None)
+                if pending is not None:
+                    self.pending.pop(fabric, None)
+                    try:
+                        self._start_fabric(fabric, pending["workers"])
+                    except Exception as e:
+                        logger.error("Traceback:\n%s", traceback.format_exc())
+
+    def cleanup(self):
+        """ graceful cleanup on exit """
+        self._exit = True
+        for sub in self.get_subscribers():
+            try:
+                sub.stop()
+            except Exception as e:
+                logger.error("Traceback:\n%s", traceback.format_exc())
+        if self.subscribe_thread is not None:
+            self.subscribe_thread.stop()
+        if self.tasks_thread is not None:
+            self.tasks_thread.exit()
+        if self.bg_thread is not None:
+            self.bg_thread.exit()
+        if self.db is not None:
+            self.db.client.close()
+
+    def get_subscribers(self):
+        """ return list of hosted subscribers """
+        with self.lock:
+            return self.subscribers.values()
+
+    def handle_channel_msg(self, msg):
+        """ handle msg received on subscribed channels """
+        try:
+            if msg["type"] == "message":
+                channel = msg["channel"]
+                msg = eptMsg.parse(msg["data"])
+                logger.debug("[%s] msg on q(%s): %s", self, channel, msg)
+                if channel == SUBSCRIBER_CTRL_CHANNEL:
+                    self.handle_subscriber_ctrl(msg)
+                else:
+                    logger.warn("[%s] unsupported channel: %s", self, channel)
+        except Exception as e:
+            logger.debug("[%s] failed to handle msg: %s", self, msg)
+            logger.error("Traceback:\n%s", traceback.format_exc())
+
+    def handle_subscriber_ctrl(self, msg):
+        """ start/stop hosted fabric or dispatch subscriber ctrl msg to hosted subscribers. Msgs
+            are only dispatched to subscribers that are initialized, which matches a dedicated
+            subscriber process that only listens on the ctrl channel after initialization.
+        """
+        if msg.msg_type == MSG_TYPE.FABRIC_START:
+            self.start_fabric(msg.data["fabric"], msg.data.get("workers", []))
+        elif msg.msg_type == MSG_TYPE.FABRIC_STOP:
+            self.stop_fabric(msg.data["fabric"])
+        elif msg.msg_type == MSG_TYPE.WORKER_UPDATE:
+            for sub in self.get_subscribers():
+                self.dispatch_subscriber_ctrl(sub, msg)
+        else:
+            with self.lock:
+                sub = self.subscribers.get(getattr(msg, "fabric", None), None)
+            if sub is None:
+                logger.debug("[%s] ignoring msg for fabric not hosted: %s", self, msg)
+            else:
+                self.dispatch_subscriber_ctrl(sub, msg)
+
+    def dispatch_subscriber_ctrl(self, sub, msg):
+        """ send ctrl msg to hosted subscriber if it is ready """
+        if not sub.ctrl_ready:
+            return
+        try:
+            sub.handle_subscriber_ctrl(msg)
+        except Exception as e:
+            logger.debug("[%s] failed to handle msg: %s", sub, msg)
+            logger.error("Traceback:\n%s", traceback.format_exc())
+
+    def start_fabric(self, fabric, workers):
+        """ start subscriber for fabric with provided list of active workers. If the fabric is
+            already hosted then it is stopped first. If a stopped subscriber for the fabric has not
+            yet exited, the start is deferred until the reaper finds the subscriber has exited so
+            the ctrl channel listener is never blocked and a fabric is never hosted twice.
+        """
+        self.stop_fabric(fabric)
+        with self.lock:
+            t = self.stopping.get(fabric, None)
+            if t is not None and t.is_alive():
+                logger.debug("[%s] deferring start of fabric '%s' until stopped subscriber exits",
+                        self, fabric)
+                self.pending[fabric] = {"workers": workers, "ts": time.time()}
+                return
+            self.stopping.pop(fabric, None)
+            self._start_fabric(fabric, workers)
+
+    def _start_fabric(self, fabric, workers):
+        """ start subscriber for fabric with lock held """
+        from . ept_manager import TrackedWorker
+        f = Fabric.load(fabric=fabric)
+        if not f.exists():
+            logger.warn("[%s] start requested for fabric '%s' which does not exist", self, fabric)
+            return
+        active_workers = {}
+        for js in workers:
+            w = TrackedWorker.from_json(js)
+            if w.role not in active_workers:
+                active_workers[w.role] = []
+            active_workers[w.role].append(w)
+        sub = eptSubscriber(f, active_workers=active_workers)
+        t = threading.Thread(target=sub.run_hosted, args=(self.db, self.redis))
+        t.daemon = True
+        self.subscribers[fabric] = sub
+        self.threads[fabric] = t
+        t.start()
+        logger.debug("[%s] started subscriber for fabric '%s'", self, fabric)
+
+    def stop_fabric(self, fabric):
+        """ stop subscriber for fabric without waiting for it to exit. The subscriber thread is
+            tracked until it exits and any deferred start for the fabric is cancelled.
+        """
+        with self.lock:
+            self.pending.pop(fabric, None)
+            sub = self.subscribers.pop(fabric, None)
+            t = self.threads.pop(fabric, None)
+            if t is not None:
+                self.stopping[fabric] = t
+        if sub is None:
+            logger.debug("[%s] stop requested for fabric '%s' which is not hosted", self, fabric)
+            return
+        try:
+            sub.stop()
+        except Exception as e:
+            logger.error("Traceback:\n%s", traceback.format_exc())
+
+    def send_hello(self):
+        """ send hello for each running subscriber """
+        for sub in self.get_subscribers():
+            if not sub.stopped:
+                sub.send_hello()
+
+    def update_stats(self):
+        """ update queue stats for each subscriber """
+        for sub in self.get_subscribers():
+            sub.update_stats()
+
+    def log_ingest_stats(self):
+        """ log websocket ingest pipeline stats for each subscriber """
+        for sub in self.get_subscribers():
+            sub.log_ingest_stats()
+
+    def handle_background_event_queue(self):
+        """ send batched events for each subscriber """
+        for sub in self.get_subscribers():
+            try:
+                sub.handle_background_event_queue()
+            except Exception as e:
+                logger.debug("Traceback:\n%s", traceback.format_exc())
+                logger.error("[%s] failed to handle background events: %s", sub, e)
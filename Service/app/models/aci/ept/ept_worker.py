@@ -4,7 +4,10 @@ from ... utils import get_db
 from .. utils import execute_worker
 from .. utils import raise_interrupt
 from .. utils import register_signal_handlers
+from . common import BULK_PREFETCH
+from . common import BULK_PREFETCH_SIZE
 from . common import CACHE_STATS_INTERVAL
+from . common import ENDPOINT_STATE_CACHE
 from . common import HELLO_INTERVAL
 from . common import MANAGER_WORK_QUEUE
 from . common import RAPID_CALCULATE_INTERVAL
@@ -15,13 +18,20 @@ from . common import TRANSITORY_STALE
 from . common import TRANSITORY_STALE_NO_LOCAL
 from . common import SUPPRESS_WATCH_OFFSUBNET
 from . common import SUPPRESS_WATCH_STALE
+from . common import STD_MO_COALESCE_WINDOW
 from . common import SUBSCRIBER_CTRL_CHANNEL
 from . common import WATCH_INTERVAL
 from . common import WATCHER_BROADCAST_CHANNEL
 from . common import WORKER_BROADCAST_CHANNEL
 from . common import WORKER_CTRL_CHANNEL
+from . common import WORKER_QUEUE_COUNT
+from . common import WORKER_QUEUE_HIGH
+from . common import WORKER_QUEUE_NORMAL
+from . common import WORKER_QUEUE_PREEMPT_COUNT
+from . common import WRITE_BUFFER
 from . common import MAX_SEND_MSG_LENGTH
 from . common import BackgroundThread
+from . common import eptWatchSchedule
 from . common import db_alive
 from . common import flush_queue
 from . common import get_addr_type
@@ -31,13 +41,30 @@ from . common import parse_vrf_name
 from . common import split_vpc_domain_id
 from . common import wait_for_db
 from . common import wait_for_redis
+from . ept_cache import eptCache
+from . ept_cache import endpointStateCachedObject
+from . ept_cache import sharedCache
+from . ept_cache_stats import eptCacheStats
 from . ept_endpoint import eptEndpoint
 from . ept_endpoint import eptEndpointEvent
 from . ept_history import eptHistory
 from . ept_history import eptHistoryEvent
 from . ept_move import eptMove
 from . ept_move import eptMoveEvent
+from . ept_msg import EPM_FLAG_BOUNCE
+from . ept_msg import EPM_FLAG_BOUNCE_TO_PROXY
+from . ept_msg import EPM_FLAG_CACHED
+from . ept_msg import EPM_FLAG_LOCAL
+from . ept_msg import EPM_FLAG_LOOPBACK
+from . ept_msg import EPM_FLAG_PEER_ATTACHED
+from . ept_msg import EPM_FLAG_PEER_ATTACHED_RL
+from . ept_msg import EPM_FLAG_PSVI
+from . ept_msg import EPM_FLAG_STATIC
+from . ept_msg import EPM_FLAG_SVI
+from . ept_msg import EPM_FLAG_VPC_ATTACHED
+from . ept_msg import EPM_FLAG_VTEP
 from . ept_msg import MSG_TYPE
+from . ept_msg import WIRE_VERSION
 from . ept_msg import WORK_TYPE
 from . ept_msg import eptMsg
 from . ept_msg import eptMsgBulk
@@ -57,6 +84,8 @@ from . ept_queue_stats import eptQueueStats
 from . ept_stale import eptStale
 from . ept_stale import eptStaleEvent
 from . ept_worker_fabric import eptWorkerFabric
+from . ept_write_buffer import eptWriteBuffer
+from . mo_dependency import DependencyIndex
 from . mo_dependency_map import dependency_map
 
 import copy
@@ -70,6 +99,36 @@ import traceback
 # module level logging
 logger = logging.getLogger(__name__)
 
+# projections used when reading eptHistory/eptEndpoint state for an endpoint event
+HISTORY_PROJECTION = {
+    "node": 1,
+    "watch_stale_ts":1,         # will embed value into events.0
+    "watch_stale_event":1,      # will embed value into events.0
+    "watch_offsubnet_ts": 1,    # will embed value into events.0
+    "events": {"$slice": 1}     # pull only events.0
+}
+ENDPOINT_PROJECTION = {
+    "fabric": 1,
+    "vnid": 1,
+    "addr": 1,
+    "learn_type": 1,
+    "is_stale": 1,
+    "is_offsubnet": 1,
+    "events": {"$slice": 2},
+    # rapid thresholds
+    "is_rapid": 1,
+    "rapid_lts": 1,
+    "rapid_count": 1,
+    "rapid_lcount": 1,
+    "rapid_icount": 1,
+}
+
+# endpoint flags that skip offsubnet and stale analysis on a node
+SKIP_OFFSUBNET_FLAGS = EPM_FLAG_LOOPBACK | EPM_FLAG_VTEP | EPM_FLAG_SVI | EPM_FLAG_PSVI | \
+                        EPM_FLAG_CACHED | EPM_FLAG_STATIC
+SKIP_STALE_FLAGS = SKIP_OFFSUBNET_FLAGS | EPM_FLAG_BOUNCE_TO_PROXY
+BOUNCE_FLAGS = EPM_FLAG_BOUNCE | EPM_FLAG_BOUNCE_TO_PROXY
+
 class eptWorker(object):
     """ endpoint tracker worker node handles epm events to update various history tables and perform
         endpoint analysis for one or more fabrics.
@@ -101,26 +160,33 @@ class eptWorker(object):
         self.worker_broadcast_seq = 0
 
         # watcher active keys where key is unique fabric+addr+vnid+node (rapid excludes node)
-        self.watch_stale = {}
-        self.watch_offsubnet = {}
-        self.watch_rapid = {}
+        self.watch_stale = eptWatchSchedule()
+        self.watch_offsubnet = eptWatchSchedule()
+        self.watch_rapid = eptWatchSchedule()
+        # watcher pending std mo events where key is unique fabric+classname+dn
+        self.watch_std_mo = eptWatchSchedule()
+
+        # eptHistory and eptEndpoint documents prefetched for the eptMsgBulk currently being 
+        # processed, indexed by (fabric, vnid, addr). Each entry is consumed by the first event for
+        # the endpoint, subsequent events within the same bulk always read from the db.
+        self.prefetch_history = {}
+        self.prefetch_endpoint = {}
+        # write-behind buffer for push_event operations while processing eptMsgBulk
+        self.write_buffer = eptWriteBuffer(self.db)
 
         # multithreading locks
         self.queue_stats_lock = threading.Lock()
         self.watch_stale_lock = threading.Lock()
         self.watch_offsubnet_lock = threading.Lock()
         self.watch_rapid_lock = threading.Lock()
+        self.watch_std_mo_lock = threading.Lock()
         self.manager_work_queue_lock = threading.Lock()
         self.priority_lock = threading.Lock()
         self.non_priority_lock = threading.Lock()
 
-        # queues that this worker will listen on 
-        self.queues = [ "q0_%s" % self.worker_id ]
+        # queues that this worker will listen on in strict priority order
+        self.queues = [ "q%s_%s" % (i, self.worker_id) for i in range(0, WORKER_QUEUE_COUNT) ]
         self.queue_stats = {
-            "q0_%s" % self.worker_id: eptQueueStats.load(
-                proc=self.worker_id,
-                queue="q0_%s" % self.worker_id
-            ),
             WORKER_CTRL_CHANNEL: eptQueueStats.load(
                 proc=self.worker_id,
                 queue=WORKER_CTRL_CHANNEL
@@ -143,9 +209,13 @@ class eptWorker(object):
             ),
             "total": eptQueueStats.load(proc=self.worker_id, queue="total"),
         }
+        for q in self.queues:
+            self.queue_stats[q] = eptQueueStats.load(proc=self.worker_id, queue=q)
         # initialize stats counters
         for k, q in self.queue_stats.items():
             q.init_queue()
+        # eptCacheStats indexed by (fabric, cache name), created on first collection for fabric
+        self.cache_stats = {}
 
         start_ts = time.time()
         self.cache_stats_time = start_ts
@@ -159,6 +229,7 @@ class eptWorker(object):
             }
             self.work_type_handlers = {
                 WORK_TYPE.FLUSH_CACHE: self.flush_cache,
+                WORK_TYPE.FLUSH_CACHE_BULK: self.flush_cache_bulk,
                 WORK_TYPE.WATCH_NODE: self.handle_watch_node,
                 WORK_TYPE.WATCH_MOVE: self.handle_watch_move,
                 WORK_TYPE.WATCH_OFFSUBNET: self.handle_watch_offsubnet,
@@ -167,7 +238,9 @@ class eptWorker(object):
                 WORK_TYPE.SETTINGS_RELOAD: self.handle_settings_reload,
                 WORK_TYPE.FABRIC_WATCH_PAUSE: self.handle_watch_pause,
                 WORK_TYPE.FABRIC_WATCH_RESUME: self.handle_watch_resume,
+                WORK_TYPE.MO_INDEX_RESET: self.handle_mo_index_reset,
                 WORK_TYPE.STD_MO: self.handle_std_mo_event,
+                WORK_TYPE.WORKER_DRAIN: self.handle_worker_drain,
             }
         elif self.role == "worker":
             self.channels = {
@@ -175,6 +248,7 @@ class eptWorker(object):
             }
             self.work_type_handlers = {
                 WORK_TYPE.FLUSH_CACHE: self.flush_cache,
+                WORK_TYPE.FLUSH_CACHE_BULK: self.flush_cache_bulk,
                 WORK_TYPE.RAW: self.handle_raw_endpoint_event,
                 WORK_TYPE.EPM_IP_EVENT: self.handle_endpoint_event,
                 WORK_TYPE.EPM_MAC_EVENT: self.handle_endpoint_event,
@@ -182,6 +256,7 @@ class eptWorker(object):
                 WORK_TYPE.DELETE_EPT: self.handle_endpoint_delete,
                 WORK_TYPE.SETTINGS_RELOAD: self.handle_settings_reload,
                 WORK_TYPE.FABRIC_EPM_EOF:  self.handle_epm_eof,
+                WORK_TYPE.WORKER_DRAIN: self.handle_worker_drain,
             }
         else:
             raise Exception("unknown role '%s'" % self.role)
@@ -294,7 +369,18 @@ class eptWorker(object):
             # increment rx stats for received message
             if q in self.queue_stats:
                 self.increment_stats(q, tx=False, count=len(msg_list))
-            for msg in msg_list:
+            if len(msg_list) > 1 and self.role == "worker":
+                if WRITE_BUFFER:
+                    self.write_buffer.enabled = True
+                if BULK_PREFETCH:
+                    self.prefetch_endpoint_state(msg_list)
+            # bulk from lower priority queue can be preempted by work on higher priority queue
+            qnum = self.queues.index(q) if q in self.queues else 0
+            for i, msg in enumerate(msg_list):
+                if qnum > 0 and i > 0 and i % WORKER_QUEUE_PREEMPT_COUNT == 0 and \
+                    self.higher_priority_pending(qnum):
+                    self.requeue_msgs(q, msg_list[i:])
+                    break
                 # exception on one msg must not block processing of other messages in block
                 try:
                     logger.debug("[%s] msg on q(%s): %s", self, q, msg)
@@ -317,6 +403,79 @@ class eptWorker(object):
         except Exception as e:
             logger.debug("failed to parse message from q: %s, data: %s", q, data)
             logger.error("Traceback:\n%s", traceback.format_exc())
+        finally:
+            # prefetched state and buffered writes are only valid for the duration of a single bulk
+            self.prefetch_history = {}
+            self.prefetch_endpoint = {}
+            self.write_buffer.flush()
+            self.write_buffer.enabled = False
+
+    def higher_priority_pending(self, qnum):
+        """ return True if there is pending work on any queue with higher priority than qnum """
+        for q in self.queues[0:qnum]:
+            if self.redis.llen(q) > 0:
+                return True
+        return False
+
+    def requeue_msgs(self, q, msg_list):
+        """ push list of unprocessed msgs back to the head of the queue they were received on """
+        logger.debug("[%s] preempted, requeue %s msgs on q(%s)", self, len(msg_list), q)
+        if len(msg_list) == 1:
+            data = msg_list[0].jsonify()
+        else:
+            bulk = eptMsgBulk()
+            bulk.msgs = msg_list
+            bulk.seq = msg_list[-1].seq
+            data = bulk.jsonify(wire=WIRE_VERSION)
+        self.redis.lpush(q, data)
+        self.increment_stats(q, tx=True, count=len(msg_list))
+
+    def prefetch_endpoint_state(self, msg_list):
+        """ read eptHistory and eptEndpoint documents for all endpoint events within msg_list using
+            batched $in queries grouped by fabric and vnid. The results are saved to 
+            prefetch_history and prefetch_endpoint and consumed by handle_endpoint_event.
+        """
+        keys = {}
+        for msg in msg_list:
+            if msg.msg_type != MSG_TYPE.WORK or msg.wt not in [WORK_TYPE.EPM_IP_EVENT, 
+                    WORK_TYPE.EPM_MAC_EVENT, WORK_TYPE.EPM_RS_IP_EVENT]:
+                continue
+            addr = msg.ip if msg.wt == WORK_TYPE.EPM_RS_IP_EVENT else msg.addr
+            # no need to prefetch endpoints already within the endpoint state cache
+            if ENDPOINT_STATE_CACHE and msg.fabric in self.fabrics and \
+                self.fabrics[msg.fabric].cache.has_endpoint_state(msg.vnid, addr):
+                continue
+            keys.setdefault((msg.fabric, msg.vnid), set()).add(addr)
+        if len(keys) == 0:
+            return
+        self.write_buffer.flush()
+        ts = time.time()
+        history = {}
+        endpoint = {}
+        queries = 0
+        for (fabric, vnid) in keys:
+            addrs = list(keys[(fabric, vnid)])
+            for i in range(0, len(addrs), BULK_PREFETCH_SIZE):
+                batch = addrs[i:i+BULK_PREFETCH_SIZE]
+                for addr in batch:
+                    history[(fabric, vnid, addr)] = []
+                    endpoint[(fabric, vnid, addr)] = None
+                flt = {
+                    "fabric": fabric,
+                    "vnid": vnid,
+                    "addr": {"$in": batch},
+                }
+                h_projection = {"addr": 1}
+                h_projection.update(HISTORY_PROJECTION)
+                for h in self.db[eptHistory._classname].find(flt, h_projection):
+                    history[(fabric, vnid, h["addr"])].append(h)
+                for e in self.db[eptEndpoint._classname].find(flt, ENDPOINT_PROJECTION):
+                    endpoint[(fabric, vnid, e["addr"])] = e
+                queries+= 2
+        self.prefetch_history = history
+        self.prefetch_endpoint = endpoint
+        logger.debug("prefetched state for %s endpoints with %s queries (time: %.3f)", 
+                len(history), queries, time.time() - ts)
 
     def increment_stats(self, queue, tx=False, count=1):
         # update stats queue
@@ -340,6 +499,18 @@ class eptWorker(object):
         for k, q in self.queue_stats.items():
             with self.queue_stats_lock:
                 q.collect(qlen = self.redis.llen(k))
+        # update stats for each cache of each fabric (in case fabric changes in another thread)
+        for f in self.fabrics.keys():
+            wf = self.fabrics.get(f, None)
+            if wf is None:
+                continue
+            for cache_name in eptCache.CACHES:
+                key = (f, cache_name)
+                if key not in self.cache_stats:
+                    stats = eptCacheStats.load(proc=self.worker_id, fabric=f, cache=cache_name)
+                    stats.init_cache()
+                    self.cache_stats[key] = stats
+                self.cache_stats[key].collect(getattr(wf.cache, cache_name))
 
     def broadcast(self, msg):
         """ broadcast one or more messages. Broadcast moved to pub/sub mechanism so simply need
@@ -376,6 +547,8 @@ class eptWorker(object):
         """ send one or more eptMsgWork objects to worker via manager work queue 
             limit the number of messages sent at a time to MAX_SEND_MSG_LENGTH
         """
+        # ensure all buffered writes are in the db before other processes act on the message
+        self.write_buffer.flush()
         if isinstance(msg, list):
             # break up msg into multiple blocks and send as single eptMsgBulk
             for i in range(0, len(msg), MAX_SEND_MSG_LENGTH):
@@ -393,8 +566,17 @@ class eptWorker(object):
     def send_flush(self, fabric, collection, name=None):
         """ send flush message to workers for provided collection """
         logger.debug("flush %s (name:%s)", collection._classname, name)
-        data = {"cache": collection._classname, "name": name}
-        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, fabric=fabric))
+        version = sharedCache.invalidate(self.redis, fabric, collection._classname)
+        data = {"cache": collection._classname, "name": name, "version": version}
+        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, WORKER_QUEUE_HIGH,
+            fabric=fabric))
+
+    def send_flush_bulk(self, fabric, flush):
+        """ send single flush message to workers for list of (collection, name) tuples """
+        logger.debug("flush bulk %s entries", len(flush))
+        data = eptCache.get_flush_bulk_data(self.redis, fabric, flush)
+        self.broadcast(eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE_BULK, WORKER_QUEUE_HIGH,
+            fabric=fabric))
 
     def send_hello(self):
         """ send hello/keepalives at regular interval, this also serves as registration """
@@ -413,6 +595,8 @@ class eptWorker(object):
             for f in fabrics:
                 if f in fabrics: 
                     self.fabrics[f].cache.log_stats()
+            if self.role == "worker":
+                self.write_buffer.log_stats()
 
     def fabric_start(self, fabric):
         """ start fabric to init cache and for watcher process, to set a start timestamp for the 
@@ -422,6 +606,7 @@ class eptWorker(object):
         self.fabric_stop(fabric)
         logger.debug("[%s] start fabric: %s", self, fabric)
         self.fabrics[fabric] = eptWorkerFabric(fabric)
+        self.fabrics[fabric].write_buffer = self.write_buffer
         if self.role == "watcher":
             self.fabrics[fabric].watcher_init()
 
@@ -431,6 +616,8 @@ class eptWorker(object):
             If this is a watcher, then also need to purge any watch events for this fabric.
         """
         logger.debug("[%s] stop fabric: %s", self, fabric)
+        self.write_buffer.flush()
+        # all cached state for the fabric including endpoint state is discarded with the old wf
         old_wf = self.fabrics.pop(fabric, None)
         if old_wf is not None:
             old_wf.close()
@@ -441,16 +628,12 @@ class eptWorker(object):
                 ("offsubnet", self.watch_offsubnet_lock, self.watch_offsubnet),
                 ("stale", self.watch_stale_lock, self.watch_stale),
                 ("rapid", self.watch_rapid_lock, self.watch_rapid),
+                ("std_mo", self.watch_std_mo_lock, self.watch_std_mo),
             ]
             for (name, lock, d) in watches:
-                pop = []
                 with lock:
-                    for (key, msg) in d.items():
-                        if msg.fabric == fabric: 
-                            pop.append(key)
-                    for k in pop: 
-                        d.pop(k, None)
-                logger.debug("[%s] %s events removed from watch_%s", self, len(pop), name)
+                    count = d.remove_fabric(fabric)
+                logger.debug("[%s] %s events removed from watch_%s", self, count, name)
 
     def flush_cache(self, msg):
         """ receive flush cache work containing cache and optional object name """
@@ -460,16 +643,29 @@ class eptWorker(object):
                 name = msg.data["name"]
                 if name is not None and len(name) == 0: 
                     name = None
-                self.fabrics[msg.fabric].cache.handle_flush(msg.data["cache"], name=name)
+                self.fabrics[msg.fabric].cache.handle_flush(msg.data["cache"], name=name,
+                        version=msg.data.get("version", None))
             else:
                 logger.debug("fabric %s not currently in cache", msg.fabric)
         else:
             logger.warn("invalid flush cache message")
 
+    def flush_cache_bulk(self, msg):
+        """ receive flush cache bulk work containing list of caches each with optional names """
+        logger.debug("flush cache bulk fabric: %s, data: %s", msg.fabric, msg.data)
+        if msg.fabric in self.fabrics:
+            self.fabrics[msg.fabric].cache.handle_flush_bulk(msg.data)
+        else:
+            logger.debug("fabric %s not currently in cache", msg.fabric)
+
     def set_msg_worker_fabric(self, msg):
         """ create eptWorkerFabric object for this fabric if not already known """
         if msg.fabric not in self.fabrics:
             self.fabrics[msg.fabric] = eptWorkerFabric(msg.fabric)
+            self.fabrics[msg.fabric].write_buffer = self.write_buffer
+            # a worker added while the fabric is running does not receive FABRIC_START
+            if self.role == "watcher":
+                self.fabrics[msg.fabric].watcher_init()
         setattr(msg, "wf", self.fabrics[msg.fabric])
         setattr(msg, "now", time.time())
 
@@ -496,6 +692,16 @@ class eptWorker(object):
         is_rs_ip_event = (msg.wt == WORK_TYPE.EPM_RS_IP_EVENT)
         addr = msg.ip if is_rs_ip_event else msg.addr
 
+        # use cached endpoint state or prefetched eptHistory/eptEndpoint state if available. 
+        # Prefetched state is popped here so any other event for the same endpoint within the bulk
+        # will read from the endpoint state cache or the db
+        key = (msg.fabric, msg.vnid, addr)
+        history = self.prefetch_history.pop(key, None)
+        endpoint = self.prefetch_endpoint.pop(key, False)
+        state = None
+        if ENDPOINT_STATE_CACHE:
+            state = msg.wf.cache.get_endpoint_state(msg.vnid, addr)
+
         # get cached rapid eptWorkerRapidEndpoint object and ensure not currently is_rapid
         cached_rapid = None
         if msg.wf.settings.analyze_rapid and not msg.force:
@@ -509,29 +715,47 @@ class eptWorker(object):
                 logger.debug("ignoring event, endpoint is_rapid")
                 return
 
-        flt = {
-            "fabric": msg.fabric,
-            "vnid": msg.vnid,
-            "addr": addr,
-        }
-        projection = {
-            "node": 1,
-            "watch_stale_ts":1,         # will embed value into events.0
-            "watch_stale_event":1,      # will embed value into events.0
-            "watch_offsubnet_ts": 1,    # will embed value into events.0
-            "events": {"$slice": 1}     # pull only events.0
-        }
-        per_node_history_events = {}    # one entry per node, indexed by node-id
-        for h in self.db[eptHistory._classname].find(flt, projection):
-            events = []
-            for event in h["events"]:
-                events.append(eptHistoryEvent.from_dict(event))
-            # embed watch info into events.0
-            if len(events) > 0:
-                events[0].watch_stale_ts = h["watch_stale_ts"]
-                events[0].watch_stale_event = eptStaleEvent.from_dict(h["watch_stale_event"])
-                events[0].watch_offsubnet_ts = h["watch_offsubnet_ts"]
-                per_node_history_events[h["node"]] = events
+        if state is not None:
+            per_node_history_events = state.get_history()
+            endpoint = state.endpoint
+        else:
+            flt = {
+                "fabric": msg.fabric,
+                "vnid": msg.vnid,
+                "addr": addr,
+            }
+            if history is None:
+                self.write_buffer.flush_key(eptHistory._classname, flt)
+                history = self.db[eptHistory._classname].find(flt, HISTORY_PROJECTION)
+            # endpoint state cache requires the eptEndpoint document to be known before update
+            if ENDPOINT_STATE_CACHE and endpoint is False:
+                self.write_buffer.flush_key(eptEndpoint._classname, flt)
+                endpoint = self.db[eptEndpoint._classname].find_one(flt, ENDPOINT_PROJECTION)
+            per_node_history_events = {}    # one entry per node, indexed by node-id
+            for h in history:
+                events = []
+                for event in h["events"]:
+                    events.append(eptHistoryEvent.from_dict(event))
+                # embed watch info into events.0
+                if len(events) > 0:
+                    events[0].watch_stale_ts = h["watch_stale_ts"]
+                    events[0].watch_stale_event = eptStaleEvent.from_dict(h["watch_stale_event"])
+                    events[0].watch_offsubnet_ts = h["watch_offsubnet_ts"]
+                    per_node_history_events[h["node"]] = events
+
+        try:
+            self.update_endpoint_state(msg, addr, per_node_history_events, cached_rapid, endpoint)
+        except Exception as e:
+            # cached state may be partially updated, next event for endpoint will read from db
+            if ENDPOINT_STATE_CACHE:
+                msg.wf.cache.remove_endpoint_state(msg.vnid, addr)
+            raise
+
+    def update_endpoint_state(self, msg, addr, per_node_history_events, cached_rapid, endpoint):
+        """ update eptHistory and eptEndpoint for endpoint event and perform analysis. If enabled,
+            the resulting state is saved to the endpoint state cache for the next event.
+        """
+        is_rs_ip_event = (msg.wt == WORK_TYPE.EPM_RS_IP_EVENT)
 
         # update endpoint history table and determine based on event if analysis is required
         # if this is a new event, the event is inserted into per_node_history_events 
@@ -546,7 +770,8 @@ class eptWorker(object):
 
         # update ept_endpoint with local event. Return last locals events for move analyze
         # note the result may be None if endpoint is_rapid
-        update_local_result = self.update_local(msg, per_node_history_events, cached_rapid) 
+        update_local_result = self.update_local(msg, per_node_history_events, cached_rapid,
+                                                endpoint=endpoint)
 
         # perform move/offsubnet/stale analysis
         if (analysis_required or msg.force) and update_local_result is not None:
@@ -560,6 +785,54 @@ class eptWorker(object):
             if msg.wf.settings.analyze_stale:
                 self.analyze_stale(msg, per_node_history_events, update_local_result)
 
+        if ENDPOINT_STATE_CACHE:
+            msg.wf.cache.set_endpoint_state(msg.vnid, addr, self.get_endpoint_state(msg, 
+                    per_node_history_events, update_local_result, cached_rapid, endpoint))
+
+    def get_endpoint_state(self, msg, per_node_history_events, update_local_result, cached_rapid,
+            endpoint):
+        """ return endpointStateCachedObject representing the db state after an endpoint event was
+            processed.  Only the watcher sets eptEndpoint is_stale/is_offsubnet to true and it 
+            only does so after a WATCH_STALE/WATCH_OFFSUBNET was sent by the worker which sets the
+            corresponding watch ts for the node. Therefore, the cached flag is treated as set for
+            any endpoint with a non-zero watch ts so that analysis always clears the db flag.
+        """
+        history = {}
+        watch_stale = False
+        watch_offsubnet = False
+        for node in per_node_history_events:
+            if len(per_node_history_events[node]) > 0:
+                event = per_node_history_events[node][0]
+                history[node] = [event]
+                watch_stale = watch_stale or event.watch_stale_ts > 0
+                watch_offsubnet = watch_offsubnet or event.watch_offsubnet_ts > 0
+        if update_local_result is not None:
+            rapid = {}
+            if endpoint is not None:
+                for a in endpointStateCachedObject.RAPID_ATTRIBUTES:
+                    rapid[a] = endpoint[a]
+            endpoint = {
+                "fabric": msg.fabric,
+                "vnid": msg.vnid,
+                "addr": msg.addr,
+                "learn_type": update_local_result.learn_type,
+                "is_stale": update_local_result.is_stale or watch_stale,
+                "is_offsubnet": update_local_result.is_offsubnet or watch_offsubnet,
+                "events": [e.to_dict() for e in update_local_result.local_events[0:2]],
+                "is_rapid": rapid.get("is_rapid", False),
+                "rapid_lts": rapid.get("rapid_lts", 0.0),
+                "rapid_count": rapid.get("rapid_count", 0),
+                "rapid_lcount": rapid.get("rapid_lcount", 0),
+                "rapid_icount": rapid.get("rapid_icount", 0),
+            }
+        elif endpoint is not None:
+            # update_local aborted for rapid endpoint, eptEndpoint document is unchanged
+            endpoint = copy.copy(endpoint)
+        state = endpointStateCachedObject(history, endpoint)
+        if endpoint is not None and cached_rapid is not None and cached_rapid.rapid_count > 0:
+            state.set_rapid(cached_rapid)
+        return state
+
     def update_endpoint_history(self, msg, per_node_history_events):
         """ push event into eptHistory table and determine if analysis is required """
         # already have basic info logged when event was received (fabric, wt, node, vnid, addr, ip)
@@ -567,7 +840,7 @@ class eptWorker(object):
         logger.debug("update endpoint history")
 
         cache = msg.wf.cache
-        is_local = "local" in msg.flags
+        is_local = (msg.flag_bits & EPM_FLAG_LOCAL) > 0
         is_deleted = msg.status == "deleted"
         is_modified = msg.status == "modified"
         is_created = msg.status == "created"
@@ -611,9 +884,9 @@ class eptWorker(object):
 
         # determine remote node for this event if it is a non-deleted XR event
         if not is_local and not is_rs_ip_event and not is_deleted:
-            if "cached" in msg.flags or "vtep" in msg.flags or msg.ifId=="unspecified":
+            if msg.flag_bits & (EPM_FLAG_CACHED|EPM_FLAG_VTEP) or msg.ifId=="unspecified":
                 logger.debug("skipping remote map of cached/vtep/unspecified endpoint")
-            elif "peer-attached" in msg.flags or "peer-attached-rl" in msg.flags:
+            elif msg.flag_bits & (EPM_FLAG_PEER_ATTACHED|EPM_FLAG_PEER_ATTACHED_RL):
                 # if endpoint is peer-attached then remote is peer node, tunnel ifId should also
                 # point to remote node but we'll give epm some slack if flag is set
                 remote = cache.get_peer_node(msg.node)
@@ -658,10 +931,12 @@ class eptWorker(object):
                 event.rw_mac = msg.addr
                 event.rw_bd = msg.bd
                 eptHistory(fabric=msg.fabric, node=msg.node, vnid=msg.vnid, addr=msg.ip, 
-                        type=msg.type, count=1, events=[event.to_dict()]).save(refresh=False)
+                        type=msg.type, count=1, events=[event.to_dict()],
+                        build_gen=msg.build_gen).save(refresh=False)
             else:
                 eptHistory(fabric=msg.fabric, node=msg.node, vnid=msg.vnid, addr=msg.addr, 
-                        type=msg.type, count=1, events=[event.to_dict()]).save(refresh=False)
+                        type=msg.type, count=1, events=[event.to_dict()],
+                        build_gen=msg.build_gen).save(refresh=False)
             per_node_history_events[msg.node] = [event]
 
             # no analysis required for new event if:
@@ -683,6 +958,10 @@ class eptWorker(object):
             event.watch_stale_ts = last_event.watch_stale_ts
             event.watch_stale_event = last_event.watch_stale_event
             event.watch_offsubnet_ts = last_event.watch_offsubnet_ts
+            # create from endpoint build confirms the entry still exists in the fabric, stamp the 
+            # build generation even if no update is required
+            if msg.build_gen > 0 and is_created:
+                msg.wf.set_fields(eptHistory._classname, flt, {"build_gen": msg.build_gen})
 
         # a few more events that can be ignored
         if last_event.classname == event.classname:
@@ -712,7 +991,7 @@ class eptWorker(object):
                 "intf_name", "epg_name", "vnid_name"]:
                 setattr(event, a, getattr(last_event, a))
             # need to recalculate local after merge
-            is_local = "local" in event.flags
+            is_local = (event.flag_bits & EPM_FLAG_LOCAL) > 0
             if last_event.rw_mac != event.rw_mac or last_event.rw_bd != event.rw_bd:
                 logger.debug("rewrite info updated from [bd:%s,mac:%s] to [bd:%s,mac:%s]", 
                     last_event.rw_bd, last_event.rw_mac, event.rw_bd, event.rw_mac)
@@ -768,7 +1047,7 @@ class eptWorker(object):
                 if len(getattr(event, a)) == 0:
                     setattr(event, a, getattr(last_event, a))
             # need to recalculate local after merge
-            is_local = "local" in event.flags
+            is_local = (event.flag_bits & EPM_FLAG_LOCAL) > 0
             # perform comparison of interesting attributes
             for a in ["remote", "pctag", "flags", "encap", "intf_id"]:
                 if getattr(event, a) != getattr(last_event, a):
@@ -794,7 +1073,7 @@ class eptWorker(object):
             logger.debug("no update detected for eptHistory")
             return False
 
-    def update_local(self, msg, per_node_history_event, cached_rapid):
+    def update_local(self, msg, per_node_history_event, cached_rapid, endpoint=False):
         """ update/add local entries to ept_endpoint table and return list of most recent
             fabric-wide complete local events (where complete requires rewrite info for ip endpoints)
             -   calculates where endpoint is local relevant to all nodes in the fabric. Note, the
@@ -806,31 +1085,21 @@ class eptWorker(object):
             -   if previous event was a delete and current event is create with timestamp less than 
                 transitory time, then overwrite the delete with the create
 
+            endpoint is the prefetched eptEndpoint document (or None if it does not exist). If 
+            not provided (False) then the eptEndpoint document is read from the db.
+
             return eptWorkerUpdateLocalResult object
         """
         ret = eptWorkerUpdateLocalResult()
         # get last local event from ept_endpoint
-        projection = {
-            "fabric": 1,
-            "vnid": 1,
-            "addr": 1,
-            "learn_type": 1,
-            "is_stale": 1,
-            "is_offsubnet": 1,
-            "events": {"$slice": 2},
-            # rapid thresholds
-            "is_rapid": 1,
-            "rapid_lts": 1,
-            "rapid_count": 1,
-            "rapid_lcount": 1,
-            "rapid_icount": 1,
-        }
         flt = {     
             "fabric": msg.fabric,
             "vnid": msg.vnid,
             "addr": msg.addr,
         }
-        endpoint = self.db[eptEndpoint._classname].find_one(flt, projection)
+        if endpoint is False:
+            self.write_buffer.flush_key(eptEndpoint._classname, flt)
+            endpoint = self.db[eptEndpoint._classname].find_one(flt, ENDPOINT_PROJECTION)
         # if analyze_rapid is enabled and cached_rapid.rapid_count is 0, then no rapid calculation
         # has been performed yet and we need to update all values and trigger analysis. Else,
         # just update rapid_count. note cached_rapid is None if analyze_rapid is disabled
@@ -864,6 +1133,7 @@ class eptWorker(object):
                 ret.local_events = [eptEndpointEvent.from_dict(e) for e in endpoint["events"]]
                 last_event = ret.local_events[0]
             last_learn_type = endpoint["learn_type"]
+            ret.learn_type = last_learn_type
         else:
             # always create an eptEndpoint object for the endpoint even if no local events are 
             # ever created for it. Without eptEndpoint object then eptHistory total endpoints will
@@ -878,6 +1148,7 @@ class eptWorker(object):
             logger.debug("learn type set to %s", learn_type)
             eptEndpoint(fabric=msg.fabric, vnid=msg.vnid, addr=msg.addr,type=endpoint_type,
                     first_learn=dummy_event, learn_type=learn_type).save(refresh=False)
+            ret.learn_type = learn_type
 
         # determine current complete local event
         local_event = None
@@ -885,7 +1156,7 @@ class eptWorker(object):
         for node in per_node_history_event:
             if len(per_node_history_event[node])>0:
                 event = per_node_history_event[node][0]
-                if "local" in event.flags:
+                if event.flag_bits & EPM_FLAG_LOCAL:
                     # logger.debug("local check node 0x%04x: %s", node, event)
                     # ensure that rewrite info is set for ip endpoints
                     if msg.type=="mac" or (event.rw_bd > 0 and len(event.rw_mac) > 0):
@@ -901,9 +1172,11 @@ class eptWorker(object):
             # that allows update of learn_type when local_event does not exists.
             if last_learn_type is not None and last_learn_type=="epg" and learn_type!="epg":
                 logger.debug("updating learn_type from %s to %s", last_learn_type, learn_type)
+                self.write_buffer.flush_key(eptEndpoint._classname, flt)
                 self.db[eptEndpoint._classname].update(flt, 
                     {"$set":{"learn_type": learn_type}}
                 )
+                ret.learn_type = learn_type
             if last_event is not None and last_event.node > 0:
                 local_event = eptEndpointEvent.from_dict({
                     "ts":msg.ts, 
@@ -926,13 +1199,13 @@ class eptWorker(object):
 
             # flags is in eptHistory event but not eptNode event. Need to maintain flags before 
             # casting eptHistoryEvent local_event to eptEndpointEvent
-            local_event_flags = local_event.flags
+            local_event_flag_bits = local_event.flag_bits
             local_event = eptEndpointEvent.from_history_event(local_node, local_event)
             # set pod-id for local event (this is before vpc remap so node is actual fabric node)
             local_event.pod = msg.wf.cache.get_pod_id(local_event.node)
             logger.debug("best local set to: %s", local_event)
             # map local_node to vpc value if this is a vpc
-            if "vpc-attached" in local_event_flags:
+            if local_event_flag_bits & EPM_FLAG_VPC_ATTACHED:
                 peer_node = msg.wf.cache.get_peer_node(local_event.node)
                 if peer_node == 0:
                     logger.warn("failed to determine peer node for node 0x%04x", local_node)
@@ -943,6 +1216,7 @@ class eptWorker(object):
             # if this is the first event, then set first_learn, count, and events in single update
             if last_event is None:
                 logger.debug("creating new entry in endpoint table: %s", local_event)
+                self.write_buffer.flush_key(eptEndpoint._classname, flt)
                 self.db[eptEndpoint._classname].update_one(flt, {"$set":{
                     "first_learn": db_event,
                     "events": [db_event],
@@ -984,15 +1258,19 @@ class eptWorker(object):
                     # check if learn_type has changed for this complete event
                     if last_learn_type is not None and last_learn_type!=learn_type:
                         logger.debug("learn type updated from %s to %s",last_learn_type,learn_type)
+                        self.write_buffer.flush_key(eptEndpoint._classname, flt)
                         self.db[eptEndpoint._classname].update(flt, 
                             {"$set":{"learn_type": learn_type}}
                         )
+                        ret.learn_type = learn_type
                     if updated:
                         # if the previous entry was a delete and the current entry is not a delete, 
                         # then check for possible merge.
                         if last_event.node==0 and local_event.node>0 and ts_delta<=TRANSITORY_DELETE:
                             logger.debug("overwritting eptEndpoint [ts delta(%.3f) < %.3f] with: %s",
                                 ts_delta, TRANSITORY_DELETE, local_event)
+                            # the delete being overwritten may still be pending in write buffer
+                            self.write_buffer.flush_key(eptEndpoint._classname, flt)
                             self.db[eptEndpoint._classname].update(flt, 
                                     {"$set":{"events.0": db_event}}
                                 )
@@ -1077,7 +1355,7 @@ class eptWorker(object):
                         "ts": cached_rapid.rapid_lts,
                         "count": cached_rapid.rapid_count,
                         "rate": rate,
-                    },WORK_TYPE.WATCH_RAPID, fabric=msg.fabric)
+                    },WORK_TYPE.WATCH_RAPID, qnum=WORKER_QUEUE_NORMAL, fabric=msg.fabric)
                 logger.debug("sending rapid event to watcher")
                 self.send_msg(mmsg)
 
@@ -1114,6 +1392,7 @@ class eptWorker(object):
             "vnid": msg.vnid,
             "addr": msg.addr,
         }
+        self.write_buffer.flush_key(eptMove._classname, flt)
         db_move = self.db[eptMove._classname].find_one(flt, projection)
         if db_move is None:
             logger.debug("new move detected")
@@ -1133,7 +1412,8 @@ class eptWorker(object):
 
         if msg.wf.notification_enabled("move")["enabled"]:
             # send msg for WATCH_MOVE
-            mmsg = eptMsgWorkWatchMove(msg.addr,"watcher",{},WORK_TYPE.WATCH_MOVE,fabric=msg.fabric)
+            mmsg = eptMsgWorkWatchMove(msg.addr,"watcher",{},WORK_TYPE.WATCH_MOVE,
+                    qnum=WORKER_QUEUE_NORMAL, fabric=msg.fabric)
             mmsg.vnid = msg.vnid
             mmsg.type = msg.type
             mmsg.src = move_event["src"]
@@ -1167,12 +1447,7 @@ class eptWorker(object):
                 event = per_node_history_events[node][0]
                 if event.pctag > 1 and event.status != "deleted":
                     # skip offsubnet analysis based on endpoint flags
-                    if "loopback" in event.flags or \
-                        "vtep" in event.flags or \
-                        "svi" in event.flags or \
-                        "psvi" in event.flags or \
-                        "cached" in event.flags or \
-                        "static" in event.flags:
+                    if event.flag_bits & SKIP_OFFSUBNET_FLAGS:
                         logger.debug("skipping offsubnet analysis on node 0x%04x with flags: [%s]", 
                                 node, ",".join(event.flags))
                         continue
@@ -1202,6 +1477,7 @@ class eptWorker(object):
         elif update_local_result.is_offsubnet:
             logger.debug("clearing eptEndpoint is_offsubnet flag")
             self.db[eptEndpoint._classname].update_one(flt, {"$set":{"is_offsubnet":False}})
+            update_local_result.is_offsubnet = False
 
         # suppress the event to watcher if within suppress interval
         if len(offsubnet_nodes)>0:
@@ -1226,7 +1502,7 @@ class eptWorker(object):
                 msgs = []
                 for node in offsubnet_nodes:
                     wmsg = eptMsgWorkWatchOffSubnet(msg.addr,"watcher",{},WORK_TYPE.WATCH_OFFSUBNET,
-                            fabric=msg.fabric)
+                            qnum=WORKER_QUEUE_NORMAL, fabric=msg.fabric)
                     wmsg.ts = msg.ts
                     wmsg.node = node
                     wmsg.vnid = msg.vnid
@@ -1238,6 +1514,8 @@ class eptWorker(object):
                     self.db[eptHistory._classname].update_one(flt, {"$set":{
                         "watch_offsubnet_ts":msg.ts
                     }})
+                    if node in per_node_history_events:
+                        per_node_history_events[node][0].watch_offsubnet_ts = msg.ts
                 logger.debug("sending %s offsubnet events to watcher", len(msgs))
                 self.send_msg(msgs)
 
@@ -1294,13 +1572,7 @@ class eptWorker(object):
             # only perform analysis on non-deleted entries
             if h_event.status != "deleted":
                 # TODO - add check for interface that proxy-acast-X if bounce-to-proxy is set
-                if "bounce-to-proxy" in h_event.flags or \
-                    "loopback" in h_event.flags or \
-                    "vtep" in h_event.flags or \
-                    "svi" in h_event.flags or \
-                    "psvi" in h_event.flags or \
-                    "cached" in h_event.flags or \
-                    "static" in h_event.flags:
+                if h_event.flag_bits & SKIP_STALE_FLAGS:
                     logger.debug("skipping stale analysis on node 0x%04x with flags: [%s]", node,
                         ",".join(h_event.flags))
                     continue
@@ -1314,7 +1586,7 @@ class eptWorker(object):
                         node, h_event.tunnel_flags)
                     continue
                 if local_node > 0:
-                    if "local" in h_event.flags:
+                    if h_event.flag_bits & EPM_FLAG_LOCAL:
                         # this node thinks the endpoint is local. If it matches local_node or is a 
                         # member within vpc_nodes then skip it
                         if node != local_node and node not in vpc_nodes:
@@ -1333,10 +1605,8 @@ class eptWorker(object):
                         if h_event.remote != local_node and h_event.remote not in vpc_nodes:
                             if h_event.remote in per_node_history_events:
                                 remote_node_event = per_node_history_events[h_event.remote][0]
-                                if remote_node_event.remote != local_node or (
-                                    "bounce" not in remote_node_event.flags and \
-                                    "bounce-to-proxy" not in remote_node_event.flags
-                                    ):
+                                if remote_node_event.remote != local_node or \
+                                    (remote_node_event.flag_bits & BOUNCE_FLAGS) == 0:
                                     logger.debug("stale on %s to %s [flags [%s], to %s]", node, 
                                         h_event.remote, ",".join(remote_node_event.flags),
                                         remote_node_event.remote)
@@ -1360,7 +1630,7 @@ class eptWorker(object):
                         # a transient event and we're waiting on rewrite info OR it is an old event
                         # where we are waiting for the delete. we will consider this a type of 
                         # stale_multiple_local
-                        if "local" in h_event.flags:
+                        if h_event.flag_bits & EPM_FLAG_LOCAL:
                             logger.debug("node %s claiming local with incomplete local_node", node)
                             if msg.wf.settings.stale_multiple_local:
                                 logger.debug("stale on %s to %s (no local)", node, h_event.remote)
@@ -1394,6 +1664,7 @@ class eptWorker(object):
             logger.debug("clearing eptEndpoint is_stale flag")
             flt.pop("node",None)
             self.db[eptEndpoint._classname].update_one(flt, {"$set":{"is_stale":False}})
+            update_local_result.is_stale = False
 
         # suppress the event to watcher if within suppress interval
         if len(stale_nodes)>0:
@@ -1425,7 +1696,7 @@ class eptWorker(object):
                 msgs = []
                 for node in stale_nodes:
                     wmsg = eptMsgWorkWatchStale(msg.addr,"watcher",{},WORK_TYPE.WATCH_STALE,
-                            fabric=msg.fabric)
+                            qnum=WORKER_QUEUE_NORMAL, fabric=msg.fabric)
                     wmsg.ts = msg.ts
                     wmsg.node = node
                     wmsg.vnid = msg.vnid
@@ -1438,6 +1709,9 @@ class eptWorker(object):
                         "watch_stale_ts": msg.ts,
                         "watch_stale_event": stale_nodes[node].to_dict()
                     }})
+                    if node in per_node_history_events:
+                        per_node_history_events[node][0].watch_stale_ts = msg.ts
+                        per_node_history_events[node][0].watch_stale_event = stale_nodes[node]
                 logger.debug("sending %s stale events to watcher", len(msgs))
                 self.send_msg(msgs)
 
@@ -1480,6 +1754,8 @@ class eptWorker(object):
 
         # requeue delete msgs
         logger.debug("sending %s deletes for node 0x%04x", len(delete_msgs), msg.node)
+        for m in delete_msgs:
+            m.qnum = WORKER_QUEUE_NORMAL
         self.send_msg(delete_msgs)
 
     def handle_watch_move(self, msg):
@@ -1551,25 +1827,24 @@ class eptWorker(object):
         self.execute_generic_watch("offsubnet")
         self.execute_generic_watch("stale")
         self.execute_watch_rapid()
+        self.execute_watch_std_mo()
 
     def watcher_get_xts_ready(self, lock, msgs):
-        """ receive a lock and dict 'msgs' and pop off msgs that are ready to execute.
+        """ receive a lock and eptWatchSchedule 'msgs' and pop off msgs that are ready to execute.
             return tuple (key, msg) of ready msgs
         """
         ts = time.time()
-        work = []               # tuple of (key, msg) of watch event that is ready
         paused = {}             # count of work per fabric for accounting only
+        for fabric in self.fabrics.keys():
+            wf = self.fabrics.get(fabric, None)
+            if wf is not None and wf.watcher_paused:
+                paused[fabric] = 0
         with lock:
-            # get msg events that are ready, remove key from corresponding dict
-            for k, msg in msgs.items():
-                if msg.wf.watcher_paused:
-                    if msg.fabric not in paused:
-                        paused[msg.fabric] = 0
-                    paused[msg.fabric]+=1
-                else:
-                    if msg.xts <= ts: 
-                        work.append((k, msg))
-            for (k, msg) in work: msgs.pop(k, None)
+            # get msg events that are ready, each is removed from schedule
+            work = msgs.pop_ready(ts, skip_fabrics=paused)
+            for fabric in paused:
+                paused[fabric] = msgs.get_count(fabric)
+        paused = dict([(f, c) for (f, c) in paused.items() if c > 0])
         if len(paused) > 0:
             for fab in paused:
                 logger.debug("paused %s watch events for fabric %s", paused[fab], fab)
@@ -1756,12 +2031,17 @@ class eptWorker(object):
             dependencies)
             caches:
                 rapid_cache
+                endpoint_cache
         """
         logger.debug("deleting %s [0x%06x %s]", msg.fabric, msg.vnid, msg.addr)
         # remove from local caches
         cache = msg.wf.cache
         key = cache.get_key_str(addr=msg.addr, vnid=msg.vnid)
         cache.rapid_cache.remove(key)
+        cache.remove_endpoint_state(msg.vnid, msg.addr)
+        self.write_buffer.flush()
+        self.prefetch_history.pop((msg.fabric, msg.vnid, msg.addr), None)
+        self.prefetch_endpoint.pop((msg.fabric, msg.vnid, msg.addr), None)
         # delete from db
         endpoint = eptEndpoint.load(fabric=msg.fabric, vnid=msg.vnid, addr=msg.addr)
         if endpoint.exists():
@@ -1777,6 +2057,8 @@ class eptWorker(object):
     def handle_epm_eof(self, msg):
         """ receive eptMsgWork with WORK_TYPE.FABRIC_EPM_EOF and send ack back to subscriber """
         logger.debug("received epm eof for fabric %s", msg.fabric)
+        # build generation stamps must be written before the subscriber sweeps the db
+        self.write_buffer.flush()
         self.redis.publish(SUBSCRIBER_CTRL_CHANNEL, 
             eptMsgSubOp(MSG_TYPE.FABRIC_EPM_EOF_ACK,data={
                 "fabric": msg.fabric,
@@ -1786,6 +2068,25 @@ class eptWorker(object):
         )
         self.increment_stats(SUBSCRIBER_CTRL_CHANNEL, tx=True)
 
+    def handle_worker_drain(self, msg):
+        """ receive eptMsgWork with WORK_TYPE.WORKER_DRAIN and send ack back to subscriber. All 
+            work enqueued before the drain marker has been processed so pending writes are flushed
+            before the ack allowing a new worker to take ownership of the endpoints. Endpoint 
+            ownership may change so the endpoint state cache is also flushed.
+        """
+        logger.debug("received worker drain %s for fabric %s", msg.data.get("drain"), msg.fabric)
+        self.write_buffer.flush()
+        msg.wf.cache.endpoint_cache.flush()
+        self.redis.publish(SUBSCRIBER_CTRL_CHANNEL, 
+            eptMsgSubOp(MSG_TYPE.WORKER_DRAIN_ACK, data={
+                "fabric": msg.fabric,
+                "addr": self.worker_id,
+                "qnum": msg.qnum,
+                }, seq=msg.data.get("drain", 0)
+            ).jsonify()
+        )
+        self.increment_stats(SUBSCRIBER_CTRL_CHANNEL, tx=True)
+
     def handle_watch_pause(self, msg):
         """ receive eptMsgWork with WORK_TYPE.FABRIC_WATCH_PAUSE and set local watcher_pause flag """
         logger.debug("receiving watch pause for fabric %s", msg.fabric)
@@ -1796,19 +2097,86 @@ class eptWorker(object):
         logger.debug("receiving watch resume for fabric %s", msg.fabric)
         msg.wf.watcher_paused = False
 
+    def handle_mo_index_reset(self, msg):
+        """ receive eptMsgWork with WORK_TYPE.MO_INDEX_RESET and clear mo dependency index so it is
+            reloaded from the db on next std mo event
+        """
+        logger.debug("receiving mo index reset for fabric %s", msg.fabric)
+        msg.wf.mo_index = None
+
     def handle_std_mo_event(self, msg):
-        """ receive eptMsgWork with WORK_TYPE.STD_MO and if an update occurs send flush """
+        """ receive eptMsgWork with WORK_TYPE.STD_MO and add to watch_std_mo. Events for the same
+            dn received within STD_MO_COALESCE_WINDOW are collapsed into a single event that is 
+            synced by execute_watch_std_mo
+        """
         classname = msg.data.keys()[0]
         attr = msg.data[classname]
-        if classname in dependency_map:
-            logger.debug("triggering sync_event for dependency %s", classname)
-            updates = dependency_map[classname].sync_event(msg.wf.fabric, attr, msg.wf.session)
-            logger.debug("updated objects: %s", len(updates))
-            # send flush for each update
-            for u in updates:
-                self.send_flush(msg.wf.fabric, u, u.name if hasattr(u, "name") else None)
-        else:
+        if classname not in dependency_map:
             logger.warn("%s not defined in dependency_map", classname)
+            return
+        key = (msg.fabric, classname, attr.get("dn", ""))
+        with self.watch_std_mo_lock:
+            if key in self.watch_std_mo:
+                prev = self.watch_std_mo[key]
+                prev_attr = prev.data[classname]
+                if prev_attr.get("_ts", 0) > attr.get("_ts", 0):
+                    logger.debug("ignoring std mo event older than pending event: %s", key)
+                    return
+                # modified events only include changed attributes so merge with pending event
+                if attr.get("status") != "deleted" and prev_attr.get("status") != "deleted":
+                    merged = dict(prev_attr)
+                    merged.update(attr)
+                    if prev_attr.get("status") == "created":
+                        merged["status"] = "created"
+                    msg.data = {classname: merged}
+                msg.xts = prev.xts
+                logger.debug("collapsed std mo event: %s", key)
+            else:
+                msg.xts = msg.now + STD_MO_COALESCE_WINDOW
+            self.watch_std_mo[key] = msg
+
+    def execute_watch_std_mo(self):
+        """ get list of std mo events that are ready to execute and trigger sync_event for each. 
+            ept objects updated by the syncs are flushed with a single message per fabric. Std mo
+            events are not delayed while the fabric watcher is paused.
+        """
+        with self.watch_std_mo_lock:
+            work = self.watch_std_mo.pop_ready(time.time())
+        if len(work) == 0:
+            return
+        logger.debug("execute %s ready watch std mo events", len(work))
+        # dict indexed by fabric with list of (collection, name) for each updated ept object
+        flush = {}
+        work.sort(key=lambda w: w[1].data.values()[0].get("_ts", 0))
+        for (k, msg) in work:
+            try:
+                for u in self.sync_std_mo_event(msg):
+                    name = u.name if hasattr(u, "name") else None
+                    flush.setdefault(msg.fabric, []).append((u.__class__, name))
+            except Exception as e:
+                logger.debug("failed to execute msg %s", msg)
+                logger.error("Traceback:\n%s", traceback.format_exc())
+        for fabric in flush:
+            self.send_flush_bulk(fabric, flush[fabric])
+
+    def sync_std_mo_event(self, msg):
+        """ trigger sync_event for std mo msg and return list of updated ept objects """
+        classname = msg.data.keys()[0]
+        attr = msg.data[classname]
+        logger.debug("triggering sync_event for dependency %s", classname)
+        if msg.wf.mo_index is None:
+            index = DependencyIndex(msg.wf.fabric, dependency_map.values())
+            if index.load():
+                msg.wf.mo_index = index
+        try:
+            updates = dependency_map[classname].sync_event(msg.wf.fabric, attr, 
+                            msg.wf.session, index=msg.wf.mo_index)
+        except Exception as e:
+            # index may be out of sync with the db, reload on next event
+            msg.wf.mo_index = None
+            raise e
+        logger.debug("updated objects: %s", len(updates))
+        return updates
 
 class eptWorkerUpdateLocalResult(object):
     """ return object for eptWorker.update_loal method """
@@ -1817,5 +2185,6 @@ class eptWorkerUpdateLocalResult(object):
         self.local_events = []          # recent (0-3) local eptEndpointEvent objects
         self.is_offsubnet = False       # eptEndpoint object is currently offsubnet
         self.is_stale = False           # eptEndpoint object is currently stale
+        self.learn_type = None          # eptEndpoint learn_type after update
         self.exists = False             # eptEndpoint entry exists
 
@@ -1,6 +1,7 @@
 
 from ... utils import get_app_config
 from ... utils import get_db
+from ... utils import get_redis
 from .. utils import get_apic_session
 from .. utils import send_emails
 from .. utils import syslog
@@ -9,6 +10,7 @@ from . common import NOTIFY_QUEUE_MAX_SIZE
 from . common import BackgroundThread
 from . common import push_event
 from . ept_cache import eptCache
+from . ept_cache import sharedCache
 from . dns_cache import DNSCache
 from . ept_msg import eptEpmEventParser
 from . ept_settings import eptSettings
@@ -37,12 +39,24 @@ class eptWorkerFabric(object):
         self.session = None
         self.notify_queue = None
         self.notify_thread = None
+        # optional eptWriteBuffer set by worker process for buffered push_event operations
+        self.write_buffer = None
+        # DependencyIndex loaded by watcher process on first std mo event
+        self.mo_index = None
         self.init() 
 
     def init(self):
         """ initialize settings after fabric settings as been loaded """
         # epm parser used with eptWorker for creating pseudo eevents
         self.ept_epm_parser = eptEpmEventParser(self.fabric, self.settings.overlay_vnid)
+        # cache sizes may be updated on settings reload
+        self.cache.resize(self.settings.cache_size, self.settings.endpoint_cache_size,
+                        max_memory=self.settings.cache_max_memory*1024*1024)
+        if self.settings.shared_cache:
+            if self.cache.shared_cache is None:
+                self.cache.shared_cache = sharedCache(self.fabric, get_redis())
+        else:
+            self.cache.shared_cache = None
         # one time calculation for email address and syslog server (which requires valid port)
         self.email_address = self.settings.email_address
         self.syslog_server = self.settings.syslog_server
@@ -107,10 +121,19 @@ class eptWorkerFabric(object):
         # wrapper to push an event to eptHistory events list.  set per_node to false to use 
         # max_endpoint_event rotate length, else max_per_node_endpoint_events value is used
         if per_node:
-            return push_event(self.db[table], key, event, 
-                    rotate=self.settings.max_per_node_endpoint_events)
+            rotate = self.settings.max_per_node_endpoint_events
         else:
-            return push_event(self.db[table], key, event, rotate=self.settings.max_endpoint_events)
+            rotate = self.settings.max_endpoint_events
+        if self.write_buffer is not None:
+            return self.write_buffer.push_event(table, key, event, rotate=rotate)
+        return push_event(self.db[table], key, event, rotate=rotate)
+
+    def set_fields(self, table, key, fields):
+        # wrapper to $set fields on an existing object, buffered along with push_event operations
+        if self.write_buffer is not None:
+            return self.write_buffer.set_fields(table, key, fields)
+        self.db[table].update_one(key, {"$set": fields})
+        return True
 
     def get_learn_type(self, vnid, flags=[]):
         # based on provide vnid and flags return learn type for endpoint:
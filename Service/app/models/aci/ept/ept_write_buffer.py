@@ -0,0 +1,182 @@
+
+from . common import WRITE_BUFFER_MAX_AGE
+from . common import WRITE_BUFFER_MAX_SIZE
+from . common import push_event
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import logging
+import time
+import traceback
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+class eptWriteBuffer(object):
+    """ write-behind buffer for push_event and set_fields operations. When enabled, push_event operations are
+        collected and written to the db as unordered bulk_write batches when the buffer exceeds
+        max_size operations or the oldest pending operation exceeds max_age seconds.
+
+        Multiple push_event operations to the same key are merged into a single update (events
+        pushed in order at position 0 with a single $inc) so there is at most one operation per
+        key within a batch and per-key ordering is preserved by the unordered bulk_write. Fields
+        from set_fields are merged into the same update with $set.
+
+        Callers are responsible for calling flush_key before reading or deleting an object that
+        may have pending writes.
+    """
+    def __init__(self, db, max_size=WRITE_BUFFER_MAX_SIZE, max_age=WRITE_BUFFER_MAX_AGE):
+        self.db = db
+        self.max_size = max_size
+        self.max_age = max_age
+        # push_event operations are passed directly to the db when buffer is not enabled
+        self.enabled = False
+        # pending operations indexed by collection and then key tuple
+        self.pending = {}
+        # count of pending operations per collection per addr for quick check in flush_key
+        self.pending_addr = {}
+        self.pending_count = 0
+        self.pending_ts = 0
+        # counters
+        self.total_ops = 0
+        self.total_merged = 0
+        self.total_flush = 0
+        self.total_flush_ops = 0
+        self.total_flush_errors = 0
+        self.total_flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    def __repr__(self):
+        avg = 0.0
+        if self.total_flush > 0:
+            avg = self.total_flush_time / self.total_flush
+        return "pending:%s, ops:%s, merged:%s, flush:%s, flush_ops:%s, errors:%s, "\
+                "flush_time(last:%.3f, avg:%.3f, max:%.3f)" % (self.pending_count, self.total_ops,
+                self.total_merged, self.total_flush, self.total_flush_ops,
+                self.total_flush_errors, self.last_flush_time, avg, self.max_flush_time)
+
+    def push_event(self, collection, key, event, rotate=None, increment=True):
+        """ add push_event operation to the buffer (or execute directly if buffer is disabled).
+            return bool success
+        """
+        if not self.enabled:
+            return push_event(self.db[collection], key, event, rotate=rotate, increment=increment)
+        self.total_ops+= 1
+        op = self.get_pending_op(collection, key)
+        # most recent event is always first in the list
+        op["events"].insert(0, event)
+        op["rotate"] = rotate
+        if increment:
+            op["count"]+= 1
+        if rotate is not None and len(op["events"]) > rotate:
+            op["events"] = op["events"][0:rotate]
+        self.check_flush()
+        return True
+
+    def set_fields(self, collection, key, fields):
+        """ add $set operation for the provided fields on an existing object to the buffer (or
+            execute directly if buffer is disabled). return bool success
+        """
+        if not self.enabled:
+            self.db[collection].update_one(key, {"$set": fields})
+            return True
+        self.total_ops+= 1
+        op = self.get_pending_op(collection, key)
+        op["set"].update(fields)
+        self.check_flush()
+        return True
+
+    def get_pending_op(self, collection, key):
+        """ return pending operation for key, creating a new operation if one does not exist """
+        if collection not in self.pending:
+            self.pending[collection] = {}
+            self.pending_addr[collection] = {}
+        hkey = tuple(sorted(key.items()))
+        op = self.pending[collection].get(hkey, None)
+        if op is None:
+            op = {
+                "key": key,
+                "events": [],
+                "rotate": None,
+                "count": 0,
+                "set": {},
+            }
+            self.pending[collection][hkey] = op
+            addr = key.get("addr", None)
+            self.pending_addr[collection][addr] = self.pending_addr[collection].get(addr, 0) + 1
+            if self.pending_count == 0:
+                self.pending_ts = time.time()
+            self.pending_count+= 1
+        else:
+            self.total_merged+= 1
+        return op
+
+    def check_flush(self):
+        """ flush the buffer if max_size or max_age has been exceeded """
+        if self.pending_count >= self.max_size or time.time() - self.pending_ts >= self.max_age:
+            self.flush()
+
+    def flush_key(self, collection, flt):
+        """ flush the buffer if there are pending operations that may match the provided read
+            filter. If addr is not within the filter, then any pending operation on the collection
+            triggers a flush.
+        """
+        if self.pending_count == 0 or collection not in self.pending:
+            return
+        addr = flt.get("addr", None)
+        if addr is None:
+            self.flush()
+        elif isinstance(addr, dict):
+            for a in addr.get("$in", []):
+                if a in self.pending_addr[collection]:
+                    self.flush()
+                    return
+        elif addr in self.pending_addr[collection]:
+            self.flush()
+
+    def flush(self):
+        """ write all pending operations to the db """
+        if self.pending_count == 0:
+            return
+        ts = time.time()
+        pending = self.pending
+        count = self.pending_count
+        self.pending = {}
+        self.pending_addr = {}
+        self.pending_count = 0
+        for collection in pending:
+            bulk = []
+            for op in pending[collection].values():
+                update = {}
+                if len(op["events"]) > 0:
+                    update["$push"] = {"events": {"$each": op["events"], "$position": 0 } }
+                    if op["rotate"] is not None:
+                        update["$push"]["events"]["$slice"] = op["rotate"]
+                if op["count"] > 0:
+                    update["$inc"] = {"count": op["count"]}
+                if len(op["set"]) > 0:
+                    update["$set"] = op["set"]
+                # set_fields only operations never create a new object
+                bulk.append(UpdateOne(op["key"], update, upsert=len(op["events"]) > 0))
+            try:
+                self.db[collection].bulk_write(bulk, ordered=False)
+            except BulkWriteError as be:
+                self.total_flush_errors+= 1
+                logger.warn("%s bulkwrite error: %s", collection, be.details)
+            except Exception as e:
+                self.total_flush_errors+= 1
+                logger.debug("Traceback:\n%s", traceback.format_exc())
+                logger.error("failed to flush %s operations for %s: %s", len(bulk), collection, e)
+        self.last_flush_time = time.time() - ts
+        self.total_flush+= 1
+        self.total_flush_ops+= count
+        self.total_flush_time+= self.last_flush_time
+        if self.last_flush_time > self.max_flush_time:
+            self.max_flush_time = self.last_flush_time
+        logger.debug("flushed %s operations (time: %.3f)", count, self.last_flush_time)
+
+    def log_stats(self):
+        """ log buffer counters """
+        logger.debug("write buffer: %s", self)
+
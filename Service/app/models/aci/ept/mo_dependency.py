@@ -223,10 +223,12 @@ class DependencyNode(object):
         #logger.debug("sync_mo_to_ept %s(%s) returning %s updates",mo._classname,mo.dn,len(updates))
         return updates
 
-    def sync_event(self, fabric, attr, session=None):
+    def sync_event(self, fabric, attr, session=None, index=None):
         """ receive subscription event and update mo and corresponding dependent ept objects
             return list of ept objects that were updated
             this requires 'dn', 'status', and '_ts' within provided attribute dict
+            if a loaded DependencyIndex is provided then it is used for parent and child lookups
+            and is updated with the mo change
         """
         logger.debug("sync event (fabric:%s), '%s' dn: %s",fabric,attr.get("status",""),attr["dn"])
         #logger.debug("full event: %s", attr)
@@ -257,6 +259,8 @@ class DependencyNode(object):
                 return updates
             logger.debug("delete event removing mo object(%s): %s", mo._classname, mo.dn)
             mo.remove()
+            if index is not None:
+                index.update(self.classname, mo)
         else:
             mo_update = not mo.exists()
             # sync mo to local db
@@ -272,14 +276,46 @@ class DependencyNode(object):
             if not mo_update:
                 # no local mo update so no ept object change or child dependencies can change
                 return updates
+            if index is not None:
+                index.update(self.classname, mo)
 
-        # get ept object along with parent and child dependencies 
+        return self.sync_mo_dependents(mo, index=index)
+
+    def sync_rebuild(self, fabric, change, index=None):
+        """ receive change from ManagedObject rebuild and update corresponding dependent ept
+            objects.  The mo is already updated in local db by the rebuild.  Return list of ept 
+            objects that were updated.
+            this requires 'dn' and 'status' within the provided change dict. An optional 
+            DependencyIndex loaded after the rebuild is used for parent and child lookups
+        """
+        logger.debug("sync rebuild (fabric:%s), '%s' dn: %s", fabric, change["status"], 
+                change["dn"])
+        if change["status"] == "deleted":
+            # deleted mo no longer exists in the db, create instance from the removed attributes
+            self.cls_mo.init()
+            attr = {"fabric": fabric}
+            for a in change:
+                if a in self.cls_mo._attributes: 
+                    attr[a] = change[a]
+            mo = self.cls_mo(**attr)
+        else:
+            mo = self.cls_mo.load(fabric=fabric, dn=change["dn"])
+            if not mo.exists():
+                logger.debug("ignoring change for non-existing mo: %s, %s", self.classname, 
+                        change["dn"])
+                return []
+        return self.sync_mo_dependents(mo, index=index)
+
+    def sync_mo_dependents(self, mo, index=None):
+        """ get ept object along with parent and child dependencies for mo and sync each.  Return 
+            list of ept objects that were updated
+        """
         self.set_ept_object(mo)
         logger.debug("getting mo dependents for %s(%s)", mo._classname, mo.dn)
         ts1 = time.time()
-        parents = self.get_parent_objects(mo)
+        parents = self.get_parent_objects(mo, index=index)
         ts2 = time.time()
-        setattr(mo, "children", self.get_child_objects(mo))
+        setattr(mo, "children", self.get_child_objects(mo, index=index))
         ts3 = time.time()
         logger.debug("mo timing total: %.3f, parent(%s): %.3f, child(%s): %0.3f", ts3-ts1, 
                 len(parents), ts2-ts1, len(mo.children), ts3-ts2) 
@@ -287,7 +323,7 @@ class DependencyNode(object):
         # update local ept object
         return self.sync_mo_to_ept(mo, parents)
 
-    def get_parent_objects(self, mo):
+    def get_parent_objects(self, mo, index=None):
         # return dict indexed by classname of each parent.  Note, each classname can only be one
         # object. This can only execute if self.object is set. Object will include .ept attribute
         # containing corresponding ept object (if exists and defined in ept_map)
@@ -305,12 +341,16 @@ class DependencyNode(object):
                 }
                 #logger.debug("checking for parent %s(%s=%s)", classname, connector.remote_attr,
                 #                                                        key[connector.remote_attr])
-                p_mo = connector.remote_node.cls_mo.find(**key)
+                if index is not None:
+                    p_mo = index.find(connector.remote_node, connector.remote_attr, 
+                                        key[connector.remote_attr])
+                else:
+                    p_mo = connector.remote_node.cls_mo.find(**key)
                 if len(p_mo) > 0:
                     p_mo = p_mo[0]
                     setattr(p_mo, "dependency", connector.remote_node)
                     #logger.debug("matched %s parent %s(%s)", mo_classname, classname, p_mo.dn)
-                    p_ret = connector.remote_node.get_parent_objects(p_mo)
+                    p_ret = connector.remote_node.get_parent_objects(p_mo, index=index)
                     for k in p_ret: ret[k] = p_ret[k]
                     ret[classname] = p_mo
                     # an instance of an object will only ever have one parent, so first match is
@@ -324,7 +364,7 @@ class DependencyNode(object):
         #    logger.debug("no parents for %s", mo.dn)
         return ret
 
-    def get_child_objects(self, mo):
+    def get_child_objects(self, mo, index=None):
         # return a list representing children where each child is a dict containing the following:
         #   [
         #       mo.object
@@ -346,12 +386,17 @@ class DependencyNode(object):
                 }
                 #logger.debug("checking for child %s(%s=%s)", classname, connector.remote_attr,
                 #                                                        key[connector.remote_attr])
-                c_mo = connector.remote_node.cls_mo.find(**key)
+                if index is not None:
+                    c_mo = index.find(connector.remote_node, connector.remote_attr, 
+                                        key[connector.remote_attr])
+                else:
+                    c_mo = connector.remote_node.cls_mo.find(**key)
                 for c in c_mo:
                     setattr(c, "dependency", connector.remote_node)
                     connector.remote_node.set_ept_object(c)
                     #logger.debug("matched %s child %s(%s)", mo_classname, classname, c.dn)
-                    setattr(c, "children", connector.remote_node.get_child_objects(c))
+                    setattr(c, "children", 
+                            connector.remote_node.get_child_objects(c, index=index))
                     ret.append(c)
         except Exception as e:
             logger.error("Traceback:\n%s", traceback.format_exc())
@@ -364,7 +409,82 @@ class DependencyNode(object):
         return ret
 
 
-       
+class DependencyIndex(object):
+    """ in-memory index of mo objects for a single fabric used by DependencyNode for parent and
+        child lookups.  Objects are indexed by each connector attribute so that lookups are dict
+        reads instead of a db query per connector at each level of the dependency tree.  The index
+        must be loaded after the mo db is built and is then updated by each sync_event.
+    """
+    def __init__(self, fabric, nodes):
+        self.fabric = fabric
+        self.nodes = nodes
+        self.loaded = False
+        # dict indexed by classname with the dict of attributes for each object indexed by dn
+        self.objects = {}
+        # dict indexed by (classname, attribute) with dict of attribute value to set of dns
+        self.index = {}
+        for node in nodes:
+            for connector in node.parents + node.children:
+                key = (connector.remote_node.classname, connector.remote_attr)
+                self.index[key] = {}
+
+    def load(self):
+        """ read all mo objects for each indexed classname from the db. Return boolean success """
+        ts = time.time()
+        self.objects = {}
+        for key in self.index:
+            self.index[key] = {}
+        try:
+            for node in self.nodes:
+                self.objects[node.classname] = {}
+                for mo in node.cls_mo.find(fabric=self.fabric):
+                    self.add(node.classname, mo.to_json())
+        except Exception as e:
+            logger.error("Traceback:\n%s", traceback.format_exc())
+            return False
+        self.loaded = True
+        logger.debug("dependency index loaded for %s, %s objects (time: %0.3f)", self.fabric,
+                sum([len(self.objects[c]) for c in self.objects]), time.time() - ts)
+        return True
+
+    def add(self, classname, attr):
+        # add attribute dict for an mo object to the index
+        dn = attr["dn"]
+        self.objects.setdefault(classname, {})[dn] = attr
+        for (c, a), values in self.index.items():
+            if c == classname and a in attr:
+                values.setdefault(attr[a], set()).add(dn)
+
+    def remove(self, classname, dn):
+        # remove mo object from index if present
+        attr = self.objects.get(classname, {}).pop(dn, None)
+        if attr is None:
+            return
+        for (c, a), values in self.index.items():
+            if c == classname and a in attr and attr[a] in values:
+                values[attr[a]].discard(dn)
+                if len(values[attr[a]]) == 0:
+                    values.pop(attr[a])
+
+    def update(self, classname, mo):
+        """ update index with the current state of an mo object after save or remove """
+        self.remove(classname, mo.dn)
+        if mo.exists():
+            self.add(classname, mo.to_json())
+
+    def find(self, node, attribute, value):
+        """ return list of mo objects for DependencyNode with attribute matching value """
+        ret = []
+        for dn in self.index.get((node.classname, attribute), {}).get(value, []):
+            # return new object on each lookup as dependency attributes are set on the mo objects
+            mo = node.cls_mo(**self.objects[node.classname][dn])
+            mo._exists = True
+            for a in mo._attributes:
+                if not mo._attributes[a]["key"] and hasattr(mo, a):
+                    mo._original_attributes[a] = getattr(mo, a)
+            ret.append(mo)
+        return ret
+
 class moAttrHandler(object):
     """ custom attribute handler that supports a get_value function with attribute name, mo object,
         and mo_parents list and returns value for the attribute
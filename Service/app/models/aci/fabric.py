@@ -12,6 +12,7 @@ from . import utils as aci_utils
 from . ept.common import MANAGER_CTRL_CHANNEL
 from . ept.ept_msg import eptMsg
 from . ept.ept_msg import MSG_TYPE
+from . ept.ept_cache_stats import eptCacheStats
 from . ept.ept_queue_stats import eptQueueStats
 
 from flask import abort
@@ -217,11 +218,12 @@ class Fabric(Rest):
     @classmethod
     @api_callback("after_delete")
     def after_fabric_delete(cls, filters):
-        """ after fabric is deleted, remove any queue-stats for this fabric """
+        """ after fabric is deleted, remove any queue-stats and cache-stats for this fabric """
         if "fabric" not in filters:
             cls.logger.warn("skipping after delete operation on bulk fabric delete")
             return filters
         eptQueueStats.delete(proc="fab-%s" % filters["fabric"])
+        eptCacheStats.delete(fabric=filters["fabric"])
 
     @api_route(path="status", methods=["GET"], role=Role.USER, swag_ret=["status", "uptime"])
     def get_fabric_status(self, api=True):
@@ -1,6 +1,10 @@
 from ... rest import Rest
 from .. utils import get_class
 from .. utils import get_apic_session
+from ... utils import get_db
+from pymongo import DeleteOne
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 import copy
 import logging
@@ -55,14 +59,20 @@ class ManagedObject(Rest):
         return ret
 
     @classmethod
-    def rebuild(cls, fabric, session=None):
+    def rebuild(cls, fabric, session=None, changes=None):
         """ rebuild collection 
             requires instance of Fabric object and optional session object for queries
+
+            objects from the APIC are compared against the existing objects within the collection
+            and only inserts, updates, and deletes are written to the db.  If a changes list is
+            provided then an entry is appended for each changed object with 'dn' and 'status' of
+            created, modified, or deleted.  Deleted entries also include the attributes of the 
+            removed object.
+
             return tuple (bool success, error message)
         """
         classname = cls.__name__
         logger.debug("db rebuild of '%s'", classname)
-        cls.delete(_filters={"fabric":fabric.fabric})
 
         if session is None:
             session = get_apic_session(fabric)
@@ -77,8 +87,19 @@ class ManagedObject(Rest):
             logger.warn("MO rebuild %s", errmsg)
             return (False, errmsg)
 
+        # existing objects indexed by dn.  Note, the apic orderBy and mongo sort on dn do not 
+        # always agree so a dict lookup is used instead of a sorted merge
+        cls.init()
+        collection = get_db()[cls._classname]
+        existing = {}
+        for db_obj in cls._mongo(collection.find, {"fabric": fabric.fabric}, {"_id": 0}):
+            if "dn" in db_obj:
+                existing[db_obj["dn"]] = db_obj
+
         ts = time.time()
-        bulk_objects = []
+        bulk = []
+        created = []
+        modified = []
         for obj in data:
             if type(obj) is dict and len(obj)>0:
                 cname = obj.keys()[0]
@@ -88,19 +109,54 @@ class ManagedObject(Rest):
                         errmsg = "invalid %s object with no dn" % classname
                         logger.warn("MO rebuild %s: %s", errmsg, attr)
                         return (False, errmsg)
-                    else:
+                    dn = attr["dn"]
+                    db_obj = existing.pop(dn, None)
+                    if db_obj is None:
                         db_obj = {"fabric": fabric.fabric, "ts": ts}
                         for a in cls._attributes:
                             if a in attr:
                                 db_obj[a] = attr[a]
-                        bulk_objects.append(cls(**db_obj))
+                        insert = cls(**db_obj)._save(bulk_prep=True, 
+                                                        skip_validation=not cls.VALIDATE)
+                        if insert is not None:
+                            bulk.append(insert)
+                            created.append(dn)
+                    else:
+                        update = {}
+                        for a in cls._attributes:
+                            if a in attr and a != "ts" and a != "fabric" and db_obj.get(a)!=attr[a]:
+                                update[a] = attr[a]
+                        if len(update)>0:
+                            update["ts"] = ts
+                            bulk.append(UpdateOne({"fabric":fabric.fabric, "dn":dn},{"$set":update}))
+                            modified.append(dn)
             else:
                 errmsg = "failed to get stream data from class query for %s" % classname
                 logger.warn("MO rebuild %s", errmsg)
                 return (False, errmsg)
-        if len(bulk_objects)>0:
-            cls.bulk_save(bulk_objects, skip_validation=not cls.VALIDATE)
+
+        # remaining existing objects were not returned by the apic and are deleted
+        for dn in existing:
+            bulk.append(DeleteOne({"fabric": fabric.fabric, "dn": dn}))
+
+        logger.debug("%s rebuild created: %s, modified: %s, deleted: %s", classname, len(created),
+                len(modified), len(existing))
+        if len(bulk)>0:
+            try:
+                cls._mongo(collection.bulk_write, bulk)
+            except BulkWriteError as be:
+                errmsg = "failed to write changes for classname %s" % classname
+                logger.warn("MO rebuild %s: %s", errmsg, be.details)
+                return (False, errmsg)
         else:
-            logger.debug("no objects of %s to insert", classname)
-        return (True, "")
+            logger.debug("no changes for %s", classname)
 
+        if changes is not None:
+            for dn in created:
+                changes.append({"dn": dn, "status": "created"})
+            for dn in modified:
+                changes.append({"dn": dn, "status": "modified"})
+            for dn in existing:
+                existing[dn]["status"] = "deleted"
+                changes.append(existing[dn])
+        return (True, "")
@@ -7,6 +7,8 @@
 
 from requests.exceptions import ConnectionError
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
+from six.moves.queue import Empty
+from six.moves.queue import Full
 from six.moves.queue import Queue
 from websocket import create_connection
 from websocket import WebSocketException
@@ -262,16 +264,18 @@ class Session(object):
         """
         return self._send(method, url, data=data, timeout=timeout, retry=retry)
 
-    def get(self, url, timeout=None, retry=True):
+    def get(self, url, timeout=None, retry=True, stream=False):
         """ perform REST GET request to apic
 
             url (str)       relative url to get
             timeout (int)   timeout in seconds to complete the request
             retry (bool)    retry get on failure
+            stream (bool)   defer download of response body until it is read by the caller. The
+                            caller must close the response if body is not fully consumed
 
             returns requests response object
         """
-        return self._send("GET", url, timeout=timeout, retry=retry)
+        return self._send("GET", url, timeout=timeout, retry=retry, stream=stream)
 
     def init_subscription_thread(self):
         """ start subscription thread """
@@ -333,7 +337,7 @@ class Session(object):
         if self.session is not None:
             self.session.close()
 
-    def _send(self, method, url, data=None, timeout=None, retry=True):
+    def _send(self, method, url, data=None, timeout=None, retry=True, stream=False):
         """ perform GET/POST/DELETE request to apic
             returns requests response object
         """
@@ -358,7 +362,7 @@ class Session(object):
         #logger.debug("%s %s", method, url)
         # perform request method with optional retry
         resp = session_method(url, data=data, verify=self.verify_ssl, timeout=timeout, 
-                    proxies=self._proxies, cookies=cookies)
+                    proxies=self._proxies, cookies=cookies, stream=stream)
         if resp.status_code == 403 and retry:
             logger.warn('%s, refreshing login and will try again', resp.text)
             resp = self._send_login()
@@ -372,7 +376,7 @@ class Session(object):
                 elif method == "DELETE":
                     session_method = self.session.delete
                 resp = session_method(url, data=data, verify=self.verify_ssl, timeout=timeout, 
-                        proxies=self._proxies, cookies=cookies)
+                        proxies=self._proxies, cookies=cookies, stream=stream)
                 logger.debug('returning resp: %s', resp)
             else:
                 logger.warn('retry login failed')
@@ -483,7 +487,11 @@ class Login(threading.Thread):
         return self.exit()
 
 class EventHandler(threading.Thread):
-    """ thread responsible for websocket event callbacks """
+    """ thread responsible for receiving websocket frames. This is the first stage of the ingest
+        pipeline and only reads each frame into the subscriber frame buffer along with the receive
+        timestamp.  Decode and callbacks are handled by the EventDispatcher thread so a slow
+        callback does not back up the websocket.
+    """
     def __init__(self, subscriber):
         threading.Thread.__init__(self)
         self.subscriber = subscriber
@@ -498,6 +506,8 @@ class EventHandler(threading.Thread):
     def run(self):
         threading.currentThread().name = "session-event"
         self.failure_reason = None
+        frame_q = self.subscriber._frame_q
+        stats = self.subscriber.ingest_stats
         while not self._exit:
             try:
                 event = self.subscriber._ws.recv()
@@ -506,22 +516,121 @@ class EventHandler(threading.Thread):
                 self.failure_reason = "websocket unexpectedly closed"
                 return
             if len(event) > 0:
+                ts = time.time()
+                stats.recv_frames+= 1
+                stats.last_recv_ts = ts
+                if frame_q.full():
+                    # block until dispatcher catches up, websocket will buffer frames meanwhile
+                    stats.recv_blocked+= 1
+                    logger.warn("frame buffer full (%s), waiting on dispatcher", frame_q.qsize())
+                # dispatcher exits with the subscriber so do not block forever on a full buffer
+                while True:
+                    if self._exit or self.subscriber._exit:
+                        return
+                    try:
+                        frame_q.put((event, ts), True, 1)
+                        break
+                    except Full:
+                        continue
+                backlog = frame_q.qsize()
+                if backlog > stats.backlog_max:
+                    stats.backlog_max = backlog
+
+class EventDispatcher(threading.Thread):
+    """ thread responsible for decoding websocket frames from the subscriber frame buffer and 
+        executing the callback for each subscription within the event.  Frames are handled in the
+        order they were received which preserves per-subscription ordering.
+    """
+    def __init__(self, subscriber):
+        threading.Thread.__init__(self)
+        self.subscriber = subscriber
+        self._exit = False
+
+    def exit(self):
+        """ exit thread """
+        logger.debug("exiting subscription event dispatcher thread")
+        self._exit = True
+
+    def run(self):
+        threading.currentThread().name = "session-dispatch"
+        frame_q = self.subscriber._frame_q
+        stats = self.subscriber.ingest_stats
+        while not self._exit and not self.subscriber._exit:
+            try:
+                (event, recv_ts) = frame_q.get(True, 1)
+            except Empty:
+                continue
+            try:
+                ts = time.time()
+                stats.add_latency("wait", ts - recv_ts)
                 # parse event, determine subscription_ids and callback
                 # note subsciption_ids is list of subscriptions... 
                 try:
                     js = json.loads(event)
-                    js["_ts"] = time.time()
-                    if "subscriptionId" in js:
-                        for s_id in js["subscriptionId"]:
-                            cb = self.subscriber._subscription_ids.get(s_id, None)
-                            if cb is not None:
-                                cb.execute_callback(js)
-                            else:
-                                logger.debug("ignorning event, no callback for %s", s_id)
-                    else:
-                        logger.debug("invalid ws event, no subscription_id: %s", js)
+                    js["_ts"] = recv_ts
                 except ValueError as e:
                     logger.debug("failed to parse ws event: %s", event)
+                    continue
+                decode_ts = time.time()
+                stats.add_latency("decode", decode_ts - ts)
+                if "subscriptionId" in js:
+                    for s_id in js["subscriptionId"]:
+                        cb = self.subscriber._subscription_ids.get(s_id, None)
+                        if cb is not None:
+                            cb.execute_callback(js)
+                        else:
+                            logger.debug("ignorning event, no callback for %s", s_id)
+                else:
+                    logger.debug("invalid ws event, no subscription_id: %s", js)
+                stats.add_latency("dispatch", time.time() - decode_ts)
+            except Exception as e:
+                logger.debug("Traceback:\n%s", traceback.format_exc())
+                logger.warn("failed to dispatch ws event: %s", e)
+            finally:
+                stats.dispatch_frames+= 1
+                frame_q.task_done()
+
+class IngestStats(object):
+    """ counters for websocket ingest pipeline. Receive counters are only updated by EventHandler
+        and latency/dispatch counters are only updated by EventDispatcher. Latency is tracked per
+        stage where 'wait' is the time a frame spent in the frame buffer, 'decode' is json decode
+        time, and 'dispatch' is the time to execute all callbacks for the frame.
+    """
+    STAGES = ["wait", "decode", "dispatch"]
+
+    def __init__(self):
+        self.recv_frames = 0
+        self.recv_blocked = 0
+        self.dispatch_frames = 0
+        self.backlog_max = 0
+        self.last_recv_ts = 0.0
+        self.latency_total = {}
+        self.latency_max = {}
+        for stage in IngestStats.STAGES:
+            self.latency_total[stage] = 0.0
+            self.latency_max[stage] = 0.0
+
+    def add_latency(self, stage, latency):
+        self.latency_total[stage]+= latency
+        if latency > self.latency_max[stage]:
+            self.latency_max[stage] = latency
+
+    def get_stats(self, backlog=0):
+        """ return dict of current stats with average and max latency per stage """
+        stats = {
+            "recv_frames": self.recv_frames,
+            "recv_blocked": self.recv_blocked,
+            "dispatch_frames": self.dispatch_frames,
+            "backlog": backlog,
+            "backlog_max": self.backlog_max,
+        }
+        for stage in IngestStats.STAGES:
+            avg = 0.0
+            if self.dispatch_frames > 0:
+                avg = self.latency_total[stage] / self.dispatch_frames
+            stats["%s_avg" % stage] = avg
+            stats["%s_max" % stage] = self.latency_max[stage]
+        return stats
 
 class CallbackHandler(object):
     """ handles callback for event for single url with pause support """
@@ -567,6 +676,10 @@ class CallbackHandler(object):
 
 class Subscriber(threading.Thread):
     """ thread responsible for event subscriptions """
+
+    FRAME_BUFFER_SIZE = 10000       # maximum number of received frames pending dispatch
+    FRAME_DRAIN_TIMEOUT = 30        # maximum time to wait for frame buffer to drain on restart
+
     def __init__(self, session, resubscribe=True):
         threading.Thread.__init__(self)
         self.failure_reason = None
@@ -583,6 +696,10 @@ class Subscriber(threading.Thread):
         self._event_q = Queue()
         self.resubscribe = resubscribe
         self.event_handler_thread = None
+        self.event_dispatcher_thread = None
+        # bounded buffer of (frame, receive timestamp) between EventHandler and EventDispatcher
+        self._frame_q = Queue(maxsize=Subscriber.FRAME_BUFFER_SIZE)
+        self.ingest_stats = IngestStats()
         self._lock = threading.Lock()
         self.restarting = False
 
@@ -614,6 +731,25 @@ class Subscriber(threading.Thread):
         self._subscription_ids = {}
         self._subscriptions = {}
         self._callbacks = {}
+        if self.event_dispatcher_thread is not None:
+            self.event_dispatcher_thread.exit()
+
+    def get_ingest_stats(self):
+        """ return dict of websocket ingest pipeline stats """
+        return self.ingest_stats.get_stats(backlog=self._frame_q.qsize())
+
+    def wait_for_frame_drain(self, timeout=None):
+        """ wait for all frames within the frame buffer to be dispatched. Return bool success """
+        if timeout is None:
+            timeout = Subscriber.FRAME_DRAIN_TIMEOUT
+        ts = time.time()
+        while self._frame_q.unfinished_tasks > 0:
+            if self.event_dispatcher_thread is None or \
+                not self.event_dispatcher_thread.is_alive() or time.time() - ts > timeout:
+                logger.warn("failed to drain frame buffer (%s pending)", self._frame_q.qsize())
+                return False
+            time.sleep(0.01)
+        return True
 
     def run(self):
         """ run subscriber thread, listening for new subscription requests """
@@ -865,6 +1001,7 @@ class Subscriber(threading.Thread):
         self._close_web_socket()
         self._ws = self._get_web_socket()
         if self._ws is not None:
+            self._start_event_dispatcher()
             self.event_handler_thread = EventHandler(self)
             self.event_handler_thread.daemon = True
             self.event_handler_thread.start()
@@ -873,6 +1010,15 @@ class Subscriber(threading.Thread):
             logger.warn("failed to open new websocket")
             return False
 
+    def _start_event_dispatcher(self):
+        """ start dispatcher thread if not currently running. The dispatcher and frame buffer are
+            maintained across websocket restarts so any pending frames are still dispatched.
+        """
+        if self.event_dispatcher_thread is None or not self.event_dispatcher_thread.is_alive():
+            self.event_dispatcher_thread = EventDispatcher(self)
+            self.event_dispatcher_thread.daemon = True
+            self.event_dispatcher_thread.start()
+
     def _resubscribe(self):
         """ restart websocket and resubscribe to urls. Triggered under the following scenarios:
             1) login thread refresh failure
@@ -954,11 +1100,16 @@ class Subscriber(threading.Thread):
                 if self.event_handler_thread is not None:
                     logger.debug("closing old event handler thread")
                     self.event_handler_thread.exit()
+                # dispatch frames already received on old websocket before old subscription ids
+                # are removed. Events on the new websocket are buffered by the socket until the
+                # new event handler is started.
+                self.wait_for_frame_drain()
                 # remap pointers
                 self._subscriptions = subscriptions
                 self._subscription_ids = subscription_ids
                 self._ws = ws
                 logger.debug("starting new event handler")
+                self._start_event_dispatcher()
                 self.event_handler_thread = EventHandler(self)
                 self.event_handler_thread.daemon = True
                 self.event_handler_thread.start()
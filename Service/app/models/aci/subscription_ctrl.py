@@ -60,6 +60,7 @@ class SubscriptionCtrl(object):
         # state of the session
         self.worker_thread = None
         self.last_heartbeat = 0
+        self.last_heartbeat_success = 0
         self.heartbeat_failures = 0
         self.heartbeat_total_success = 0
         self.heartbeat_total_failures = 0
@@ -142,6 +143,23 @@ class SubscriptionCtrl(object):
         """ determine if subscription is still alive """
         return self.alive
 
+    def get_ingest_stats(self):
+        """ return dict of websocket ingest pipeline stats for the session subscription thread or
+            None if subscription thread is not running
+        """
+        if self.session is not None and self.session.subscription_thread is not None:
+            return self.session.subscription_thread.get_ingest_stats()
+        return None
+
+    def get_last_alive_ts(self):
+        """ return timestamp subscription was last confirmed alive which is the latest of the last
+            received websocket frame and the last successful heartbeat (or subscription start)
+        """
+        ts = self.last_heartbeat_success
+        if self.session is not None and self.session.subscription_thread is not None:
+            ts = max(ts, self.session.subscription_thread.ingest_stats.last_recv_ts)
+        return ts
+
     def pause(self, classname):
         """ pause subscription callback for one or more classnames within interest.  
             This is useful to keep the subscription alive and queue the susbscriptions events until 
@@ -329,6 +347,7 @@ class SubscriptionCtrl(object):
 
         # monitor subscription health
         self.last_heartbeat = time.time()
+        self.last_heartbeat_success = self.last_heartbeat
         self.heartbeat_failures = 0
         heartbeat_enabled = self.heartbeat_interval > 0
         logger.debug("heartbeat [enable: %r, interval: %s, timeout: %s, retries: %s]",
@@ -432,16 +451,20 @@ class SubscriptionCtrl(object):
                 alive = alive and (
                     self.session.subscription_thread._ws.connected and \
                     hasattr(self.session.subscription_thread.event_handler_thread, "is_alive") and \
-                    self.session.subscription_thread.event_handler_thread.is_alive()
+                    self.session.subscription_thread.event_handler_thread.is_alive() and \
+                    hasattr(self.session.subscription_thread.event_dispatcher_thread,"is_alive") and \
+                    self.session.subscription_thread.event_dispatcher_thread.is_alive()
                 )
                 if not alive:
-                    self.set_failure("websocket is not connected or event handler thread has died")
+                    self.set_failure("websocket is not connected or event handler/dispatcher "
+                                        "thread has died")
 
             if alive and heartbeat:
                 self.heartbeat_total+=1
                 hb = get_dn(self.session, "uni", timeout=self.heartbeat_timeout) is not None
                 if hb:
                     self.heartbeat_failures = 0
+                    self.last_heartbeat_success = time.time()
                     self.heartbeat_total_success+= 1
                     logger.debug("heartbeat success [pass/fail/total]=[%s/%s/%s]", 
                         self.heartbeat_total_success,
@@ -7,6 +7,8 @@ from ..utils import get_app
 from ..utils import get_app_config
 from ..utils import pretty_print
 
+import codecs
+import json
 import logging
 import logging.handlers
 import os
@@ -22,6 +24,7 @@ logger = logging.getLogger(__name__)
 # static queue thresholds and timeouts
 SESSION_MAX_TIMEOUT = 120   # apic timeout hardcoded to 90...
 SESSION_LOGIN_TIMEOUT = 10  # login should be fast
+STREAM_CHUNK_SIZE = 65536   # size of chunks read from response body for streamed queries
 
 ###############################################################################
 #
@@ -82,10 +85,99 @@ def build_query_filters(**kwargs):
     if len(opts)>0: opts = "?%s" % opts.strip("&")
     return opts
                 
-def _get(session, url, timeout=None, limit=None, page_size=75000):
+class ImdataStreamDecoder(object):
+    """ incremental decoder for APIC json reply that yields each object within imdata as soon as it
+        has been received. Only the current chunk and the current object are held in memory, so
+        memory usage does not depend on the page size. All other top level attributes of the reply
+        (i.e., totalCount) are available in the attributes dict once iter_imdata has completed.
+        ValueError is raised if the reply is not valid json.
+    """
+    WHITESPACE = u" \t\n\r"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = u""
+        self.pos = 0
+        self.eof = False
+        self.has_imdata = False
+        self.attributes = {}
+
+    def _read(self):
+        # add next chunk to buffer and discard already decoded data. Return False at end of data
+        if self.eof:
+            return False
+        try:
+            data = self.utf8.decode(next(self.chunks))
+        except StopIteration:
+            data = self.utf8.decode(b"", final=True)
+            self.eof = True
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        # skip whitespace and return next character without consuming it, None at end of data
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos+= 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                return None
+
+    def _expect(self, chars):
+        # consume and return next character which must be one of the provided characters
+        c = self._peek()
+        if c is None or c not in chars:
+            raise ValueError("expected '%s' at offset %s, found '%s'" % (chars, self.pos, c))
+        self.pos+= 1
+        return c
+
+    def _value(self):
+        # decode next json value, reading more data until the full value is available
+        c = self._peek()
+        while True:
+            try:
+                (obj, end) = self.decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue within the next chunk
+                if end < len(self.buf) or self.eof or c in u'{["' or not self._read():
+                    self.pos = end
+                    return obj
+            except ValueError as e:
+                if not self._read():
+                    raise
+
+    def iter_imdata(self):
+        """ generator yielding each object within imdata """
+        self._expect(u"{")
+        if self._peek() == u"}":
+            return
+        while True:
+            key = self._value()
+            self._expect(u":")
+            if key == "imdata":
+                self.has_imdata = True
+                self._expect(u"[")
+                if self._peek() == u"]":
+                    self.pos+= 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(u",]") == u"]":
+                            break
+            else:
+                self.attributes[key] = self._value()
+            if self._expect(u",}") == u"}":
+                return
+
+def _get(session, url, timeout=None, limit=None, page_size=75000, stream=False):
     # handle session request and perform basic data validation.  
     # this module always returns a generator of the results. If there is an error the first item
     # in the iterator (or on the received page) will be None.
+    # if stream is enabled, then each page is decoded incrementally from the response body 
+    # instead of decoding the full page before yielding the first result.
 
     page = 0
     if timeout is None:
@@ -102,7 +194,7 @@ def _get(session, url, timeout=None, limit=None, page_size=75000):
         logger.debug("host:%s, timeout:%s, get:%s", session.hostname, timeout, turl)
         tstart = time.time()
         try:
-            resp = session.get(turl, timeout=timeout)
+            resp = session.get(turl, timeout=timeout, stream=stream)
         except Exception as e:
             logger.warn("exception occurred in get request: %s", e)
             yield None
@@ -111,6 +203,39 @@ def _get(session, url, timeout=None, limit=None, page_size=75000):
             logger.warn("failed to get data: %s", url)
             yield None
             return
+        if stream:
+            page_count = 0
+            try:
+                reply = ImdataStreamDecoder(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+                for obj in reply.iter_imdata():
+                    if "error" in obj:
+                        logger.warn("error in streamed reply: %s", pretty_print(obj))
+                        yield None
+                        return
+                    page_count+= 1
+                    count_yield+=1
+                    if (limit is not None and count_yield >= limit):
+                        logger.debug("limit(%s) hit or exceeded", limit)
+                        return
+                    yield obj
+                if not reply.has_imdata or "totalCount" not in reply.attributes:
+                    logger.warn("failed to parse streamed reply: %s", reply.attributes)
+                    yield None
+                    return
+                count_received+= page_count
+                logger.debug("time: %0.3f, results count: %s/%s", time.time() - tstart, 
+                        count_received, reply.attributes["totalCount"])
+                if page_count < page_size or count_received>=int(reply.attributes["totalCount"]):
+                    return
+                page+= 1
+                continue
+            except Exception as e:
+                # ValueError for invalid json or requests exception if body read fails mid-stream
+                logger.warn("failed to read streamed resp: %s", e)
+                yield None
+                return
+            finally:
+                resp.close()
         try:
             js = resp.json()
             if "imdata" not in js or "totalCount" not in js:
@@ -161,7 +286,21 @@ def get_class(session, classname, timeout=None, limit=None, stream=False, **kwar
     opts = build_query_filters(**kwargs)
     url = "/api/class/%s.json%s" % (classname, opts)
     if stream:
-        return _get(session, url, timeout=timeout, limit=limit) 
+        return _get(session, url, timeout=timeout, limit=limit, stream=True)
+    ret = []
+    for obj in _get(session, url, timeout=timeout, limit=limit):
+        if obj is None:
+            return None
+        ret.append(obj)
+    return ret
+
+def get_node_class(session, pod_id, node_id, classname, timeout=None, limit=None, stream=False, 
+        **kwargs):
+    # perform class query scoped to a single node. Same behavior as get_class
+    opts = build_query_filters(**kwargs)
+    url = "/api/node/class/topology/pod-%s/node-%s/%s.json%s" % (pod_id, node_id, classname, opts)
+    if stream:
+        return _get(session, url, timeout=timeout, limit=limit, stream=True)
     ret = []
     for obj in _get(session, url, timeout=timeout, limit=limit):
         if obj is None:
@@ -245,7 +384,7 @@ def validate_session_role(session):
         err_msg+= "missing required read role 'admin' for security domain 'all'"
         return (False, err_msg)
 
-def get_apic_session(fabric, resubscribe=False):
+def get_apic_session(fabric, resubscribe=False, hostname=None):
     """ get_apic_session 
         based on current aci.settings for provided fabric name, connect to
         apic and return valid session object. If fail to connect to apic 
@@ -256,6 +395,9 @@ def get_apic_session(fabric, resubscribe=False):
 
         set resubscribe to true to auto restart subscriptions (disabled by default)
 
+        set hostname to a discovered controller to prefer that controller over the configured apic
+        hostname. This is ignored in app mode where only the configured apic hostname is used.
+
         Returns None on failure
     """
     from . fabric import Fabric
@@ -273,6 +415,8 @@ def get_apic_session(fabric, resubscribe=False):
     app = get_app()
     hostnames = [aci.apic_hostname]
     if not app.config["ACI_APP_MODE"]:
+        if hostname is not None and hostname not in hostnames:
+            hostnames.insert(0, hostname)
         for h in aci.controllers:
             if h not in hostnames: hostnames.append(h)
 
@@ -0,0 +1,125 @@
+"""
+endpoint event object benchmarks
+
+    python perf_event.py [count]
+
+compares memory footprint and cpu time per million events for the __slots__ based event classes
+(eptMsgWorkEpmEvent, eptHistoryEvent, eptEndpointEvent) against the same attributes held in a
+__dict__ backed object, and flag checks using the flags list against flag_bits.  Also compares the
+epm dn tokenizer against the regex parser and bulk parse_many against per-object parse.
+"""
+
+import logging
+import os
+import sys
+import time
+
+# update sys path for importing test classes for app registration
+sys.path.append(os.path.realpath("%s/../../" % os.path.dirname(os.path.realpath(__file__))))
+
+# set logger to base app logger
+logger = logging.getLogger("app")
+
+from app.models.utils import setup_logger
+from app.models.aci.ept.ept_endpoint import eptEndpointEvent
+from app.models.aci.ept.ept_history import eptHistoryEvent
+from app.models.aci.ept.ept_msg import EPM_FLAG_LOCAL
+from app.models.aci.ept.ept_msg import eptEpmEventParser
+from app.models.aci.ept.ept_msg import parse_epm_dn
+from app.models.aci.ept.ept_msg import parse_epm_dn_regex
+
+parser = eptEpmEventParser("fab1", 0xffffef)
+
+class dictEvent(object):
+    """ __dict__ backed object with the same attributes as the provided slots object """
+    def __init__(self, obj):
+        for cls in type(obj).__mro__:
+            for a in getattr(cls, "__slots__", ()):
+                if hasattr(obj, a):
+                    setattr(self, a, getattr(obj, a))
+
+def get_object_size(obj):
+    # return size of object and its attribute dict (attribute values are shared and not included)
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size+= sys.getsizeof(obj.__dict__)
+    return size
+
+def get_attr():
+    # return epmIpEp attributes for a local endpoint
+    return {
+        "dn": "topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007697]/"
+              "vlan-[vlan-101]/db-ep/ip-[10.1.1.101]",
+        "status": "created",
+        "flags": "ip,local,vpc-attached",
+        "ifId": "po2",
+        "pcTag": "30011",
+    }
+
+def get_msg():
+    # return parsed eptMsgWorkEpmEvent with attributes normally added by worker
+    msg = parser.parse("epmIpEp", get_attr(), time.time())
+    msg.epg_name = "uni/tn-ag/ap-app/epg-e1"
+    msg.remote = 0
+    msg.ifId_name = "ag_vpc1"
+    msg.tunnel_flags = ""
+    msg.vnid_name = "uni/tn-ag/ctx-v1"
+    return msg
+
+def per_million(func, count):
+    # execute func count times and return seconds per million executions
+    ts = time.time()
+    for i in xrange(0, count):
+        func()
+    return 1000000.0 * (time.time() - ts) / count
+
+def benchmark(count):
+    msg = get_msg()
+    h_event = eptHistoryEvent.from_msg(msg)
+    e_event = eptEndpointEvent.from_history_event(101, h_event)
+    for (name, obj) in [
+            ("eptMsgWorkEpmEvent", msg),
+            ("eptHistoryEvent", h_event),
+            ("eptEndpointEvent", e_event),
+        ]:
+        legacy = dictEvent(obj)
+        slot_size = get_object_size(obj)
+        dict_size = get_object_size(legacy)
+        slot_time = per_million(lambda: type(obj)(), count) if name != "eptMsgWorkEpmEvent" else \
+                    per_million(lambda: type(obj)(None, "worker", {}, None), count)
+        dict_time = per_million(lambda: dictEvent(obj), count)
+        logger.debug("%-20s bytes: %4s (dict: %4s), MB per million: %0.1f (dict: %0.1f), "
+            "create sec per million: %0.3f (dict copy: %0.3f)", name, slot_size, dict_size,
+            slot_size/1048576.0*1000000, dict_size/1048576.0*1000000, slot_time, dict_time)
+
+    attr = get_attr()
+    logger.debug("%-20s sec per million: %0.3f", "parse",
+        per_million(lambda: parser.parse("epmIpEp", attr, 1.0), count))
+    logger.debug("%-20s sec per million: %0.3f (regex: %0.3f)", "parse dn",
+        per_million(lambda: parse_epm_dn(attr["dn"]), count),
+        per_million(lambda: parse_epm_dn_regex(attr["dn"]), count))
+    # parse_many over pages of objects reported as time per object
+    page_size = 1000
+    page = [get_attr() for i in xrange(0, page_size)]
+    pages = max(1, count/page_size)
+    logger.debug("%-20s sec per million: %0.3f (parse: %0.3f)", "parse_many",
+        per_million(lambda: parser.parse_many("epmIpEp", page, 1.0), pages)/page_size,
+        per_million(lambda: [parser.parse("epmIpEp", a, 1.0) for a in page], pages)/page_size)
+    logger.debug("%-20s sec per million: %0.3f", "from_msg",
+        per_million(lambda: eptHistoryEvent.from_msg(msg), count))
+    logger.debug("%-20s sec per million: %0.3f", "from_history_event",
+        per_million(lambda: eptEndpointEvent.from_history_event(101, h_event), count))
+    logger.debug("%-20s sec per million: %0.3f", "to_dict",
+        per_million(lambda: h_event.to_dict(), count))
+    logger.debug("%-20s sec per million: %0.3f (list: %0.3f)", "flag check",
+        per_million(lambda: msg.flag_bits & EPM_FLAG_LOCAL > 0, count),
+        per_million(lambda: "local" in msg.flags, count))
+
+if __name__ == "__main__":
+
+    # force logging to stdout
+    setup_logger(logger, stdout=True)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    benchmark(count)
+
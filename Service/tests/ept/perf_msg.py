@@ -0,0 +1,87 @@
+"""
+message encoding benchmarks
+
+    python perf_msg.py [bulk_size] [iterations]
+
+compares eptMsgBulk encode/decode time and size for each supported wire version
+"""
+
+import logging
+import os
+import sys
+import time
+
+# update sys path for importing test classes for app registration
+sys.path.append(os.path.realpath("%s/../../" % os.path.dirname(os.path.realpath(__file__))))
+
+# set logger to base app logger
+logger = logging.getLogger("app")
+
+from app.models.utils import setup_logger
+from app.models.aci.ept.ept_msg import WIRE_VERSION_COMPACT
+from app.models.aci.ept.ept_msg import WIRE_VERSION_JSON
+from app.models.aci.ept.ept_msg import eptEpmEventParser
+from app.models.aci.ept.ept_msg import eptMsg
+from app.models.aci.ept.ept_msg import eptMsgBulk
+
+parser = eptEpmEventParser("fab1", 0xffffef)
+
+def get_events(count):
+    # return list of count eptMsgWorkEpmEvent objects with a mix of mac, ip, and rs_ip events
+    events = []
+    ctx = "topology/pod-1/node-%s/sys/ctx-[vxlan-2916352]"
+    bd = "bd-[vxlan-15007697]/vlan-[vlan-101]/db-ep"
+    for i in xrange(0, count):
+        node = 101 + i % 4
+        ip = "10.1.%s.%s" % ((i >> 8) & 0xff, i & 0xff)
+        mac = "00:00:00:00:%02x:%02x" % ((i >> 8) & 0xff, i & 0xff)
+        dn = ctx % node
+        if i % 3 == 0:
+            classname = "epmMacEp"
+            dn = "%s/%s/mac-%s" % (dn, bd, mac)
+        elif i % 3 == 1:
+            classname = "epmIpEp"
+            dn = "%s/%s/ip-[%s]" % (dn, bd, ip)
+        else:
+            classname = "epmRsMacEpToIpEpAtt"
+            rs = "sys/ctx-[vxlan-2916352]/%s/ip-[%s]" % (bd, ip)
+            dn = "%s/%s/mac-%s/rsmacEpToIpEpAtt-[%s]" % (dn, bd, mac, rs)
+        attr = {
+            "dn": dn,
+            "status": "created",
+            "flags": "local,vpc-attached",
+            "ifId": "po2",
+            "pcTag": "30011",
+        }
+        events.append(parser.parse(classname, attr, time.time()))
+    return events
+
+def benchmark_wire(bulk, wire, iterations):
+    # return tuple (size, encode_time, decode_time) for provided wire version
+    ts = time.time()
+    for i in xrange(0, iterations):
+        data = bulk.jsonify(wire=wire)
+    encode_time = (time.time() - ts) / iterations
+    ts = time.time()
+    for i in xrange(0, iterations):
+        msg = eptMsg.parse(data)
+    decode_time = (time.time() - ts) / iterations
+    assert len(msg.msgs) == len(bulk.msgs)
+    return (len(data), encode_time, decode_time)
+
+if __name__ == "__main__":
+
+    # force logging to stdout
+    setup_logger(logger, stdout=True)
+
+    bulk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    bulk = eptMsgBulk()
+    bulk.msgs = get_events(bulk_size)
+    for (name, wire) in [("json", WIRE_VERSION_JSON), ("compact", WIRE_VERSION_COMPACT)]:
+        (size, encode_time, decode_time) = benchmark_wire(bulk, wire, iterations)
+        logger.debug("%-8s bulk: %s, bytes: %s (%0.1f per msg), encode: %0.6f, decode: %0.6f, "
+            "decode msgs/sec: %0.3f", name, bulk_size, size, 1.0*size/bulk_size, encode_time,
+            decode_time, bulk_size/decode_time)
+
@@ -389,15 +389,16 @@ from app.models.aci.ept.common import get_ipv4_string
 from app.models.aci.ept.common import get_ipv6_prefix
 from app.models.aci.ept.common import get_ipv6_string
 from app.models.aci.ept.common import get_mac_string
+from app.models.aci.ept.common import eptEndpointPresence
 from app.models.aci.fabric import Fabric
 from app.models.aci.ept.common import get_ipv4_string, get_ipv6_string
-from app.models.aci.ept.epg import eptEpg
-from app.models.aci.ept.history import eptHistory
-from app.models.aci.ept.node import eptNode
-from app.models.aci.ept.subnet import eptSubnet
-from app.models.aci.ept.tunnel import eptTunnel
-from app.models.aci.ept.vnid import eptVnid
-from app.models.aci.ept.vpc import eptVpc
+from app.models.aci.ept.ept_epg import eptEpg
+from app.models.aci.ept.ept_history import eptHistory
+from app.models.aci.ept.ept_node import eptNode
+from app.models.aci.ept.ept_subnet import eptSubnet
+from app.models.aci.ept.ept_tunnel import eptTunnel
+from app.models.aci.ept.ept_vnid import eptVnid
+from app.models.aci.ept.ept_vpc import eptVpc
 db = None
 
 def allocate_new_value(atype):
@@ -849,6 +850,85 @@ def build_endpoints():
 
     logger.debug("building endpoints complete")
 
+def get_dict_size(d):
+    # return size of nested dict including keys (values are shared and not included)
+    size = sys.getsizeof(d)
+    for k in d:
+        size+= sys.getsizeof(k)
+        if isinstance(d[k], dict):
+            size+= get_dict_size(d[k])
+    return size
+
+def iter_presence_endpoints(count):
+    # yield (node, vnid, addr) tuples with the same mix of mac, ipv4, and ipv6 endpoints as the
+    # scale setup spread across all nodes
+    total_nodes = scale["nodes"]
+    total_bds = scale["vrfs"] * scale["bds_per_vrf"]
+    for i in xrange(0, count):
+        node = node_base_id + i % total_nodes
+        index = i / total_nodes
+        if index % 5 == 0:
+            vnid = bd_base_vnid + index % total_bds
+            addr = get_mac_string(mac_base + index)
+        elif index % 5 < 3:
+            vnid = vrf_base_vnid + index % scale["vrfs"]
+            addr = get_ipv4_string(v4_subnet_base + index)
+        else:
+            vnid = vrf_base_vnid + index % scale["vrfs"]
+            addr = get_ipv6_string(v6_subnet_base + index)
+        yield (node, vnid, addr)
+
+def presence_scale_test(count, stale_interval=100):
+    """ compare memory and time of eptEndpointPresence against the 3-level dict previously used
+        by build_endpoint_db for delete detection. Every stale_interval endpoint is treated as an
+        endpoint in the db but not returned from the APIC and both structures must return the same 
+        set of delete endpoints.
+    """
+    logger.info("presence scale test with %s endpoints", count)
+    ts = time.time()
+    endpoints = {}
+    for (node, vnid, addr) in iter_presence_endpoints(count):
+        if hash((node, vnid, addr)) % stale_interval == 0:
+            continue
+        if node not in endpoints: endpoints[node] = {}
+        if vnid not in endpoints[node]: endpoints[node][vnid] = {}
+        endpoints[node][vnid][addr] = 1
+    dict_time = time.time() - ts
+    dict_size = get_dict_size(endpoints)
+
+    ts = time.time()
+    presence = eptEndpointPresence()
+    for (node, vnid, addr) in iter_presence_endpoints(count):
+        if hash((node, vnid, addr)) % stale_interval == 0:
+            continue
+        presence.add(node, vnid, addr)
+    presence_time = time.time() - ts
+    presence_size = presence.memory_size()
+
+    # walk full set of 'db' endpoints and check for delete
+    ts = time.time()
+    dict_delete = []
+    for (node, vnid, addr) in iter_presence_endpoints(count):
+        if node in endpoints and vnid in endpoints[node] and addr in endpoints[node][vnid]:
+            continue
+        dict_delete.append((node, vnid, addr))
+    dict_check_time = time.time() - ts
+    ts = time.time()
+    presence_delete = []
+    for (node, vnid, addr) in iter_presence_endpoints(count):
+        if presence.exists(node, vnid, addr):
+            continue
+        presence_delete.append((node, vnid, addr))
+    presence_check_time = time.time() - ts
+
+    logger.info("dict      bytes: %s (%0.1f per endpoint), add: %0.3f, check: %0.3f", dict_size, 
+            float(dict_size)/count, dict_time, dict_check_time)
+    logger.info("presence  bytes: %s (%0.1f per endpoint), add: %0.3f, check: %0.3f", 
+            presence_size, float(presence_size)/count, presence_time, presence_check_time)
+    logger.info("delete count dict: %s, presence: %s", len(dict_delete), len(presence_delete))
+    assert dict_delete == presence_delete
+    assert presence_size < dict_size
+
 if __name__ == "__main__":
     
     import argparse
@@ -859,6 +939,8 @@ if __name__ == "__main__":
         help="use db cache instead of creating all new objects")
     parser.add_argument("--debug", action="store", dest="debug", default="debug",
         help="debugging level", choices=["debug","info","warn","error"])
+    parser.add_argument("--presence", action="store", dest="presence", type=int, default=None,
+        help="run endpoint presence scale test for provided number of endpoints (no db required)")
     args = parser.parse_args()
 
     # set logging level environment variable
@@ -878,6 +960,10 @@ if __name__ == "__main__":
     # force logging to stdout
     setup_logger(logger, stdout=True)
 
+    if args.presence is not None:
+        presence_scale_test(args.presence)
+        sys.exit(0)
+
     app = create_app("config.py")
     db = get_db()
     
@@ -4,17 +4,22 @@ import pytest
 import time
 
 from app.models.aci.fabric import Fabric
+from app.models.utils import get_redis
 
 from app.models.aci.ept.ept_cache import eptCache
+from app.models.aci.ept.ept_cache import get_approx_size
 from app.models.aci.ept.ept_cache import hitCache
 from app.models.aci.ept.ept_cache import hitCacheNotFound
-from app.models.aci.ept.ept_cache import offsubnetCachedObject
+from app.models.aci.ept.ept_cache import sharedCache
+from app.models.aci.ept.ept_cache import subnetIndex
+from app.models.aci.ept.ept_cache_stats import eptCacheStats
 from app.models.aci.ept.ept_epg import eptEpg
 from app.models.aci.ept.ept_node import eptNode
 from app.models.aci.ept.ept_subnet import eptSubnet
 from app.models.aci.ept.ept_tunnel import eptTunnel
 from app.models.aci.ept.ept_vnid import eptVnid
 from app.models.aci.ept.ept_vpc import eptVpc
+from app.models.aci.ept.common import FLUSH_CACHE_MAX_NAMES
 from app.models.aci.ept.common import get_ip_prefix
 
 # module level logging
@@ -50,6 +55,7 @@ def func_prep(request, app):
         eptNode.delete(_filters={})
         eptVpc.delete(_filters={})
         eptTunnel.delete(_filters={})
+        eptCacheStats.delete(_filters={})
         
     request.addfinalizer(teardown)
     return
@@ -139,8 +145,8 @@ def test_hit_cache_general_name_and_none_lookup(app, func_prep):
     assert "name6" in h_cache.name_hash
     assert "name1" in h_cache.name_hash
 
-    # remove one key should also remove all entries in none_hash
-    h_cache.remove("key1")
+    # remove one key with preserve_none disabled should also remove all entries in none_hash
+    h_cache.remove("key1", preserve_none=False)
     assert len(h_cache.none_hash) == 0
     assert h_cache.get_size() == 2          # removed key1, key2, and key5
     assert isinstance(h_cache.search("key1"), hitCacheNotFound)
@@ -177,6 +183,130 @@ def test_hit_cache_general_name_and_none_lookup(app, func_prep):
     assert "name7" not in h_cache.name_hash
     assert h_cache.get_size() == 1
 
+    # default remove should not touch entries in none_hash
+    h_cache.push("key5", None)
+    h_cache.remove("key3")
+    assert "key5" in h_cache.none_hash
+    assert h_cache.get_size() == 1
+
+def test_hit_cache_tag_index(app, func_prep):
+    # ensure that objects added to cache with tagged attribute are indexed and remove_tag removes
+    # only the nodes with matching tag value
+    h_cache = hitCache(10, tags=["bd"])
+    def tagged(name, bd):
+        obj = dummyHitObject(name, name)
+        obj.bd = bd
+        return obj
+    h_cache.push("key1", tagged("name1", 1))
+    h_cache.push("key2", tagged("name2", 1))
+    h_cache.push("key3", tagged("name3", 2))
+    h_cache.push("key4", [tagged("name4", 3), tagged("name5", 3)])
+    h_cache.push("key5", None)
+    assert len(h_cache.tag_hash["bd"][1]) == 2
+    assert len(h_cache.tag_hash["bd"][3]) == 1
+
+    assert h_cache.remove_tag("bd", 1) == 2
+    assert isinstance(h_cache.search("key1"), hitCacheNotFound)
+    assert isinstance(h_cache.search("key2"), hitCacheNotFound)
+    assert 1 not in h_cache.tag_hash["bd"]
+    assert h_cache.get_size() == 3
+    assert h_cache.remove_tag("bd", 1) == 0
+
+    # remove by key or name also updates tag index
+    h_cache.remove("name5", name=True)
+    assert 3 not in h_cache.tag_hash["bd"]
+    assert h_cache.remove_tag("bd", 2, preserve_none=False) == 1
+    assert h_cache.get_size() == 0
+
+def test_hit_cache_resize_and_memory_limit(app, func_prep):
+    # ensure that resize evicts oldest entries and that max_memory evicts entries when approximate
+    # memory footprint is exceeded
+    h_cache = hitCache(10)
+    for i in range(0, 10):
+        h_cache.push("key%02d" % i, dummyHitObject("name%02d" % i, "val%02d" % i))
+    assert h_cache.get_size() == 10
+    assert h_cache.memory == 0
+    h_cache.resize(5)
+    assert h_cache.get_size() == 5
+    assert h_cache.tail.key == "key05" and h_cache.head.key == "key09"
+
+    # enable memory tracking with limit of roughly 3 objects
+    node_size = get_approx_size(h_cache.head.val)
+    assert node_size > 0
+    h_cache.resize(5, max_memory=node_size*5)
+    assert h_cache.memory == node_size*5
+    h_cache.resize(5, max_memory=node_size*3)
+    assert h_cache.get_size() == 3
+    assert h_cache.memory == node_size*3
+    assert h_cache.tail.key == "key07"
+    h_cache.push("key10", dummyHitObject("name10", "val10"))
+    assert h_cache.get_size() == 3
+    assert h_cache.tail.key == "key08" and h_cache.head.key == "key10"
+    h_cache.remove("key10")
+    assert h_cache.memory == node_size*2
+    h_cache.flush()
+    assert h_cache.memory == 0
+
+def test_cache_stats_collect(app, func_prep):
+    # ensure cache stats correctly accumulate counters across collections and cache restarts
+    h_cache = hitCache(5)
+    stats = eptCacheStats.load(proc="w1", fabric=tfabric, cache="node_cache")
+    stats.init_cache()
+    h_cache.push("key1", "val1")
+    h_cache.search("key1")
+    h_cache.search("key2")
+    h_cache.search("key3")
+    stats.collect(h_cache)
+    assert stats.total_hit == 1 and stats.total_miss == 2
+    assert stats.hit_ratio == 1.0/3
+    assert stats.size == 1 and stats.max_size == 5
+    h_cache.search("key1")
+    stats.collect(h_cache)
+    assert stats.total_hit == 2 and stats.total_miss == 2
+
+    # new cache object (i.e., after fabric restart) should be added to existing totals
+    h_cache = hitCache(5)
+    h_cache.search("key1")
+    stats.collect(h_cache)
+    assert stats.total_hit == 2 and stats.total_miss == 3
+    stats = eptCacheStats.find(proc="w1", fabric=tfabric, cache="node_cache")
+    assert len(stats) == 1 and stats[0].total_miss == 3
+
+def test_shared_cache_read_through(app, func_prep):
+    # ensure objects found in db are added to the shared cache, read by a second cache without a db
+    # lookup, and no longer read after invalidate and flush
+    redis = get_redis()
+    for k in redis.keys("ept.cache.%s.*" % tfabric):
+        redis.delete(k)
+    node = 101
+    assert eptNode.load(fabric=tfabric, node=node, name="node1", peer=102, pod_id=1, role="leaf").save()
+    cache1 = get_test_cache()
+    cache1.shared_cache = sharedCache(tfabric, redis)
+    assert cache1.get_peer_node(node) == 102
+    assert cache1.shared_cache.miss_count == 1
+
+    # remove from db, second cache should still find the node in shared cache
+    eptNode.delete(_filters={})
+    cache2 = get_test_cache()
+    cache2.shared_cache = sharedCache(tfabric, redis)
+    assert cache2.get_peer_node(node) == 102
+    assert cache2.shared_cache.hit_count == 1
+    assert isinstance(cache2.node_cache.search(cache2.get_key_str(node=node)), eptNode)
+
+    # invalidate and flush with new version, next lookup should go to db
+    version = sharedCache.invalidate(redis, tfabric, eptNode._classname)
+    assert version is not None
+    cache2.handle_flush(eptNode._classname, version=version)
+    assert cache2.get_peer_node(node) == 0
+    assert cache2.shared_cache.miss_count == 1
+
+    # flush without version should read the current version from redis
+    cache1.handle_flush(eptNode._classname)
+    assert cache1.get_peer_node(node) == 0
+    assert cache1.shared_cache.versions[eptNode._classname] == version
+
+    # collections that are not shared are not versioned
+    assert sharedCache.invalidate(redis, tfabric, eptSubnet._classname) is None
 
 def test_get_peer_node_lookup(app, func_prep):
     # add eptNode object and ensure cache returns peer value if found, and 0 if not present
@@ -268,9 +398,40 @@ def test_get_epg_name_lookup(app, func_prep):
     assert cache.epg_cache.get_size() == 4
     assert name not in cache.epg_cache.key_hash
     assert isinstance(cache.epg_cache.search(keystr), hitCacheNotFound)
+    cache.handle_flush(eptEpg._classname, names=["epg2", "epg3"])
+    assert cache.epg_cache.get_size() == 2
+    assert cache.get_epg_name(vrf, 4) == "epg4"
+    assert cache.epg_cache.get_size() == 2
     cache.handle_flush(eptEpg._classname)
     assert cache.epg_cache.get_size() == 0
 
+def test_flush_bulk_data_and_escalation(app, func_prep):
+    # build flush bulk data for multiple collections and ensure names are grouped per collection, 
+    # a None name escalates to full collection flush, and exceeding FLUSH_CACHE_MAX_NAMES also
+    # escalates to a full collection flush
+    flush = [(eptEpg, "epg1"), (eptVnid, "bd1"), (eptEpg, "epg2"), (eptEpg, "epg1"),
+            (eptNode, None), (eptNode, "node1")]
+    flush+= [(eptSubnet, "subnet%s" % i) for i in range(0, FLUSH_CACHE_MAX_NAMES + 1)]
+    data = eptCache.get_flush_bulk_data(get_redis(), tfabric, flush)
+    entries = dict([(f["cache"], f) for f in data["flush"]])
+    assert len(data["flush"]) == 4
+    assert entries[eptEpg._classname]["names"] == ["epg1", "epg2"]
+    assert entries[eptVnid._classname]["names"] == ["bd1"]
+    assert entries[eptNode._classname]["names"] is None
+    assert entries[eptSubnet._classname]["names"] is None
+
+    # ensure bulk flush removes only named epgs
+    cache = get_test_cache()
+    for i in range(1, 5):
+        assert eptEpg.load(fabric=tfabric, vrf=1, pctag=i, bd=i, name="epg%s" % i).save()
+        assert cache.get_epg_name(1, i) == "epg%s" % i
+    assert cache.epg_cache.get_size() == 4
+    cache.handle_flush_bulk(eptCache.get_flush_bulk_data(get_redis(), tfabric, [
+            (eptEpg, "epg1"), (eptEpg, "epg2")]))
+    assert cache.epg_cache.get_size() == 2
+    cache.handle_flush_bulk(eptCache.get_flush_bulk_data(get_redis(), tfabric, [(eptEpg, None)]))
+    assert cache.epg_cache.get_size() == 0
+
 def test_vnid_name_lookup(app, func_prep):
     # create an entry in eptVnid and ensure that first lookup returns results and adds to cache
     # ensure second lookup finds entry in cache.  Perform lookup for unknown vnid and ensure empty
@@ -311,9 +472,9 @@ def test_ip_is_offsubnet_full(app, func_prep):
     # ip_is_offsubnet relies on three different caches:
     #   subnet_cache
     #   epg_cache
-    #   offsubnet_cache
-    # A flush for a bd in epg_cache or subnet_cache should delete all cached objects within 
-    # offsubhet_cache.  Ensure that is happening correctly.
+    #   subnet_index_cache
+    # A flush for a subnet should delete the subnet index for the corresponding bd while a flush
+    # of an epg only removes the epg.  Ensure that is happening correctly.
     # Most importantly, ensure that offsubnet check is executing correctly.  I.e., an IP learned on
     # subnet should return False (not offsubnet) and an IP learned off subnet should return true
 
@@ -363,60 +524,49 @@ def test_ip_is_offsubnet_full(app, func_prep):
     subnet2 = cache.subnet_cache.search(cache.get_key_str(bd=2))
     assert type(subnet2) is list and len(subnet2) == 1 and subnet2[0].ip == "30.1.1.1/16"
 
-    # ensure ip's are present within cache
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="10.1.1.5")).offsubnet
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="20.1.1.5")).offsubnet
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="2001:1:2:3:4:5:6:abcd")).offsubnet
-    assert cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="2001:1:2:3:4:5:5:abcd")).offsubnet
-    assert cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="2001::abcd")).offsubnet
-    assert cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="30.1.2.5")).offsubnet
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1004,ip="30.1.2.5")).offsubnet
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="40.2.1.5")).offsubnet
-    assert not cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1005,ip="40.3.1.5")).offsubnet
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0xffff,ip="1.1.1.1")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=1,ip="30.1.2.5")),
-            hitCacheNotFound)
-
-    logger.debug("offsubnet keys: %s" % cache.offsubnet_cache.key_hash.keys())
-    logger.debug("offsubnet names: %s" % cache.offsubnet_cache.name_hash.keys())
+    # ensure subnet index is present for each bd
+    index1 = cache.subnet_index_cache.search(cache.get_key_str(bd=1))
+    assert isinstance(index1, subnetIndex) and index1.size == 4
+    index2 = cache.subnet_index_cache.search(cache.get_key_str(bd=2))
+    assert isinstance(index2, subnetIndex) and index2.size == 1
 
-    # flush of single epg name should flush all offsubnet_cache for corresponding bd (which is name)
+    # flush of single epg should only remove the epg and leave the subnet index for the bd
     cache.handle_flush(eptEpg._classname, name="epg1")
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="10.1.1.5")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1002,ip="10.1.1.6")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1003,ip="10.1.1.7")),
+    assert isinstance(cache.epg_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001)),
             hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1005,ip="10.1.1.9")),
-            hitCacheNotFound)
-    # entry for bd 2 still present
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1004,ip="30.1.2.5")),
-            offsubnetCachedObject)
+    assert isinstance(cache.subnet_index_cache.search(cache.get_key_str(bd=1)), subnetIndex)
 
     # repeat for subnet flush by first adding values back into cache...
     add_hits_to_cache()
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="10.1.1.5")),
-            offsubnetCachedObject)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1002,ip="10.1.1.6")),
-            offsubnetCachedObject)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1003,ip="10.1.1.7")),
-            offsubnetCachedObject)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1005,ip="10.1.1.9")),
-            offsubnetCachedObject)
-
     cache.handle_flush(eptSubnet._classname, name="subnet3")
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1001,ip="10.1.1.5")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1002,ip="10.1.1.6")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1003,ip="10.1.1.7")),
-            hitCacheNotFound)
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1005,ip="10.1.1.9")),
-            hitCacheNotFound)
+    assert isinstance(cache.subnet_cache.search(cache.get_key_str(bd=1)), hitCacheNotFound)
+    assert isinstance(cache.subnet_index_cache.search(cache.get_key_str(bd=1)), hitCacheNotFound)
     # entry for bd 2 still present
-    assert isinstance(cache.offsubnet_cache.search(cache.get_key_str(vrf=vrf,pctag=0x1004,ip="30.1.2.5")),
-            offsubnetCachedObject)
-
+    assert isinstance(cache.subnet_index_cache.search(cache.get_key_str(bd=2)), subnetIndex)
 
+    # index is rebuilt on next lookup
+    add_hits_to_cache()
+    assert isinstance(cache.subnet_index_cache.search(cache.get_key_str(bd=1)), subnetIndex)
+
+def test_subnet_index_longest_prefix_match(app, func_prep):
+    # ensure subnet index returns longest matching subnet and keeps ipv4 and ipv6 separate
+    subnets = [
+        eptSubnet(fabric=tfabric, name="s8", bd=1, ip="10.0.0.1/8"),
+        eptSubnet(fabric=tfabric, name="s16", bd=1, ip="10.1.0.1/16"),
+        eptSubnet(fabric=tfabric, name="s24", bd=1, ip="10.1.1.1/24"),
+        eptSubnet(fabric=tfabric, name="s24b", bd=1, ip="10.1.2.1/24"),
+        eptSubnet(fabric=tfabric, name="v6", bd=1, ip="::a01:101/120"),
+        eptSubnet(fabric=tfabric, name="bad", bd=1, ip="10.1.1"),
+    ]
+    index = subnetIndex(1, subnets)
+    assert index.size == 5
+    def lookup(ip):
+        (addr, mask) = get_ip_prefix(ip)
+        return index.lookup(addr, ipv6=(":" in ip))
+    assert lookup("10.1.1.5") == "s24"
+    assert lookup("10.1.2.5") == "s24b"
+    assert lookup("10.1.3.5") == "s16"
+    assert lookup("10.2.3.5") == "s8"
+    assert lookup("11.1.1.5") is None
+    assert lookup("::a01:105") == "v6"
+    assert lookup("::b01:105") is None
@@ -0,0 +1,83 @@
+import logging
+import pytest
+
+from app.models.aci.ept.common import eptEndpointPresence
+from app.models.aci.ept.common import parse_apic_timestamp
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+@pytest.fixture(scope="module")
+def app(request, app):
+    # module level setup
+    app.config["LOGIN_ENABLED"] = False
+
+    # teardown called after all tests in session have completed
+    def teardown(): pass
+    request.addfinalizer(teardown)
+
+    logger.debug("(%s) module level app setup completed", __name__)
+    return app
+
+def get_endpoints(count, node=101, vnid=0x2a0000):
+    # return list of (node, vnid, addr) tuples
+    return [(node, vnid, "10.0.%s.%s" % (i >> 8, i & 0xff)) for i in xrange(0, count)]
+
+def test_endpoint_presence_add_exists(app):
+    # added endpoints exist and endpoints differing in any field do not
+    presence = eptEndpointPresence(size=64)
+    assert len(presence) == 0
+    assert not presence.exists(101, 1, "10.0.0.1")
+    presence.add(101, 1, "10.0.0.1")
+    presence.add(101, 1, "00:00:00:00:00:01")
+    assert len(presence) == 2
+    assert presence.exists(101, 1, "10.0.0.1")
+    assert (101, 1, "00:00:00:00:00:01") in presence
+    assert not presence.exists(102, 1, "10.0.0.1")
+    assert not presence.exists(101, 2, "10.0.0.1")
+    assert not presence.exists(101, 1, "10.0.0.2")
+
+def test_endpoint_presence_key_fits_table(app):
+    # keys are non-zero and fit within the key table item
+    presence = eptEndpointPresence(size=64)
+    assert presence.table.itemsize * 8 >= eptEndpointPresence.KEY_BITS
+    for (node, vnid, addr) in get_endpoints(1024):
+        key = eptEndpointPresence.get_key(node, vnid, addr)
+        assert 0 < key < (1 << eptEndpointPresence.KEY_BITS)
+
+def test_endpoint_presence_grow(app):
+    # table is grown when max load is exceeded and all endpoints still exist after growth
+    presence = eptEndpointPresence(size=64)
+    assert len(presence.table) == 64
+    endpoints = get_endpoints(1000)
+    for (node, vnid, addr) in endpoints:
+        presence.add(node, vnid, addr)
+    assert len(presence) == len(endpoints)
+    assert len(presence.table) == 2048
+    assert presence.count <= presence.max_count
+    assert presence.memory_size() == presence.table.itemsize * 2048
+    for ep in endpoints:
+        assert ep in presence
+    for ep in get_endpoints(1000, node=102):
+        assert ep not in presence
+
+def test_endpoint_presence_duplicates(app):
+    # adding the same endpoint multiple times only counts it once
+    presence = eptEndpointPresence(size=64)
+    endpoints = get_endpoints(40)
+    for i in xrange(0, 3):
+        for (node, vnid, addr) in endpoints:
+            presence.add(node, vnid, addr)
+    assert len(presence) == len(endpoints)
+    assert len(presence.table) == 64
+    assert len([k for k in presence.table if k > 0]) == len(endpoints)
+
+def test_parse_apic_timestamp(app):
+    # modTs with any offset is converted to the same unix timestamp, unknown values return 0
+    ts = 1557427594.123
+    assert abs(parse_apic_timestamp("2019-05-09T18:46:34.123+00:00") - ts) < 0.001
+    assert abs(parse_apic_timestamp("2019-05-09T11:46:34.123-07:00") - ts) < 0.001
+    assert abs(parse_apic_timestamp("2019-05-10T00:16:34.123+05:30") - ts) < 0.001
+    assert parse_apic_timestamp("2019-05-09T18:46:34") == int(ts)
+    assert parse_apic_timestamp("never") == 0
+    assert parse_apic_timestamp("") == 0
@@ -11,6 +11,7 @@ from app.models.aci.ept.ept_pc import eptPc
 from app.models.aci.ept.ept_subnet import eptSubnet
 from app.models.aci.ept.ept_tunnel import eptTunnel
 from app.models.aci.ept.ept_vnid import eptVnid
+from app.models.aci.ept.mo_dependency import DependencyIndex
 from app.models.aci.ept.mo_dependency_map import dependency_map as dmap
 
 from app.models.aci.mo.fvCtx import fvCtx
@@ -560,3 +561,87 @@ def test_dependency_pc_member_callback(app, func_prep):
     assert len(pc)==1
     assert len(pc[0].members)==2 and mbr1 in pc[0].members and mbr3 in pc[0].members
 
+
+def test_dependency_rebuild_diff_and_sync_changes(app, func_prep, monkeypatch):
+    # create existing bd mos and then rebuild with apic data that modifies, deletes, and creates a
+    # bd.  Ensure only changed dns are reported and dependent eptVnid objects are synced
+    bd1 = "uni/tn-ag/BD-bd1"
+    bd2 = "uni/tn-ag/BD-bd2"
+    bd3 = "uni/tn-ag/BD-bd3"
+    bd4 = "uni/tn-ag/BD-bd4"
+    for (dn, vnid) in [(bd1, "1"), (bd2, "2"), (bd4, "4")]:
+        dmap["fvBD"].sync_event(tfabric, get_create_event({
+            "dn": dn,
+            "pcTag": "10",
+            "scope": "100",
+            "seg": vnid,
+        }))
+    def get_class(session, classname, **kwargs):
+        for (dn, vnid) in [(bd1, "11"), (bd3, "3"), (bd4, "4")]:
+            yield {"fvBD": {"attributes": {"dn":dn, "pcTag":"10", "scope":"100", "seg":vnid}}}
+    monkeypatch.setattr("app.models.aci.mo.get_class", get_class)
+
+    changes = []
+    (success, errmsg) = fvBD.rebuild(Fabric.load(fabric=tfabric), session=object(), 
+                                    changes=changes)
+    assert success
+    status = dict([(c["dn"], c["status"]) for c in changes])
+    assert status == {bd1: "modified", bd2: "deleted", bd3: "created"}
+    assert fvBD.load(fabric=tfabric, dn=bd1).seg == "11"
+    assert not fvBD.load(fabric=tfabric, dn=bd2).exists()
+    assert fvBD.load(fabric=tfabric, dn=bd3).exists()
+
+    for c in changes:
+        assert len(dmap["fvBD"].sync_rebuild(tfabric, c)) == 1
+    assert eptVnid.load(fabric=tfabric, name=bd1).vnid == 11
+    assert not eptVnid.load(fabric=tfabric, name=bd2).exists()
+    assert eptVnid.load(fabric=tfabric, name=bd3).vnid == 3
+    assert eptVnid.load(fabric=tfabric, name=bd4).vnid == 4
+
+def test_dependency_index_sync_event(app, func_prep):
+    # perform bd delete sequence using DependencyIndex for parent/child lookups and ensure the
+    # index is updated with each event and dependent ept objects are synced
+    vrf = 1
+    bd_dn = "uni/tn-ag/BD-bd1"
+    bd_vnid = 2
+    epg_dn = "uni/tn-ap/ap-ap1/epg-e1"
+    subnet_dn = "%s/subnet-[1.1.1.1/24]" % epg_dn
+
+    index = DependencyIndex(tfabric, dmap.values())
+    assert index.load()
+    dmap["fvAEPg"].sync_event(tfabric, get_create_event({
+        "dn": epg_dn,
+        "pcTag": 4,
+        "scope": vrf,
+        "isAttrBasedEPg": "no",
+    }), index=index)
+    dmap["fvBD"].sync_event(tfabric, get_create_event({
+        "dn": bd_dn,
+        "pcTag": 3,
+        "scope": vrf,
+        "seg": bd_vnid
+    }), index=index)
+    dmap["fvSubnet"].sync_event(tfabric, get_create_event({
+        "dn": subnet_dn,
+        "ip": "1.1.1.1/24"
+    }), index=index)
+    dmap["fvRsBd"].sync_event(tfabric, get_create_event({
+        "dn": "%s/rsbd" % epg_dn,
+        "tDn": bd_dn,
+    }), index=index)
+
+    rsbd = index.find(dmap["fvRsBd"], "tDn", bd_dn)
+    assert len(rsbd) == 1 and rsbd[0].exists() and rsbd[0].parent == epg_dn
+    assert len(index.find(dmap["fvSubnet"], "parent", epg_dn)) == 1
+    epg = eptEpg.load(fabric=tfabric, name=epg_dn)
+    assert epg.exists() and epg.bd == bd_vnid
+    subnet = eptSubnet.load(fabric=tfabric, name=subnet_dn)
+    assert subnet.exists() and subnet.bd == bd_vnid
+
+    updates = dmap["fvBD"].sync_event(tfabric, get_delete_event({"dn":bd_dn}), index=index)
+    assert len(updates) == 3
+    assert len(index.find(dmap["fvBD"], "dn", bd_dn)) == 0
+    epg = eptEpg.load(fabric=tfabric, name=epg_dn)
+    assert epg.exists() and epg.bd == 0
+    subnet = eptSubnet.load(fabric=tfabric, name=subnet_dn)
+    assert subnet.exists() and subnet.bd == 0
@@ -75,7 +75,23 @@ import time
 
 from app.models.aci.fabric import Fabric
 from app.models.aci.ept.common import MANAGER_WORK_QUEUE
+from app.models.aci.ept.common import WORKER_QUEUE_BULK
+from app.models.aci.ept.common import WORKER_QUEUE_COUNT
+from app.models.aci.ept.common import WORKER_QUEUE_HIGH
+from app.models.aci.ept.common import WORKER_QUEUE_NORMAL
+from app.models.aci.ept.common import WORKER_QUEUE_PREEMPT_COUNT
+from app.models.aci.ept.common import WATCHER_BROADCAST_CHANNEL
+from app.models.aci.ept.common import WATCH_SCHEDULE_COMPACT_MIN
+from app.models.aci.ept.common import eptWatchSchedule
+from app.models.aci.ept.common import flush_queue
+from app.models.aci.ept.common import get_msg_hash
+from app.models.aci.ept.common import get_worker_index
+from app.models.aci.ept.ept_cache import endpointStateCachedObject
 from app.models.aci.ept.ept_msg import *
+from app.models.aci.ept.ept_manager import TrackedWorker
+from app.models.aci.ept.ept_manager import WorkerTracker
+from app.models.aci.ept.ept_worker import ENDPOINT_PROJECTION
+from app.models.aci.ept.ept_worker import HISTORY_PROJECTION
 from app.models.aci.ept.ept_worker import eptWorker
 from app.models.aci.ept.ept_queue_stats import eptQueueStats
 from app.models.aci.ept.ept_epg import eptEpg
@@ -295,6 +311,8 @@ def test_epm_parser_parse_basic(app, func_prep):
     assert msg.type == "mac"
     assert msg.status == "modified"
     assert msg.flags == ["ip","local","mac","peer-aged","vpc-attached"]
+    assert msg.flag_bits == EPM_FLAG_IP|EPM_FLAG_LOCAL|EPM_FLAG_MAC|EPM_FLAG_PEER_AGED|\
+                            EPM_FLAG_VPC_ATTACHED
     assert msg.ifId == "po1"
     assert msg.pcTag == 32771
     assert msg.encap == "vlan-101"
@@ -352,6 +370,48 @@ def test_epm_parser_parse_basic(app, func_prep):
     assert msg.bd == 15007704
     assert msg.wt == WORK_TYPE.EPM_RS_IP_EVENT
 
+def test_epm_parser_parse_dn_matches_regex(app, func_prep):
+    # fast path dn tokenizer must return same result as regex parser
+    for (dn, rs) in [
+        ("topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]/db-ep/mac-00:00:40:01:01:01", False),
+        ("topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]/db-ep/ip-[10.1.1.101]", False),
+        ("topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/db-ep/ip-[2001:10:1:1::101]", False),
+        ("topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vxlan-[vxlan-8001]/db-ep/mac-00:00:40:01:01:01", False),
+        ("topology/pod-1/node-101/sys/inst-overlay-1/bd-[vxlan-16777209]/db-ep/mac-00:00:00:00:00:01", False),
+        ("topology/pod-1/node-101/sys/inst-overlay-1/db-ep/ip-[10.0.72.64]", False),
+        ("topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]/db-ep/mac-00:00:40:01:01:01/rsmacEpToIpEpAtt-[sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]/db-ep/ip-[10.1.1.101]]", True),
+    ]:
+        logger.debug("checking dn: %s", dn)
+        assert parse_epm_dn(dn, rs) is not None
+        assert parse_epm_dn(dn, rs) == parse_epm_dn_regex(dn, rs)
+
+    # unexpected formats return None
+    assert parse_epm_dn("topology/pod-1/node-101/sys/db-ep/ip-[10.1.1.101]") is None
+    assert parse_epm_dn("topology/pod-1/node-abc/sys/inst-overlay-1/db-ep/ip-[10.1.1.101]") is None
+
+def test_epm_parser_parse_many(app, func_prep):
+    # parse_many returns same result as parse for each object and skips invalid objects
+    objects = [
+        {
+            "dn": "topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]/db-ep/ip-[10.1.1.%s]" % i,
+            "flags": "local,vpc-attached",
+            "ifId": "po2",
+            "pcTag": "32771",
+            "status": "",
+        } for i in range(1, 5)
+    ]
+    objects.append({"dn": "topology/pod-1/node-101/sys/db-ep/ip-[10.1.1.1]"})
+    objects.append({"status": "created"})
+    msgs = parser.parse_many("epmIpEp", objects, 1.0)
+    assert len(msgs) == 4
+    for i, msg in enumerate(msgs):
+        expected = parser.parse("epmIpEp", objects[i], 1.0)
+        assert msg.jsonify() == expected.jsonify()
+        assert msg.addr == "10.1.1.%s" % (i+1)
+        assert msg.status == "created"
+        assert msg.flag_bits == EPM_FLAG_LOCAL|EPM_FLAG_VPC_ATTACHED
+    assert parser.parse_many("epmUnknownEp", objects, 1.0) == []
+
 def get_epg_encap_pctag_vnid(val):
     # return tuple (encap, pctag, bd_vnid) for this bd or epg (assume epg if epg=True)
     if val is None or val == 1 or val == 4:
@@ -1057,6 +1117,59 @@ def test_handle_endpoint_event_basic_mac_move(app, func_prep):
 
     validate_mac_state_1()
 
+def test_handle_endpoint_event_basic_mac_move_bulk_prefetch(app, func_prep):
+    # same events as test_handle_endpoint_event_basic_mac_move but received as a single eptMsgBulk
+    # so endpoint state is prefetched for the bulk. Final state must be identical.
+    dut = get_worker()
+    mac = "00:00:01:02:03:04"
+    bulk = eptMsgBulk()
+    bulk.msgs = [
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=1.0),
+        get_epm_event(104, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=2.0),
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, status="deleted", ts=2.1),
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, status="created", ts=2.2, 
+            remote_node=104, flags=["bounce","mac"]),
+    ]
+    dut.handle_redis_msgs(dut.queues[0], bulk.jsonify())
+    # prefetched state is always cleared after the bulk is processed
+    assert len(dut.prefetch_history) == 0
+    assert len(dut.prefetch_endpoint) == 0
+
+    validate_mac_state_1()
+
+def test_handle_endpoint_event_basic_mac_move_endpoint_state_cache(app, func_prep):
+    # same events as test_handle_endpoint_event_basic_mac_move with endpoint state read from the
+    # cache for all but the first event. Cached state must match the db after each event and be
+    # removed on endpoint delete
+    dut = get_worker()
+    mac = "00:00:01:02:03:04"
+    for msg in [
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=1.0),
+        get_epm_event(104, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=2.0),
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, status="deleted", ts=2.1),
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, status="created", ts=2.2,
+            remote_node=104, flags=["bounce","mac"]),
+        ]:
+        dut.set_msg_worker_fabric(msg)
+        dut.handle_endpoint_event(msg)
+        state = msg.wf.cache.endpoint_cache.peek(msg.wf.cache.get_key_str(vnid=msg.vnid,addr=mac))
+        assert isinstance(state, endpointStateCachedObject)
+        flt = {"fabric": tfabric, "vnid": msg.vnid, "addr": mac}
+        for h in dut.db[eptHistory._classname].find(flt, HISTORY_PROJECTION):
+            assert state.history[h["node"]][0].to_dict() == h["events"][0]
+        e = dut.db[eptEndpoint._classname].find_one(flt, ENDPOINT_PROJECTION)
+        assert state.endpoint["events"] == e["events"]
+        assert state.endpoint["learn_type"] == e["learn_type"]
+
+    validate_mac_state_1()
+    assert msg.wf.cache.endpoint_cache.hit_count == 3
+
+    msg = eptMsgWorkDeleteEpt(mac, "worker", {"vnid": msg.vnid, "type": "mac"},
+            WORK_TYPE.DELETE_EPT, WORKER_QUEUE_HIGH, fabric=tfabric)
+    dut.set_msg_worker_fabric(msg)
+    dut.handle_endpoint_delete(msg)
+    assert not msg.wf.cache.has_endpoint_state(msg.vnid, mac)
+
 def test_handle_endpoint_event_basic_mac_move_transitory_delete(app, func_prep):
     # trigger move event between node 103 and node 104. Generally we see create on node 103, followed
     # by create on node 104, then delete on node-103, followed by create on node-103 with bounce.
@@ -1083,6 +1196,46 @@ def test_handle_endpoint_event_basic_mac_move_transitory_delete(app, func_prep):
 
     validate_mac_state_1()
 
+def test_handle_endpoint_event_transitory_delete_bulk_endpoint_state_cache(app, func_prep):
+    # delete on node-103 followed by create on node-104 within TRANSITORY_DELETE received in a 
+    # single eptMsgBulk with endpoint state read from the cache. The buffered delete must be written
+    # before it is overwritten by the create so that eptEndpoint has only the two local events
+    dut = get_worker()
+    mac = "00:00:01:02:03:04"
+    msg = get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=1.0)
+    dut.set_msg_worker_fabric(msg)
+    dut.handle_endpoint_event(msg)
+    assert msg.wf.cache.has_endpoint_state(msg.vnid, mac)
+
+    bulk = eptMsgBulk()
+    bulk.msgs = [
+        get_epm_event(103, mac, wt=WORK_TYPE.EPM_MAC_EVENT, status="deleted", ts=2.1),
+        get_epm_event(104, mac, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="eth1/1", ts=2.2),
+    ]
+    dut.handle_redis_msgs(dut.queues[0], bulk.jsonify())
+    assert dut.write_buffer.pending_count == 0
+
+    endpoint = eptEndpoint.find(fabric=tfabric, addr=mac)
+    assert len(endpoint) == 1
+    e = endpoint[0]
+    logger.debug(pretty_print(e.to_json()))
+    assert len(e.events) == 2
+    e0 = eptEndpointEvent.from_dict(e.events[0])
+    assert e0.node == 104
+    assert e0.status == "created"
+    e1 = eptEndpointEvent.from_dict(e.events[1])
+    assert e1.node == 103
+    assert e1.status == "created"
+
+    # cached state must match the db
+    state = msg.wf.cache.endpoint_cache.peek(msg.wf.cache.get_key_str(vnid=msg.vnid,addr=mac))
+    assert isinstance(state, endpointStateCachedObject)
+    assert state.endpoint["events"] == e.events[0:2]
+
+    move = eptMove.find(fabric=tfabric, addr=mac)
+    assert len(move) == 1
+    assert move[0].count == 1
+
 def validate_ip_state_2():
     # final state for following tests:
     #   test_handle_endpoint_event_basic_ipv4_move_scenario_1
@@ -2103,6 +2256,271 @@ def test_create_ept_msg_bulk(app, func_prep):
         assert m.wt == WORK_TYPE.EPM_IP_EVENT
         assert m.addr == ip
 
+def test_create_ept_msg_bulk_compact(app, func_prep):
+    # create and parse an eptMsgBulk with compact wire version and ensure all epm event attributes
+    # are preserved along with non-epm msgs within the same bulk
+
+    mac = "00:00:01:02:03:04"
+    ip = "10.1.1.101"
+    msg1 = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="po2", ts=1.0)
+    msg2 = get_epm_event(101, mac, ip=ip, wt=WORK_TYPE.EPM_RS_IP_EVENT, epg=1, ts=2.0)
+    msg2.build_gen = 1000
+    msg3 = eptMsgWorkDeleteEpt(ip, "worker", {"vnid": vrf_vnid}, WORK_TYPE.DELETE_EPT, 
+                                WORKER_QUEUE_HIGH, fabric=tfabric)
+    bulk = eptMsgBulk()
+    bulk.msgs = [msg1, msg2, msg3]
+
+    js = bulk.jsonify(wire=WIRE_VERSION_COMPACT)
+    assert len(js) < len(bulk.jsonify())
+    p = eptMsg.parse(js)
+    assert p.msg_type == MSG_TYPE.BULK
+    assert len(p.msgs) == 3
+    for (src, dst) in [(msg1, p.msgs[0]), (msg2, p.msgs[1])]:
+        assert isinstance(dst, eptMsgWorkEpmEvent)
+        for a in ["wt", "addr", "role", "qnum", "seq", "fabric", "classname", "type", "ts", 
+                "status", "flags", "ifId", "pcTag", "node", "vrf", "bd", "encap", "ip", "vnid", 
+                "force", "build_gen"]:
+            assert getattr(src, a) == getattr(dst, a)
+    assert p.msgs[2].wt == WORK_TYPE.DELETE_EPT
+    assert p.msgs[2].vnid == vrf_vnid
+
+    # brief parse provides count without parsing each msg
+    p = eptMsg.parse(js, brief=True)
+    assert p.msg_count == 3 and len(p.msgs) == 0
+
+def test_flush_queue_preserves_order_of_other_fabrics(app, func_prep):
+    # flush_queue must remove all msgs (bulk and single) for the provided fabric and keep msgs for
+    # other fabrics in their original order
+    q = "test_flush_queue"
+    redis.delete(q)
+    ip = "10.1.1.101"
+    for i in range(0, 6):
+        fabric = tfabric if i % 2 == 0 else "fab2"
+        msg1 = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="eth1/1", ts=1.0*i)
+        msg2 = get_epm_event(102, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="eth1/1", ts=1.0*i)
+        msg1.fabric = fabric
+        msg2.fabric = fabric
+        if i < 4:
+            bulk = eptMsgBulk()
+            bulk.msgs = [msg1, msg2]
+            redis.rpush(q, bulk.jsonify(wire=WIRE_VERSION_COMPACT if i < 2 else WIRE_VERSION_JSON))
+        else:
+            redis.rpush(q, msg1.jsonify())
+    flush_queue(redis, tfabric, q)
+    msgs = get_queue_msgs(q, pop=True)
+    assert len(msgs) == 5
+    assert [m.ts for m in msgs] == [1.0, 1.0, 3.0, 3.0, 5.0]
+    for m in msgs:
+        assert m.fabric == "fab2"
+    # flush of empty queue is a no-op
+    flush_queue(redis, tfabric, q)
+    assert redis.llen(q) == 0
+
+def test_flush_queue_concurrent_push_and_pop(app, func_prep):
+    # msgs pushed and popped while flush_queue is inspecting the queue do not change the order of
+    # the remaining msgs. Only msgs for the flushed fabric present when the flush started are removed
+    class concurrentRedis(object):
+        # wrap redis to pop the head of the queue and push new msgs on first inspection of the copy
+        def __init__(self, q, msgs):
+            self.q = q
+            self.msgs = msgs
+            self.popped = []
+        def __getattr__(self, attr):
+            return getattr(redis, attr)
+        def lrange(self, key, start, end):
+            if len(self.msgs) > 0:
+                self.popped.append(redis.lpop(self.q))
+                for m in self.msgs:
+                    redis.rpush(self.q, m.jsonify())
+                self.msgs = []
+            return redis.lrange(key, start, end)
+
+    q = "test_flush_queue"
+    redis.delete(q)
+    ip = "10.1.1.101"
+    def get_msg(fabric, ts):
+        msg = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="eth1/1", ts=ts)
+        msg.fabric = fabric
+        return msg
+    for i in range(0, 4):
+        redis.rpush(q, get_msg(tfabric if i % 2 == 0 else "fab2", 1.0*i).jsonify())
+    rdb = concurrentRedis(q, [get_msg("fab2", 4.0), get_msg(tfabric, 5.0), get_msg("fab2", 6.0)])
+    flush_queue(rdb, tfabric, q)
+    assert len(rdb.popped) == 1
+    msgs = get_queue_msgs(q, pop=True)
+    assert [m.ts for m in msgs] == [1.0, 3.0, 4.0, 5.0, 6.0]
+    assert len(redis.keys("%s.flush.*" % q)) == 0
+
+def test_handoff_queues_preserves_order(app, func_prep, monkeypatch):
+    # pending work on each queue of a removed worker is handed off to the new owner ahead of any
+    # newer work already on the new owner queue with the original order preserved across chunks
+    class dummyManager(object):
+        def __init__(self):
+            self.redis = redis
+        def increment_stats(self, queue, tx=False, count=1):
+            pass
+    monkeypatch.setattr("app.models.aci.ept.ept_manager.FLUSH_QUEUE_CHUNK_SIZE", 2)
+    tracker = WorkerTracker(manager=dummyManager())
+    tracker.update_thread.exit()
+    old = TrackedWorker.from_json({"worker_id": "w9", "role": "worker",
+            "queues": ["test_handoff_q%s_w9" % i for i in xrange(0, WORKER_QUEUE_COUNT)]})
+    new = TrackedWorker.from_json({"worker_id": "w1", "role": "worker", "active": True,
+            "queues": ["test_handoff_q%s_w1" % i for i in xrange(0, WORKER_QUEUE_COUNT)]})
+    tracker.active_workers = {"worker": [new]}
+    for q in old.queues + new.queues:
+        redis.delete(q)
+    ip = "10.1.1.101"
+    def get_msg(ts):
+        msg = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="eth1/1", ts=ts)
+        msg.fabric = tfabric
+        return msg
+    # newer event already on the new owner queue
+    redis.rpush(new.queues[WORKER_QUEUE_NORMAL], get_msg(100.0).jsonify())
+    # pending work on removed worker queue with a mix of bulk and single msgs
+    for i in xrange(0, 5):
+        if i % 2 == 0:
+            bulk = eptMsgBulk()
+            bulk.msgs = [get_msg(2.0*i), get_msg(2.0*i+1)]
+            redis.rpush(old.queues[WORKER_QUEUE_NORMAL], bulk.jsonify())
+        else:
+            redis.rpush(old.queues[WORKER_QUEUE_NORMAL], get_msg(2.0*i).jsonify())
+    redis.rpush(old.queues[WORKER_QUEUE_BULK], get_msg(50.0).jsonify())
+    tracker.handoff_queues(old)
+    msgs = get_queue_msgs(new.queues[WORKER_QUEUE_NORMAL], pop=True)
+    assert [m.ts for m in msgs] == [0.0, 1.0, 2.0, 4.0, 5.0, 6.0, 8.0, 9.0, 100.0]
+    msgs = get_queue_msgs(new.queues[WORKER_QUEUE_BULK], pop=True)
+    assert [m.ts for m in msgs] == [50.0]
+    for q in old.queues:
+        assert redis.llen(q) == 0
+        assert len(redis.keys("%s.handoff.*" % q)) == 0
+
+def test_write_buffer_merge_push_events(app, func_prep):
+    # multiple push_event operations to the same key are merged into a single ordered update and
+    # are not written to the db until the buffer is flushed
+    dut = get_worker()
+    buf = dut.write_buffer
+    buf.enabled = True
+    key = {"fabric": tfabric, "node": 101, "vnid": bd1_vnid, "addr": "00:00:01:02:03:04"}
+    key2 = {"fabric": tfabric, "node": 102, "vnid": bd1_vnid, "addr": "00:00:01:02:03:04"}
+    for i in range(0, 3):
+        buf.push_event(eptHistory._classname, key, {"ts": float(i)}, rotate=2)
+    buf.push_event(eptHistory._classname, key2, {"ts": 5.0}, rotate=2)
+    assert buf.pending_count == 2
+    assert buf.total_merged == 2
+    assert len(eptHistory.find(fabric=tfabric)) == 0
+
+    # flush_key for a different addr must not trigger a flush
+    buf.flush_key(eptHistory._classname, {"fabric": tfabric, "addr": "00:00:01:02:03:05"})
+    assert buf.pending_count == 2
+    buf.flush_key(eptHistory._classname, {"fabric": tfabric, "addr": key["addr"]})
+    assert buf.pending_count == 0
+    assert buf.total_flush == 1
+
+    h = eptHistory.load(**key)
+    assert h.exists()
+    assert h.count == 3
+    assert len(h.events) == 2
+    assert h.events[0]["ts"] == 2.0 and h.events[1]["ts"] == 1.0
+    h = eptHistory.load(**key2)
+    assert h.exists()
+    assert h.count == 1
+
+def test_write_buffer_merge_set_fields(app, func_prep):
+    # set_fields is merged with push_event operations to the same key and a set_fields only
+    # operation never creates a new object
+    dut = get_worker()
+    buf = dut.write_buffer
+    buf.enabled = True
+    key = {"fabric": tfabric, "node": 101, "vnid": bd1_vnid, "addr": "00:00:01:02:03:04"}
+    key2 = {"fabric": tfabric, "node": 102, "vnid": bd1_vnid, "addr": "00:00:01:02:03:04"}
+    buf.push_event(eptHistory._classname, key, {"ts": 1.0}, rotate=2)
+    buf.set_fields(eptHistory._classname, key, {"build_gen": 5})
+    buf.set_fields(eptHistory._classname, key2, {"build_gen": 5})
+    assert buf.pending_count == 2
+    assert buf.total_merged == 1
+    buf.flush()
+
+    h = eptHistory.load(**key)
+    assert h.exists()
+    assert h.count == 1
+    assert h.build_gen == 5
+    assert not eptHistory.load(**key2).exists()
+
+def test_handle_endpoint_event_build_gen_stamped(app, func_prep):
+    # create event from endpoint build stamps build_gen on new and existing eptHistory entries even
+    # when no update to the entry is required
+    dut = get_worker()
+    addr = "00:00:01:02:03:04"
+    msg = get_epm_event(101, addr, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="po2", ts=1.0)
+    msg.build_gen = 1000
+    dut.set_msg_worker_fabric(msg)
+    dut.handle_endpoint_event(msg)
+    dut.write_buffer.flush()
+    h = eptHistory.load(fabric=tfabric, node=101, vnid=bd1_vnid, addr=addr)
+    assert h.exists() and h.count == 1
+    assert h.build_gen == 1000
+
+    msg = get_epm_event(101, addr, wt=WORK_TYPE.EPM_MAC_EVENT, epg=1, intf="po2", ts=2.0)
+    msg.build_gen = 2000
+    dut.set_msg_worker_fabric(msg)
+    dut.handle_endpoint_event(msg)
+    dut.write_buffer.flush()
+    h = eptHistory.load(fabric=tfabric, node=101, vnid=bd1_vnid, addr=addr)
+    assert h.count == 1
+    assert h.build_gen == 2000
+
+def test_worker_index_consistent_on_worker_change(app, func_prep):
+    # adding or removing a worker must only remap hashes to/from that worker
+    workers = ["w%s" % i for i in range(0, 4)]
+    hashes = []
+    for i in range(0, 2000):
+        ip = "10.1.%s.%s" % (i/256, i%256)
+        msg = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1)
+        hashes.append(get_msg_hash(msg))
+    before = [workers[get_worker_index(h, workers)] for h in hashes]
+    # each worker receives a share of the hashes
+    for w in workers:
+        assert before.count(w) > 300
+
+    added = workers + ["w4"]
+    after = [added[get_worker_index(h, added)] for h in hashes]
+    moved = [i for i in range(0, len(hashes)) if before[i] != after[i]]
+    assert 0 < len(moved) < len(hashes)/3
+    for i in moved:
+        assert after[i] == "w4"
+
+    removed = [w for w in workers if w != "w1"]
+    after = [removed[get_worker_index(h, removed)] for h in hashes]
+    for i in range(0, len(hashes)):
+        if before[i] != "w1":
+            assert after[i] == before[i]
+    assert get_worker_index(hashes[0], []) == -1
+
+def test_worker_bulk_queue_preempted_by_high_priority(app, func_prep):
+    # a bulk received on a lower priority queue is preempted when there is work on a higher
+    # priority queue and the remaining messages are pushed back to the head of the original queue
+    dut = get_worker()
+    assert len(dut.queues) == WORKER_QUEUE_COUNT
+    for q in dut.queues:
+        redis.delete(q)
+    count = WORKER_QUEUE_PREEMPT_COUNT + 10
+    bulk = eptMsgBulk()
+    for i in range(0, count):
+        ip = "10.1.%s.%s" % (i/256, i%256)
+        msg = get_epm_event(101, ip, wt=WORK_TYPE.EPM_IP_EVENT, epg=1, intf="eth1/1", ts=1.0)
+        msg.qnum = WORKER_QUEUE_BULK
+        bulk.msgs.append(msg)
+    high = eptMsgWork(0, "worker", {}, WORK_TYPE.FLUSH_CACHE, qnum=WORKER_QUEUE_HIGH, 
+                        fabric=tfabric)
+    redis.rpush(dut.queues[WORKER_QUEUE_HIGH], high.jsonify())
+    dut.handle_redis_msgs(dut.queues[WORKER_QUEUE_BULK], bulk.jsonify())
+
+    requeued = get_queue_msgs(dut.queues[WORKER_QUEUE_BULK], pop=True)
+    assert len(requeued) == 10
+    assert [m.addr for m in requeued] == [m.addr for m in bulk.msgs[WORKER_QUEUE_PREEMPT_COUNT:]]
+    # high priority queue is untouched and serviced first by blpop
+    assert redis.llen(dut.queues[WORKER_QUEUE_HIGH]) == 1
+
 def test_flush_offsubnet_cache(app, func_prep):
     # when adding a new subnet to a running client, ensure that the offsubnet_cache is properly 
     # flushed such that new learns are correctly detected as on subnet.  Similarly, if the subnet
@@ -2138,7 +2556,8 @@ def test_flush_offsubnet_cache(app, func_prep):
         ip=prefix
     ).save()
     data = {"cache": eptSubnet._classname, "name": "%s/subnet-[%s]" % (bd1_name, prefix)}
-    msg = eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, fabric=tfabric)
+    msg = eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, WORKER_QUEUE_HIGH,
+            fabric=tfabric)
     dut.set_msg_worker_fabric(msg)
     dut.flush_cache(msg)
 
@@ -2165,7 +2584,8 @@ def test_flush_offsubnet_cache(app, func_prep):
         ip=prefix
     ).remove()
     data = {"cache": eptSubnet._classname, "name": "%s/subnet-[%s]" % (bd1_name, prefix1)}
-    msg = eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, fabric=tfabric)
+    msg = eptMsgWork(0, "worker", data, WORK_TYPE.FLUSH_CACHE, WORKER_QUEUE_HIGH,
+            fabric=tfabric)
     dut.set_msg_worker_fabric(msg)
     dut.flush_cache(msg)
 
@@ -2179,3 +2599,123 @@ def test_flush_offsubnet_cache(app, func_prep):
     assert h[0].is_offsubnet 
 
 
+
+def test_watcher_std_mo_events_coalesced(app, func_prep):
+    # send create and multiple modify events for the same dn to the watcher and ensure they are
+    # collapsed into a single pending event with merged attributes and latest timestamp
+    dut = get_worker(role="watcher")
+    dn = "uni/tn-ag/BD-bd1"
+    events = [
+        {"dn": dn, "status": "created", "seg": "1", "pcTag": "10", "scope": "100", "_ts": 1.0},
+        {"dn": dn, "status": "modified", "seg": "2", "_ts": 3.0},
+        {"dn": dn, "status": "modified", "pcTag": "11", "_ts": 2.0},
+        {"dn": dn, "status": "modified", "pcTag": "12", "_ts": 4.0},
+    ]
+    for e in events:
+        msg = eptMsgWorkStdMo("", "watcher", {"fvBD": e}, WORK_TYPE.STD_MO, WORKER_QUEUE_NORMAL,
+            fabric=tfabric)
+        dut.set_msg_worker_fabric(msg)
+        dut.handle_std_mo_event(msg)
+    assert len(dut.watch_std_mo) == 1
+    msg = dut.watch_std_mo[(tfabric, "fvBD", dn)]
+    attr = msg.data["fvBD"]
+    assert attr["status"] == "created"
+    assert attr["seg"] == "2" and attr["pcTag"] == "12" and attr["scope"] == "100"
+    assert attr["_ts"] == 4.0
+
+    # delete event replaces pending event
+    msg = eptMsgWorkStdMo("", "watcher", {"fvBD": {"dn": dn, "status": "deleted", "_ts": 5.0}},
+            WORK_TYPE.STD_MO, WORKER_QUEUE_NORMAL, fabric=tfabric)
+    dut.set_msg_worker_fabric(msg)
+    dut.handle_std_mo_event(msg)
+    assert len(dut.watch_std_mo) == 1
+    assert dut.watch_std_mo[(tfabric, "fvBD", dn)].data["fvBD"]["status"] == "deleted"
+
+    # std mo events are executed even while watcher is paused for the fabric
+    msg = dut.watch_std_mo.pop((tfabric, "fvBD", dn))
+    msg.xts = 0
+    dut.watch_std_mo[(tfabric, "fvBD", dn)] = msg
+    msg.wf.watcher_paused = True
+    dut.execute_watch_std_mo()
+    assert len(dut.watch_std_mo) == 0
+
+def test_watcher_mo_index_reloaded_on_reset(app, func_prep):
+    # watcher loads mo dependency index on first std mo event and reloads it after MO_INDEX_RESET
+    # is received from subscriber
+    dut = get_worker(role="watcher")
+    dn = "uni/tn-ag/BD-bd1"
+    attr = {"dn": dn, "status": "created", "seg": "1", "pcTag": "10", "scope": "100", "_ts": 1.0}
+    msg = eptMsgWorkStdMo("", "watcher", {"fvBD": attr}, WORK_TYPE.STD_MO, WORKER_QUEUE_NORMAL,
+            fabric=tfabric)
+    dut.set_msg_worker_fabric(msg)
+    dut.sync_std_mo_event(msg)
+    index = msg.wf.mo_index
+    assert index is not None
+
+    msg = eptMsgWork(0, "watcher", {}, WORK_TYPE.MO_INDEX_RESET, WORKER_QUEUE_HIGH,
+            fabric=tfabric)
+    dut.handle_redis_msgs(WATCHER_BROADCAST_CHANNEL, msg.jsonify())
+    assert dut.fabrics[tfabric].mo_index is None
+
+    attr = {"dn": dn, "status": "modified", "pcTag": "11", "_ts": 2.0}
+    msg = eptMsgWorkStdMo("", "watcher", {"fvBD": attr}, WORK_TYPE.STD_MO, WORKER_QUEUE_NORMAL,
+            fabric=tfabric)
+    dut.set_msg_worker_fabric(msg)
+    dut.sync_std_mo_event(msg)
+    assert msg.wf.mo_index is not None
+    assert msg.wf.mo_index is not index
+
+def test_watcher_mo_index_kept_on_full_flush(app, func_prep):
+    # full collection flush within FLUSH_CACHE_BULK does not reset the mo dependency index, only
+    # MO_INDEX_RESET from the subscriber reloads it
+    dut = get_worker(role="watcher")
+    dn = "uni/tn-ag/BD-bd1"
+    attr = {"dn": dn, "status": "created", "seg": "1", "pcTag": "10", "scope": "100", "_ts": 1.0}
+    msg = eptMsgWorkStdMo("", "watcher", {"fvBD": attr}, WORK_TYPE.STD_MO, WORKER_QUEUE_NORMAL,
+            fabric=tfabric)
+    dut.set_msg_worker_fabric(msg)
+    dut.sync_std_mo_event(msg)
+    index = msg.wf.mo_index
+    assert index is not None
+
+    data = {"flush": [{"cache": eptVnid._classname, "names": None, "version": None}]}
+    msg = eptMsgWork(0, "watcher", data, WORK_TYPE.FLUSH_CACHE_BULK, WORKER_QUEUE_HIGH,
+            fabric=tfabric)
+    dut.handle_redis_msgs(WATCHER_BROADCAST_CHANNEL, msg.jsonify())
+    assert dut.fabrics[tfabric].mo_index is index
+
+def test_watch_schedule_pop_ready_and_lazy_delete(app, func_prep):
+    # ensure eptWatchSchedule returns only ready msgs in xts order, replaced and popped keys are 
+    # skipped, and skipped fabrics remain scheduled
+    class watchMsg(object):
+        def __init__(self, fabric, xts):
+            self.fabric = fabric
+            self.xts = xts
+    schedule = eptWatchSchedule()
+    schedule["k1"] = watchMsg("fab1", 3.0)
+    schedule["k2"] = watchMsg("fab1", 1.0)
+    schedule["k3"] = watchMsg("fab1", 2.0)
+    schedule["k4"] = watchMsg("fab2", 1.5)
+    schedule["k5"] = watchMsg("fab1", 1.0)
+    # replace k2 with later xts and remove k5
+    schedule["k2"] = watchMsg("fab1", 10.0)
+    assert schedule.pop("k5") is not None
+    assert len(schedule) == 4 and "k5" not in schedule
+    assert schedule.get_count("fab1") == 3
+
+    work = schedule.pop_ready(2.5, skip_fabrics=["fab2"])
+    assert [k for (k, msg) in work] == ["k3"]
+    work = schedule.pop_ready(3.0)
+    assert [k for (k, msg) in work] == ["k4", "k1"]
+    assert len(schedule) == 1 and schedule["k2"].xts == 10.0
+    assert len(schedule.pop_ready(9.0)) == 0
+    assert [k for (k, msg) in schedule.pop_ready(10.0)] == ["k2"]
+    assert len(schedule) == 0
+
+    # repeated replacement of same key is compacted
+    for i in range(0, 3*WATCH_SCHEDULE_COMPACT_MIN):
+        schedule["k1"] = watchMsg("fab1", float(i))
+    assert len(schedule.heaps["fab1"]) <= WATCH_SCHEDULE_COMPACT_MIN + 1
+    work = schedule.pop_ready(float(3*WATCH_SCHEDULE_COMPACT_MIN))
+    assert len(work) == 1 and work[0][1].xts == 3*WATCH_SCHEDULE_COMPACT_MIN - 1
+    assert schedule.remove_fabric("fab1") == 0
@@ -0,0 +1,246 @@
+import json
+import logging
+import pytest
+
+from app.models.aci.ept.ept_fetch import eptEpmFetcher
+from app.models.aci.utils import ImdataStreamDecoder
+from app.models.aci.utils import get_class
+from requests.exceptions import ChunkedEncodingError
+
+import re
+import threading
+import time
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+@pytest.fixture(scope="module")
+def app(request, app):
+    # module level setup
+    app.config["LOGIN_ENABLED"] = False
+
+    # teardown called after all tests in session have completed
+    def teardown(): pass
+    request.addfinalizer(teardown)
+
+    logger.debug("(%s) module level app setup completed", __name__)
+    return app
+
+class dummyResponse(object):
+    # streamed response that returns body in chunks of chunk_size bytes. If error is set then it
+    # is raised after all chunks are returned
+    def __init__(self, body, chunk_size=1, error=None):
+        self.ok = True
+        self.body = body
+        self.chunk_size = chunk_size
+        self.error = error
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for i in xrange(0, len(self.body), self.chunk_size):
+            yield self.body[i:i+self.chunk_size]
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+class dummySession(object):
+    # session returning provided list of responses, one per page
+    def __init__(self, responses):
+        self.hostname = "apic1"
+        self.responses = list(responses)
+
+    def get(self, url, timeout=None, stream=False):
+        return self.responses.pop(0)
+
+class dummyNodeSession(object):
+    # session returning the next response from provided dict of responses indexed by node id
+    def __init__(self, responses, hostname="apic1"):
+        self.hostname = hostname
+        self.responses = responses
+
+    def get(self, url, timeout=None, stream=False):
+        node = int(re.search("/node-(?P<node>[0-9]+)/", url).group("node"))
+        return self.responses[node].pop(0)
+
+class dummyParser(object):
+    # epm parser returning the dn of each object
+    def parse_many(self, classname, attrs, ts):
+        return [a["dn"] for a in attrs]
+
+def get_epm_objects(node, count):
+    # list of epmMacEp objects for provided node
+    return [
+        {"epmMacEp": {"attributes": {"dn": "topology/pod-1/node-%s/mac-%s" % (node, i)}}}
+        for i in xrange(0, count)
+    ]
+
+def get_fetcher(sessions, page_size=2):
+    # return eptEpmFetcher with provided sessions
+    fetcher = eptEpmFetcher(None, dummyParser(), concurrency=len(sessions), page_size=page_size)
+    fetcher.sessions = sessions
+    return fetcher
+
+def get_fetch_results(fetcher, nodes):
+    # return list of pages from fetcher
+    return list(fetcher.fetch("epmMacEp", nodes, time.time()))
+
+def get_reply_body(objects, totalCount=None):
+    # return utf-8 encoded apic reply for list of objects
+    reply = {"imdata": objects}
+    if totalCount is not None:
+        reply["totalCount"] = "%s" % totalCount
+    return json.dumps(reply).encode("utf-8")
+
+def get_test_objects():
+    # list of objects with escaped strings, unicode, and numbers that may be split across chunks
+    return [
+        {"fvCEp": {"attributes": {"dn": "uni/tn-ag/ap-\"app\"/epg-e1", "name": u"caf\u00e9"}}},
+        {"fvCEp": {"attributes": {"dn": "uni/tn-ag\\ap-a2", "count": 123456789, "val": -1.25}}},
+        {"fvCEp": {"attributes": {"dn": "uni/tn-ag/ap-a3", "list": [1, 22, 333], "n": None}}},
+    ]
+
+def test_imdata_stream_decoder_split_chunks(app):
+    # ensure strings, escapes, unicode, and numbers split across any chunk boundary are decoded
+    # and top level attributes before and after imdata are available
+    objects = get_test_objects()
+    body = b'{"totalCount": "3", "imdata": [%s], "count": 12345}' % (
+            b", ".join([json.dumps(o, ensure_ascii=False).encode("utf-8") for o in objects]))
+    for chunk_size in [1, 2, 3, 7, 64, len(body)]:
+        resp = dummyResponse(body, chunk_size=chunk_size)
+        reply = ImdataStreamDecoder(resp.iter_content())
+        assert list(reply.iter_imdata()) == objects
+        assert reply.has_imdata
+        assert reply.attributes["totalCount"] == "3"
+        assert reply.attributes["count"] == 12345
+
+def test_imdata_stream_decoder_empty_imdata(app):
+    # empty imdata and empty reply
+    reply = ImdataStreamDecoder(dummyResponse(get_reply_body([], totalCount=0)).iter_content())
+    assert list(reply.iter_imdata()) == []
+    assert reply.has_imdata and reply.attributes["totalCount"] == "0"
+    reply = ImdataStreamDecoder(dummyResponse(b"{}").iter_content())
+    assert list(reply.iter_imdata()) == []
+    assert not reply.has_imdata
+
+def test_imdata_stream_decoder_truncated_body(app):
+    # truncated body raises ValueError after all complete objects are yielded
+    objects = get_test_objects()
+    body = get_reply_body(objects, totalCount=3)
+    body = body[0:body.index(b"ap-a3")]
+    reply = ImdataStreamDecoder(dummyResponse(body, chunk_size=5).iter_content())
+    received = []
+    with pytest.raises(ValueError):
+        for obj in reply.iter_imdata():
+            received.append(obj)
+    assert received == objects[0:2]
+
+def test_get_class_stream_success(app):
+    # streamed get_class returns all objects and closes the response
+    objects = get_test_objects()
+    resp = dummyResponse(get_reply_body(objects, totalCount=3), chunk_size=3)
+    assert list(get_class(dummySession([resp]), "fvCEp", stream=True)) == objects
+    assert resp.closed
+
+def test_get_class_stream_error_object(app):
+    # error object within imdata yields None and no further objects
+    objects = get_test_objects()
+    objects.insert(1, {"error": {"attributes": {"code": "400", "text": "invalid query"}}})
+    resp = dummyResponse(get_reply_body(objects, totalCount=4), chunk_size=16)
+    result = list(get_class(dummySession([resp]), "fvCEp", stream=True))
+    assert result == [objects[0], None]
+    assert resp.closed
+
+def test_get_class_stream_missing_total_count(app):
+    # reply without totalCount yields None after all objects
+    objects = get_test_objects()
+    resp = dummyResponse(get_reply_body(objects), chunk_size=16)
+    result = list(get_class(dummySession([resp]), "fvCEp", stream=True))
+    assert result == objects + [None]
+
+def test_get_class_stream_truncated_body(app):
+    # truncated body yields None after all complete objects
+    objects = get_test_objects()
+    body = get_reply_body(objects, totalCount=3)
+    resp = dummyResponse(body[0:body.index(b"ap-a3")], chunk_size=16)
+    result = list(get_class(dummySession([resp]), "fvCEp", stream=True))
+    assert result == objects[0:2] + [None]
+    assert resp.closed
+
+def test_get_class_stream_read_error(app):
+    # requests exception while reading body yields None
+    objects = get_test_objects()
+    body = get_reply_body(objects, totalCount=3)
+    resp = dummyResponse(body[0:body.index(b"ap-a2")], chunk_size=16,
+            error=ChunkedEncodingError("connection broken"))
+    result = list(get_class(dummySession([resp]), "fvCEp", stream=True))
+    assert result == objects[0:1] + [None]
+    assert resp.closed
+
+def test_fetch_interleaved_pages(app):
+    # pages from multiple nodes are all returned with per-node order maintained
+    nodes = [(1, 101), (1, 102), (1, 103)]
+    objects = dict([(n, get_epm_objects(n, 7)) for (p, n) in nodes])
+    responses = dict([(n, [dummyResponse(get_reply_body(objects[n], totalCount=7), 
+                    chunk_size=64)]) for n in objects])
+    sessions = [dummyNodeSession(responses, hostname="apic%s" % i) for i in xrange(0, 2)]
+    pages = get_fetch_results(get_fetcher(sessions), nodes)
+    assert None not in pages
+    assert max([len(p) for p in pages]) == 2
+    for n in objects:
+        expected = [o["epmMacEp"]["attributes"]["dn"] for o in objects[n]]
+        assert [dn for p in pages for dn in p if "/node-%s/" % n in dn] == expected
+
+def test_fetch_retry_failed_shard(app):
+    # failed node query is retried from the first object without querying other nodes again.
+    # Objects from the failed node already returned are returned again on retry
+    nodes = [(1, 101), (1, 102)]
+    objects = dict([(n, get_epm_objects(n, 5)) for (p, n) in nodes])
+    body = get_reply_body(objects[101], totalCount=5)
+    responses = {
+        101: [
+            dummyResponse(body[0:body.index(b"mac-3")], chunk_size=16,
+                error=ChunkedEncodingError("connection broken")),
+            dummyResponse(body, chunk_size=16),
+        ],
+        102: [dummyResponse(get_reply_body(objects[102], totalCount=5), chunk_size=16)],
+    }
+    pages = get_fetch_results(get_fetcher([dummyNodeSession(responses)]), nodes)
+    assert None not in pages
+    result = [dn for p in pages for dn in p]
+    expected = [o["epmMacEp"]["attributes"]["dn"] for n in objects for o in objects[n]]
+    assert sorted(set(result)) == sorted(expected)
+    # first page of node-101 was returned before the failure and again on retry
+    duplicates = sorted([dn for dn in set(result) if result.count(dn) > 1])
+    assert duplicates == sorted([o["epmMacEp"]["attributes"]["dn"] for o in objects[101][0:2]])
+    assert len(responses[101]) == 0 and len(responses[102]) == 0
+
+def test_fetch_retry_exhausted(app):
+    # node query failing on each retry yields None
+    nodes = [(1, 101)]
+    err = {"error": {"attributes": {"code": "400", "text": "invalid query"}}}
+    responses = {
+        101: [dummyResponse(get_reply_body([err], totalCount=1)) for i in xrange(0, 3)]
+    }
+    fetcher = get_fetcher([dummyNodeSession(responses)])
+    fetcher.max_retries = 2
+    assert get_fetch_results(fetcher, nodes) == [None]
+    assert len(responses[101]) == 0
+
+def test_fetch_abort_drains_results(app):
+    # closing the generator early drains the result queue so no fetch thread remains blocked
+    nodes = [(1, 101), (1, 102)]
+    responses = dict([(n, [dummyResponse(get_reply_body(get_epm_objects(n, 50), totalCount=50),
+                    chunk_size=256)]) for (p, n) in nodes])
+    sessions = [dummyNodeSession(responses, hostname="apic%s" % i) for i in xrange(0, 2)]
+    gen = get_fetcher(sessions, page_size=1).fetch("epmMacEp", nodes, time.time())
+    assert len(next(gen)) == 1
+    gen.close()
+    ts = time.time() + 5.0
+    while time.time() < ts:
+        if len([t for t in threading.enumerate() if t.name == "sub-fetch"]) == 0:
+            break
+        time.sleep(0.1)
+    assert len([t for t in threading.enumerate() if t.name == "sub-fetch"]) == 0
+
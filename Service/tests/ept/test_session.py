@@ -0,0 +1,97 @@
+import json
+import logging
+import pytest
+import time
+
+from app.models.aci.session import CallbackHandler
+from app.models.aci.session import EventHandler
+from app.models.aci.session import Subscriber
+from six.moves.queue import Queue
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+@pytest.fixture(scope="module")
+def app(request, app):
+    # module level setup
+    app.config["LOGIN_ENABLED"] = False
+
+    # teardown called after all tests in session have completed
+    def teardown(): pass
+    request.addfinalizer(teardown)
+
+    logger.debug("(%s) module level app setup completed", __name__)
+    return app
+
+class dummyWebSocket(object):
+    # websocket returning provided frames and then raising an exception as if socket was closed.
+    # If repeat is set then the last frame is returned indefinitely
+    def __init__(self, frames, repeat=False):
+        self.frames = list(frames)
+        self.repeat = repeat
+
+    def recv(self):
+        if len(self.frames) == 0:
+            raise Exception("socket closed")
+        if self.repeat and len(self.frames) == 1:
+            return self.frames[0]
+        return self.frames.pop(0)
+
+def get_frame(subscription_id, value):
+    # return websocket frame for provided subscription_id
+    return json.dumps({"subscriptionId": [subscription_id], "imdata": [{"value": value}]})
+
+def get_subscriber(frames, repeat=False, callback=None):
+    # return Subscriber with dummy websocket and single subscription with provided callback
+    sub = Subscriber(None)
+    sub._ws = dummyWebSocket(frames, repeat=repeat)
+    sub._subscription_ids["1"] = CallbackHandler("/api/class/fvCEp.json", "1", callback, False)
+    return sub
+
+def wait_for_thread(thread, timeout=5.0):
+    # wait for thread to exit, return True if thread exited
+    thread.join(timeout)
+    return not thread.is_alive()
+
+def test_session_frames_dispatched_in_order(app):
+    # all received frames are dispatched in order with receive and dispatch counters updated
+    received = []
+    def callback(event):
+        received.append(event["imdata"][0]["value"])
+    count = 100
+    sub = get_subscriber([get_frame("1", i) for i in xrange(0, count)], callback=callback)
+    sub._start_event_dispatcher()
+    handler = EventHandler(sub)
+    handler.daemon = True
+    handler.start()
+    assert wait_for_thread(handler)
+    assert handler.failure_reason == "websocket unexpectedly closed"
+    assert sub.wait_for_frame_drain(timeout=5.0)
+    assert received == range(0, count)
+    stats = sub.get_ingest_stats()
+    assert stats["recv_frames"] == count
+    assert stats["dispatch_frames"] == count
+    assert stats["backlog"] == 0
+    assert stats["backlog_max"] >= 1
+    assert sub.ingest_stats.last_recv_ts > 0
+    sub._exit = True
+    assert wait_for_thread(sub.event_dispatcher_thread)
+
+def test_session_full_frame_buffer_exits_with_subscriber(app):
+    # event handler blocked on full frame buffer with no dispatcher exits when subscriber exits
+    # and wait_for_frame_drain fails without a dispatcher
+    sub = get_subscriber([get_frame("1", 1)], repeat=True)
+    sub._frame_q = Queue(maxsize=2)
+    handler = EventHandler(sub)
+    handler.daemon = True
+    handler.start()
+    ts = time.time() + 5.0
+    while sub.ingest_stats.recv_blocked == 0 and time.time() < ts:
+        time.sleep(0.01)
+    stats = sub.get_ingest_stats()
+    assert stats["recv_blocked"] == 1
+    assert stats["recv_frames"] == 3
+    assert stats["backlog"] == 2 and stats["backlog_max"] == 2
+    assert not sub.wait_for_frame_drain(timeout=0.1)
+    sub._exit = True
+    assert wait_for_thread(handler)
@@ -0,0 +1,186 @@
+import logging
+import pytest
+import time
+
+from app.models.aci.fabric import Fabric
+from app.models.aci.ept.common import RESYNC_MAX_GAP
+from app.models.aci.ept.common import RESYNC_TS_MARGIN
+from app.models.aci.ept.common import WORKER_QUEUE_BULK
+from app.models.aci.ept.ept_msg import eptEpmEventParser
+from app.models.aci.ept.ept_queue_stats import eptQueueStats
+from app.models.aci.ept.ept_subscriber import eptSubscriber
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+tfabric = "fab1"
+overlay_vnid = 0xffffef
+mac_dn = "topology/pod-1/node-101/sys/ctx-[vxlan-2916352]/bd-[vxlan-15007704]/vlan-[vlan-101]"
+mac_dn+= "/db-ep/mac-00:00:40:01:01:%02x"
+
+@pytest.fixture(scope="module")
+def app(request, app):
+    # module level setup
+    app.config["LOGIN_ENABLED"] = False
+
+    # teardown called after all tests in session have completed
+    def teardown(): pass
+    request.addfinalizer(teardown)
+
+    logger.debug("(%s) module level app setup completed", __name__)
+    return app
+
+class dummySession(object):
+    # apic session that is never used as get_class is replaced
+    def close(self):
+        pass
+
+class dummySubscriptionCtrl(object):
+    # subscription that is always alive and records subscribe and resume calls
+    def __init__(self, last_alive_ts=0):
+        self.failure_reason = None
+        self.last_alive_ts = last_alive_ts
+        self.subscribed = 0
+        self.resumed = []
+
+    def get_last_alive_ts(self):
+        return self.last_alive_ts
+
+    def is_alive(self):
+        return True
+
+    def pause(self, classnames):
+        pass
+
+    def resume(self, classnames):
+        self.resumed+= classnames
+
+    def subscribe(self, blocking=True, session=None):
+        self.subscribed+= 1
+        return True
+
+@pytest.fixture(scope="function")
+def sub(request, app, monkeypatch):
+    # subscriber with dummy subscription and base db build where the epm objects returned from the
+    # apic are set in sub.epm_objects and msgs sent to workers are recorded in sub.sent
+    s = eptSubscriber(Fabric(fabric=tfabric), active_workers={})
+    s.fabric.heartbeat_interval = 60
+    s.fabric.heartbeat_timeout = 10
+    s.fabric.heartbeat_max_retries = 3
+    s.epm_parser = eptEpmEventParser(tfabric, overlay_vnid)
+    s.subscriber = dummySubscriptionCtrl()
+    s.subscription_alive_ts = time.time()
+    s.epm_objects = {}
+    s.leafs = [[(1, 101)]]
+    s.sent = {"msgs": [], "sweep": [], "eof": 0}
+
+    def get_class(session, classname, **kwargs):
+        return iter(s.epm_objects.get(classname, []))
+    def get_active_leafs():
+        return s.leafs.pop(0) if len(s.leafs) > 1 else s.leafs[0]
+    def sweep_endpoint_db(build_gen=None, ts=None, endpoints=None):
+        s.sent["sweep"].append({"build_gen": build_gen, "ts": ts, "endpoints": endpoints})
+        return 0
+    def send_epm_eof():
+        s.sent["eof"]+= 1
+    monkeypatch.setattr("app.models.aci.ept.ept_subscriber.get_class", get_class)
+    monkeypatch.setattr("app.models.aci.ept.ept_subscriber.get_apic_session",
+            lambda fabric: dummySession())
+    monkeypatch.setattr(s, "broadcast", lambda msg: None)
+    monkeypatch.setattr(s, "send_msg", lambda msgs: s.sent["msgs"].extend(msgs))
+    monkeypatch.setattr(s, "build_base_db", lambda init_str, incremental=False: True)
+    monkeypatch.setattr(s, "get_active_leafs", get_active_leafs)
+    monkeypatch.setattr(s, "sweep_endpoint_db", sweep_endpoint_db)
+    monkeypatch.setattr(s, "send_epm_eof", send_epm_eof)
+
+    def teardown():
+        eptQueueStats.delete(_filters={})
+    request.addfinalizer(teardown)
+    return s
+
+def get_mod_ts(ts):
+    # return apic modTs string for provided unix timestamp
+    return "%s.000+00:00" % time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts))
+
+def get_mac_object(i, mod_ts=None):
+    # return epmMacEp object with optional modTs
+    attr = {"dn": mac_dn % i, "status": "created", "flags": "local,mac", "ifId": "eth1/1"}
+    if mod_ts is not None:
+        attr["modTs"] = mod_ts
+    return {"epmMacEp": {"attributes": attr}}
+
+def test_subscriber_resync_cutoff(app, sub):
+    # cutoff is the last alive ts minus the heartbeat detection window and RESYNC_TS_MARGIN. An
+    # unknown last alive ts or one later than the last subscription check uses the check ts
+    window = (60 + 10) * 3
+    sub.subscription_alive_ts = 10000.0
+    assert sub.get_resync_cutoff(9000.0) == 9000.0 - window - RESYNC_TS_MARGIN
+    assert sub.get_resync_cutoff(0) == 10000.0 - window - RESYNC_TS_MARGIN
+    assert sub.get_resync_cutoff(20000.0) == 10000.0 - window - RESYNC_TS_MARGIN
+
+def test_subscriber_resync_endpoint_db_cutoff(app, sub):
+    # create jobs are only sent for objects modified after the cutoff or with an unknown modTs
+    # while all returned objects are included in the presence set used for the delete sweep
+    last_alive_ts = time.time() - 60
+    cutoff = sub.get_resync_cutoff(last_alive_ts)
+    objects = [
+        get_mac_object(1, mod_ts=get_mod_ts(cutoff - 10)),
+        # modified before the subscription was lost but within the detection window and margin
+        get_mac_object(2, mod_ts=get_mod_ts(last_alive_ts - RESYNC_TS_MARGIN)),
+        get_mac_object(3, mod_ts=get_mod_ts(last_alive_ts + 10)),
+        get_mac_object(4),
+        get_mac_object(5, mod_ts="never"),
+    ]
+    sub.epm_objects["epmMacEp"] = objects
+    ts = time.time()
+    assert sub.resync_endpoint_db(cutoff, ts)
+    expected = sub.epm_parser.parse_many("epmMacEp", [o["epmMacEp"]["attributes"] for o in
+                objects], ts)
+    assert len(expected) == len(objects)
+    assert [m.addr for m in sub.sent["msgs"]] == [m.addr for m in expected[1:]]
+    for m in sub.sent["msgs"]:
+        assert m.qnum == WORKER_QUEUE_BULK
+    assert len(sub.sent["sweep"]) == 1
+    sweep = sub.sent["sweep"][0]
+    assert sweep["ts"] == ts and sweep["build_gen"] is None
+    assert len(sweep["endpoints"]) == len(objects)
+    for m in expected:
+        assert (m.node, m.vnid, m.addr) in sweep["endpoints"]
+
+def test_subscriber_resync_fallback_to_full_build(app, sub, monkeypatch):
+    # resync fails so the fabric is restarted with a full build if the gap exceeds the max resync
+    # gap, the active leafs change, or the endpoint resync fails
+    sub.subscription_alive_ts = time.time() - RESYNC_MAX_GAP - 1
+    assert not sub.resync()
+    assert sub.subscriber.subscribed == 0
+
+    sub.subscription_alive_ts = time.time()
+    sub.leafs = [[(1, 101)], [(1, 101), (1, 102)]]
+    assert not sub.resync()
+    assert sub.subscriber.subscribed == 1
+    assert len(sub.sent["sweep"]) == 0
+
+    sub.leafs = [[(1, 101)]]
+    monkeypatch.setattr(sub, "resync_endpoint_db", lambda cutoff, ts: False)
+    assert not sub.resync()
+    assert sub.subscriber.subscribed == 2
+    assert sub.sent["eof"] == 0
+    assert sub.epm_initializing
+    assert sub.epm_build_held is None
+
+def test_subscriber_resync_skips_build_sweep(app, sub):
+    # incremental resync sends deletes for endpoints not returned so a pending build generation
+    # sweep is cleared and only the presence sweep is run
+    sub.build_gen = 2
+    sub.build_sweep = {"gen": 2, "ts": time.time(), "ready": False, "late": False}
+    sub.epm_objects["epmMacEp"] = [get_mac_object(1)]
+    assert sub.resync()
+    assert sub.build_sweep is None
+    assert len(sub.sent["sweep"]) == 1
+    assert sub.sent["sweep"][0]["build_gen"] is None
+    assert len(sub.sent["sweep"][0]["endpoints"]) == 1
+    assert len(sub.sent["msgs"]) == 1
+    assert sub.sent["eof"] == 1
+    assert not sub.epm_initializing
+    assert sub.epm_build_held == []
+    assert sub.subscriber.resumed == sub.epm_subscription_classes
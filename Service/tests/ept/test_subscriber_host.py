@@ -0,0 +1,162 @@
+import logging
+import pytest
+import threading
+
+from app.models.aci.ept.ept_subscriber_host import eptSubscriberHost
+
+# module level logging
+logger = logging.getLogger(__name__)
+
+tfabric = "fab1"
+
+@pytest.fixture(scope="module")
+def app(request, app):
+    # module level setup
+    app.config["LOGIN_ENABLED"] = False
+
+    # teardown called after all tests in session have completed
+    def teardown(): pass
+    request.addfinalizer(teardown)
+
+    logger.debug("(%s) module level app setup completed", __name__)
+    return app
+
+class dummyFabric(object):
+    # fabric that always exists
+    def __init__(self, fabric):
+        self.fabric = fabric
+
+    @staticmethod
+    def load(fabric=None):
+        return dummyFabric(fabric)
+
+    def exists(self):
+        return True
+
+class dummySubscriber(object):
+    # hosted subscriber that runs until stopped. If block_stop is set then the subscriber does not
+    # exit on stop until release is set, simulating a subscriber busy in a blocking call. If
+    # exit_on_start is set then the subscriber exits immediately as if the subscription failed.
+    block_stop = False
+    exit_on_start = False
+
+    def __init__(self, fabric, active_workers=None):
+        self.fabric = fabric
+        self.active_workers = active_workers
+        self.ctrl_ready = True
+        self.stopped = False
+        self.exit = threading.Event()
+        self.release = threading.Event()
+        if not dummySubscriber.block_stop:
+            self.release.set()
+
+    def run_hosted(self, db, redis):
+        if dummySubscriber.exit_on_start:
+            return
+        self.exit.wait(5.0)
+        self.release.wait(5.0)
+
+    def stop(self):
+        self.stopped = True
+        self.ctrl_ready = False
+        self.exit.set()
+
+@pytest.fixture(scope="function")
+def host(request, app, monkeypatch):
+    # host with dummy subscriber and fabric
+    monkeypatch.setattr("app.models.aci.ept.ept_subscriber_host.eptSubscriber", dummySubscriber)
+    monkeypatch.setattr("app.models.aci.ept.ept_subscriber_host.Fabric", dummyFabric)
+    monkeypatch.setattr(dummySubscriber, "block_stop", False)
+    monkeypatch.setattr(dummySubscriber, "exit_on_start", False)
+    h = eptSubscriberHost()
+
+    # release all subscriber threads still running
+    def teardown():
+        for sub in h.get_subscribers():
+            sub.stop()
+            sub.release.set()
+    request.addfinalizer(teardown)
+    return h
+
+def wait_for_thread(thread, timeout=5.0):
+    # wait for thread to exit, return True if thread exited
+    thread.join(timeout)
+    return not thread.is_alive()
+
+def test_subscriber_host_start_stop(app, host):
+    # start runs a subscriber thread for the fabric and stop returns without waiting for the
+    # thread which is reaped once it exits
+    host.start_fabric(tfabric, [])
+    sub = host.subscribers[tfabric]
+    t = host.threads[tfabric]
+    assert sub.fabric.fabric == tfabric
+    assert t.is_alive()
+    assert len(host.get_subscribers()) == 1
+    host.stop_fabric(tfabric)
+    assert sub.stopped
+    assert tfabric not in host.subscribers and tfabric not in host.threads
+    assert host.stopping[tfabric] is t
+    assert wait_for_thread(t)
+    host.reap_subscribers()
+    assert len(host.stopping) == 0
+    assert len(host.get_subscribers()) == 0
+    # stop of fabric that is not hosted is a no-op
+    host.stop_fabric(tfabric)
+    assert len(host.stopping) == 0
+
+def test_subscriber_host_restart_while_alive(app, host):
+    # start for a fabric whose stopped subscriber has not exited is deferred until the reaper
+    # finds the previous thread has exited and then started with the latest workers
+    worker = {"worker_id": "w1", "role": "worker", "queues": ["q0_w1"]}
+    dummySubscriber.block_stop = True
+    host.start_fabric(tfabric, [])
+    sub1 = host.subscribers[tfabric]
+    t1 = host.threads[tfabric]
+    host.start_fabric(tfabric, [])
+    host.start_fabric(tfabric, [worker])
+    assert sub1.stopped
+    assert tfabric not in host.subscribers
+    assert host.pending[tfabric]["workers"] == [worker]
+    host.reap_subscribers()
+    assert t1.is_alive()
+    assert tfabric not in host.subscribers
+    # release first subscriber and deferred start is executed by the reaper
+    dummySubscriber.block_stop = False
+    sub1.release.set()
+    assert wait_for_thread(t1)
+    host.reap_subscribers()
+    assert len(host.pending) == 0 and len(host.stopping) == 0
+    sub2 = host.subscribers[tfabric]
+    assert sub2 is not sub1 and not sub2.stopped
+    assert [w.worker_id for w in sub2.active_workers["worker"]] == ["w1"]
+    assert host.threads[tfabric].is_alive()
+
+def test_subscriber_host_stop_cancels_deferred_start(app, host):
+    # stop received while a start is deferred cancels the start
+    dummySubscriber.block_stop = True
+    host.start_fabric(tfabric, [])
+    sub1 = host.subscribers[tfabric]
+    t1 = host.threads[tfabric]
+    host.start_fabric(tfabric, [])
+    assert tfabric in host.pending
+    host.stop_fabric(tfabric)
+    assert len(host.pending) == 0
+    sub1.release.set()
+    assert wait_for_thread(t1)
+    host.reap_subscribers()
+    assert len(host.stopping) == 0
+    assert len(host.get_subscribers()) == 0
+
+def test_subscriber_host_reap_exited_subscriber(app, host):
+    # subscriber that exits on its own is removed by the reaper so it no longer sends hellos
+    dummySubscriber.exit_on_start = True
+    host.start_fabric(tfabric, [])
+    t = host.threads[tfabric]
+    assert wait_for_thread(t)
+    host.reap_subscribers()
+    assert tfabric not in host.subscribers and tfabric not in host.threads
+    assert len(host.stopping) == 0
+    # fabric can be started again after the subscriber exited
+    dummySubscriber.exit_on_start = False
+    host.start_fabric(tfabric, [])
+    assert host.threads[tfabric].is_alive()